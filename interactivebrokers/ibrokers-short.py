@@ -162,32 +162,16 @@ for ticker in prev_data:
 
 
 # Obtain quote information about all these stocks
-command = '../tda-bot/tda-quote-stock.py --stocks=' + str( ','.join(list(short_data.keys())) )
-process = Popen( command, stdin=None, stdout=PIPE, stderr=STDOUT, shell=True )
+command = '../tda-bot/tda-quote-stock.py --rawquote --json --stocks=' + str( ','.join(list(short_data.keys())) )
+process = Popen( command, stdin=None, stdout=PIPE, stderr=PIPE, shell=True )
 output, err = process.communicate()
 
-# Fixup output - needs to be json compliant
-# Single quotes should be double quotes
-# True|False strings need to be quoted
-output = output.decode()
-p = re.compile('(?<!\\\\)\'')
-output = p.sub('\"', output)
-
-output = re.sub('[a-zA-Z]"s', '\'s', output)
-output = re.sub('[a-zA-Z]s" [a-zA-Z]', 's\'', output)
-output = re.sub('L"Air', 'L\'Air', output)
-
-#output = re.sub('L"[a-zA-Z] ', '', output) # Handle french names like L"Air or L"Oreal
-output = re.sub('L"Air', '', output)
-output = re.sub('L"Oreal ', '', output)
-
-output = re.sub('True', '"True"',  output)
-output = re.sub('False', '"False"',  output)
-output = re.sub('None', '"None"',  output)
+if ( process.returncode != 0 ):
+	print('Error: tda-quote-stock.py returned ' + str(process.returncode) + ': ' + str(err.decode()), file=sys.stderr)
+	sys.exit(1)
 
 # Import as json
-#print(output)
-quote_data = json.loads(output)
+quote_data = json.loads(output.decode())
 
 print('Ticker,Current Avail Shorts,Previous Avail Shorts,Total Volume,Last Price,52WkHigh,52WkLow,Exchange')
 for ticker in quote_data.keys():
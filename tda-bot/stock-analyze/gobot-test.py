@@ -1,20 +1,49 @@
 #!/usr/bin/python3 -u
 
-import sys
+# Run tda-gobot-analyze.py against one or more pickle files using the test scenarios below
+#
+# Each scenario runs tda-gobot-analyze.py in-process in a pool of worker processes (one per CPU
+#  by default). The input files are read once in the parent process before the workers are
+#  forked, and the heavy modules (talib, tulipy, etc.) are imported once per worker instead of
+#  once per scenario. The output of each scenario is written to <ofile>-<scenario> as before
+#  (or printed to stdout if neither --ofile nor --odir is set), and a JSON record is printed
+#  to stdout (or --records) as each scenario completes.
+#  With --ledger, the trade ledger for each scenario is also written to <ofile>-<scenario>.npz
+#  (see tda_ledger_helper.py), which summarize-ledger.py can aggregate much faster than
+#  parsing the text output.
+#
+# Example:
+#  $ ./gobot-test.py --ifile=monthly-1min-csv/AAPL-2022-04-01.pickle,monthly-1min-csv/MSFT-2022-04-01.pickle --odir=results --jobs=8
+
+import os, sys
 import argparse
 import datetime, pytz
 import pickle
 import re
-
-from subprocess import Popen, PIPE, STDOUT
+import io
+import json
+import time
+import shlex
+import runpy
+import contextlib
+import traceback
+import multiprocessing
+import concurrent.futures
+
+parent_path = os.path.dirname( os.path.realpath(__file__) )
+sys.path.append(parent_path + '/../')
 
 parser = argparse.ArgumentParser()
 group = parser.add_mutually_exclusive_group(required=True)
-group.add_argument("--ifile", help='Pickle file to read', type=str)
+group.add_argument("--ifile", help='Pickle file to read. Multiple files (i.e. one per ticker) may be comma-delimited.', type=str)
 group.add_argument("--print_scenarios", help='Just print the test scenarios and exit (for other scripts that are parsing the results)', action="store_true")
 
 parser.add_argument("--scenarios", help='List of scenarios to test, comma-delimited. By default all scenarios listed in this script will be used.', type=str, default=None)
-parser.add_argument("--ofile", help='File to output results', type=str, default=None)
+parser.add_argument("--ofile", help='File to output results (results are written to <ofile>-<scenario>). Only valid with a single --ifile.', type=str, default=None)
+parser.add_argument("--odir", help='Directory to output results (results are written to <odir>/<ticker>-<scenario>)', type=str, default=None)
+parser.add_argument("--ledger", help='Also write the trade ledger for each scenario to <ofile>-<scenario>.npz (requires --ofile or --odir)', action="store_true")
+parser.add_argument("--records", help='File to write the JSON record for each completed scenario (Default: stdout)', type=str, default='-')
+parser.add_argument("--jobs", help='Number of scenarios to run in parallel (Default: number of CPUs)', type=int, default=os.cpu_count())
 parser.add_argument("--opts", help='Add any additional options for tda-gobot-analyze', default=None, type=str)
 parser.add_argument("--debug", help='Enable debug output', action="store_true")
 parser.add_argument("--debug_only", help='Print the command to run but do not actually run the command', action="store_true")
@@ -305,74 +334,183 @@ if ( args.scenarios != None ):
 		sys.exit(1)
 
 
-# Grab OHLCV data from pickle file
-try:
-	with open(args.ifile, 'rb') as handle:
-		pricehistory = handle.read()
-		pricehistory = pickle.loads(pricehistory)
-
-except Exception as e:
-	print('Error opening file ' + str(args.ifile) + ': ' + str(e), file=sys.stderr)
-	exit(1)
-
-# Sanity check the data
-# Check order of timestamps
-prev_time = 0
-for key in pricehistory['candles']:
-	time = int( key['datetime'] )
-	if ( prev_time != 0 ):
-		if ( time < prev_time ):
-			print('(' + str(ticker) + '): Error: timestamps out of order!', file=sys.stderr)
-			exit(-1)
-
-	prev_time = time
-
-# Check if pricehistory['symbol'] is set
-try:
-	ticker = pricehistory['symbol']
+# Run tda-gobot-analyze.py in-process with the command line argv
+# Returns a record describing the result and the output, and writes the output to outfile.
+#  The output is only returned if outfile is None, so the parent process can print it.
+def run_scenario(ticker=None, ifile=None, scenario=None, argv=[], outfile=None, ledger=None):
 
-except:
-	print('Error: pricehistory does not contain ticker symbol', file=sys.stderr)
-	exit(-1)
+	record = {	'ticker':	ticker,
+			'ifile':	ifile,
+			'scenario':	scenario,
+			'ofile':	outfile,
+			'ledger':	ledger,
+			'exit_code':	0,
+			'error':	None,
+			'start':	time.time(),
+			'elapsed':	0 }
+
+	output		= io.StringIO()
+	sys.argv	= argv
+	try:
+		with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+			runpy.run_path( parent_path + '/tda-gobot-analyze.py', run_name='__main__' )
+
+	except SystemExit as e:
+		if ( e.code != None and e.code != 0 ):
+			record['exit_code']	= e.code if isinstance(e.code, int) else 1
+			record['error']		= 'tda-gobot-analyze.py exited with code ' + str(e.code)
+
+	except Exception as e:
+		output.write( traceback.format_exc() )
+		record['exit_code']	= 1
+		record['error']		= 'Caught Exception: ' + str(e)
+
+	record['elapsed'] = round( time.time() - record['start'], 3 )
+
+	if ( outfile != None ):
+		try:
+			with open(outfile, 'w') as handle:
+				handle.write( output.getvalue() )
+
+		except Exception as e:
+			record['error'] = 'Unable to write to file ' + str(outfile) + ': ' + str(e)
+
+		return record, None
+
+	return record, output.getvalue()
+
+
+if ( args.ofile != None and args.odir != None ):
+	print('Error: --ofile and --odir are mutually exclusive', file=sys.stderr)
+	sys.exit(1)
+
+ifiles = args.ifile.split(',')
+if ( args.ofile != None and len(ifiles) > 1 ):
+	print('Error: --ofile is only valid with a single --ifile, use --odir instead', file=sys.stderr)
+	sys.exit(1)
+
+# Grab OHLCV data from pickle files
+# The raw data stays in tda_gobot_analyze_helper.ifile_cache and is shared with the
+#  worker processes, so tda-gobot-analyze.py does not need to read it again.
+import tda_gobot_analyze_helper
+
+tickers = {}
+for ifile in ifiles:
+	try:
+		pricehistory = tda_gobot_analyze_helper.read_ifile(ifile)
+
+	except Exception as e:
+		print('Error opening file ' + str(ifile) + ': ' + str(e), file=sys.stderr)
+		sys.exit(1)
+
+	# Check if pricehistory['symbol'] is set
+	try:
+		ticker = pricehistory['symbol']
+
+	except:
+		print('Error: ' + str(ifile) + ': pricehistory does not contain ticker symbol', file=sys.stderr)
+		sys.exit(1)
+
+	# Sanity check the data
+	# Check order of timestamps
+	prev_time = 0
+	for key in pricehistory['candles']:
+		cur_time = int( key['datetime'] )
+		if ( prev_time != 0 ):
+			if ( cur_time < prev_time ):
+				print('(' + str(ticker) + '): Error: timestamps out of order!', file=sys.stderr)
+				sys.exit(1)
+
+		prev_time = cur_time
+
+	tickers[ifile] = ticker
+
+pricehistory = None
 
 # Additional arguments to tda-gobot-analyze
 opts = ''
 if ( args.opts != None ):
 	opts = args.opts
 
-# Run the data through all available test scenarios
-for key in scenarios:
+# Build the list of tickers x scenarios to test
+jobs = []
+for ifile in ifiles:
+	ticker = tickers[ifile]
+	for key in scenarios:
 
-	if ( args.scenarios != None and key not in valid_scenarios ):
-		continue
+		if ( args.scenarios != None and key not in valid_scenarios ):
+			continue
 
-	command = './tda-gobot-analyze.py ' + str(ticker) + ' ' + str(std_opts) + ' --ifile=' + str(args.ifile) + ' ' + str(scenarios[key] + ' ' + str(opts))
-	outfile = str(args.ofile) + '-' + str(key)
+		command = './tda-gobot-analyze.py ' + str(ticker) + ' ' + str(std_opts) + ' --ifile=' + str(ifile) + ' ' + str(scenarios[key] + ' ' + str(opts))
 
-	if ( args.debug == True or args.debug_only == True ):
-		command = re.sub( '\t', ' ', command )
-		command = re.sub( '\s{2,}', ' ', command )
-		print('Command: ' + str(command))
+		outfile = None
+		if ( args.ofile != None ):
+			outfile = str(args.ofile) + '-' + str(key)
+		elif ( args.odir != None ):
+			outfile = os.path.join( args.odir, str(ticker) + '-' + str(key) )
 
-	if ( args.debug_only == True ):
-		continue
+		ledger = None
+		if ( args.ledger == True and outfile != None ):
+			ledger	= str(outfile) + '.npz'
+			command	+= ' --ledger_ofile=' + str(ledger) + ' --ledger_scenario=' + str(key)
 
-	# Run the test
-	try:
-		process = Popen( command, stdin=None, stdout=PIPE, stderr=STDOUT, shell=True )
-		output, err = process.communicate()
+		if ( args.debug == True or args.debug_only == True ):
+			command = re.sub( '\t', ' ', command )
+			command = re.sub( '\s{2,}', ' ', command )
+			print('Command: ' + str(command), file=sys.stderr)
 
-	except Exception as e:
-		print('Error: unable to open file ' + str(args.ifile) + ': ' + str(e), file=sys.stderr)
-		exit(1)
+		if ( args.debug_only == True ):
+			continue
+
+		jobs.append( (ticker, ifile, key, shlex.split(command), outfile, ledger) )
 
+if ( len(jobs) == 0 ):
+	sys.exit(0)
+
+# Import the modules used by tda-gobot-analyze.py before forking so that each worker
+#  does not need to import them again
+try:
+	import tulipy, talib
+	import robin_stocks.tda
+	import tda_gobot_helper
+	import tda_algo_helper
+except:
+	pass
+
+records = sys.stdout
+if ( args.records != '-' ):
 	try:
-		file = open(outfile, "wb")
-		file.write(output)
-		file.close()
+		records = open(args.records, 'a')
 
 	except Exception as e:
-		print('Unable to write to file ' + str(args.ofile) + ': ' + str(e), file=sys.stderr)
+		print('Unable to open file ' + str(args.records) + ': ' + str(e), file=sys.stderr)
+		sys.exit(1)
+
+# Run the data through all available test scenarios
+exit_code = 0
+with concurrent.futures.ProcessPoolExecutor( max_workers=max(1, args.jobs), mp_context=multiprocessing.get_context('fork') ) as executor:
+	futures = [ executor.submit(run_scenario, *job) for job in jobs ]
+
+	for future in concurrent.futures.as_completed( futures ):
+		try:
+			record, output = future.result()
+
+		except Exception as e:
+			print('Caught Exception: ' + str(e), file=sys.stderr)
+			exit_code = 1
+			continue
+
+		if ( args.debug == True and record['error'] != None ):
+			print('Error: ' + str(record['ticker']) + ' (' + str(record['scenario']) + '): ' + str(record['error']), file=sys.stderr)
+
+		if ( output != None ):
+			sys.stdout.write( output )
+			sys.stdout.flush()
+
+		records.write( json.dumps(record) + '\n' )
+		records.flush()
 
+if ( records != sys.stdout ):
+	records.close()
 
-sys.exit(0)
+sys.exit(exit_code)
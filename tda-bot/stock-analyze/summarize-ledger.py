@@ -0,0 +1,193 @@
+#!/usr/bin/python3 -u
+
+# Summarize the trade ledgers written by tda-gobot-analyze.py --ledger_ofile (or gobot-test.py --ledger)
+#
+# All ledgers are concatenated into a single array and aggregated with np.unique/np.bincount,
+#  so thousands of result files can be summarized in a few seconds. This replaces grepping
+#  the ANSI-colored output of tda-gobot-analyze.py (i.e. summarize-results.sh).
+#
+# Examples:
+#  $ ./summarize-ledger.py results/
+#  $ ./summarize-ledger.py --group_by=ticker,scenario --sort=success_pct results/*.npz
+#  $ ./summarize-ledger.py --daily --scenarios=stochrsi_bbands_kchan results/
+#  $ ./summarize-ledger.py --csv results/ > summary.csv
+
+import os, sys
+import argparse
+import glob
+
+import numpy as np
+
+import tda_ledger_helper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("ifiles", help='Ledger files, or directories containing ledger files', nargs='+', type=str)
+parser.add_argument("--group_by", help='Fields to group the results by, comma-delimited (ticker, scenario, short) (Default: scenario)', default='scenario', type=str)
+parser.add_argument("--daily", help='Also group the results by trading day', action="store_true")
+parser.add_argument("--scenarios", help='Only include these scenarios, comma-delimited', default=None, type=str)
+parser.add_argument("--tickers", help='Only include these tickers, comma-delimited', default=None, type=str)
+parser.add_argument("--start_date", help='Only include trades entered on or after this day (i.e. 2022-04-01)', default=None, type=str)
+parser.add_argument("--stop_date", help='Only include trades entered on or before this day (i.e. 2022-04-30)', default=None, type=str)
+parser.add_argument("--stock_usd", help='Scale total_return as if each trade used this amount of money (Default: use num_shares from the ledger)', default=None, type=float)
+parser.add_argument("--sort", help='Sort the results by this column (Default: total_return)', default='total_return', type=str)
+parser.add_argument("--csv", help='Print the results as CSV', action="store_true")
+args = parser.parse_args()
+
+
+# Find all the ledger files
+ifiles = []
+for ifile in args.ifiles:
+	if ( os.path.isdir(ifile) ):
+		for ext in tda_ledger_helper.ledger_formats:
+			ifiles += glob.glob( os.path.join(ifile, '*' + ext) )
+	else:
+		ifiles.append( ifile )
+
+ifiles = sorted( set(ifiles) )
+if ( len(ifiles) == 0 ):
+	print('Error: no ledger files found', file=sys.stderr)
+	sys.exit(1)
+
+# Read the ledgers
+# Older ledgers may not have the ticker/scenario fields set, in which case they are taken
+#  from the file name (<ticker>-<scenario>.npz, as written by gobot-test.py)
+ledgers = []
+for ifile in ifiles:
+	try:
+		ledger = tda_ledger_helper.read_ledger( ifile )
+
+	except Exception as e:
+		print('Warning: ' + str(ifile) + ': ' + str(e), file=sys.stderr)
+		continue
+
+	if ( len(ledger) == 0 ):
+		continue
+
+	name = os.path.splitext( os.path.basename(ifile) )[0]
+	if ( ledger['ticker'][0] == '' ):
+		ledger['ticker'] = name.split('-', 1)[0]
+	if ( ledger['scenario'][0] == '' ):
+		ledger['scenario'] = name.split('-', 1)[-1]
+
+	ledgers.append( ledger )
+
+if ( len(ledgers) == 0 ):
+	print('No trades found in ' + str(len(ifiles)) + ' ledger files')
+	sys.exit(0)
+
+ledger = np.concatenate( ledgers )
+
+# Filters
+day = ledger['entry_time'].astype('datetime64[D]')
+mask = np.ones( len(ledger), dtype=bool )
+if ( args.scenarios != None ):
+	mask &= np.isin( ledger['scenario'], args.scenarios.split(',') )
+if ( args.tickers != None ):
+	mask &= np.isin( ledger['ticker'], args.tickers.split(',') )
+if ( args.start_date != None ):
+	mask &= ( day >= np.datetime64(args.start_date, 'D') )
+if ( args.stop_date != None ):
+	mask &= ( day <= np.datetime64(args.stop_date, 'D') )
+
+ledger	= ledger[mask]
+day	= day[mask]
+if ( len(ledger) == 0 ):
+	print('No trades matched the requested filters')
+	sys.exit(0)
+
+total_return = ledger['total_return']
+if ( args.stock_usd != None ):
+	total_return = np.floor( args.stock_usd / ledger['entry_price'] ) * np.round( ledger['gain'], 2 )
+
+# Build the group key for each trade
+group_by = [ field for field in args.group_by.split(',') if field != '' ]
+for field in group_by:
+	if ( field not in ('ticker', 'scenario', 'short') ):
+		print('Error: invalid --group_by field: ' + str(field), file=sys.stderr)
+		sys.exit(1)
+
+keys = [ ledger[field].astype(str) for field in group_by ]
+if ( args.daily == True ):
+	group_by.append( 'day' )
+	keys.append( day.astype(str) )
+
+if ( len(keys) == 0 ):
+	keys = [ np.full(len(ledger), 'all') ]
+	group_by = [ 'group' ]
+
+key = keys[0]
+for k in keys[1:]:
+	key = np.char.add( np.char.add(key, '\t'), k )
+
+groups, inverse = np.unique( key, return_inverse=True )
+num_groups = len(groups)
+
+# Aggregate
+success		= ledger['success']
+gain		= ledger['gain']
+txs		= np.bincount( inverse, minlength=num_groups )
+num_success	= np.bincount( inverse, weights=success, minlength=num_groups ).astype(int)
+num_fail	= txs - num_success
+net_gain	= np.bincount( inverse, weights=np.where(success, gain, 0), minlength=num_groups )
+net_loss	= np.bincount( inverse, weights=np.where(success, 0, gain), minlength=num_groups )
+sum_return	= np.bincount( inverse, weights=total_return, minlength=num_groups )
+
+# Number of distinct trading days in each group
+day_key		= np.unique( np.stack([inverse, day.astype(np.int64)], axis=1), axis=0 )
+num_days	= np.bincount( day_key[:,0], minlength=num_groups )
+
+with np.errstate(divide='ignore', invalid='ignore'):
+	success_pct	= np.where( txs > 0, num_success / txs * 100, 0 )
+	average_gain	= np.where( num_success > 0, net_gain / num_success, 0 )
+	average_loss	= np.where( num_fail > 0, net_loss / num_fail, 0 )
+	txs_per_day	= np.where( num_days > 0, txs / num_days, 0 )
+
+columns = [
+	( 'txs',		txs ),
+	( 'days',		num_days ),
+	( 'txs_per_day',	txs_per_day ),
+	( 'success',		num_success ),
+	( 'fail',		num_fail ),
+	( 'success_pct',	success_pct ),
+	( 'average_gain',	average_gain ),
+	( 'average_loss',	average_loss ),
+	( 'net_gain',		net_gain ),
+	( 'net_loss',		net_loss ),
+	( 'total_return',	sum_return ),
+]
+
+names = [ c[0] for c in columns ]
+if ( args.sort not in names and args.sort not in group_by ):
+	print('Error: invalid --sort column: ' + str(args.sort), file=sys.stderr)
+	sys.exit(1)
+
+if ( args.sort in names ):
+	order = np.argsort( columns[names.index(args.sort)][1], kind='stable' )[::-1]
+else:
+	order = np.arange( num_groups )
+
+def fmt(name=None, val=None, digits=2):
+	if ( name in ('txs', 'days', 'success', 'fail') ):
+		return str(int(val))
+	return str(round(float(val), digits))
+
+# Print the results
+if ( args.csv == True ):
+	print( ','.join(group_by + names) )
+	for i in order:
+		print( ','.join( groups[i].split('\t') + [ fmt(n, c[i], 4) for n, c in columns ] ) )
+
+else:
+	width = [ max(len(g), max([ len(k) for k in groups_col ])) for g, groups_col in zip(group_by, zip(*[ g.split('\t') for g in groups ])) ]
+	print( ' '.join([ g.ljust(w) for g, w in zip(group_by, width) ]) + ' ' + ' '.join([ n.rjust(13) for n in names ]) )
+	for i in order:
+		line = ' '.join([ g.ljust(w) for g, w in zip(groups[i].split('\t'), width) ])
+		for n, c in columns:
+			line += ' ' + fmt(n, c[i]).rjust(13)
+
+		print( line )
+
+	print()
+	print( 'Ledgers: ' + str(len(ifiles)) + ' / Trades: ' + str(len(ledger)) + ' / Total return: ' + str(round(float(total_return.sum()), 2)) )
+
+sys.exit(0)
@@ -0,0 +1,83 @@
+#!/usr/bin/python3 -u
+
+# Convert the segment files written by the tda-gobot-v2 streaming archiver
+#  (tda_archive_helper.py) to the pickle files previously written by export_pricehistory(),
+#  so they can be used with tda-gobot-analyze.py, tda-ts-reader.py, etc.
+#
+# Example:
+#  $ ./tda-archive-export.py --archive_dir=TX_LOGS_v2 --day=2022-04-22 --stocks=SPY,QQQ
+#  Writes TX_LOGS_v2/2022-04-22/SPY-2022-04-22.pickle.xz, SPY_level1-2022-04-22.pickle.xz, etc.
+
+import os, sys
+import re
+import argparse
+import glob
+import lzma
+import pickle
+
+parent_path = os.path.dirname( os.path.realpath(__file__) )
+sys.path.append(parent_path + '/../')
+import tda_archive_helper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--archive_dir", help='Directory containing the archive (the --tx_log_dir used with tda-gobot-v2.py)', required=True, type=str)
+parser.add_argument("--day", help='Day to export (YYYY-MM-DD)', required=True, type=str)
+parser.add_argument("--stocks", help='Stock tickers to export, comma-delimited (Default: all tickers found in the archive)', default=None, type=str)
+parser.add_argument("--odir", help='Output directory (Default: <archive_dir>/<day>)', default=None, type=str)
+parser.add_argument("--streams", help='Streams to export, comma-delimited (Default: candles,level1,level2,ets)', default='candles,level1,level2,ets', type=str)
+args = parser.parse_args()
+
+odir = args.odir
+if ( odir == None ):
+	odir = os.path.join( args.archive_dir, args.day )
+
+# Find all tickers in the archive if --stocks was not specified
+# Note that segment files replace '/' in ticker names with '_'
+if ( args.stocks == None ):
+	tickers = set()
+	for fname in glob.glob( os.path.join(args.archive_dir, args.day, '*.seg') ):
+		try:
+			tickers.add( tda_archive_helper.read_header(fname)['ticker'] )
+		except Exception as e:
+			print('Warning: ' + str(fname) + ': ' + str(e), file=sys.stderr)
+
+	tickers = sorted( tickers )
+
+else:
+	tickers = args.stocks.split(',')
+
+suffix = { 'candles': '', 'level1': '_level1', 'level2': '_level2', 'ets': '_ets' }
+for ticker in tickers:
+	for stream in args.streams.split(','):
+		try:
+			records = tda_archive_helper.load( args.archive_dir, ticker, stream, day=args.day )
+
+		except Exception as e:
+			print('Error: ' + str(ticker) + ' (' + str(stream) + '): ' + str(e), file=sys.stderr)
+			continue
+
+		if ( len(records) == 0 ):
+			continue
+
+		if ( stream == 'candles' ):
+			data = tda_archive_helper.to_pricehistory( records, ticker )
+		elif ( stream == 'level1' ):
+			data = tda_archive_helper.to_level1( records, ticker )
+		elif ( stream == 'level2' ):
+			data = tda_archive_helper.to_level2( records )
+		elif ( stream == 'ets' ):
+			data = tda_archive_helper.to_ets( records, ticker )
+
+		fname = os.path.join( odir, re.sub('/', '_', ticker) + suffix[stream] + '-' + str(args.day) + '.pickle.xz' )
+		try:
+			with lzma.open(fname, 'wb') as handle:
+				pickle.dump(data, handle)
+				handle.flush()
+
+		except Exception as e:
+			print('Error: unable to write ' + str(fname) + ': ' + str(e), file=sys.stderr)
+			continue
+
+		print( str(fname) + ': ' + str(len(records)) + ' records' )
+
+sys.exit(0)
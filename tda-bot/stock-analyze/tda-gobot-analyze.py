@@ -18,6 +18,7 @@ parent_path = os.path.dirname( os.path.realpath(__file__) )
 sys.path.append(parent_path + '/../')
 import tda_gobot_helper
 import tda_gobot_analyze_helper
+import tda_ledger_helper
 
 
 # Parse and check variables
@@ -300,6 +301,9 @@ parser.add_argument("--mfi_signal_cancel_high_limit", help='Limit used to cancel
 parser.add_argument("--noshort", help='Disable short selling of stock', action="store_true")
 parser.add_argument("--shortonly", help='Only short sell the stock', action="store_true")
 
+parser.add_argument("--vectorized", help='Precompute the stochastic, chop and bbands/kchannel signal conditions and candle filters as arrays to speed up the backtest. The results are identical. (Default: False)', action="store_true")
+parser.add_argument("--ledger_ofile", help='Write the trade ledger to this file. The format is determined by the extension (.npz, or .parquet/.arrow if pyarrow is installed). See summarize-ledger.py', default=None, type=str)
+parser.add_argument("--ledger_scenario", help='Scenario name to record in the trade ledger', default='', type=str)
 parser.add_argument("--verbose", help='Print additional information about each transaction (Default: False)', action="store_true")
 parser.add_argument("-d", "--debug", help='Enable debug output', action="store_true")
 parser.add_argument("--debug_all", help='Enable extra debugging output', action="store_true")
@@ -471,9 +475,7 @@ for algo in args.algo.split(','):
 
 	if ( args.ifile != None ):
 		try:
-			with open(args.ifile, 'rb') as handle:
-				data = handle.read()
-				data = pickle.loads(data)
+			data = tda_gobot_analyze_helper.read_ifile(args.ifile)
 
 		except Exception as e:
 			print('Error opening file ' + str(args.ifile) + ': ' + str(e))
@@ -527,9 +529,7 @@ for algo in args.algo.split(','):
 	data_weekly = None
 	if ( args.weekly_ifile != None ):
 		try:
-			with open(args.weekly_ifile, 'rb') as handle:
-				data_weekly = handle.read()
-				data_weekly = pickle.loads(data_weekly)
+			data_weekly = tda_gobot_analyze_helper.read_ifile(args.weekly_ifile)
 
 		except Exception as e:
 			print('Error opening file ' + str(args.weekly_ifile) + ': ' + str(e))
@@ -539,9 +539,7 @@ for algo in args.algo.split(','):
 	data_daily = None
 	if ( args.daily_ifile != None ):
 		try:
-			with open(args.daily_ifile, 'rb') as handle:
-				data_daily = handle.read()
-				data_daily = pickle.loads(data_daily)
+			data_daily = tda_gobot_analyze_helper.read_ifile(args.daily_ifile)
 
 		except Exception as e:
 			print('Error opening file ' + str(args.daily_ifile) + ': ' + str(e))
@@ -551,9 +549,7 @@ for algo in args.algo.split(','):
 	mp_resistance_1min = None
 	if ( args.use_mp_resistance == True and args.mp_resistance_ifile != None ):
 		try:
-			with open(args.mp_resistance_ifile, 'rb') as handle:
-				mp_resistance_1min = handle.read()
-				mp_resistance_1min = pickle.loads(mp_resistance_1min)
+			mp_resistance_1min = tda_gobot_analyze_helper.read_ifile(args.mp_resistance_ifile)
 
 		except Exception as e:
 			print('Error opening file ' + str(args.mp_resistance_ifile) + ': ' + str(e))
@@ -583,16 +579,14 @@ for algo in args.algo.split(','):
 				etf_ifile	= re.sub('^.*\/' + str(stock), '', args.ifile)
 				etf_ifile	= stock_path + '/' + str(t) + etf_ifile
 				try:
-					with open(etf_ifile, 'rb') as handle:
-						etf_data = handle.read()
-						etf_data = pickle.loads(etf_data)
+					etf_data = tda_gobot_analyze_helper.read_ifile(etf_ifile)
 
 				except Exception as e:
 					print('Error opening file ' + str(etf_ifile) + ': ' + str(e))
 					sys.exit(1)
 
 				etf_indicators[t]['pricehistory']	= etf_data
-				etf_indicators[t]['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=etf_indicators[t]['pricehistory'], candle_type=5 )
+				etf_indicators[t]['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=etf_indicators[t]['pricehistory'], candle_type=5, align=False )
 				etf_indicators[t]['pricehistory']	= tda_gobot_helper.translate_heikin_ashi( pricehistory=etf_indicators[t]['pricehistory'] )
 
 		else:
@@ -620,7 +614,7 @@ for algo in args.algo.split(','):
 					continue
 
 				etf_indicators[t]['pricehistory']	= etf_data
-				etf_indicators[t]['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=etf_indicators[t]['pricehistory'], candle_type=5)
+				etf_indicators[t]['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=etf_indicators[t]['pricehistory'], candle_type=5, align=False)
 
 	# $TRIN and $TICK Indicators
 	trin_tick = {	'trin': {	'pricehistory':		{},
@@ -663,37 +657,31 @@ for algo in args.algo.split(','):
 			tick_ifile	= stock_path + '/TICK' + ifile
 
 			try:
-				with open(trin_ifile, 'rb') as handle:
-					trin_data = handle.read()
-					trin_data = pickle.loads(trin_data)
+				trin_data = tda_gobot_analyze_helper.read_ifile(trin_ifile)
 
 			#	with open(trinq_ifile, 'rb') as handle:
 			#		trinq_data = handle.read()
 			#		trinq_data = pickle.loads(trinq_data)
 
-				with open(trina_ifile, 'rb') as handle:
-					trina_data = handle.read()
-					trina_data = pickle.loads(trina_data)
+				trina_data = tda_gobot_analyze_helper.read_ifile(trina_ifile)
 
-				with open(tick_ifile, 'rb') as handle:
-					tick_data = handle.read()
-					tick_data = pickle.loads(tick_data)
+				tick_data = tda_gobot_analyze_helper.read_ifile(tick_ifile)
 
 			except Exception as e:
 				print('Error opening file: ' + str(e))
 				sys.exit(1)
 
 			trin_tick['trin']['pricehistory']	= trin_data
-			trin_tick['trin']['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=trin_tick['trin']['pricehistory'], candle_type=5 )
+			trin_tick['trin']['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=trin_tick['trin']['pricehistory'], candle_type=5, align=False )
 
 			#trin_tick['trinq']['pricehistory']	= trinq_data
-			#trin_tick['trinq']['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=trin_tick['trinq']['pricehistory'], candle_type=5 )
+			#trin_tick['trinq']['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=trin_tick['trinq']['pricehistory'], candle_type=5, align=False )
 
 			trin_tick['trina']['pricehistory']	= trina_data
-			trin_tick['trina']['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=trin_tick['trina']['pricehistory'], candle_type=5 )
+			trin_tick['trina']['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=trin_tick['trina']['pricehistory'], candle_type=5, align=False )
 
 			trin_tick['tick']['pricehistory']	= tick_data
-			trin_tick['tick']['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=trin_tick['tick']['pricehistory'], candle_type=5 )
+			trin_tick['tick']['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=trin_tick['tick']['pricehistory'], candle_type=5, align=False )
 
 			# FIXME: disabling ticka for now
 			trin_tick['ticka']['pricehistory']	= tick_data
@@ -738,23 +726,23 @@ for algo in args.algo.split(','):
 				print('Warning: trina_data[] is empty!', file=sys.stderr)
 
 			trin_tick['trin']['pricehistory']	= trin_data
-			trin_tick['trin']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['trin']['pricehistory'], candle_type=5)
+			trin_tick['trin']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['trin']['pricehistory'], candle_type=5, align=False)
 
 			#trin_tick['trinq']['pricehistory']	= trinq_data
-			#trin_tick['trinq']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['trinq']['pricehistory'], candle_type=5)
+			#trin_tick['trinq']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['trinq']['pricehistory'], candle_type=5, align=False)
 
 			trin_tick['trina']['pricehistory']	= trina_data
-			trin_tick['trina']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['trina']['pricehistory'], candle_type=5)
+			trin_tick['trina']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['trina']['pricehistory'], candle_type=5, align=False)
 
 			if ( len(tick_data['candles']) == 0 ):
 				print('Warning: tick_data[] is empty!')
 
 			trin_tick['tick']['pricehistory']	= tick_data
-			trin_tick['tick']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['tick']['pricehistory'], candle_type=5)
+			trin_tick['tick']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['tick']['pricehistory'], candle_type=5, align=False)
 
 			trin_tick['ticka']['pricehistory']	= tick_data
 #			trin_tick['ticka']['pricehistory']	= ticka_data
-#			trin_tick['ticka']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['tick']['pricehistory'], candle_type=5)
+#			trin_tick['ticka']['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=trin_tick['tick']['pricehistory'], candle_type=5, align=False)
 
 	# ETF SP monitor
 	sp_monitor_tickers	= args.sp_monitor_tickers.split(',')
@@ -788,16 +776,14 @@ for algo in args.algo.split(','):
 				sp_ifile	= re.sub('^.*\/' + str(stock), '', args.ifile)
 				sp_ifile	= stock_path + '/' + str(sp_t) + sp_ifile
 				try:
-					with open(sp_ifile, 'rb') as handle:
-						sp_data = handle.read()
-						sp_data = pickle.loads(sp_data)
+					sp_data = tda_gobot_analyze_helper.read_ifile(sp_ifile)
 
 				except Exception as e:
 					print('Error opening file ' + str(sp_ifile) + ': ' + str(e))
 					sys.exit(1)
 
 				sp_monitor[sp_t]['pricehistory']	= sp_data
-				sp_monitor[sp_t]['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=sp_monitor[sp_t]['pricehistory'], candle_type=5 )
+				sp_monitor[sp_t]['pricehistory_5m']	= tda_gobot_helper.translate_1m( pricehistory=sp_monitor[sp_t]['pricehistory'], candle_type=5, align=False )
 
 			else:
 				days = 9
@@ -826,7 +812,7 @@ for algo in args.algo.split(','):
 					sys.exit(1)
 
 				sp_monitor[sp_t]['pricehistory']	= sp_data
-				sp_monitor[sp_t]['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=sp_monitor[sp_t]['pricehistory'], candle_type=5)
+				sp_monitor[sp_t]['pricehistory_5m']	= tda_gobot_helper.translate_1m(pricehistory=sp_monitor[sp_t]['pricehistory'], candle_type=5, align=False)
 
 	# VIX - volatility index
 	vix = {	'pricehistory':	{},
@@ -841,9 +827,7 @@ for algo in args.algo.split(','):
 			vix_ifile	= stock_path + '/VXX' + ifile
 
 			try:
-				with open(vix_ifile, 'rb') as handle:
-					vix_data = handle.read()
-					vix_data = pickle.loads(vix_data)
+				vix_data = tda_gobot_analyze_helper.read_ifile(vix_ifile)
 
 			except Exception as e:
 				print('Error opening file: ' + str(e))
@@ -891,15 +875,7 @@ for algo in args.algo.split(','):
 
 		try:
 
-			if ( re.search('\.xz$', args.time_sales_ifile) != None ):
-				with lzma.open(args.time_sales_ifile, 'rb') as handle:
-					ts_data = handle.read()
-					ts_data = pickle.loads(ts_data)
-
-			else:
-				with open(args.time_sales_ifile, 'rb') as handle:
-					ts_data = handle.read()
-					ts_data = pickle.loads(ts_data)
+			ts_data = tda_gobot_analyze_helper.read_ifile(args.time_sales_ifile)
 
 		except Exception as e:
 			print('Error opening file: ' + str(e))
@@ -1009,6 +985,7 @@ for algo in args.algo.split(','):
 
 					'debug':				args.debug,
 					'debug_all':				args.debug_all,
+					'vectorized':				args.vectorized,
 
 					# Trade exit parameters
 					'incr_threshold':			args.incr_threshold,
@@ -1290,6 +1267,17 @@ for algo in args.algo.split(','):
 		if ( isinstance(results, bool) and results == False ):
 			print('Error: rsi_analyze(' + str(stock) + ') returned false', file=sys.stderr)
 			continue
+
+		# Write the trade ledger, even if it is empty so that summarize-ledger.py can
+		#  distinguish between a scenario with no trades and one that failed to run
+		if ( args.ledger_ofile != None ):
+			try:
+				ledger = tda_ledger_helper.parse_results( results, ticker=stock, scenario=args.ledger_scenario )
+				tda_ledger_helper.write_ledger( args.ledger_ofile, ledger )
+
+			except Exception as e:
+				print('Error: unable to write ledger file ' + str(args.ledger_ofile) + ': ' + str(e), file=sys.stderr)
+
 		if ( int(len(results)) == 0 ):
 			print('There were no possible trades for requested time period, exiting.')
 			continue
@@ -0,0 +1,357 @@
+#!/usr/bin/python3 -u
+
+# Micro-benchmark for the indicators in tda_algo_helper and tda_incremental_helper
+#
+# Synthetic 1-minute (04:00-20:00 ET), daily and weekly candles are generated for several
+#  lengths of time, and each indicator is timed on each set of candles:
+#
+#   batch	- one call to the tda_algo_helper function over the full pricehistory (best of --repeat)
+#   incr	- the IndicatorSet (tda_incremental_helper) version, called after each of the last
+#		  --stream candles is appended, as gobot_run() does. Throughput is the number of
+#		  streamed candles per second.
+#
+# The peak memory allocated during each run is measured separately with tracemalloc, so
+#  it does not affect the timings.
+#
+# Results are written as JSON to --odir (bench-results/<date>-<git commit>.json by default)
+#  and compared with the most recent previous results file (or --compare), so any
+#  indicator that got slower than --threshold between commits is reported.
+#
+# Examples:
+#   ./tda-indicator-bench.py
+#   ./tda-indicator-bench.py --freq=1min --lengths=1d,1m --indicators='^(rsi|stochrsi|vwap)$'
+#   ./tda-indicator-bench.py --lengths=2y --repeat=1 --compare=bench-results/2022-05-01-abc1234.json
+
+import os, sys, re
+import argparse
+import json
+import time
+import gc
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+parent_path = os.path.dirname( os.path.realpath(__file__) )
+sys.path.append(parent_path + '/../')
+import tda_algo_helper
+import tda_incremental_helper
+from tda_candle_helper import CandleStore
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--freq", help='Candle frequencies to test, comma-delimited (Default: 1min,daily,weekly)', default='1min,daily,weekly', type=str)
+parser.add_argument("--lengths", help='Lengths of history to test, comma-delimited: 1d,1w,1m,3m,6m,1y,2y (Default: 1d,1w,1m,6m,1y,2y)', default='1d,1w,1m,6m,1y,2y', type=str)
+parser.add_argument("--indicators", help='Only run indicators whose name matches this regex', default=None, type=str)
+parser.add_argument("--mode", help='batch, incr or both (Default: both)', default='both', type=str)
+parser.add_argument("--repeat", help='Number of times to run each batch indicator, the best time is used (Default: 3)', default=3, type=int)
+parser.add_argument("--stream", help='Number of candles to stream for incremental indicators (Default: 500)', default=500, type=int)
+parser.add_argument("--min_candles", help='Skip candle sets with fewer candles than this (Default: 30)', default=30, type=int)
+parser.add_argument("--max_candles", help='Skip candle sets with more candles than this (Default: 0, no limit)', default=0, type=int)
+parser.add_argument("--store", help='Pass a CandleStore to the batch functions instead of a pricehistory dict', action="store_true")
+parser.add_argument("--no_memory", help='Do not measure memory usage', action="store_true")
+parser.add_argument("--odir", help='Directory to write the results to (Default: bench-results)', default=parent_path + '/bench-results', type=str)
+parser.add_argument("--ofile", help='Write the results to this file instead of <odir>/<date>-<git commit>.json', default=None, type=str)
+parser.add_argument("--compare", help='Compare with this results file (Default: most recent file in --odir)', default=None, type=str)
+parser.add_argument("--threshold", help='Report indicators that are this much slower than --compare (Default: 1.25)', default=1.25, type=float)
+parser.add_argument("--seed", help='Random seed for the synthetic candles (Default: 1)', default=1, type=int)
+args = parser.parse_args()
+
+mytimezone			= tda_incremental_helper.mytimezone
+tda_algo_helper.mytimezone	= mytimezone
+
+# Number of business days for each length
+lengths = { '1d': 1, '1w': 5, '1m': 21, '3m': 63, '6m': 126, '1y': 252, '2y': 504 }
+
+# 1-minute candles from 04:00 to 20:00 ET, like tda-gobot-v2 downloads with extended hours
+minute_start	= 4 * 60
+minute_count	= 16 * 60
+
+
+# Generate a random walk of candles for num_days business days ending on 2022-05-27
+def synthetic_pricehistory(freq='1min', num_days=1, start_price=50, seed=1):
+	days = np.busday_offset( np.datetime64('2022-05-27'), -np.arange(num_days)[::-1], roll='backward' )
+	if ( freq == 'weekly' ):
+		days = days[ days.astype('datetime64[W]') != np.roll(days.astype('datetime64[W]'), 1) ] if ( len(days) > 1 ) else days
+
+	dts = []
+	for day in days.astype(object):
+		if ( freq == '1min' ):
+			start = int( mytimezone.localize(datetime(day.year, day.month, day.day)).timestamp() * 1000 )
+			dts.append( start + (minute_start + np.arange(minute_count, dtype=np.int64)) * 60000 )
+		else:
+			dts.append( [ int(mytimezone.localize(datetime(day.year, day.month, day.day)).timestamp() * 1000) ] )
+
+	dts	= np.concatenate( dts ).astype( np.int64 )
+	num	= len(dts)
+	vol	= { '1min': 0.001, 'daily': 0.015, 'weekly': 0.035 }[freq]
+
+	rng	= np.random.default_rng(seed)
+	close	= start_price * np.exp( np.cumsum(rng.normal(0, vol, num)) )
+	open_p	= np.concatenate( ([start_price], close[:-1]) )
+	high	= np.maximum(open_p, close) * ( 1 + np.abs(rng.normal(0, vol / 2, num)) )
+	low	= np.minimum(open_p, close) * ( 1 - np.abs(rng.normal(0, vol / 2, num)) )
+	volume	= rng.integers(100, 50000, num) * ( 1 if freq == '1min' else 400 )
+
+	store = CandleStore.from_arrays( 'SYNTH', open=np.round(open_p, 2), high=np.round(high, 2), low=np.round(low, 2),
+						close=np.round(close, 2), volume=volume, datetime=dts )
+
+	return store.to_pricehistory()
+
+
+# Batch indicators
+# Each entry is (name, func(pricehistory, last_day))
+batch_checks = [
+	( 'sma',		lambda ph, day: tda_algo_helper.get_sma(ph, period=200) ),
+	( 'ema',		lambda ph, day: tda_algo_helper.get_ema(ph, period=50) ),
+	( 'rsi',		lambda ph, day: tda_algo_helper.get_rsi(ph, rsi_period=14, type='hlc3') ),
+	( 'stochrsi',		lambda ph, day: tda_algo_helper.get_stochrsi(ph, rsi_period=14, stochrsi_period=128, type='hlc3', rsi_k_period=128) ),
+	( 'mfi',		lambda ph, day: tda_algo_helper.get_mfi(ph, period=14) ),
+	( 'stochmfi',		lambda ph, day: tda_algo_helper.get_stochmfi(ph, mfi_period=14, mfi_k_period=128) ),
+	( 'stoch_oscillator',	lambda ph, day: tda_algo_helper.get_stoch_oscillator(ph, type='hlc3') ),
+	( 'atr',		lambda ph, day: tda_algo_helper.get_atr(ph, period=14) ),
+	( 'adx',		lambda ph, day: tda_algo_helper.get_adx(ph, period=14) ),
+	( 'vpt',		lambda ph, day: tda_algo_helper.get_vpt(ph, period=128) ),
+	( 'aroon_osc',		lambda ph, day: tda_algo_helper.get_aroon_osc(ph, period=24) ),
+	( 'vwap',		lambda ph, day: tda_algo_helper.get_vwap(ph, day=day) ),
+	( 'vwap_all',		lambda ph, day: tda_algo_helper.get_vwap_all(ph) ),
+	( 'bbands',		lambda ph, day: tda_algo_helper.get_bbands(ph, period=20) ),
+	( 'kchannels',		lambda ph, day: tda_algo_helper.get_kchannels(ph, period=20, atr_period=20) ),
+	( 'macd',		lambda ph, day: tda_algo_helper.get_macd(ph, short_period=48, long_period=104, signal_period=36) ),
+	( 'chop',		lambda ph, day: tda_algo_helper.get_chop_index(ph, period=20) ),
+	( 'supertrend',		lambda ph, day: tda_algo_helper.get_supertrend(ph, atr_period=128) ),
+	( 'keylevels',		lambda ph, day: tda_algo_helper.get_keylevels(ph, filter=True) ),
+	( 'roc',		lambda ph, day: tda_algo_helper.get_roc(ph, period=50, type='hlc3') ),
+	( 'momentum',		lambda ph, day: tda_algo_helper.get_momentum(ph, period=12) ),
+	( 'trix_altma',		lambda ph, day: tda_algo_helper.get_trix_altma(ph, ma_type='kama', period=24) ),
+	( 'frama',		lambda ph, day: tda_algo_helper.get_frama(ph, period=20) ),
+	( 'mesa_sine',		lambda ph, day: tda_algo_helper.get_mesa_sine(ph, period=25) ),
+	( 'mesa_emd',		lambda ph, day: tda_algo_helper.get_mesa_emd(ph, period=20) ),
+	( 'fisher_transform',	lambda ph, day: tda_algo_helper.get_fisher_transform(ph, period=20) ),
+	( 'mesa_fisher',	lambda ph, day: tda_algo_helper.get_mesa_fisher_transform(ph, period=20) ),
+	( 'market_profile',	lambda ph, day: tda_algo_helper.get_market_profile(ph, close_type='hl2', tick_size=0.01) ),
+]
+
+# get_alt_ma() for each ma_type
+for ma_type in [ 'sma', 'ema', 'kama', 'dema', 'hma', 'tema', 'trima', 'wma', 'zlema', 'vwma', 'mama', 'frama', 'vidya' ]:
+	batch_checks.append( ( 'alt_ma_' + ma_type, lambda ph, day, ma_type=ma_type: tda_algo_helper.get_alt_ma(ph, period=50, ma_type=ma_type) ) )
+
+# Incremental indicators
+# Each entry is (name, func(indicator_set, pricehistory))
+incr_checks = [
+	( 'sma',		lambda ind, ph: ind.get_sma(ph, period=200) ),
+	( 'ema',		lambda ind, ph: ind.get_ema(ph, period=50) ),
+	( 'rsi',		lambda ind, ph: ind.get_rsi(ph, rsi_period=14, type='hlc3') ),
+	( 'stochrsi',		lambda ind, ph: ind.get_stochrsi(ph, rsi_period=14, stochrsi_period=128, type='hlc3', rsi_k_period=128) ),
+	( 'mfi',		lambda ind, ph: ind.get_mfi(ph, period=14) ),
+	( 'stochmfi',		lambda ind, ph: ind.get_stochmfi(ph, mfi_period=14, mfi_k_period=128) ),
+	( 'atr',		lambda ind, ph: ind.get_atr(ph, period=14) ),
+	( 'vpt',		lambda ind, ph: ind.get_vpt(ph, period=128) ),
+	( 'aroon_osc',		lambda ind, ph: ind.get_aroon_osc(ph, period=24) ),
+	( 'vwap',		lambda ind, ph: ind.get_vwap(ph) ),
+	( 'bbands',		lambda ind, ph: ind.get_bbands(ph, period=20) ),
+	( 'kchannels',		lambda ind, ph: ind.get_kchannels(ph, period=20, atr_period=20) ),
+	( 'macd',		lambda ind, ph: ind.get_macd(ph, short_period=48, long_period=104, signal_period=36) ),
+	( 'chop',		lambda ind, ph: ind.get_chop_index(ph, period=20) ),
+	( 'supertrend',		lambda ind, ph: ind.get_supertrend(ph, atr_period=128) ),
+	( 'roc',		lambda ind, ph: ind.get_roc(ph, period=50, type='hlc3') ),
+	( 'market_profile',	lambda ind, ph: ind.get_market_profile(ph, close_type='hl2', tick_size=0.01) ),
+]
+
+
+# Return the peak memory (bytes) allocated while running func()
+def peak_memory(func=None):
+	if ( args.no_memory == True ):
+		return None
+
+	gc.collect()
+	tracemalloc.start()
+	try:
+		func()
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+	return peak
+
+def bench_batch(func=None, pricehistory=None, last_day=None):
+	best = None
+	for i in range( max(args.repeat, 1) ):
+		gc.collect()
+		start	= time.perf_counter()
+		func( pricehistory, last_day )
+		elapsed	= time.perf_counter() - start
+
+		best = elapsed if ( best == None ) else min( best, elapsed )
+
+	return best, peak_memory( lambda: func(pricehistory, last_day) )
+
+# Load all but the last --stream candles, then append the rest one at a time
+def bench_incr(func=None, pricehistory=None):
+	candles = pricehistory['candles']
+	stream	= min( args.stream, len(candles) - 1 )
+
+	def run():
+		ind		= tda_incremental_helper.IndicatorSet()
+		ph_stream	= { 'candles': candles[:len(candles)-stream], 'symbol': pricehistory['symbol'] }
+
+		start = time.perf_counter()
+		func( ind, ph_stream )
+		warmup = time.perf_counter() - start
+
+		start = time.perf_counter()
+		for candle in candles[len(candles)-stream:]:
+			ph_stream['candles'].append( candle )
+			func( ind, ph_stream )
+
+		return warmup, time.perf_counter() - start
+
+	gc.collect()
+	warmup, elapsed = run()
+
+	return warmup, elapsed, stream, peak_memory( run )
+
+# Return the short git commit for the repo, or None
+def git_commit():
+	try:
+		return subprocess.run( ['git', 'rev-parse', '--short', 'HEAD'], cwd=parent_path, capture_output=True, text=True, timeout=10 ).stdout.strip() or None
+	except:
+		return None
+
+def print_result(r=None):
+	mem = '-' if ( r['peak_mem'] == None ) else str( round(r['peak_mem'] / 1024) ) + 'K'
+	print( str(r['freq']).ljust(7) + str(r['length']).ljust(4) + str(r['candles']).rjust(8) + '  ' + str(r['indicator']).ljust(18) + str(r['mode']).ljust(6) +
+		str(round(r['seconds'] * 1000, 3)).rjust(12) + 'ms' + str(int(r['candles_per_sec'])).rjust(14) + '/s' + mem.rjust(10) )
+
+# Return the most recent results file in odir, other than ofile
+def find_previous(odir=None, ofile=None):
+	try:
+		files = [ os.path.join(odir, f) for f in os.listdir(odir) if f.endswith('.json') ]
+	except:
+		return None
+
+	files = [ f for f in files if os.path.realpath(f) != os.path.realpath(ofile) ]
+	if ( len(files) == 0 ):
+		return None
+
+	return max( files, key=os.path.getmtime )
+
+def compare(results=None, prev_file=None):
+	try:
+		with open(prev_file, 'r') as handle:
+			prev = json.load(handle)
+
+	except Exception as e:
+		print('Error: unable to read ' + str(prev_file) + ': ' + str(e), file=sys.stderr)
+		return
+
+	print( '\nComparing with ' + str(prev_file) + ' (commit ' + str(prev.get('commit', None)) + ')' )
+
+	key	= lambda r: ( r['freq'], r['length'], r['indicator'], r['mode'] )
+	prev	= { key(r): r for r in prev['results'] }
+	slower = faster = 0
+	for r in results['results']:
+		if ( key(r) not in prev or prev[key(r)]['seconds'] <= 0 ):
+			continue
+
+		ratio = r['seconds'] / prev[key(r)]['seconds']
+		if ( ratio >= args.threshold ):
+			slower += 1
+			print( 'SLOWER ' + '/'.join([str(k) for k in key(r)]).ljust(40) + str(round(ratio, 2)).rjust(8) + 'x' )
+		elif ( ratio <= 1 / args.threshold ):
+			faster += 1
+			print( 'FASTER ' + '/'.join([str(k) for k in key(r)]).ljust(40) + str(round(ratio, 2)).rjust(8) + 'x' )
+
+	print( str(slower) + ' slower, ' + str(faster) + ' faster (threshold ' + str(args.threshold) + 'x)' )
+
+
+# Main
+freqs	= args.freq.split(',')
+for f in freqs:
+	if ( f not in [ '1min', 'daily', 'weekly' ] ):
+		print('Error: unsupported frequency "' + str(f) + '"', file=sys.stderr)
+		sys.exit(1)
+
+for l in args.lengths.split(','):
+	if ( l not in lengths ):
+		print('Error: unsupported length "' + str(l) + '"', file=sys.stderr)
+		sys.exit(1)
+
+if ( args.indicators != None ):
+	batch_checks	= [ c for c in batch_checks if re.search(args.indicators, c[0]) != None ]
+	incr_checks	= [ c for c in incr_checks if re.search(args.indicators, c[0]) != None ]
+
+if ( args.mode == 'batch' ):
+	incr_checks = []
+elif ( args.mode == 'incr' ):
+	batch_checks = []
+
+commit	= git_commit()
+results	= { 'date':		datetime.now(tz=mytimezone).strftime('%Y-%m-%d %H:%M:%S'),
+	    'commit':		commit,
+	    'python':		platform.python_version(),
+	    'numpy':		np.__version__,
+	    'machine':		platform.machine(),
+	    'args':		vars(args),
+	    'results':		[] }
+
+print( 'freq   len  candles  indicator         mode          time    candles/sec  peak_mem' )
+for freq in freqs:
+	for length in args.lengths.split(','):
+		pricehistory	= synthetic_pricehistory( freq, lengths[length], seed=args.seed )
+		num		= len( pricehistory['candles'] )
+		if ( num < args.min_candles or (args.max_candles > 0 and num > args.max_candles) ):
+			continue
+
+		last_day	= datetime.fromtimestamp( pricehistory['candles'][-1]['datetime'] / 1000, tz=mytimezone ).strftime('%Y-%m-%d')
+		batch_ph	= CandleStore.from_pricehistory( pricehistory ) if ( args.store == True ) else pricehistory
+
+		for name, func in batch_checks:
+			try:
+				elapsed, mem = bench_batch( func, batch_ph, last_day )
+			except Exception as e:
+				print('Caught Exception: ' + str(name) + ' (' + str(freq) + '/' + str(length) + '): ' + str(e), file=sys.stderr)
+				continue
+
+			r = {	'freq': freq, 'length': length, 'candles': num, 'indicator': name, 'mode': 'batch',
+				'seconds': elapsed, 'candles_per_sec': num / elapsed if ( elapsed > 0 ) else 0, 'peak_mem': mem }
+
+			results['results'].append( r )
+			print_result( r )
+
+		for name, func in incr_checks:
+			try:
+				warmup, elapsed, stream, mem = bench_incr( func, pricehistory )
+			except Exception as e:
+				print('Caught Exception: ' + str(name) + ' (' + str(freq) + '/' + str(length) + '): ' + str(e), file=sys.stderr)
+				continue
+
+			r = {	'freq': freq, 'length': length, 'candles': num, 'indicator': name, 'mode': 'incr',
+				'seconds': elapsed, 'candles_per_sec': stream / elapsed if ( elapsed > 0 ) else 0, 'peak_mem': mem,
+				'warmup_seconds': warmup, 'stream': stream }
+
+			results['results'].append( r )
+			print_result( r )
+
+# Save the results
+ofile = args.ofile
+if ( ofile == None ):
+	ofile = os.path.join( args.odir, datetime.now(tz=mytimezone).strftime('%Y-%m-%d_%H%M%S') + '-' + str(commit if commit != None else 'nocommit') + '.json' )
+
+prev_file = args.compare if ( args.compare != None ) else find_previous( os.path.dirname(ofile) or '.', ofile )
+
+try:
+	os.makedirs( os.path.dirname(ofile) or '.', exist_ok=True )
+	with open(ofile, 'w') as handle:
+		json.dump( results, handle, indent=1 )
+
+	print('\nResults written to ' + str(ofile))
+
+except Exception as e:
+	print('Error: unable to write results to ' + str(ofile) + ': ' + str(e), file=sys.stderr)
+
+if ( prev_file != None ):
+	compare( results, prev_file )
+
+sys.exit(0)
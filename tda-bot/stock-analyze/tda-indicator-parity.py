@@ -0,0 +1,198 @@
+#!/usr/bin/python3 -u
+
+# Check that the incremental indicators in tda_incremental_helper produce the same
+#  values as the batch functions in tda_algo_helper.
+#
+# Candles are streamed into an IndicatorSet one at a time (as gobot_run() does) after an
+#  initial warmup, and the most recent --tail values of each indicator are compared with
+#  the batch results over the full pricehistory.
+#
+# Examples:
+#   ./tda-indicator-parity.py --ifile=monthly-1min-csv/MSFT-1min-2022-03-01.pickle
+#   ./tda-indicator-parity.py --synthetic=20000
+
+import os, sys
+import argparse
+import pickle
+import lzma
+from datetime import datetime
+
+import numpy as np
+
+parent_path = os.path.dirname( os.path.realpath(__file__) )
+sys.path.append(parent_path + '/../')
+import tda_algo_helper
+import tda_incremental_helper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--ifile", help='Pickle file containing 1-minute pricehistory (optionally lzma compressed)', default=None, type=str)
+parser.add_argument("--synthetic", help='Generate this many random 1-minute candles instead of using --ifile (Default: 10000)', default=10000, type=int)
+parser.add_argument("--warmup", help='Number of candles to load before streaming the rest one at a time (Default: 2000)', default=2000, type=int)
+parser.add_argument("--tail", help='Number of most recent values to compare (Default: 300)', default=300, type=int)
+parser.add_argument("--rtol", help='Relative tolerance (Default: 1e-7)', default=1e-7, type=float)
+parser.add_argument("--atol", help='Absolute tolerance (Default: 1e-6)', default=1e-6, type=float)
+parser.add_argument("--rsi_type", help='Price type to use for RSI/StochRSI (Default: hlc3)', default='hlc3', type=str)
+parser.add_argument("-d", "--debug", help='Print the mismatched values', action="store_true")
+args = parser.parse_args()
+
+mytimezone				= tda_incremental_helper.mytimezone
+tda_algo_helper.mytimezone		= mytimezone
+
+
+# Generate a random walk of 1-minute candles
+def synthetic_pricehistory(num_candles=10000, start_price=50, seed=1):
+	rng	= np.random.default_rng(seed)
+	close	= start_price * np.exp( np.cumsum(rng.normal(0, 0.001, num_candles)) )
+	open_p	= np.concatenate( ([start_price], close[:-1]) )
+	high	= np.maximum(open_p, close) * ( 1 + np.abs(rng.normal(0, 0.0005, num_candles)) )
+	low	= np.minimum(open_p, close) * ( 1 - np.abs(rng.normal(0, 0.0005, num_candles)) )
+	volume	= rng.integers(100, 50000, num_candles)
+
+	start	= int( datetime(2022, 3, 1, 4, 0, tzinfo=mytimezone).timestamp() * 1000 )
+	ph	= { 'candles': [], 'symbol': 'SYNTH' }
+	for i in range(num_candles):
+		ph['candles'].append( {	'open':		round(float(open_p[i]), 2),
+					'high':		round(float(high[i]), 2),
+					'low':		round(float(low[i]), 2),
+					'close':	round(float(close[i]), 2),
+					'volume':	int(volume[i]),
+					'datetime':	start + i * 60000 } )
+
+	return ph
+
+
+if ( args.ifile != None ):
+	try:
+		with open(args.ifile, 'rb') as handle:
+			data = handle.read()
+			if ( args.ifile.endswith('.xz') or args.ifile.endswith('.lzma') ):
+				data = lzma.decompress(data)
+
+			pricehistory = pickle.loads(data)
+
+	except Exception as e:
+		print('Error opening file ' + str(args.ifile) + ': ' + str(e))
+		sys.exit(1)
+
+else:
+	pricehistory = synthetic_pricehistory(args.synthetic)
+
+if ( len(pricehistory['candles']) <= args.warmup ):
+	print('Error: pricehistory contains ' + str(len(pricehistory['candles'])) + ' candles, which is not more than --warmup (' + str(args.warmup) + ')')
+	sys.exit(1)
+
+# Stream candles into the IndicatorSet
+# Query the indicators along the way so that the catch-up path is exercised as well
+indicators	= tda_incremental_helper.IndicatorSet(history=args.tail)
+ph_stream	= { 'candles': pricehistory['candles'][:args.warmup], 'symbol': pricehistory['symbol'] }
+
+checks = [
+	( 'rsi',		lambda ph: tda_algo_helper.get_rsi(ph, rsi_period=14, type=args.rsi_type),
+				lambda ph: indicators.get_rsi(ph, rsi_period=14, type=args.rsi_type) ),
+
+	( 'stochrsi_k',		lambda ph: tda_algo_helper.get_stochrsi(ph, rsi_period=14, stochrsi_period=128, type=args.rsi_type, rsi_k_period=128)[1],
+				lambda ph: indicators.get_stochrsi(ph, rsi_period=14, stochrsi_period=128, type=args.rsi_type, rsi_k_period=128)[0] ),
+
+	( 'stochrsi_d',		lambda ph: tda_algo_helper.get_stochrsi(ph, rsi_period=14, stochrsi_period=128, type=args.rsi_type, rsi_k_period=128)[2],
+				lambda ph: indicators.get_stochrsi(ph, rsi_period=14, stochrsi_period=128, type=args.rsi_type, rsi_k_period=128)[1] ),
+
+	( 'stochmfi_k',		lambda ph: tda_algo_helper.get_stochmfi(ph, mfi_period=14, mfi_k_period=128)[0],
+				lambda ph: indicators.get_stochmfi(ph, mfi_period=14, mfi_k_period=128)[0] ),
+
+	( 'stochmfi_d',		lambda ph: tda_algo_helper.get_stochmfi(ph, mfi_period=14, mfi_k_period=128)[1],
+				lambda ph: indicators.get_stochmfi(ph, mfi_period=14, mfi_k_period=128)[1] ),
+
+	( 'mfi',		lambda ph: tda_algo_helper.get_mfi(ph, period=14),
+				lambda ph: indicators.get_mfi(ph, period=14) ),
+
+	( 'atr',		lambda ph: tda_algo_helper.get_atr(ph, period=14)[0],
+				lambda ph: indicators.get_atr(ph, period=14)[0] ),
+
+	( 'natr',		lambda ph: tda_algo_helper.get_atr(ph, period=14)[1],
+				lambda ph: indicators.get_atr(ph, period=14)[1] ),
+
+	( 'roc',		lambda ph: tda_algo_helper.get_roc(ph, period=50, type='hlc3'),
+				lambda ph: indicators.get_roc(ph, period=50, type='hlc3') ),
+
+	( 'aroonosc',		lambda ph: tda_algo_helper.get_aroon_osc(ph, period=24),
+				lambda ph: indicators.get_aroon_osc(ph, period=24) ),
+
+	( 'macd',		lambda ph: tda_algo_helper.get_macd(ph, short_period=48, long_period=104, signal_period=36)[0],
+				lambda ph: indicators.get_macd(ph, short_period=48, long_period=104, signal_period=36)[0] ),
+
+	( 'macd_signal',	lambda ph: tda_algo_helper.get_macd(ph, short_period=48, long_period=104, signal_period=36)[1],
+				lambda ph: indicators.get_macd(ph, short_period=48, long_period=104, signal_period=36)[1] ),
+
+	( 'macd_12_26',		lambda ph: tda_algo_helper.get_macd(ph)[0],
+				lambda ph: indicators.get_macd(ph)[0] ),
+
+	( 'chop',		lambda ph: tda_algo_helper.get_chop_index(ph, period=20),
+				lambda ph: indicators.get_chop_index(ph, period=20) ),
+
+	( 'supertrend',		lambda ph: tda_algo_helper.get_supertrend(ph, atr_period=128),
+				lambda ph: indicators.get_supertrend(ph, atr_period=128) ),
+
+	( 'bbands_lower',	lambda ph: tda_algo_helper.get_bbands(ph, period=20)[0],
+				lambda ph: indicators.get_bbands(ph, period=20)[0] ),
+
+	( 'bbands_upper',	lambda ph: tda_algo_helper.get_bbands(ph, period=20)[2],
+				lambda ph: indicators.get_bbands(ph, period=20)[2] ),
+
+	( 'kchannel_lower',	lambda ph: tda_algo_helper.get_kchannels(ph, period=20, atr_period=20)[0],
+				lambda ph: indicators.get_kchannels(ph, period=20, atr_period=20)[0] ),
+
+	( 'kchannel_mid',	lambda ph: tda_algo_helper.get_kchannels(ph, period=20, atr_period=20)[1],
+				lambda ph: indicators.get_kchannels(ph, period=20, atr_period=20)[1] ),
+
+	( 'vpt',		lambda ph: tda_algo_helper.get_vpt(ph, period=72)[0],
+				lambda ph: indicators.get_vpt(ph, period=72)[0] ),
+
+	( 'vpt_sma',		lambda ph: tda_algo_helper.get_vpt(ph, period=72)[1],
+				lambda ph: indicators.get_vpt(ph, period=72)[1] ),
+
+	( 'ema',		lambda ph: tda_algo_helper.get_ema(ph, period=21),
+				lambda ph: indicators.get_ema(ph, period=21) ),
+]
+
+# Compare the value area and poc of the last day of the market profile
+def mp_levels(mprofile=None):
+	last = list(mprofile.keys())[-1]
+	return [ mprofile[last]['val'], mprofile[last]['vah'], mprofile[last]['poc_price'] ]
+
+checks.append( ( 'market_profile',	lambda ph: mp_levels( tda_algo_helper.get_market_profile(ph, close_type='hl2', tick_size=0.01) ),
+					lambda ph: mp_levels( indicators.get_market_profile(ph, close_type='hl2', tick_size=0.01) ) ) )
+
+for idx,candle in enumerate( pricehistory['candles'][args.warmup:] ):
+	ph_stream['candles'].append( candle )
+	if ( idx % 97 == 0 ):
+		for name, batch, incr in checks:
+			incr(ph_stream)
+
+# VWAP is only calculated for the current day, so compare against the last day in pricehistory
+last_day = datetime.fromtimestamp( int(pricehistory['candles'][-1]['datetime']) / 1000, tz=mytimezone ).strftime('%Y-%m-%d')
+checks.append( ( 'vwap',	lambda ph: tda_algo_helper.get_vwap(ph, day=last_day)[0],
+				lambda ph: indicators.get_vwap(ph)[0] ) )
+checks.append( ( 'vwap_up',	lambda ph: tda_algo_helper.get_vwap(ph, day=last_day)[1],
+				lambda ph: indicators.get_vwap(ph)[1] ) )
+
+failed = 0
+for name, batch, incr in checks:
+	b = np.array( batch(pricehistory), dtype=np.float64 )
+	i = np.array( incr(ph_stream), dtype=np.float64 )
+
+	num = min( args.tail, len(b), len(i) )
+	b = b[-num:]
+	i = i[-num:]
+
+	match = np.isclose( b, i, rtol=args.rtol, atol=args.atol, equal_nan=True )
+	if ( match.all() ):
+		print( 'PASS ' + str(name).ljust(16) + ' (' + str(num) + ' values, max diff ' + str(np.nanmax(np.abs(b - i))) + ')' )
+
+	else:
+		failed += 1
+		print( 'FAIL ' + str(name).ljust(16) + ' (' + str(np.count_nonzero(~match)) + ' of ' + str(num) + ' values differ)' )
+		if ( args.debug == True ):
+			for idx in np.nonzero(~match)[0]:
+				print( '    [' + str(idx - num) + '] batch=' + str(b[idx]) + ', incremental=' + str(i[idx]) )
+
+sys.exit( 1 if ( failed > 0 ) else 0 )
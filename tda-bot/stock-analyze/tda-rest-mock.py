@@ -0,0 +1,191 @@
+#!/usr/bin/python3 -u
+
+# Run the mock TDA REST API server (tda_mock_helper.py), or test tda_rest_helper.py and
+#  the tda_gobot_helper API functions against it offline with --selftest.
+#
+# Without --selftest the server runs until interrupted. Point the bots or utilities at it
+#  by setting tda_api_url in the environment to the URL that is printed.
+#
+# Examples:
+#   ./tda-rest-mock.py --port=8080
+#   ./tda-rest-mock.py --selftest
+
+import os, sys
+import argparse
+import time
+import concurrent.futures
+
+parent_path = os.path.dirname( os.path.realpath(__file__) )
+sys.path.append(parent_path + '/../')
+import tda_mock_helper
+import tda_rest_helper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--host", help='Address to listen on (Default: 127.0.0.1)', default='127.0.0.1', type=str)
+parser.add_argument("--port", help='Port to listen on (Default: 8080)', default=8080, type=int)
+parser.add_argument("--token", help='Access token the server expects (Default: mock-token)', default='mock-token', type=str)
+parser.add_argument("--delay", help='Seconds to wait before each response (Default: 0)', default=0, type=float)
+parser.add_argument("--rate", help='Return 429 after this many requests within --per seconds (Default: no limit)', default=None, type=int)
+parser.add_argument("--per", help='Rate limit window in seconds (Default: 60)', default=60, type=float)
+parser.add_argument("--invalid", help='Comma-delimited list of tickers to treat as invalid', default='', type=str)
+parser.add_argument("--selftest", help='Start the server on a random port and test the API functions against it', action="store_true")
+parser.add_argument("-d", "--debug", help='Log each request', action="store_true")
+args = parser.parse_args()
+
+invalid = [ t for t in args.invalid.split(',') if t != '' ]
+
+if ( args.selftest == False ):
+	server = tda_mock_helper.MockServer( host=args.host, port=args.port, token=args.token, delay=args.delay, rate=args.rate, per=args.per,
+						invalid=invalid, debug=args.debug )
+
+	print('Mock TDA API listening on ' + str(server.url))
+	print('  export tda_api_url=' + str(server.url))
+	try:
+		server.httpd.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+	server.stop()
+	sys.exit(0)
+
+
+##################################################################################################################
+# Self test
+failed = 0
+def check(name=None, ok=False, msg=''):
+	global failed
+	if ( ok != True ):
+		failed += 1
+
+	print( '{0:50} {1:6} {2}'.format(str(name), 'OK' if ( ok == True ) else 'FAILED', str(msg)) )
+
+server	= tda_mock_helper.MockServer( token=args.token, invalid=['BADTICKER'] + invalid, debug=args.debug )
+url	= server.start()
+
+# tda_gobot_helper uses the shared client, which is configured from the environment
+os.environ['tda_api_url']	= url
+os.environ['tda_history_cache']	= ''
+
+# The rate limiter is tested separately below
+tda_rest_helper.rate_limits = { 'data': (1000, 1, 100), 'orders': (1000, 1, 100) }
+
+import tda_gobot_helper
+
+tda_gobot_helper.tda			= tda_mock_helper.MockLogin( args.token )
+tda_gobot_helper.passcode		= 'mock'
+tda_gobot_helper.tda_account_number	= 123456789
+
+client = tda_rest_helper.get_client()
+check( 'tda_rest_helper.get_client()', client.url == url, client.url )
+
+# Requests without the token are refused
+data, err = client.get_quotes( 'MSFT' )
+check( 'get_quotes() before login', err != None and err.startswith('401'), err )
+
+check( 'tdalogin()', tda_gobot_helper.tdalogin('mock') == True and client.authorized() == True )
+
+# Quotes
+last_price = tda_gobot_helper.get_lastprice( 'MSFT', WarnDelayed=False )
+check( 'get_lastprice()', last_price == server.base_price('MSFT'), last_price )
+
+tickers = [ 'T' + str(i) for i in range(250) ]
+quotes	= tda_gobot_helper.get_quotes( ','.join(tickers) )
+check( 'get_quotes() 250 tickers', isinstance(quotes, dict) and sorted(quotes.keys()) == sorted(tickers), len(quotes) )
+
+data, err = client.get_quotes_batch( tickers + ['T0', ''], max_symbols=60, workers=4 )
+check( 'get_quotes_batch()', err == None and sorted(data.keys()) == sorted(tickers), len(data) )
+
+quotes = tda_gobot_helper.get_quote_records( 'MSFT,BADTICKER,AAPL' )
+check( 'get_quote_records()', isinstance(quotes, dict) and sorted(quotes.keys()) == ['AAPL', 'MSFT'] and
+	quotes['MSFT'].last_price == server.base_price('MSFT') and isinstance(quotes['MSFT'].volume, int), len(quotes) if isinstance(quotes, dict) else quotes )
+
+valid = tda_gobot_helper.check_stock_symbol( 'MSFT,BADTICKER,AAPL' )
+check( 'check_stock_symbol()', valid == 'MSFT,AAPL', valid )
+
+# Pricehistory
+ph, epochs = tda_gobot_helper.get_pricehistory( 'MSFT', 'day', 'minute', '1', 2, needExtendedHoursData=True )
+check( 'get_pricehistory()', isinstance(ph, dict) and len(ph['candles']) > 0 and len(epochs) == len(ph['candles']), len(epochs) )
+
+# Orders
+data = tda_gobot_helper.buy_stock_marketprice( 'MSFT', 10, fillwait=True )
+check( 'buy_stock_marketprice()', isinstance(data, dict) and data.get('status') == 'FILLED' and server.positions.get('MSFT') == 10, server.positions )
+
+order_id = data.get('orderId') if isinstance(data, dict) else None
+data = tda_gobot_helper.get_order( order_id, passcode='mock' )
+check( 'get_order()', isinstance(data, dict) and data.get('orderId') == order_id, order_id )
+
+data = tda_gobot_helper.sell_stock_marketprice( 'MSFT', 10, fillwait=True )
+check( 'sell_stock_marketprice()', isinstance(data, dict) and 'MSFT' not in server.positions, server.positions )
+
+data = tda_gobot_helper.short_stock_marketprice( 'AAPL', 5, fillwait=True )
+check( 'short_stock_marketprice()', isinstance(data, dict) and server.positions.get('AAPL') == -5, server.positions )
+
+data, err = client.get_account( 123456789, fields='positions' )
+check( 'get_account()', err == None and len(data['securitiesAccount']['positions']) == 1, err )
+
+data = tda_gobot_helper.buytocover_stock_marketprice( 'AAPL', 5, fillwait=True )
+check( 'buytocover_stock_marketprice()', isinstance(data, dict) and 'AAPL' not in server.positions, server.positions )
+
+data = tda_gobot_helper.get_option_chains( 'MSFT' )
+check( 'get_option_chains()', isinstance(data, dict) and data.get('status') == 'SUCCESS' )
+
+# Watchlists
+try:
+	import tda_api_helper
+
+	server.watchlists['1'] = { 'name': 'mock-list', 'watchlistId': '1', 'watchlistItems': [] }
+	watchlist_id = tda_api_helper.get_watchlist_id( tda_account=123456789, watchlist_name='mock-list' )
+	check( 'get_watchlist_id()', watchlist_id == '1', watchlist_id )
+
+	ret = tda_api_helper.delete_watchlist_byname( tda_account=123456789, watchlist_name='mock-list' )
+	check( 'delete_watchlist_byname()', ret == True and server.watchlists == {} )
+
+except ImportError as e:
+	print( '{0:50} {1:6} {2}'.format('tda_api_helper', 'SKIP', str(e)) )
+
+# Concurrent requests reuse the pooled connections
+connections	= server.stats['connections']
+workers		= 8
+with concurrent.futures.ThreadPoolExecutor( max_workers=workers ) as executor:
+	results = list( executor.map(lambda t: client.get_quotes(t), tickers[:100]) )
+
+connections = server.stats['connections'] - connections
+check( 'connection reuse', all(err == None for data, err in results) and connections <= workers, str(connections) + ' new connections for 100 requests' )
+
+# Timeouts are enforced without a thread per call
+slow		= tda_mock_helper.MockServer( token=args.token, delay=2 )
+slow_client	= tda_rest_helper.RestClient( url=slow.start(), token=args.token )
+start		= time.time()
+try:
+	slow_client.get_quotes( 'MSFT', timeout=0.5 )
+	check( 'read timeout', False, 'request did not time out' )
+
+except tda_rest_helper.Timeout:
+	check( 'read timeout', time.time() - start < 1.5, str(round(time.time() - start, 2)) + 's' )
+
+slow.stop()
+
+# The rate limiter keeps the request rate under the server's limit
+limited		= tda_mock_helper.MockServer( token=args.token, rate=20, per=1 )
+limited_client	= tda_rest_helper.RestClient( url=limited.start(), token=args.token, limits={ 'data': (15, 1, 1), 'orders': (15, 1, 1) } )
+with concurrent.futures.ThreadPoolExecutor( max_workers=workers ) as executor:
+	results = list( executor.map(lambda t: limited_client.get_quotes(t), tickers[:45]) )
+
+check( 'rate limiter', all(err == None for data, err in results) and limited.stats['rate_limited'] == 0, str(limited.stats) )
+
+# GET requests are retried after a 429
+unlimited_client = tda_rest_helper.RestClient( url=limited.url, token=args.token, limits={ 'data': (1000, 1, 1000) } )
+time.sleep(1)
+results = [ unlimited_client.get_quotes(t) for t in tickers[:30] ]
+check( '429 retry', all(err == None for data, err in results) and limited.stats['rate_limited'] > 0, str(limited.stats) )
+
+limited.stop()
+server.stop()
+
+print()
+if ( failed > 0 ):
+	print( str(failed) + ' checks failed' )
+	sys.exit(1)
+
+print( 'All checks passed' )
+sys.exit(0)
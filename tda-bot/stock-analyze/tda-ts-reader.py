@@ -4,16 +4,22 @@
 #  collect data about each trade (bid/ask/volume/etc.) and dump it to a file to use
 #  later for backtesting.
 #
-# This is a time-consuming process to parse and organize an entire day of level2 and
-#  time/sales data, so we use this tool to perform that process once so that the
-#  backtesting tool(s) can consume the data quickly.
+# Matching each trade to the Level2 data is done with a single np.searchsorted() pass
+#  over the sorted Level2 timestamps, and the best bid/ask is calculated once for each
+#  Level2 snapshot, so a full day of data can be processed in a few seconds. Multiple days
+#  can be processed in parallel with --days, in which case 'DAY' in --ts_ifile, --l2_ifile
+#  and --ofile is replaced with each day.
 #
 # Example:
 #  $ ./tda-ts-reader.py --ts_ifile TX_LOGS_v2/2022-04-22/SPY_ets-2022-04-22.pickle.xz \
 #                       --l2_ifile TX_LOGS_v2/2022-04-22/SPY_level2-2022-04-22.pickle.xz \
 #                       --ofile ts-processed_2022-04-22.pickle.xz
+#
+#  $ ./tda-ts-reader.py --ts_ifile TX_LOGS_v2/DAY/SPY_ets-DAY.pickle.xz \
+#                       --l2_ifile TX_LOGS_v2/DAY/SPY_level2-DAY.pickle.xz \
+#                       --ofile ts-processed_DAY.pickle.xz --days=2022-04-20,2022-04-21,2022-04-22
 
-import sys, re
+import os, sys, re
 import argparse
 import lzma
 import pickle
@@ -21,195 +27,228 @@ from datetime import datetime
 import pytz
 import numpy as np
 
+import concurrent.futures
+import multiprocessing
 from collections import OrderedDict
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--ts_ifile", help='Time and sales file to import from streaming client (i.e. SPY_ets-2022-04-22.pickle.xz)', required=True, type=str)
 parser.add_argument("--l2_ifile", help='Level2 file to import from streaming client (i.e. SPY_level2-2022-04-22.pickle.xz)', required=True, type=str)
 parser.add_argument("--ofile", help='Output file', required=True, type=str)
+parser.add_argument("--days", help='Process these days, comma-delimited. The string DAY in --ts_ifile, --l2_ifile and --ofile is replaced with each day.', default=None, type=str)
+parser.add_argument("--jobs", help='Number of days to process in parallel (Default: number of CPUs)', type=int, default=os.cpu_count())
 parser.add_argument("--silent", help='Suppress all output and diagnostic messages', action="store_true")
 args = parser.parse_args()
 
 mytimezone = pytz.timezone("US/Eastern")
 
-if ( args.silent == False ):
-	print('Loading data files... ')
-
-try:
-	# Time and sales data file
-	if ( re.search('\.xz$', args.ts_ifile) != None ):
-		with lzma.open(args.ts_ifile, 'rb') as handle:
-			ets = handle.read()
-			ets = pickle.loads(ets)
-
-	else:
-		with open(args.ts_ifile, 'rb') as handle:
-			ets = handle.read()
-			ets = pickle.loads(ets)
-
-	# Level2 data file
-	if ( re.search('\.xz$', args.l2_ifile) != None ):
-		with lzma.open(args.l2_ifile, 'rb') as handle:
-			l2 = handle.read()
-			l2 = pickle.loads(l2)
-
-	else:
-		with open(args.l2_ifile, 'rb') as handle:
-			l2 = handle.read()
-			l2 = pickle.loads(l2)
-
-except Exception as e:
-	if ( args.silent == False ):
-		print('Error opening file: ' + str(e), file=sys.stderr)
 
-	sys.exit(1)
+def load_file(ifile=None):
+	if ( re.search('\.xz$', ifile) != None ):
+		with lzma.open(ifile, 'rb') as handle:
+			return pickle.loads( handle.read() )
+
+	with open(ifile, 'rb') as handle:
+		return pickle.loads( handle.read() )
+
+
+# Find the Level2 snapshot to use for each trade
+# Returns the index into dts for each trade time, or -1 if there is no usable snapshot
+def match_l2(dts=None, trade_times=None):
+
+	# Use the Level2 snapshot with the same timestamp as the trade if there is one,
+	#  otherwise use the first snapshot after the trade
+	idx	= np.searchsorted( dts, trade_times, side='left' )
+	found	= idx < len(dts)
+	exact	= np.zeros( len(trade_times), dtype=bool )
+	exact[found] = ( dts[idx[found]] == trade_times[found] )
+
+	idx	= np.where( exact, idx, np.searchsorted(dts, trade_times, side='right') )
+	found	= idx < len(dts)
 
+	# The data is probably not reliable if the timestamps are too far apart
+	match		= np.full( len(trade_times), -1, dtype=np.int64 )
+	close		= np.zeros( len(trade_times), dtype=bool )
+	close[found]	= ( np.abs(dts[idx[found]] - trade_times[found]) <= 1000 )
+	match[close]	= idx[close]
 
-# Process time and sales data
-if ( args.silent == False ):
-	print('Processing all time and sales data. This may take some time...')
+	return match
 
-# Find all the available datetimes in the Level2 data
-# We will use this to match timestamps between the Level2 data and the
-#  time/sales data
-dts = list( l2.keys() )
-for i in range( len(dts) ):
-	dts[i] = int( dts[i] )
-dts.sort()
-dts = np.array( dts )
 
-ets_data = OrderedDict()
-for tx in ets:
+def process_ets(ets=None, l2=None):
 
-	trade_time	= int( tx['TRADE_TIME'] )
-	last_price	= float( tx['LAST_PRICE'] )
-	last_size	= float( tx['LAST_SIZE'] )
+	# Find all the available datetimes in the Level2 data
+	# We will use this to match timestamps between the Level2 data and the
+	#  time/sales data
+	keys	= sorted( l2.keys(), key=int )
+	dts	= np.array( [ int(dt) for dt in keys ], dtype=np.int64 )
+
+	# Best bid/ask for each Level2 snapshot
+	best_bid = np.full( len(keys), np.nan )
+	best_ask = np.full( len(keys), np.nan )
+	for i, dt in enumerate(keys):
+		if ( len(l2[dt]['bids']) > 0 ):
+			best_bid[i] = max( l2[dt]['bids'].keys() )
+		if ( len(l2[dt]['asks']) > 0 ):
+			best_ask[i] = min( l2[dt]['asks'].keys() )
 
 	# Time and sales stream does not include bid/ask prices, only last_price and volume.
 	#  Therefore, we will need to find the closest level2 entry that matches the data
 	#  from the time and sales stream so we can determine volume of trades that were
 	#  matched closer to bid or ask (or neutral).
-	#
-	#  The ability to determine if a trade was made closer to the bid or ask is essential,
-	#   but unfortunately this is a time-consuming operation when processing a full day of
-	#   time and sale data.
-	cur_bid_price	= None
-	cur_ask_price	= None
-	if ( trade_time in l2 ):
-		cur_bid_price = max( l2[trade_time]['bids'].keys() )
-		cur_ask_price = min( l2[trade_time]['asks'].keys() )
-
-	else:
+	trade_times	= np.array( [ int(tx['TRADE_TIME']) for tx in ets ], dtype=np.int64 )
+	match		= match_l2( dts, trade_times )
 
-		try:
-			# Find the smallest timestamp from Level 2 data that matches the timestamp
-			#  from time and sales without going above the timestamp from time and sales
-			dt = dts[dts > trade_time].min()
+	ets_data = OrderedDict()
+	for i, tx in enumerate(ets):
+		if ( match[i] == -1 ):
+			continue
 
-		except:
-			# Fall back to just find the closest timestamp from Level 2 data that matches
-			#  the timestamp from time and sales
-			dt = (np.abs(dts - trade_time)).argmin()
+		trade_time	= int( trade_times[i] )
+		last_price	= float( tx['LAST_PRICE'] )
+		last_size	= float( tx['LAST_SIZE'] )
+
+		cur_bid_price	= best_bid[match[i]]
+		cur_ask_price	= best_ask[match[i]]
+
+		# We now have:
+		#   - trade_time
+		#   - last_price
+		#   - last_size
+		#   - bid_price
+		#   - ask_price
+		if trade_time not in ets_data:
+			num_trades		= 1
+			sum_sizes		= 0
+			num_sizes		= 0
+			dt_string		= datetime.fromtimestamp(trade_time/1000, tz=mytimezone).strftime('%Y-%m-%d %H:%M:%S')
+
+			ets_data[trade_time]	= {	'txs':			[],
+							'num_trades':		0,
+							'avg_size':		0,
+							'uptick_vol':		0,
+							'downtick_vol':		0,
+							'neutral_vol':		0,
+							'high_price':		0,
+							'low_price':		9999999,
+							'span_trade_up':	0,
+							'span_trade_down':	0,
+							'span_trade_up_vol':	0,
+							'span_trade_down_vol':	0 }
+
+		else:
+			num_trades += 1
+
+		# Keep each TX separated with its own parameters
+		ets_data[trade_time]['txs'].append( {	'dt_string':		dt_string,
+							'trade_time':		trade_time,
+							'size':			last_size,
+							'at_ask':		0,
+							'at_bid':		0,
+							'price':		last_price } )
+
+		# Get the uptick/downticks
+		# It seems some algos ensure the trade settles at 0.0001 away from the bid or ask
+		#  price, I suppose to make the tx appear that it occurred just within the bid/ask
+		#  zone. So check this so we can be sure include those as at_bid or at_ask instead
+		#  of neutral.
+		if ( last_price <= cur_bid_price or abs(last_price - cur_bid_price) == 0.0001 ):
+			ets_data[trade_time]['txs'][-1]['at_bid']	= 1
+			ets_data[trade_time]['downtick_vol']		+= last_size
+
+		elif ( last_price >= cur_ask_price or abs(last_price - cur_ask_price) == 0.0001 ):
+			ets_data[trade_time]['txs'][-1]['at_ask']	= 1
+			ets_data[trade_time]['uptick_vol']		+= last_size
+
+		else:
+			ets_data[trade_time]['neutral_vol']		+= last_size
+
+		sum_sizes += last_size
+		num_sizes += 1
+		ets_data[trade_time]['num_trades']	= num_trades
+		ets_data[trade_time]['avg_size']	= sum_sizes / num_sizes
+
+		if ( re.search('^\d{1,}\.\d{3,}$', str(last_price)) != None ):
+			if ( last_price <= cur_bid_price ):
+				ets_data[trade_time]['span_trade_down']		+= 1
+				ets_data[trade_time]['span_trade_down_vol']	+= last_size
+
+			elif ( last_price >= cur_ask_price ):
+				ets_data[trade_time]['span_trade_up']		+= 1
+				ets_data[trade_time]['span_trade_up_vol']	+= last_size
+
+		# Get the high/low candle
+		if ( last_price < ets_data[trade_time]['low_price'] ):
+			 ets_data[trade_time]['low_price'] = last_price
+
+		if ( last_price > ets_data[trade_time]['high_price'] ):
+			ets_data[trade_time]['high_price'] = last_price
+
+	return ets_data
+
+
+# Process one day of time and sales data and write the results to ofile
+def process_day(ts_ifile=None, l2_ifile=None, ofile=None):
 
-		# The data is probably not reliable if the timestamps are too far apart
-		if ( abs(dt - trade_time) > 1000 ):
-			continue
+	if ( args.silent == False ):
+		print('Loading data files ' + str(ts_ifile) + ', ' + str(l2_ifile) + '...')
+
+	try:
+		# Time and sales data file
+		ets = load_file( ts_ifile )
 
-		cur_bid_price = max( l2[dt]['bids'].keys() )
-		cur_ask_price = min( l2[dt]['asks'].keys() )
-
-	# We now have:
-	#   - trade_time
-	#   - last_price
-	#   - last_size
-	#   - bid_price
-	#   - ask_price
-	if trade_time not in ets_data:
-		num_trades		= 1
-		all_sizes		= []
-		dt_string		= datetime.fromtimestamp(trade_time/1000, tz=mytimezone).strftime('%Y-%m-%d %H:%M:%S')
-
-		ets_data[trade_time]	= {	'txs':			[],
-						'num_trades':		0,
-						'avg_size':		0,
-						'uptick_vol':		0,
-						'downtick_vol':		0,
-						'neutral_vol':		0,
-						'high_price':		0,
-						'low_price':		9999999,
-						'span_trade_up':	0,
-						'span_trade_down':	0,
-						'span_trade_up_vol':	0,
-						'span_trade_down_vol':	0 }
-
-	else:
-		num_trades += 1
-
-	# Keep each TX separated with its own parameters
-	ets_data[trade_time]['txs'].append( {	'dt_string':		dt_string,
-						'trade_time':		trade_time,
-						'size':			0,
-						'at_ask':		0,
-						'at_bid':		0,
-						'price':		0 } )
-
-	ets_data[trade_time]['txs'][-1]['size']		= last_size
-	ets_data[trade_time]['txs'][-1]['price']	= last_price
-
-	# Get the uptick/downticks
-	# It seems some algos ensure the trade settles at 0.0001 away from the bid or ask
-	#  price, I suppose to make the tx appear that it occurred just within the bid/ask
-	#  zone. So check this so we can be sure include those as at_bid or at_ask instead
-	#  of neutral.
-	if ( last_price <= cur_bid_price or abs(last_price - cur_bid_price) == 0.0001 ):
-		ets_data[trade_time]['txs'][-1]['at_bid']	= 1
-		ets_data[trade_time]['downtick_vol']		+= last_size
-
-	elif ( last_price >= cur_ask_price or abs(last_price - cur_ask_price) == 0.0001 ):
-		ets_data[trade_time]['txs'][-1]['at_ask']	= 1
-		ets_data[trade_time]['uptick_vol']		+= last_size
-
-	else:
-		ets_data[trade_time]['neutral_vol']		+= last_size
-
-
-	all_sizes.append( last_size )
-	ets_data[trade_time]['num_trades']	= num_trades
-	ets_data[trade_time]['avg_size']	= sum( all_sizes ) / len( all_sizes )
-
-	if ( re.search('^\d{1,}\.\d{3,}$', str(last_price)) != None ):
-		if ( last_price <= cur_bid_price ):
-			ets_data[trade_time]['span_trade_down']		+= 1
-			ets_data[trade_time]['span_trade_down_vol']	+= last_size
-
-		elif ( last_price >= cur_ask_price ):
-			ets_data[trade_time]['span_trade_up']		+= 1
-			ets_data[trade_time]['span_trade_up_vol']	+= last_size
-
-	# Get the high/low candle
-	if ( last_price < ets_data[trade_time]['low_price'] ):
-		 ets_data[trade_time]['low_price'] = last_price
-
-	if ( last_price > ets_data[trade_time]['high_price'] ):
-		ets_data[trade_time]['high_price'] = last_price
-
-# Done, write out results.
-if ( args.silent == False ):
-	print('Writing out results to ' + str(args.ofile) + '...')
-try:
-	if ( re.search('\.xz$', args.ofile) == None ):
-		args.ofile = args.ofile + '.xz'
-
-	with lzma.open(args.ofile, 'wb') as handle:
-		pickle.dump(ets_data, handle)
-		handle.flush()
-
-except Exception as e:
+		# Level2 data file
+		l2 = load_file( l2_ifile )
+
+	except Exception as e:
+		if ( args.silent == False ):
+			print('Error opening file: ' + str(e), file=sys.stderr)
+
+		return False
+
+	# Process time and sales data
+	ets_data = process_ets( ets, l2 )
+
+	# Done, write out results.
 	if ( args.silent == False ):
-		print('Error opening file for writing: ' + str(e), file=sys.stderr)
+		print('Writing out results to ' + str(ofile) + '...')
+	try:
+		if ( re.search('\.xz$', ofile) == None ):
+			ofile = ofile + '.xz'
+
+		with lzma.open(ofile, 'wb') as handle:
+			pickle.dump(ets_data, handle)
+			handle.flush()
+
+	except Exception as e:
+		if ( args.silent == False ):
+			print('Error opening file for writing: ' + str(e), file=sys.stderr)
 
-	sys.exit(1)
+		return False
 
+	return True
+
+
+if ( args.days == None ):
+	jobs = [ (args.ts_ifile, args.l2_ifile, args.ofile) ]
+else:
+	jobs = [ ( re.sub('DAY', day, args.ts_ifile), re.sub('DAY', day, args.l2_ifile), re.sub('DAY', day, args.ofile) ) for day in args.days.split(',') ]
+
+if ( len(jobs) == 1 ):
+	sys.exit( 0 if process_day(*jobs[0]) == True else 1 )
+
+exit_code = 0
+with concurrent.futures.ProcessPoolExecutor( max_workers=max(1, min(args.jobs, len(jobs))), mp_context=multiprocessing.get_context('fork') ) as executor:
+	futures = [ executor.submit(process_day, *job) for job in jobs ]
+
+	for future in concurrent.futures.as_completed( futures ):
+		try:
+			if ( future.result() != True ):
+				exit_code = 1
 
-sys.exit(0)
+		except Exception as e:
+			if ( args.silent == False ):
+				print('Caught Exception: ' + str(e), file=sys.stderr)
+			exit_code = 1
 
+sys.exit(exit_code)
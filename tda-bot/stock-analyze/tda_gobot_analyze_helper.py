@@ -1,6 +1,8 @@
 #!/usr/bin/python3 -u
 
 import os, sys, time, re
+import pickle
+import lzma
 from collections import OrderedDict
 
 from datetime import datetime, timedelta
@@ -12,6 +14,34 @@ parent_path = os.path.dirname( os.path.realpath(__file__) )
 sys.path.append(parent_path + '/../')
 import tda_gobot_helper
 import tda_algo_helper
+import tda_candle_helper
+
+
+# Raw (uncompressed) pickle data for input files, keyed by filename
+# gobot-test.py preloads the input files before forking its worker processes, so that
+#  every scenario can unpickle its own copy of the data without reading it from disk again.
+ifile_cache = {}
+
+def preload_ifile(ifile=None):
+	if ( ifile == None ):
+		raise ValueError('preload_ifile(): ifile is empty')
+
+	if ( ifile not in ifile_cache ):
+		if ( re.search('\.xz$', ifile) != None ):
+			with lzma.open(ifile, 'rb') as handle:
+				ifile_cache[ifile] = handle.read()
+		else:
+			with open(ifile, 'rb') as handle:
+				ifile_cache[ifile] = handle.read()
+
+	return True
+
+# Return the data from pickle file ifile
+# Files ending in .xz are decompressed with lzma. The raw data is kept in ifile_cache,
+#  so the file is only read once per process.
+def read_ifile(ifile=None):
+	preload_ifile(ifile)
+	return pickle.loads( ifile_cache[ifile] )
 
 
 # Like stochrsi_analyze(), but sexier
@@ -136,6 +166,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 	debug				= False		if ('debug' not in params) else params['debug']
 	debug_all			= False		if ('debug_all' not in params) else params['debug_all']
+	vectorized			= False		if ('vectorized' not in params) else params['vectorized']
 
 	# Trade exit parameters
 	incr_threshold			= 1		if ('incr_threshold' not in params) else params['incr_threshold']
@@ -439,7 +470,15 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 			return False
 
 	# 5-minute candles
-	pricehistory_5m = tda_gobot_helper.translate_1m(pricehistory=pricehistory, candle_type=5)
+	# The backtest maps 1-minute candles to 5-minute candles by position (i.e. int(idx/5)),
+	#  so group every 5 candles instead of aligning them to the clock
+	pricehistory_5m = tda_gobot_helper.translate_1m(pricehistory=pricehistory, candle_type=5, align=False)
+
+	# Local day, minute of the day and market hours of each 1-minute candle, so that the
+	#  loops below do not need to convert each candle's datetime to US/Eastern
+	sessions	= tda_candle_helper.get_sessions( pricehistory )
+	day_str		= sessions.day_str.tolist()
+	cndl_minute	= sessions.minute
 
 	# Daily candles
 	if ( daily_ph == None ):
@@ -849,8 +888,8 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 	# Calculate daily volume from the 1-minute candles that we have
 	if ( check_volume == True ):
 		daily_volume = OrderedDict()
-		for key in pricehistory['candles']:
-			day = datetime.fromtimestamp(float(key['datetime'])/1000, tz=mytimezone).strftime('%Y-%m-%d')
+		for idx,key in enumerate(pricehistory['candles']):
+			day = day_str[idx]
 			if day not in daily_volume:
 				daily_volume[day] = { 'volume': int(key['volume']), 'trade': True }
 			else:
@@ -912,49 +951,36 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 	# Calculate vwap
 	if ( with_vwap == True or use_vwap == True or no_use_resistance == False ):
 		vwap_vals = OrderedDict()
-		days = OrderedDict()
-
-		# Create a dict containing all the days and timestamps for which we need vwap data
-		prev_day = ''
-		prev_timestamp = ''
-		for key in pricehistory['candles']:
-
-			# I have seen single candles delivered from API that fall outside regular market hours for
-			#  some reason. Use this to filter them out.
-			day = datetime.fromtimestamp(key['datetime']/1000, tz=mytimezone)
-			if ( tda_gobot_helper.ismarketopen_US(date=day, check_day_only=True) == False ):
-				continue
 
-			day = day.strftime('%Y-%m-%d')
-			if day not in days:
-				days[day] = { 'start': key['datetime'], 'end': '', 'timestamps': [] }
-				if ( prev_day != '' ):
-					days[prev_day]['end'] = prev_timestamp
+		# Calculate the VWAP data for all days in one pass
+		try:
+			vwap, vwap_up, vwap_down = tda_algo_helper.get_vwap_all(pricehistory, num_stddev=2)
+			session, days = tda_algo_helper.get_session_index( sessions, session_start_hour=1 )
 
-			prev_day = day
-			prev_timestamp = key['datetime']
-			days[day]['timestamps'].append(key['datetime'])
+		except Exception as e:
+			print('Error: stochrsi_analyze_new(' + str(ticker) + '): get_vwap(): ' + str(e), file=sys.stderr)
+			return False
 
-		days[day]['end'] = prev_timestamp
+		if ( isinstance(vwap, bool) and vwap == False ):
+			print('Error: stochrsi_analyze_new(' + str(ticker) + '): get_vwap() returned False', file=sys.stderr)
+			return False
 
-		# Calculate the VWAP data for each day in days{}
-		for key in days:
-			try:
-				vwap, vwap_up, vwap_down = tda_algo_helper.get_vwap(pricehistory, day=key, end_timestamp=days[key]['end'], num_stddev=2)
+		# I have seen single candles delivered from API that fall outside regular market hours for
+		#  some reason. Use this to filter them out.
+		market_days = []
+		for day in days:
+			day = mytimezone.localize( datetime.strptime(day, '%Y-%m-%d') )
+			market_days.append( tda_gobot_helper.ismarketopen_US(date=day, check_day_only=True) )
 
-			except Exception as e:
-				print('Error: stochrsi_analyze_new(' + str(ticker) + '): get_vwap(): ' + str(e), file=sys.stderr)
-				return False
-
-			if ( len(vwap) != len(days[key]['timestamps']) ):
-				print('WARNING: len(vwap) != len(days[key][timestamps]): ' + str(len(vwap)) + ', ' + str(len(days[key]['timestamps'])))
+		for idx,key in enumerate(pricehistory['candles']):
+			if ( session[idx] < 0 or market_days[session[idx]] == False ):
+				continue
 
-			for idx,val in enumerate(vwap):
-				vwap_vals.update( { days[key]['timestamps'][idx]: {
-							'vwap': float(val),
-							'vwap_up': float(vwap_up[idx]),
-							'vwap_down': float(vwap_down[idx]) }
-						} )
+			vwap_vals.update( { key['datetime']: {
+						'vwap': float(vwap[idx]),
+						'vwap_up': float(vwap_up[idx]),
+						'vwap_down': float(vwap_down[idx]) }
+					} )
 
 	# Resistance / Support
 	if ( no_use_resistance == False or use_pdc == True or use_natr_resistance == True or lod_hod_check == True ):
@@ -1033,17 +1059,20 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 			day_stats[today]['pivot_s2']    = day_stats[today]['pivot'] - ( day_stats[today]['pdh'] - day_stats[today]['pdl'] )
 
 		# We still need to iterate over the 1-minute candles to ensure we have all the info we need
+		# The previous trading day only depends on the day, so only look it up once for each day
+		yesterdays = {}
 		for idx,key in enumerate( pricehistory['candles'] ):
-			today_dt	= datetime.fromtimestamp(int(key['datetime'])/1000, tz=mytimezone)
-			yesterday_dt	= today_dt - timedelta(days=1)
-			yesterday_dt	= tda_gobot_helper.fix_timestamp(yesterday_dt, check_day_only=True)
+			today = day_str[idx]
+			if ( today not in yesterdays ):
+				yesterday_dt		= sessions.date(idx) - timedelta(days=1)
+				yesterday_dt		= tda_gobot_helper.fix_timestamp(yesterday_dt, check_day_only=True)
+				yesterdays[today]	= yesterday_dt.strftime('%Y-%m-%d')
 
-			today		= today_dt.strftime('%Y-%m-%d')
-			yesterday	= yesterday_dt.strftime('%Y-%m-%d')
+			yesterday = yesterdays[today]
 
 			# Fill in the 1-minute pricehistory index
 			if ( today in day_stats ):
-				if ( tda_gobot_helper.ismarketopen_US(today_dt, safe_open=False) == True ):
+				if ( sessions.regular[idx] == True ):
 					if ( float(key['high']) >= day_stats[today]['high'] ):
 						day_stats[today]['high_idx'] = idx
 					elif ( float(key['low']) <= day_stats[today]['low'] ):
@@ -1053,7 +1082,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				#  as retrieved from TDA isn't very accurate, so instead just store
 				#  the index of the first 1min candle so we can use the open price
 				#  from that instead.
-				if ( today_dt.strftime('%-H:%-M') == '9:30' ):
+				if ( cndl_minute[idx] == 570 ):
 					day_stats[today]['open_idx'] = idx
 
 				if ( yesterday in day_stats ):
@@ -1956,7 +1985,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 
 	# StochRSI/StochMFI long algorithm
-	def get_stoch_signal_long(cur_k=0, cur_d=0, prev_k=0, prev_d=0, stoch_signal=False, crossover_signal=False, threshold_signal=False, final_signal=False):
+	def get_stoch_signal_long(cur_k=0, cur_d=0, prev_k=0, prev_d=0, stoch_signal=False, crossover_signal=False, threshold_signal=False, final_signal=False, masks=None):
 
 		nonlocal rsi_low_limit				; stoch_low_limit		= rsi_low_limit
 		nonlocal rsi_high_limit				; stoch_high_limit		= rsi_high_limit
@@ -1966,6 +1995,11 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		nonlocal nocrossover
 		nonlocal crossover_only
 
+		# Vectorized mode - the conditions below were precomputed by get_stoch_masks()
+		nonlocal idx
+		if ( masks != None and masks['valid'][idx] == True ):
+			return get_stoch_signal_masks( masks, stoch_signal, crossover_signal, threshold_signal, final_signal )
+
 		# Signal the primary stoch signal if K and D cross the low limit threshold
 		if ( cur_k < stoch_low_limit and cur_d < stoch_low_limit ):
 			stoch_signal = True
@@ -2000,7 +2034,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 
 	# StochRSI/StochMFI short algorithm
-	def get_stoch_signal_short(cur_k=0, cur_d=0, prev_k=0, prev_d=0, stoch_signal=False, crossover_signal=False, threshold_signal=False, final_signal=False):
+	def get_stoch_signal_short(cur_k=0, cur_d=0, prev_k=0, prev_d=0, stoch_signal=False, crossover_signal=False, threshold_signal=False, final_signal=False, masks=None):
 
 		nonlocal rsi_low_limit				; stoch_low_limit		= rsi_low_limit
 		nonlocal rsi_high_limit				; stoch_high_limit		= rsi_high_limit
@@ -2010,6 +2044,11 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		nonlocal nocrossover
 		nonlocal crossover_only
 
+		# Vectorized mode - the conditions below were precomputed by get_stoch_masks()
+		nonlocal idx
+		if ( masks != None and masks['valid'][idx] == True ):
+			return get_stoch_signal_masks( masks, stoch_signal, crossover_signal, threshold_signal, final_signal )
+
 		# Signal the primary stoch signal if K and D cross the high limit threshold
 		if ( cur_k > stoch_high_limit and cur_d > stoch_high_limit ):
 			stoch_signal = True
@@ -2042,6 +2081,76 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		return stoch_signal, crossover_signal, threshold_signal, final_signal
 
 
+	# Vectorized StochRSI/StochMFI algorithm
+	# Precompute the conditions tested by get_stoch_signal_long()/get_stoch_signal_short() for every candle
+	#  as boolean arrays. cur_idx contains the index into k/d for each candle in pricehistory (the previous
+	#  value is always cur_idx-1). Candles where either index is out of range are marked invalid and are
+	#  processed by the scalar algorithm instead.
+	def get_stoch_masks(k=[], d=[], cur_idx=None, direction='long'):
+
+		nonlocal rsi_low_limit				; stoch_low_limit		= rsi_low_limit
+		nonlocal rsi_high_limit				; stoch_high_limit		= rsi_high_limit
+		nonlocal stochrsi_offset			; stoch_offset			= stochrsi_offset
+		nonlocal stochrsi_default_low_limit		; stoch_default_low_limit	= stochrsi_default_low_limit
+		nonlocal stochrsi_default_high_limit		; stoch_default_high_limit	= stochrsi_default_high_limit
+
+		k	= np.array( k, dtype=np.float64 )
+		d	= np.array( d, dtype=np.float64 )
+		cur_idx	= np.array( cur_idx, dtype=np.int64 )
+
+		valid	= (cur_idx - 1 >= -len(k)) & (cur_idx < len(k)) & (cur_idx - 1 >= -len(d)) & (cur_idx < len(d))
+		cur_idx	= np.where( valid, cur_idx, 1 )
+
+		cur_k	= k[cur_idx]
+		prev_k	= k[cur_idx - 1]
+		cur_d	= d[cur_idx]
+		prev_d	= d[cur_idx - 1]
+
+		if ( direction == 'long' ):
+			zone		= (cur_k < stoch_low_limit) & (cur_d < stoch_low_limit)
+			crossover	= (prev_k < prev_d) & (cur_k >= cur_d)
+			uncross		= (prev_k > prev_d) & (cur_k <= cur_d)
+			threshold	= (prev_k < stoch_default_low_limit) & (cur_k > prev_k) & (cur_k >= stoch_default_low_limit)
+			offset		= (cur_k - cur_d >= stoch_offset)
+
+		else:
+			zone		= (cur_k > stoch_high_limit) & (cur_d > stoch_high_limit)
+			crossover	= (prev_k > prev_d) & (cur_k <= cur_d)
+			uncross		= (prev_k < prev_d) & (cur_k >= cur_d)
+			threshold	= (prev_k > stoch_default_high_limit) & (cur_k < prev_k) & (cur_k <= stoch_default_high_limit)
+			offset		= (cur_d - cur_k >= stoch_offset)
+
+		return { 'valid': valid, 'zone': zone, 'crossover': crossover, 'uncross': uncross, 'threshold': threshold, 'offset': offset }
+
+
+	# Apply the conditions from get_stoch_masks() for the current candle to the stoch signal state
+	def get_stoch_signal_masks(masks=None, stoch_signal=False, crossover_signal=False, threshold_signal=False, final_signal=False):
+
+		nonlocal nocrossover
+		nonlocal crossover_only
+		nonlocal idx
+
+		if ( masks['zone'][idx] == True ):
+			stoch_signal = True
+			if ( masks['crossover'][idx] == True ):
+				crossover_signal = True
+
+		if ( crossover_signal == True and masks['uncross'][idx] == True ):
+			crossover_signal = False
+
+		if ( stoch_signal == True ):
+			if ( masks['threshold'][idx] == True ):
+				threshold_signal = True
+
+			if ( (crossover_signal == True and nocrossover == False) or
+			     (threshold_signal == True and crossover_only == False) ):
+
+				if ( masks['offset'][idx] == True ):
+					final_signal = True
+
+		return stoch_signal, crossover_signal, threshold_signal, final_signal
+
+
 	# Check orientation of stacked moving averages
 	def check_stacked_ma(s_ma=[], affinity=None):
 
@@ -2080,47 +2189,90 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 
 	# Choppiness Index
-	def get_chop_signal(simple=False, prev_chop=-1, cur_chop=-1, chop_init_signal=False, chop_signal=False):
+	def get_chop_signal(simple=False, prev_chop=-1, cur_chop=-1, chop_init_signal=False, chop_signal=False, masks=None):
 
 		nonlocal chop_high_limit
 		nonlocal chop_low_limit
 		nonlocal default_chop_high_limit
+		nonlocal idx
+
+		# Vectorized mode - the conditions below were precomputed by get_chop_masks()
+		if ( masks != None and masks['valid'][idx] == True ):
+			in_range	= masks['in_range'][idx]
+			out_range	= masks['out_range'][idx]
+			crossover	= masks['crossover'][idx]
+			below_default	= masks['below_default'][idx]
+			above_default	= masks['above_default'][idx]
+			reversal	= masks['reversal'][idx]
+
+		else:
+			in_range	= ( cur_chop < chop_high_limit and cur_chop > chop_low_limit )
+			out_range	= ( cur_chop > chop_high_limit or cur_chop < chop_low_limit )
+			crossover	= ( prev_chop > chop_high_limit and cur_chop <= chop_high_limit )
+			below_default	= ( cur_chop <= default_chop_high_limit )
+			above_default	= ( cur_chop > default_chop_high_limit )
+			reversal	= ( prev_chop < chop_low_limit and cur_chop < chop_low_limit and cur_chop > prev_chop )
 
 		if ( simple == True ):
 			# Chop simple algo can be used as a weak signal to help confirm trendiness,
 			#  but no crossover from high->low is required
-			if ( cur_chop < chop_high_limit and cur_chop > chop_low_limit ):
+			if ( in_range == True ):
 				chop_init_signal = True
 				chop_signal = True
-			elif ( cur_chop > chop_high_limit or cur_chop < chop_low_limit ):
+			elif ( out_range == True ):
 				chop_init_signal = False
 				chop_signal = False
 
 		else:
-			if ( prev_chop > chop_high_limit and cur_chop <= chop_high_limit ):
+			if ( crossover == True ):
 				chop_init_signal = True
 
 			if ( chop_init_signal == True and chop_signal == False ):
-				if ( cur_chop <= default_chop_high_limit ):
+				if ( below_default == True ):
 					chop_signal = True
 
 			if ( chop_signal == True ):
-				if ( cur_chop > default_chop_high_limit ):
+				if ( above_default == True ):
 					chop_init_signal = False
 					chop_signal = False
 
-				elif ( prev_chop < chop_low_limit and cur_chop < chop_low_limit ):
-					if ( cur_chop > prev_chop ):
-						# Trend may be reversing, cancel the signal
-						chop_init_signal = False
-						chop_signal = False
+				elif ( reversal == True ):
+					# Trend may be reversing, cancel the signal
+					chop_init_signal = False
+					chop_signal = False
 
 		return chop_init_signal, chop_signal
 
 
+	# Vectorized Choppiness Index
+	# Precompute the conditions tested by get_chop_signal() for every candle. See get_stoch_masks().
+	def get_chop_masks(chop=[], cur_idx=None):
+
+		nonlocal chop_high_limit
+		nonlocal chop_low_limit
+		nonlocal default_chop_high_limit
+
+		chop	= np.array( chop, dtype=np.float64 )
+		cur_idx	= np.array( cur_idx, dtype=np.int64 )
+
+		valid	= (cur_idx - 1 >= -len(chop)) & (cur_idx < len(chop))
+		cur_idx	= np.where( valid, cur_idx, 1 )
+
+		cur_chop	= chop[cur_idx]
+		prev_chop	= chop[cur_idx - 1]
+
+		return { 'valid':		valid,
+			 'in_range':		(cur_chop < chop_high_limit) & (cur_chop > chop_low_limit),
+			 'out_range':		(cur_chop > chop_high_limit) | (cur_chop < chop_low_limit),
+			 'crossover':		(prev_chop > chop_high_limit) & (cur_chop <= chop_high_limit),
+			 'below_default':	(cur_chop <= default_chop_high_limit),
+			 'above_default':	(cur_chop > default_chop_high_limit),
+			 'reversal':		(prev_chop < chop_low_limit) & (cur_chop < chop_low_limit) & (cur_chop > prev_chop) }
+
+
 	# Bollinger Bands and Keltner Channel crossover
 	def bbands_kchannels(pricehistory=None, simple=False, cur_bbands=(0,0,0), prev_bbands=(0,0,0), cur_kchannel=(0,0,0), prev_kchannel=(0,0,0), bbands_roc=None,
-				bbands_kchan_init_signal=False, bbands_roc_threshold_signal=False, bbands_kchan_crossover_signal=False, bbands_kchan_signal=False, debug=False ):
+				bbands_kchan_init_signal=False, bbands_roc_threshold_signal=False, bbands_kchan_crossover_signal=False, bbands_kchan_signal=False, debug=False, masks=None ):
 
 		nonlocal bbands_kchannel_offset
 		nonlocal bbands_kchannel_offset_debug
@@ -2144,22 +2296,48 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 		nonlocal bbands_kchan_ma
 
-		# bbands/kchannel (0,0,0) = lower, middle, upper
-		cur_bbands_lower	= round( cur_bbands[0], 3 )
-		cur_bbands_mid		= round( cur_bbands[1], 3 )
-		cur_bbands_upper	= round( cur_bbands[2], 3 )
+		# Vectorized mode - the rounded values, offsets and crossover conditions were precomputed
+		#  by get_bbands_kchannel_masks()
+		vec = False
+		if ( masks != None and masks['valid'][idx] == True ):
+			vec = True
+
+			cur_bbands_lower	= masks['cur_bbands_lower'][idx]
+			cur_bbands_upper	= masks['cur_bbands_upper'][idx]
+			prev_bbands_upper	= masks['prev_bbands_upper'][idx]
 
-		prev_bbands_lower	= round( prev_bbands[0], 3 )
-		prev_bbands_mid		= round( prev_bbands[1], 3 )
-		prev_bbands_upper	= round( prev_bbands[2], 3 )
+			cur_offset		= masks['cur_offset'][idx]
+			prev_offset		= masks['prev_offset'][idx]
 
-		cur_kchannel_lower	= round( cur_kchannel[0], 3 )
-		cur_kchannel_mid	= round( cur_kchannel[1], 3 )
-		cur_kchannel_upper	= round( cur_kchannel[2], 3 )
+			outside			= masks['outside'][idx]
+			inside			= masks['inside'][idx]
+			crossover		= masks['crossover'][idx]
+			crossback		= masks['crossback'][idx]
 
-		prev_kchannel_lower	= round( prev_kchannel[0], 3 )
-		prev_kchannel_mid	= round( prev_kchannel[1], 3 )
-		prev_kchannel_upper	= round( prev_kchannel[2], 3 )
+		else:
+			# bbands/kchannel (0,0,0) = lower, middle, upper
+			cur_bbands_lower	= round( cur_bbands[0], 3 )
+			cur_bbands_mid		= round( cur_bbands[1], 3 )
+			cur_bbands_upper	= round( cur_bbands[2], 3 )
+
+			prev_bbands_lower	= round( prev_bbands[0], 3 )
+			prev_bbands_mid		= round( prev_bbands[1], 3 )
+			prev_bbands_upper	= round( prev_bbands[2], 3 )
+
+			cur_kchannel_lower	= round( cur_kchannel[0], 3 )
+			cur_kchannel_mid	= round( cur_kchannel[1], 3 )
+			cur_kchannel_upper	= round( cur_kchannel[2], 3 )
+
+			prev_kchannel_lower	= round( prev_kchannel[0], 3 )
+			prev_kchannel_mid	= round( prev_kchannel[1], 3 )
+			prev_kchannel_upper	= round( prev_kchannel[2], 3 )
+
+			outside		= ( cur_bbands_lower <= cur_kchannel_lower or cur_bbands_upper >= cur_kchannel_upper )
+			inside		= ( cur_kchannel_lower < cur_bbands_lower or cur_kchannel_upper > cur_bbands_upper )
+			crossover	= ( (prev_kchannel_lower <= prev_bbands_lower and cur_kchannel_lower > cur_bbands_lower) or
+						(prev_kchannel_upper >= prev_bbands_upper and cur_kchannel_upper < cur_bbands_upper) )
+			crossback	= ( (prev_kchannel_lower > prev_bbands_lower and cur_kchannel_lower <= cur_bbands_lower) or
+						(prev_kchannel_upper < prev_bbands_upper and cur_kchannel_upper >= cur_bbands_upper) )
 
 		if ( debug == True and bbands_kchan_init_signal == False and bbands_kchan_signal == False ):
 			bbands_kchannel_offset_debug['cur_squeeze'] = []
@@ -2167,7 +2345,13 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		# Simple algo
 		if ( simple == True ):
 			bbands_kchan_init_signal = True
-			if ( cur_kchannel_lower < cur_bbands_lower and prev_kchannel_lower < prev_bbands_lower ):
+			if ( vec == True ):
+				if ( masks['simple_signal'][idx] == True ):
+					bbands_kchan_signal = True
+				elif ( masks['simple_cancel'][idx] == True ):
+					bbands_kchan_signal = False
+
+			elif ( cur_kchannel_lower < cur_bbands_lower and prev_kchannel_lower < prev_bbands_lower ):
 				prev_offset	= ((prev_kchannel_lower / prev_bbands_lower) - 1) * 100
 				cur_offset	= ((cur_kchannel_lower / cur_bbands_lower) - 1) * 100
 				if ( cur_offset < prev_offset ):
@@ -2184,7 +2368,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		#
 		# If the init signal has been triggered then we can move on and the signal may be canceled later
 		#  either via the buy/short signal or using bbands_kchan_xover_counter below
-		if ( (cur_bbands_lower <= cur_kchannel_lower or cur_bbands_upper >= cur_kchannel_upper) and bbands_kchan_init_signal == False ):
+		if ( outside == True and bbands_kchan_init_signal == False ):
 			bbands_kchan_init_signal	= False
 			bbands_kchan_signal		= False
 			bbands_kchan_crossover_signal	= False
@@ -2197,7 +2381,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 		# Check if the Bollinger Bands have moved inside the Keltner Channel
 		# Signal when they begin to converge
-		if ( cur_kchannel_lower < cur_bbands_lower or cur_kchannel_upper > cur_bbands_upper ):
+		if ( inside == True ):
 
 			# bbands_natr['bbands'] contains the difference between the upper and lower bands
 			if ( bbands_kchan_signal_counter == 0 ):
@@ -2217,8 +2401,9 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 			#  bbands_kchan_init_signal=True sooner, and checking bbands_kchan_squeeze_count in the next
 			#  section. Having it here results in a bit fewer trades, but slightly better trade percentage.
 			#  So this appears to produce just slighly better trades.
-			prev_offset	= abs((prev_kchannel_lower / prev_bbands_lower) - 1) * 100
-			cur_offset	= abs((cur_kchannel_lower / cur_bbands_lower) - 1) * 100
+			if ( vec == False ):
+				prev_offset	= abs((prev_kchannel_lower / prev_bbands_lower) - 1) * 100
+				cur_offset	= abs((cur_kchannel_lower / cur_bbands_lower) - 1) * 100
 			if ( bbands_kchan_signal_counter >= bbands_kchan_squeeze_count and cur_offset >= bbands_kchannel_offset ):
 
 				if ( bbands_kchan_x1_xover == True ):
@@ -2245,8 +2430,9 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 			# An aggressive strategy is to try to get in early when the Bollinger bands begin to widen
 			#  and before they pop out of the Keltner channel
-			prev_offset	= abs((prev_kchannel_lower / prev_bbands_lower) - 1) * 100
-			cur_offset	= abs((cur_kchannel_lower / cur_bbands_lower) - 1) * 100
+			if ( vec == False ):
+				prev_offset	= abs((prev_kchannel_lower / prev_bbands_lower) - 1) * 100
+				cur_offset	= abs((cur_kchannel_lower / cur_bbands_lower) - 1) * 100
 
 			# Monitor the rate-of-change of the bbands to detect a breakout before the crossover happens
 			if ( bbands_kchan_crossover_only == False and bbands_kchan_crossover_signal == False and cur_offset < prev_offset ):
@@ -2283,8 +2469,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 					bbands_kchan_crossover_signal = True
 
 			# Check for crossover
-			if ( (prev_kchannel_lower <= prev_bbands_lower and cur_kchannel_lower > cur_bbands_lower) or
-					(prev_kchannel_upper >= prev_bbands_upper and cur_kchannel_upper < cur_bbands_upper) ):
+			if ( crossover == True ):
 				bbands_kchan_crossover_signal = True
 
 				if ( bbands_roc_strict == False or (bbands_roc_strict == True and bbands_roc_counter >= bbands_roc_count) ):
@@ -2369,10 +2554,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 			#  it is important that we don't just check the current position but check both the previous and
 			#  current positions. Otherwise a lingering upper or lower band could cause the signal to be cancelled
 			#  just because it hasn't yet crossed over, but probably will.
-			if ( bbands_kchan_crossover_signal == True and
-				((prev_kchannel_lower > prev_bbands_lower and cur_kchannel_lower <= cur_bbands_lower) or
-				(prev_kchannel_upper < prev_bbands_upper and cur_kchannel_upper >= cur_bbands_upper)) or
-				bbands_kchan_xover_counter >= 2 ):
+			if ( (bbands_kchan_crossover_signal == True and crossback == True) or bbands_kchan_xover_counter >= 2 ):
 
 				bbands_kchan_init_signal	= False
 				bbands_kchan_signal		= False
@@ -2385,6 +2567,62 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		return bbands_kchan_init_signal, bbands_roc_threshold_signal, bbands_kchan_crossover_signal, bbands_kchan_signal
 
 
+	# Vectorized Bollinger Bands and Keltner Channel crossover
+	# Precompute the rounded bands, the offset between the bbands and kchannel, and the
+	#  stateless conditions used by bbands_kchannels() for every candle. See get_stoch_masks().
+	def get_bbands_kchannel_masks(bbands_cur_idx=None, kchannel_cur_idx=None):
+
+		nonlocal bbands_lower
+		nonlocal bbands_upper
+		nonlocal kchannel_lower
+		nonlocal kchannel_upper
+
+		bb_lower	= np.array( [ round(val, 3) for val in bbands_lower ], dtype=np.float64 )
+		bb_upper	= np.array( [ round(val, 3) for val in bbands_upper ], dtype=np.float64 )
+		kc_lower	= np.array( [ round(val, 3) for val in kchannel_lower ], dtype=np.float64 )
+		kc_upper	= np.array( [ round(val, 3) for val in kchannel_upper ], dtype=np.float64 )
+
+		bb_idx	= np.array( bbands_cur_idx, dtype=np.int64 )
+		kc_idx	= np.array( kchannel_cur_idx, dtype=np.int64 )
+
+		valid	= (bb_idx - 1 >= -len(bb_lower)) & (bb_idx < len(bb_lower)) & (kc_idx - 1 >= -len(kc_lower)) & (kc_idx < len(kc_lower))
+		bb_idx	= np.where( valid, bb_idx, 1 )
+		kc_idx	= np.where( valid, kc_idx, 1 )
+
+		cur_bbands_lower	= bb_lower[bb_idx]
+		cur_bbands_upper	= bb_upper[bb_idx]
+		prev_bbands_lower	= bb_lower[bb_idx - 1]
+		prev_bbands_upper	= bb_upper[bb_idx - 1]
+
+		cur_kchannel_lower	= kc_lower[kc_idx]
+		cur_kchannel_upper	= kc_upper[kc_idx]
+		prev_kchannel_lower	= kc_lower[kc_idx - 1]
+		prev_kchannel_upper	= kc_upper[kc_idx - 1]
+
+		with np.errstate( divide='ignore', invalid='ignore' ):
+			cur_pct		= ((cur_kchannel_lower / cur_bbands_lower) - 1) * 100
+			prev_pct	= ((prev_kchannel_lower / prev_bbands_lower) - 1) * 100
+
+		squeeze = (cur_kchannel_lower < cur_bbands_lower) & (prev_kchannel_lower < prev_bbands_lower)
+
+		return { 'valid':		valid,
+			 'cur_bbands_lower':	cur_bbands_lower,
+			 'cur_bbands_upper':	cur_bbands_upper,
+			 'prev_bbands_upper':	prev_bbands_upper,
+			 'cur_offset':		np.abs( cur_pct ),
+			 'prev_offset':		np.abs( prev_pct ),
+
+			 'outside':		(cur_bbands_lower <= cur_kchannel_lower) | (cur_bbands_upper >= cur_kchannel_upper),
+			 'inside':		(cur_kchannel_lower < cur_bbands_lower) | (cur_kchannel_upper > cur_bbands_upper),
+			 'crossover':		((prev_kchannel_lower <= prev_bbands_lower) & (cur_kchannel_lower > cur_bbands_lower)) |
+						((prev_kchannel_upper >= prev_bbands_upper) & (cur_kchannel_upper < cur_bbands_upper)),
+			 'crossback':		((prev_kchannel_lower > prev_bbands_lower) & (cur_kchannel_lower <= cur_bbands_lower)) |
+						((prev_kchannel_upper < prev_bbands_upper) & (cur_kchannel_upper >= cur_bbands_upper)),
+
+			 'simple_signal':	squeeze & (cur_pct < prev_pct),
+			 'simple_cancel':	~squeeze & (cur_kchannel_lower > cur_bbands_lower) & (cur_kchannel_upper < cur_bbands_upper) }
+
+
 	# MESA Sine Wave
 	def mesa_sine(sine=[], lead=[], direction=None, mesa_exit=False, strict=False, mesa_sine_signal=False):
 
@@ -2533,10 +2771,208 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		return False
 
 
+	# Vectorized mode
+	# Precompute the stateless signal conditions for the stochastic, chop and bbands/kchannel indicators,
+	#  and the candle filters at the top of the main loop (start/stop date, market hours, earnings,
+	#  volume, daily NATR, etc.) as arrays indexed by candle. The main loop then only needs to maintain
+	#  the state of each signal and the long/short/sell/buy_to_cover state machine, and the results
+	#  are the same as when vectorized=False.
+	def get_signal_masks():
+
+		num_candles	= len( pricehistory['candles'] )
+		cndl_idx	= np.arange( num_candles, dtype=np.int64 )
+
+		# Stochastic indicators
+		sources = {}
+		if ( with_stoch_5m == True ):
+			sources['rsi']		= ( rsi_k, rsi_d, ((cndl_idx - stochrsi_5m_idx) / 5).astype(np.int64) )
+		else:
+			sources['rsi']		= ( rsi_k, rsi_d, cndl_idx - stochrsi_idx )
+
+		if ( with_stochrsi_5m == True ):
+			sources['rsi_5m']	= ( rsi_k_5m, rsi_d_5m, ((cndl_idx - stochrsi_5m_idx) / 5).astype(np.int64) )
+		if ( with_stochmfi == True ):
+			sources['mfi']		= ( mfi_k, mfi_d, cndl_idx - stochmfi_idx )
+		if ( with_stochmfi_5m == True ):
+			sources['mfi_5m']	= ( mfi_k_5m, mfi_d_5m, ((cndl_idx - stochmfi_5m_idx) / 5).astype(np.int64) )
+
+		s_masks = { 'long': {}, 'short': {} }
+		for direction in s_masks:
+			for name in sources:
+				s_masks[direction][name] = get_stoch_masks( sources[name][0], sources[name][1], sources[name][2], direction )
+
+		# Choppiness Index
+		c_masks = None
+		if ( with_chop_index == True or with_chop_simple == True ):
+			c_masks = get_chop_masks( chop, cndl_idx - chop_idx )
+
+		# Bollinger Bands and Keltner Channel
+		b_masks = None
+		if ( with_bbands_kchannel == True or with_bbands_kchannel_simple == True ):
+			if ( use_bbands_kchannel_5m == True ):
+				b_masks = get_bbands_kchannel_masks( ((cndl_idx - bbands_idx) / 5).astype(np.int64), ((cndl_idx - kchannel_idx) / 5).astype(np.int64) )
+			else:
+				b_masks = get_bbands_kchannel_masks( cndl_idx, cndl_idx )
+
+		return s_masks, c_masks, b_masks
+
+
+	# Precompute the candle filters at the top of the main loop
+	# Returns:
+	#  candle_gate:		0 = process candle, 1 = skip candle, 2 = stop_date reached
+	#  ph_only_skip:	True if the candle is outside the ph_only trading periods
+	#  eod_masks:		isendofday() for last_hour_block and 5 minutes
+	def get_candle_gate():
+
+		num_candles	= len( pricehistory['candles'] )
+		cndl_idx	= np.arange( num_candles, dtype=np.int64 )
+
+		# Skip the first day of data, and candles for which the indicators are not yet available
+		dt_ms		= sessions.datetime
+		process		= np.array( [ float(key['datetime']) >= start_day_epoch for key in pricehistory['candles'] ], dtype=bool )
+
+		try:
+			process &= ( cndl_idx - stochrsi_idx >= 1 )
+			process &= ( ((cndl_idx - stochrsi_idx) / 5).astype(np.int64) - 1 >= 1 )
+			process &= ( cndl_idx - adx_idx >= 0 )
+			process &= ( cndl_idx - di_idx >= 1 )
+
+			if ( with_macd == True or with_macd_simple == True):
+				process &= ( cndl_idx - macd_idx >= 1 )
+				process &= ( cndl_idx - aroonosc_idx >= 0 )
+
+		except:
+			process[:] = False
+
+		# Local date, hour and minute of each candle
+		minute		= sessions.minute
+		hour		= sessions.hour
+		day_str		= sessions.day_str
+
+		days, day_inv	= sessions.days()
+		days		= days.astype( 'datetime64[D]' ).astype( str ).tolist()
+
+		# Start/stop date
+		# Compare microseconds since the epoch to avoid any rounding issues
+		epoch	= datetime( 1970, 1, 1, tzinfo=timezone('UTC') )
+		dt_us	= dt_ms * 1000
+		skip	= np.zeros( num_candles, dtype=bool )
+		stop	= np.zeros( num_candles, dtype=bool )
+		if ( start_date != None ):
+			skip |= ( dt_us < (start_date - epoch) // timedelta(microseconds=1) )
+		if ( stop_date != None ):
+			stop = ~skip & ( dt_us >= (stop_date - epoch) // timedelta(microseconds=1) )
+
+		# Time and sales days
+		if ( time_sales_algo == True ):
+			skip |= ~np.isin( day_str, list(ts_days) )
+
+		# Earnings blacklist
+		if ( blacklist_earnings == True ):
+			for day in earnings_blacklist:
+				skip |= ( (dt_us > (earnings_blacklist[day]['start_blacklist'] - epoch) // timedelta(microseconds=1)) &
+					  (dt_us < (earnings_blacklist[day]['end_blacklist'] - epoch) // timedelta(microseconds=1)) )
+
+		# Low volume days
+		if ( check_volume == True ):
+			low_volume = []
+			for day in set( day_str[process & ~skip & ~stop] ):
+				if ( isinstance(daily_volume[day]['trade'], bool) and daily_volume[day]['trade'] == False ):
+					low_volume.append( day )
+
+			skip |= np.isin( day_str, low_volume )
+
+		# Market hours and end of day
+		# ismarketopen_US() and isendofday() only depend on whether the day is a trading day or an
+		#  early close day, and on the hour and minute. So classify each day, and then call them once
+		#  for each (day class, minute) using the first day of that class.
+		classes		= {}
+		class_day	= []
+		day_class	= np.zeros( len(days), dtype=np.int64 )
+		for i,day in enumerate( days ):
+			dt_obj	= datetime.strptime( day, '%Y-%m-%d' )
+			c	= ( tda_gobot_helper.ismarketopen_US(dt_obj.replace(hour=12), check_day_only=True),
+				    tda_gobot_helper.ismarketopen_US(dt_obj.replace(hour=13, minute=30), safe_open=False),
+				    tda_gobot_helper.isendofday(60, dt_obj.replace(hour=12)) )
+
+			if ( c not in classes ):
+				classes[c] = len( class_day )
+				class_day.append( dt_obj )
+
+			day_class[i] = classes[c]
+
+		keys, key_inv	= np.unique( day_class[day_inv] * 1440 + minute, return_inverse=True )
+		market_open	= np.zeros( len(keys), dtype=bool )
+		eod		= { last_hour_block: np.zeros(len(keys), dtype=bool), 5: np.zeros(len(keys), dtype=bool) }
+		for i,key in enumerate( keys ):
+			dt_obj = class_day[int(key) // 1440].replace( hour=int(key) % 1440 // 60, minute=int(key) % 60 )
+
+			market_open[i] = ( tda_gobot_helper.ismarketopen_US(dt_obj, safe_open=safe_open) == True )
+			for mins in eod:
+				eod[mins][i] = ( tda_gobot_helper.isendofday(mins, dt_obj) == True )
+
+		skip |= ~market_open[key_inv]
+		for mins in eod:
+			eod[mins] = eod[mins][key_inv]
+
+		# Daily NATR
+		if ( min_daily_natr != None or max_daily_natr != None ):
+			natr = np.zeros( len(days), dtype=np.float64 )
+			for i,day in enumerate( days ):
+				try:
+					natr[i] = daily_natr[day]['natr']
+				except:
+					pass
+
+			natr = natr[day_inv]
+			if ( min_daily_natr != None ):
+				skip |= ( natr < min_daily_natr )
+			if ( max_daily_natr != None ):
+				skip |= ( natr > max_daily_natr )
+
+		# ph_only depends on signal_mode, so it is checked in the main loop
+		ph_only_skip = ( (hour >= 11) & (hour < 14) ) | ( (hour == 10) & (minute % 60 > 30) ) | ( (hour == 14) & (minute % 60 < 30) )
+
+		candle_gate			= np.ones( num_candles, dtype=np.int8 )
+		candle_gate[process & ~skip]	= 0
+		candle_gate[process & stop]	= 2
+
+		return candle_gate, ph_only_skip, eod
+
+
+	stoch_masks		= { 'long': {}, 'short': {} }
+	chop_masks		= None
+	bbands_kchannel_masks	= None
+	candle_gate		= None
+	ph_only_skip		= None
+	eod_masks		= {}
+	if ( vectorized == True ):
+		stoch_masks, chop_masks, bbands_kchannel_masks	= get_signal_masks()
+		candle_gate, ph_only_skip, eod_masks		= get_candle_gate()
+
+	# Return tda_gobot_helper.isendofday(), or the precomputed value in vectorized mode
+	def end_of_day(mins=5):
+
+		nonlocal idx
+		nonlocal date
+
+		if ( mins in eod_masks ):
+			return eod_masks[mins][idx]
+
+		return tda_gobot_helper.isendofday(mins, date)
+
+
 	##################################################################################################################
 	# Main loop
 	for idx,key in enumerate(pricehistory['candles']):
 
+		# Vectorized mode - the candle filters were precomputed by get_candle_gate()
+		if ( vectorized == True ):
+			if ( candle_gate[idx] == 1 ):
+				continue
+			elif ( candle_gate[idx] == 2 ):
+				return results
+
 		# Skip the first day of data
 		if ( float(pricehistory['candles'][idx]['datetime']) < start_day_epoch ):
 			continue
@@ -2570,7 +3006,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		cur_ha_low			= pricehistory['hacandles'][idx]['low']
 		cur_ha_close			= pricehistory['hacandles'][idx]['close']
 
-		date				= datetime.fromtimestamp(int(cur_dt)/1000, tz=mytimezone)
+		date				= sessions.date(idx)
 
 		# Indicators current values
 		cur_rsi_k			= rsi_k[idx - stochrsi_idx]
@@ -2761,13 +3197,13 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 		cur_natr_daily = 0
 		try:
-			cur_natr_daily = daily_natr[date.strftime('%Y-%m-%d')]['natr']
+			cur_natr_daily = daily_natr[day_str[idx]]['natr']
 		except:
 			pass
 
 		cur_daily_ma = (0,0,0)
 		try:
-			cur_daily_ma = daily_ma[date.strftime('%Y-%m-%d')]
+			cur_daily_ma = daily_ma[day_str[idx]]
 		except:
 			pass
 
@@ -2781,58 +3217,67 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 			price_support_pct = price_resistance_pct
 
-		# Skip all candles until start_date, if it is set
-		if ( start_date != None and date < start_date ):
-			continue
-		elif ( stop_date != None and date >= stop_date ):
-			return results
+		# These are precomputed in vectorized mode, see get_candle_gate()
+		if ( vectorized == False ):
 
-		# If time and sales algo monitor is enabled, then only
-		#  process days for which we have ts data available
-		if ( time_sales_algo == True ):
-			if ( date.strftime('%Y-%m-%d') not in ts_days ):
+			# Skip all candles until start_date, if it is set
+			if ( start_date != None and date < start_date ):
 				continue
+			elif ( stop_date != None and date >= stop_date ):
+				return results
 
-		# Skip the week before/after earnings if --blacklist_earnings was set
-		if ( blacklist_earnings == True ):
-			blackout = False
-			for day in earnings_blacklist:
-				if ( date > earnings_blacklist[day]['start_blacklist'] and date < earnings_blacklist[day]['end_blacklist'] ):
-					blackout = True
-					break
+			# If time and sales algo monitor is enabled, then only
+			#  process days for which we have ts data available
+			if ( time_sales_algo == True ):
+				if ( day_str[idx] not in ts_days ):
+					continue
 
-			if ( blackout == True ):
-				continue
+			# Skip the week before/after earnings if --blacklist_earnings was set
+			if ( blacklist_earnings == True ):
+				blackout = False
+				for day in earnings_blacklist:
+					if ( date > earnings_blacklist[day]['start_blacklist'] and date < earnings_blacklist[day]['end_blacklist'] ):
+						blackout = True
+						break
 
-		# Skip any days if check_volume marked it as low volume
-		if ( check_volume == True ):
-			day = date.strftime('%Y-%m-%d')
-			if ( isinstance(daily_volume[day]['trade'], bool) and daily_volume[day]['trade'] == False ):
-				continue
+				if ( blackout == True ):
+					continue
 
-		# Ignore pre-post market since we cannot trade during those hours
-		if ( tda_gobot_helper.ismarketopen_US(date, safe_open=safe_open) != True ):
-			continue
+			# Skip any days if check_volume marked it as low volume
+			if ( check_volume == True ):
+				day = day_str[idx]
+				if ( isinstance(daily_volume[day]['trade'], bool) and daily_volume[day]['trade'] == False ):
+					continue
+
+			# Ignore pre-post market since we cannot trade during those hours
+			if ( tda_gobot_helper.ismarketopen_US(date, safe_open=safe_open) != True ):
+				continue
 
 		# If ph_only is set then only trade during high-volume periods
 		#  9:30AM - 11:00AM
 		#  3:30PM - 4:00PM
 		if ( ph_only == True and (signal_mode['primary'] == 'long' or signal_mode['primary'] == 'short') ):
-			cur_hour	= int( date.strftime('%-H') )
-			cur_min		= int( date.strftime('%-M') )
+			if ( vectorized == True ):
+				if ( ph_only_skip[idx] == True ):
+					continue
 
-			if ( cur_hour >= 11 and cur_hour < 14 ):
-				continue
-			elif ( cur_hour == 10 and cur_min > 30 ):
-				continue
-			elif ( cur_hour == 14 and cur_min < 30 ):
-				continue
+			else:
+				cur_hour	= int( cndl_minute[idx] // 60 )
+				cur_min		= int( cndl_minute[idx] % 60 )
+
+				if ( cur_hour >= 11 and cur_hour < 14 ):
+					continue
+				elif ( cur_hour == 10 and cur_min > 30 ):
+					continue
+				elif ( cur_hour == 14 and cur_min < 30 ):
+					continue
 
 		# Ignore days where cur_daily_natr is below min_daily_natr or above max_daily_natr, if configured
-		if ( min_daily_natr != None and cur_natr_daily < min_daily_natr ):
-			continue
-		if ( max_daily_natr != None and cur_natr_daily > max_daily_natr ):
-			continue
+		if ( vectorized == False ):
+			if ( min_daily_natr != None and cur_natr_daily < min_daily_natr ):
+				continue
+			if ( max_daily_natr != None and cur_natr_daily > max_daily_natr ):
+				continue
 
 
 		# BUY mode
@@ -2840,7 +3285,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 			# hold_overnight=False - Don't enter any new trades 1-hour before Market close
 			if ( hold_overnight == False and ph_only == False and
-					tda_gobot_helper.isendofday(last_hour_block, date) == True ):
+					end_of_day(last_hour_block) == True ):
 				reset_signals()
 				continue
 
@@ -2871,7 +3316,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 										bbands_roc_threshold_signal=bbands_roc_threshold_signal,
 										bbands_kchan_crossover_signal=bbands_kchan_crossover_signal,
 										bbands_kchan_signal=bbands_kchan_signal,
-										bbands_roc=bbands_roc, debug=False )
+										bbands_roc=bbands_roc, debug=False, masks=bbands_kchannel_masks )
 
 
 			# StochRSI / StochMFI Primary
@@ -2890,7 +3335,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				  stochrsi_crossover_signal,
 				  stochrsi_threshold_signal,
 				  buy_signal ) = get_stoch_signal_long(	cur_rsi_k, cur_rsi_d, prev_rsi_k, prev_rsi_d,
-									stochrsi_signal, stochrsi_crossover_signal, stochrsi_threshold_signal, buy_signal )
+									stochrsi_signal, stochrsi_crossover_signal, stochrsi_threshold_signal, buy_signal, masks=stoch_masks['long'].get('rsi') )
 
 				if ( cur_rsi_k > stochrsi_signal_cancel_high_limit ):
 					# Reset all signals if the primary stochastic
@@ -3224,7 +3669,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				  stochrsi_5m_crossover_signal,
 				  stochrsi_5m_threshold_signal,
 				  stochrsi_5m_final_signal ) = get_stoch_signal_long( cur_rsi_k_5m, cur_rsi_d_5m, prev_rsi_k_5m, prev_rsi_d_5m,
-										      stochrsi_5m_signal, stochrsi_5m_crossover_signal, stochrsi_5m_threshold_signal, stochrsi_5m_final_signal )
+										      stochrsi_5m_signal, stochrsi_5m_crossover_signal, stochrsi_5m_threshold_signal, stochrsi_5m_final_signal, masks=stoch_masks['long'].get('rsi_5m') )
 
 				if ( cur_rsi_k_5m > stochrsi_signal_cancel_high_limit ):
 					stochrsi_5m_signal		= False
@@ -3238,7 +3683,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				  stochmfi_crossover_signal,
 				  stochmfi_threshold_signal,
 				  stochmfi_final_signal ) = get_stoch_signal_long( cur_mfi_k, cur_mfi_d, prev_mfi_k, prev_mfi_d,
-										   stochmfi_signal, stochmfi_crossover_signal, stochmfi_threshold_signal, stochmfi_final_signal )
+										   stochmfi_signal, stochmfi_crossover_signal, stochmfi_threshold_signal, stochmfi_final_signal, masks=stoch_masks['long'].get('mfi') )
 
 				if ( cur_mfi_k > stochrsi_signal_cancel_high_limit ):
 					stochmfi_signal			= False
@@ -3252,7 +3697,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				  stochmfi_5m_crossover_signal,
 				  stochmfi_5m_threshold_signal,
 				  stochmfi_5m_final_signal ) = get_stoch_signal_long( cur_mfi_k_5m, cur_mfi_d_5m, prev_mfi_k_5m, prev_mfi_d_5m,
-										      stochmfi_5m_signal, stochmfi_5m_crossover_signal, stochmfi_5m_threshold_signal, stochmfi_5m_final_signal )
+										      stochmfi_5m_signal, stochmfi_5m_crossover_signal, stochmfi_5m_threshold_signal, stochmfi_5m_final_signal, masks=stoch_masks['long'].get('mfi_5m') )
 
 				if ( cur_mfi_k_5m > stochrsi_signal_cancel_high_limit ):
 					stochmfi_5m_signal		= False
@@ -3456,7 +3901,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 			if ( with_chop_index == True or with_chop_simple == True ):
 				chop_init_signal, chop_signal = get_chop_signal( simple=with_chop_simple,
 										 prev_chop=prev_chop, cur_chop=cur_chop,
-										 chop_init_signal=chop_init_signal, chop_signal=chop_signal )
+										 chop_init_signal=chop_init_signal, chop_signal=chop_signal, masks=chop_masks )
 
 			# Supertrend Indicator
 			if ( with_supertrend == True ):
@@ -3479,7 +3924,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 			# SUPPORT / RESISTANCE LEVELS
 			resistance_signal = True
-			today = date.strftime('%Y-%m-%d')
+			today = day_str[idx]
 
 			# PDC
 			if ( use_pdc == True and buy_signal == True and resistance_signal == True ):
@@ -3554,14 +3999,11 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 			if ( lod_hod_check == True and buy_signal == True and resistance_signal == True ):
 
 				# Check for current-day HOD after 1PM Eastern
-				cur_hour = int( date.strftime('%-H') )
+				cur_hour = int( cndl_minute[idx] // 60 )
 				if ( cur_hour >= 13 ):
 
-					cur_day_start	= datetime.strptime(today + ' 09:30:00', '%Y-%m-%d %H:%M:%S')
-					cur_day_start	= mytimezone.localize(cur_day_start)
-
-					delta = date - cur_day_start
-					delta = int( delta.total_seconds() / 60 )
+					# Minutes since 09:30
+					delta = int( cndl_minute[idx] ) - 570
 
 					# Find HOD
 					hod = 0
@@ -3691,7 +4133,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 				# Enable current VAH/VAL checks later in the day
 				cur_vah = cur_val = 0
-				if ( int(date.strftime('%-H')) > 12 ):
+				if ( int( cndl_minute[idx] // 60 ) > 12 ):
 					cur_vah = mprofile[today]['vah']
 					cur_val = mprofile[today]['val']
 
@@ -4166,14 +4608,14 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		if ( signal_mode['primary'] == 'sell' or (signal_mode['straddle'] == True and signal_mode['secondary'] == 'sell') ):
 
 			# hold_overnight=False - drop the stock before market close
-			if ( hold_overnight == False and tda_gobot_helper.isendofday(5, date) == True ):
+			if ( hold_overnight == False and end_of_day(5) == True ):
 				sell_signal		= True
 				end_of_day_exits	+= 1
 
 			# The last trading hour is a bit unpredictable. If --hold_overnight is false we want
 			#  to sell the stock at a more conservative exit percentage.
 			elif ( ph_only == False and hold_overnight == False and
-					tda_gobot_helper.isendofday(last_hour_block, date) == True ):
+					end_of_day(last_hour_block) == True ):
 				if ( cur_close > purchase_price ):
 					percent_change = abs( purchase_price / cur_close - 1 ) * 100
 					if ( percent_change >= last_hour_threshold ):
@@ -4576,7 +5018,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 			# hold_overnight=False - Don't enter any new trades 1-hour before Market close
 			if ( hold_overnight == False and ph_only == False and
-					tda_gobot_helper.isendofday(last_hour_block, date) == True ):
+					end_of_day(last_hour_block) == True ):
 				reset_signals()
 				continue
 
@@ -4609,7 +5051,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 										bbands_roc_threshold_signal=bbands_roc_threshold_signal,
 										bbands_kchan_crossover_signal=bbands_kchan_crossover_signal,
 										bbands_kchan_signal=bbands_kchan_signal,
-										bbands_roc=bbands_roc, debug=False )
+										bbands_roc=bbands_roc, debug=False, masks=bbands_kchannel_masks )
 
 
 			# StochRSI / StochMFI Primary
@@ -4626,7 +5068,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				  stochrsi_crossover_signal,
 				  stochrsi_threshold_signal,
 				  short_signal ) = get_stoch_signal_short( cur_rsi_k, cur_rsi_d, prev_rsi_k, prev_rsi_d,
-									   stochrsi_signal, stochrsi_crossover_signal, stochrsi_threshold_signal, short_signal )
+									   stochrsi_signal, stochrsi_crossover_signal, stochrsi_threshold_signal, short_signal, masks=stoch_masks['short'].get('rsi') )
 
 				if ( cur_rsi_k < stochrsi_signal_cancel_low_limit ):
 					# Reset all signals if the primary stochastic
@@ -4943,7 +5385,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				  stochrsi_5m_crossover_signal,
 				  stochrsi_5m_threshold_signal,
 				  stochrsi_5m_final_signal ) = get_stoch_signal_short(	cur_rsi_k_5m, cur_rsi_d_5m, prev_rsi_k_5m, prev_rsi_d_5m,
-											stochrsi_5m_signal, stochrsi_5m_crossover_signal, stochrsi_5m_threshold_signal, stochrsi_5m_final_signal )
+											stochrsi_5m_signal, stochrsi_5m_crossover_signal, stochrsi_5m_threshold_signal, stochrsi_5m_final_signal, masks=stoch_masks['short'].get('rsi_5m') )
 
 				if ( cur_rsi_k_5m < stochrsi_signal_cancel_low_limit ):
 					stochrsi_5m_signal		= False
@@ -4957,7 +5399,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				  stochmfi_crossover_signal,
 				  stochmfi_threshold_signal,
 				  stochmfi_final_signal ) = get_stoch_signal_short( cur_mfi_k, cur_mfi_d, prev_mfi_k, prev_mfi_d,
-										    stochmfi_signal, stochmfi_crossover_signal, stochmfi_threshold_signal, stochmfi_final_signal )
+										    stochmfi_signal, stochmfi_crossover_signal, stochmfi_threshold_signal, stochmfi_final_signal, masks=stoch_masks['short'].get('mfi') )
 
 				if ( cur_mfi_k < stochrsi_signal_cancel_low_limit ):
 					stochmfi_signal			= False
@@ -4971,7 +5413,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 				  stochmfi_5m_crossover_signal,
 				  stochmfi_5m_threshold_signal,
 				  stochmfi_5m_final_signal ) = get_stoch_signal_short(	cur_mfi_k_5m, cur_mfi_d_5m, prev_mfi_k_5m, prev_mfi_d_5m,
-											stochmfi_5m_signal, stochmfi_5m_crossover_signal, stochmfi_5m_threshold_signal, stochmfi_5m_final_signal )
+											stochmfi_5m_signal, stochmfi_5m_crossover_signal, stochmfi_5m_threshold_signal, stochmfi_5m_final_signal, masks=stoch_masks['short'].get('mfi_5m') )
 
 				if ( cur_mfi_k_5m < stochrsi_signal_cancel_low_limit ):
 					stochmfi_5m_signal		= False
@@ -5165,7 +5607,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 			if ( with_chop_index == True or with_chop_simple == True ):
 				chop_init_signal, chop_signal = get_chop_signal( simple=with_chop_simple,
 										 prev_chop=prev_chop, cur_chop=cur_chop,
-										 chop_init_signal=chop_init_signal, chop_signal=chop_signal )
+										 chop_init_signal=chop_init_signal, chop_signal=chop_signal, masks=chop_masks )
 
 			# Supertrend indicator
 			if ( with_supertrend == True ):
@@ -5187,7 +5629,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 			# SUPPORT / RESISTANCE LEVELS
 			resistance_signal = True
-			today = date.strftime('%Y-%m-%d')
+			today = day_str[idx]
 
 			# PDC
 			if ( use_pdc == True and short_signal == True and resistance_signal == True ):
@@ -5264,14 +5706,11 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 			if ( lod_hod_check == True and short_signal == True and resistance_signal == True ):
 
 				# Check for current-day LOD after 1PM Eastern
-				cur_hour = int( date.strftime('%-H') )
+				cur_hour = int( cndl_minute[idx] // 60 )
 				if ( cur_hour >= 13 ):
 
-					cur_day_start	= datetime.strptime(today + ' 09:30:00', '%Y-%m-%d %H:%M:%S')
-					cur_day_start	= mytimezone.localize(cur_day_start)
-
-					delta = date - cur_day_start
-					delta = int( delta.total_seconds() / 60 )
+					# Minutes since 09:30
+					delta = int( cndl_minute[idx] ) - 570
 
 					# Find LOD
 					lod = 9999
@@ -5401,7 +5840,7 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 
 				# Enable current VAH/VAL checks later in the day
 				cur_vah = cur_val = 0
-				if ( int(date.strftime('%-H')) > 12 ):
+				if ( int( cndl_minute[idx] // 60 ) > 12 ):
 					cur_vah = mprofile[today]['vah']
 					cur_val = mprofile[today]['val']
 
@@ -5872,14 +6311,14 @@ def stochrsi_analyze_new( pricehistory=None, ticker=None, params={} ):
 		if ( signal_mode['primary'] == 'buy_to_cover' or (signal_mode['straddle'] == True and signal_mode['secondary'] == 'buy_to_cover') ):
 
 			# hold_overnight=False - drop the stock before market close
-			if ( hold_overnight == False and tda_gobot_helper.isendofday(5, date) == True ):
+			if ( hold_overnight == False and end_of_day(5) == True ):
 				buy_to_cover_signal	= True
 				end_of_day_exits	+= 1
 
 			# The last trading hour is a bit unpredictable. If --hold_overnight is false we want
 			#  to sell the stock at a more conservative exit percentage.
 			elif (ph_only == False and hold_overnight == False and
-					tda_gobot_helper.isendofday(last_hour_block, date) == True ):
+					end_of_day(last_hour_block) == True ):
 				if ( cur_close < short_price ):
 					percent_change = abs( short_price / cur_close - 1 ) * 100
 					if ( percent_change >= last_hour_threshold ):
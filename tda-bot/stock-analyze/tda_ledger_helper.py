@@ -0,0 +1,214 @@
+#!/usr/bin/python3 -u
+
+# Structured trade ledger for backtests
+#
+# stochrsi_analyze_new() returns a flat list of comma-delimited strings, alternating
+#  between the entry and exit of each trade. tda-gobot-analyze.py prints these as an
+#  ANSI-colored table, which summarize-results.sh, daily_results.sh, tx-overlap.py, etc.
+#  then have to grep and split back apart.
+#
+# parse_results() converts the results list to a NumPy structured array with one row
+#  per trade, and write_ledger()/read_ledger() store it as a columnar file. NPZ is always
+#  available, Parquet and Arrow (Feather) files are supported if pyarrow is installed.
+#
+# Times are stored as datetime64[us] in the US/Eastern wall time that stochrsi_analyze_new()
+#  uses, so ledger['entry_time'].astype('datetime64[D]') is the trading day.
+
+import os, sys
+from datetime import datetime
+
+import numpy as np
+
+# pyarrow is optional, it is only needed for Parquet/Arrow ledgers
+try:
+	import pyarrow
+	import pyarrow.parquet
+	import pyarrow.feather
+except:
+	pyarrow = None
+
+
+# Fields in each ledger row
+# Values ending in _tx are from the trade entry, values ending in _rx are from the exit
+ledger_dtype = np.dtype( [
+	('ticker',		'U16'),
+	('scenario',		'U128'),
+	('short',		'?'),
+	('entry_time',		'datetime64[us]'),
+	('exit_time',		'datetime64[us]'),
+	('entry_price',		'f8'),
+	('exit_price',		'f8'),
+	('num_shares',		'i8'),
+	('net_change',		'f8'),		# exit_price - entry_price
+	('gain',		'f8'),		# Gain per share, negative if the trade lost money (sign flipped for shorts)
+	('total_return',	'f8'),		# num_shares * round(gain, 2), as in tda-gobot-analyze.py
+	('success',		'?'),
+	('rsi_k_tx',		'f8'),
+	('rsi_d_tx',		'f8'),
+	('rsi_k_rx',		'f8'),
+	('rsi_d_rx',		'f8'),
+	('mfi_k_tx',		'f8'),
+	('mfi_d_tx',		'f8'),
+	('mfi_k_rx',		'f8'),
+	('mfi_d_rx',		'f8'),
+	('natr_tx',		'f8'),
+	('natr_rx',		'f8'),
+	('daily_natr_tx',	'f8'),
+	('daily_natr_rx',	'f8'),
+	('bbands_natr',		'f8'),
+	('bbands_squeeze_natr',	'f8'),
+	('sp_monitor_impulse',	'f8'),
+	('rs',			'f8'),
+	('adx_tx',		'f8'),
+	('adx_rx',		'f8'),
+] )
+
+ledger_formats = ( '.npz', '.parquet', '.arrow', '.feather' )
+
+
+def _float(val=None):
+	try:
+		return float(val)
+	except:
+		return np.nan
+
+def _kd(val=None):
+	try:
+		k, d = val.split('/', 1)
+		return _float(k), _float(d)
+	except:
+		return np.nan, np.nan
+
+def _time(val=None):
+	try:
+		return np.datetime64( datetime.strptime(val.strip(), '%Y-%m-%d %H:%M:%S.%f'), 'us' )
+	except:
+		return np.datetime64('NaT', 'us')
+
+
+# Convert the results list returned by stochrsi_analyze_new() to a ledger
+# A trailing entry without a matching exit is ignored, as in tda-gobot-analyze.py
+def parse_results(results=[], ticker='', scenario=''):
+
+	if ( isinstance(results, bool) or results == None ):
+		return np.zeros( 0, dtype=ledger_dtype )
+
+	num_txs	= int( len(results) / 2 )
+	ledger	= np.zeros( num_txs, dtype=ledger_dtype )
+
+	ledger['ticker']	= ticker
+	ledger['scenario']	= scenario
+	for i in range(num_txs):
+		tx = results[i*2].split( ',', 12 )
+		rx = results[i*2+1].split( ',', 7 )
+
+		price_tx, num_shares, short, rsi_tx, mfi_tx, natr_tx, dnatr_tx, bbands_natr, bbands_squeeze_natr, impulse, rs, adx_tx, time_tx = tx
+		price_rx, short_rx, rsi_rx, mfi_rx, natr_rx, dnatr_rx, adx_rx, time_rx = rx
+
+		row = ledger[i]
+		row['short']		= ( short == 'True' )
+		row['entry_time']	= _time(time_tx)
+		row['exit_time']	= _time(time_rx)
+		row['entry_price']	= _float(price_tx)
+		row['exit_price']	= _float(price_rx)
+		row['num_shares']	= int(num_shares)
+
+		row['rsi_k_tx'], row['rsi_d_tx']	= _kd(rsi_tx)
+		row['rsi_k_rx'], row['rsi_d_rx']	= _kd(rsi_rx)
+		row['mfi_k_tx'], row['mfi_d_tx']	= _kd(mfi_tx)
+		row['mfi_k_rx'], row['mfi_d_rx']	= _kd(mfi_rx)
+
+		row['natr_tx']			= _float(natr_tx)
+		row['natr_rx']			= _float(natr_rx)
+		row['daily_natr_tx']		= _float(dnatr_tx)
+		row['daily_natr_rx']		= _float(dnatr_rx)
+		row['bbands_natr']		= _float(bbands_natr)
+		row['bbands_squeeze_natr']	= _float(bbands_squeeze_natr)
+		row['sp_monitor_impulse']	= _float(impulse)
+		row['rs']			= _float(rs)
+		row['adx_tx']			= _float(adx_tx)
+		row['adx_rx']			= _float(adx_rx)
+
+	# Long trades succeed if the price went up, short trades if the price went down
+	ledger['net_change']	= ledger['exit_price'] - ledger['entry_price']
+	ledger['gain']		= np.where( ledger['short'], -ledger['net_change'], ledger['net_change'] )
+	ledger['success']	= ( ledger['gain'] > 0 )
+	ledger['total_return']	= ledger['num_shares'] * np.round( ledger['gain'], 2 )
+
+	return ledger
+
+
+# Write ledger to fname, the format is determined by the file extension
+def write_ledger(fname=None, ledger=None):
+
+	if ( fname == None or ledger is None ):
+		raise ValueError('write_ledger(): fname and ledger are required')
+
+	ext = os.path.splitext(fname)[1].lower()
+	if ( ext == '.npz' ):
+		np.savez_compressed( fname, ledger=ledger )
+
+	elif ( ext in ('.parquet', '.arrow', '.feather') ):
+		if ( pyarrow == None ):
+			raise ValueError('write_ledger(): pyarrow is required to write ' + str(ext) + ' files')
+
+		table = pyarrow.table( { name: ledger[name] for name in ledger.dtype.names } )
+		if ( ext == '.parquet' ):
+			pyarrow.parquet.write_table( table, fname )
+		else:
+			pyarrow.feather.write_feather( table, fname )
+
+	else:
+		raise ValueError('write_ledger(): unsupported file type: ' + str(fname))
+
+	return True
+
+
+# Read a ledger written by write_ledger()
+def read_ledger(fname=None):
+
+	ext = os.path.splitext(fname)[1].lower()
+	if ( ext == '.npz' ):
+		with np.load(fname) as data:
+			return data['ledger']
+
+	elif ( ext in ('.parquet', '.arrow', '.feather') ):
+		if ( pyarrow == None ):
+			raise ValueError('read_ledger(): pyarrow is required to read ' + str(ext) + ' files')
+
+		if ( ext == '.parquet' ):
+			table = pyarrow.parquet.read_table( fname )
+		else:
+			table = pyarrow.feather.read_table( fname )
+
+		ledger = np.zeros( table.num_rows, dtype=ledger_dtype )
+		for name in ledger.dtype.names:
+			if ( name in table.column_names ):
+				ledger[name] = table.column(name).to_numpy()
+
+		return ledger
+
+	raise ValueError('read_ledger(): unsupported file type: ' + str(fname))
+
+
+# Return summary statistics for ledger as a dict, using the same calculations as the
+#  "### Statistics ###" section of tda-gobot-analyze.py
+def summarize(ledger=None):
+
+	txs		= len(ledger)
+	success		= int( np.count_nonzero(ledger['success']) )
+	fail		= txs - success
+	net_gain	= float( ledger['gain'][ledger['success']].sum() )
+	net_loss	= float( ledger['gain'][~ledger['success']].sum() )
+	days		= len( np.unique(ledger['entry_time'].astype('datetime64[D]')) )
+
+	return {	'txs':		txs,
+			'days':		days,
+			'success':	success,
+			'fail':		fail,
+			'success_pct':	( success / txs * 100 ) if ( txs > 0 ) else 0,
+			'net_gain':	net_gain,
+			'net_loss':	net_loss,
+			'average_gain':	( net_gain / success ) if ( success > 0 ) else 0,
+			'average_loss':	( net_loss / fail ) if ( fail > 0 ) else 0,
+			'total_return':	float( ledger['total_return'].sum() ) }
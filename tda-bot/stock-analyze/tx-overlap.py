@@ -4,62 +4,69 @@ import os, sys, re
 import time, datetime, pytz
 import argparse
 
+import tda_ledger_helper
+
 parser = argparse.ArgumentParser()
-parser.add_argument("algo1_ifile", help='Results file for the first algo to compare', default=None, type=str)
-parser.add_argument("algo2_ifile", help='Results file for the second algo to compare', default=None, type=str)
+parser.add_argument("algo1_ifile", help='Results file or trade ledger (.npz) for the first algo to compare', default=None, type=str)
+parser.add_argument("algo2_ifile", help='Results file or trade ledger (.npz) for the second algo to compare', default=None, type=str)
 parser.add_argument("--verbose", help='More verbose results', action="store_true")
 args = parser.parse_args()
 
 mytimezone = pytz.timezone("US/Eastern")
 
-# Read the ledger files
-algo1 = ''
-algo2 = ''
+# Read the transaction times from a trade ledger written by tda-gobot-analyze.py --ledger_ofile,
+#  or from the text output of tda-gobot-analyze.py --verbose
+# Returns a list of alternating entry and exit datetimes
+def read_txs(ifile=None):
+
+	txs = []
+	if ( ifile.endswith(tda_ledger_helper.ledger_formats) ):
+		# NaT (i.e. the exit time of a position that was still open at the end of the
+		#  backtest) converts to None. Skip the whole trade, since algo_compare() expects
+		#  entry/exit pairs.
+		ledger = tda_ledger_helper.read_ledger(ifile)
+		for tx in ledger[['entry_time', 'exit_time']].tolist():
+			if ( tx[0] == None or tx[1] == None ):
+				continue
+
+			txs.append( mytimezone.localize(tx[0].replace(microsecond=0)) )
+			txs.append( mytimezone.localize(tx[1].replace(microsecond=0)) )
+
+		return txs
+
+	with open(ifile, 'rt') as handle:
+		data = handle.read()
+
+	for line in data.splitlines():
+		if ( re.search('Warning', line) != None ):
+			continue
+		if ( re.search('20[0-9]{2}\-[0-9]{2}\-[0-9]{2}', line) == None ):
+			continue
+
+		line = re.split('[\s\t]+', line)
+		datestr = str(line[12]) + ' ' + re.sub('\..*', '', line[13])
+
+		date = datetime.datetime.strptime(datestr, '%Y-%m-%d %H:%M:%S')
+		date = mytimezone.localize(date)
+		txs.append(date)
+
+	return txs
+
+
+# Add the dates of the transactions for each algo to algoN_txs
 try:
-	with open(args.algo1_ifile, 'rt') as handle:
-		algo1 = handle.read()
+	algo1_txs = read_txs(args.algo1_ifile)
 except Exception as e:
 	print('Error opening file ' + str(args.algo1_ifile) + ': ' + str(e))
 	sys.exit(1)
 
 try:
-	with open(args.algo2_ifile, 'rt') as handle:
-		algo2 = handle.read()
+	algo2_txs = read_txs(args.algo2_ifile)
 except Exception as e:
 	print('Error opening file ' + str(args.algo2_ifile) + ': ' + str(e))
 	sys.exit(1)
 
 
-# Add the dates of the transactions for each algo to algoN_txs
-algo1_txs = []
-for line in algo1.splitlines():
-	if ( re.search('Warning', line) != None ):
-		continue
-	if ( re.search('2021\-', line) == None ):
-		continue
-
-	line = re.split('[\s\t]+', line)
-	datestr = str(line[12]) + ' ' + re.sub('\..*', '', line[13])
-
-	date = datetime.datetime.strptime(datestr, '%Y-%m-%d %H:%M:%S')
-	date = mytimezone.localize(date)
-	algo1_txs.append(date)
-
-algo2_txs = []
-for line in algo2.splitlines():
-	if ( re.search('Warning', line) != None ):
-		continue
-	if ( re.search('2021\-', line) == None ):
-		continue
-
-	line = re.split('[\s\t]+', line)
-	datestr = str(line[12]) + ' ' + re.sub('\..*', '', line[13])
-
-	date = datetime.datetime.strptime(datestr, '%Y-%m-%d %H:%M:%S')
-	date = mytimezone.localize(date)
-	algo2_txs.append(date)
-
-
 def algo_compare(algo1_txs=[], algo2_txs=[]):
 
 	if ( len(algo1_txs) == 0 or len(algo2_txs) == 0 ):
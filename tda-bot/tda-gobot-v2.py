@@ -13,7 +13,13 @@ from collections import OrderedDict
 
 import tda_gobot_helper
 import tda_algo_helper
+import tda_candle_helper
 import tda_gobotv2_helper
+import tda_incremental_helper
+import tda_archive_helper
+import tda_order_helper
+import tda_level2_helper
+import tda_warmup_helper
 import av_gobot_helper
 
 # We use robin_stocks for most REST operations
@@ -48,9 +54,15 @@ parser.add_argument("--algo_exclude_tickers", help='Tickers to exclude with a pa
 parser.add_argument("--force", help='Force bot to purchase the stock even if it is listed in the stock blacklist', action="store_true")
 parser.add_argument("--fake", help='Paper trade only - disables buy/sell functions', action="store_true")
 parser.add_argument("--tx_log_dir", help='Transaction log directory (default: TX_LOGS', default='TX_LOGS', type=str)
+parser.add_argument("--no_archive", help='Disable the streaming archiver and instead write all pricehistory, level1, level2 and time/sales data to --tx_log_dir at exit', action="store_true")
+parser.add_argument("--archive_codec", help='Compression to use for the streaming archive (lz4, zlib or none). Default: lz4 if available, otherwise zlib.', default=None, type=str)
 
 parser.add_argument("--multiday", help='Run and monitor stock continuously across multiple days (but will not trade after hours) - see also --hold_overnight', action="store_true")
 parser.add_argument("--singleday", help='Allows bot to start (but not trade) before market opens. Bot will revert to non-multiday behavior after the market opens.', action="store_true")
+parser.add_argument("--history_max_candles", help='Maximum number of 1-minute candles to keep in memory per ticker, older candles are written to --tx_log_dir (Default: 0 - size automatically based on the longest lookback used by --algos, -1 to disable)', default=0, type=int)
+parser.add_argument("--history_lookback_mult", help='Multiply the longest indicator period by this value when sizing --history_max_candles automatically (Default: 10)', default=10, type=int)
+parser.add_argument("--history_min_candles", help='Minimum number of 1-minute candles to keep in memory when sizing --history_max_candles automatically (Default: 3000)', default=3000, type=int)
+parser.add_argument("--stream_history_max", help='Maximum number of level1, level2 and time/sales updates to keep in memory per ticker, older entries are written to --tx_log_dir (Default: 50000, -1 to disable)', default=50000, type=int)
 parser.add_argument("--unsafe", help='Allow trading between 9:30-10:15AM where volatility is high', action="store_true")
 parser.add_argument("--ph_only", help='Allow trading only between 9:30-10:30AM and 3:00PM-4:00PM when volatility is high', action="store_true")
 parser.add_argument("--hold_overnight", help='Hold stocks overnight when --multiday is in use (default: False) - Warning: implies --unsafe', action="store_true")
@@ -71,6 +83,8 @@ parser.add_argument("--options_decr_threshold", help='Max allowed drop percentag
 parser.add_argument("--options_exit_percent", help='Sell security if price improves by this percentile', default=None, type=float)
 
 parser.add_argument("--num_purchases", help='Number of purchases allowed per day', default=10, type=int)
+parser.add_argument("--order_workers", help='Number of worker threads used to place equity orders in the background (Default: 4)', default=4, type=int)
+parser.add_argument("--sync_orders", help='Place equity orders synchronously from the stream handlers instead of in the background', action="store_true")
 parser.add_argument("--stoploss", help='Sell security if price drops below --decr_threshold (default=False)', action="store_true")
 parser.add_argument("--max_failed_txs", help='Maximum number of failed transactions allowed for a given stock before stock is blacklisted', default=2, type=int)
 parser.add_argument("--max_failed_usd", help='Maximum allowed USD for a failed transaction before the stock is blacklisted', default=99999, type=float)
@@ -243,6 +257,9 @@ parser.add_argument("--short", help='Enable short selling of stock', action="sto
 parser.add_argument("--shortonly", help='Only short sell the stock', action="store_true")
 parser.add_argument("--short_check_ma", help='Allow short selling of the stock when it is bearish (SMA200 < SMA50)', action="store_true")
 
+parser.add_argument("--warmup_workers", help='Number of concurrent API calls to make when downloading pricehistory at startup (Default: 8)', default=8, type=int)
+parser.add_argument("--warmup_rate", help='Max number of API calls per minute when downloading pricehistory at startup (Default: 110)', default=110, type=int)
+parser.add_argument("--batch_indicators", help='Recalculate indicators over the full pricehistory on every candle instead of updating them incrementally', action="store_true")
 parser.add_argument("-d", "--debug", help='Enable debug output', action="store_true")
 args = parser.parse_args()
 
@@ -254,6 +271,8 @@ args.debug = True
 mytimezone = pytz.timezone("US/Eastern")
 tda_gobot_helper.mytimezone = mytimezone
 tda_gobotv2_helper.mytimezone = mytimezone
+tda_incremental_helper.mytimezone = mytimezone
+tda_archive_helper.mytimezone = mytimezone
 
 # --hold_overnight implies --multiday
 # --hold_overnight implies --unsafe (safe_open=False)
@@ -1418,6 +1437,13 @@ for ticker in stock_list.split(','):
 				   'pricehistory_daily':	{},
 				   'pricehistory_weekly':	{},
 
+				   # Incremental indicator state for pricehistory and pricehistory_5m
+				   'indicators':		tda_incremental_helper.IndicatorSet(use_batch=args.batch_indicators),
+				   'indicators_5m':		tda_incremental_helper.IndicatorSet(use_batch=args.batch_indicators),
+
+				   # Builds pricehistory_5m from the streamed 1-minute candles
+				   'aggregator_5m':		tda_candle_helper.CandleAggregator(5),
+
 				   'exchange':			None,
 				   'ask_price':			float(1),
 				   'ask_size':			int(0),
@@ -1441,10 +1467,8 @@ for ticker in stock_list.split(','):
 										'num_bids':	int(0),
 										'total_volume':	int(0) },
 
-								  'asks':	{},
-								  'bids':	{},
-
-								  'history':	{} }, # end level2{}
+								  'book':	tda_level2_helper.OrderBook(),
+								  'history':	tda_level2_helper.BookHistory() }, # end level2{}
 
 				   # Equity time and sale data
 				   'ets':			{ 'cumulative_vol_delta':	0,
@@ -1688,62 +1712,6 @@ for ticker in list(stocks.keys()):
 		print('Warning: exchange info not returned for ticker ' + str(ticker) + ', level2 data will not be available')
 		pass
 
-	# Get general information about the stock that we can use later
-	# I.e. volatility, resistance, etc.
-	# 3-week high / low / average
-	high = low = avg = False
-	count = 0
-	while ( count <= 3 ):
-		count += 1
-		try:
-			high, low, avg = tda_gobot_helper.get_price_stats(ticker, days=15)
-
-		except Exception as e:
-			print('Warning: get_price_stats(' + str(ticker) + '): ' + str(e))
-
-		if ( isinstance(high, bool) and high == False ):
-			if ( count >= 3 ):
-				print('Error: get_price_stats(' + str(ticker) + '): invalidating ticker')
-				stocks[ticker]['isvalid'] = False
-				continue
-
-			if ( tda_gobot_helper.tdalogin(passcode, token_fname) != True ):
-				print('Error: (' + str(ticker) + '): Login failure')
-			time.sleep(5)
-
-		else:
-			stocks[ticker]['three_week_high'] = high
-			stocks[ticker]['three_week_low'] = low
-			stocks[ticker]['three_week_avg'] = avg
-			break
-
-	# 20-week high / low / average
-	high = low = avg = False
-	count = 0
-	while ( count <= 3 ):
-		count += 1
-		try:
-			high, low, avg = tda_gobot_helper.get_price_stats(ticker, days=100)
-
-		except Exception as e:
-			print('Warning: get_price_stats(' + str(ticker) + '): ' + str(e))
-
-		if ( isinstance(high, bool) and high == False ):
-			if ( count >= 3 ):
-				print('Error: get_price_stats(' + str(ticker) + '): invalidating ticker')
-				stocks[ticker]['isvalid'] = False
-				continue
-
-			if ( tda_gobot_helper.tdalogin(passcode, token_fname) != True ):
-				print('Error: (' + str(ticker) + '): Login failure')
-			time.sleep(5)
-
-		else:
-			stocks[ticker]['twenty_week_high'] = high
-			stocks[ticker]['twenty_week_low'] = low
-			stocks[ticker]['twenty_week_avg'] = avg
-			break
-
 	# SMA200 and EMA50
 	if ( args.short_check_ma == True ):
 		try:
@@ -1765,7 +1733,7 @@ for ticker in list(stocks.keys()):
 				# Stock is bullish, disable shorting
 				stocks[ticker]['shortable'] = False
 
-	time.sleep(1)
+		time.sleep(1)
 
 # SAZ - 2022-03-14 - Max number of tickers for listed_book_subs() and nasdaq_book_subs() is 100.
 #  This is in contrast to equity OHLCV data which is 300 tickers. Unfortunately, I don't have a
@@ -1778,7 +1746,13 @@ if ( len(nasdaq_tickers) > 100 ):
 # Initialize signal handlers to dump stock history on exit
 def graceful_exit(signum=None, frame=None):
 	print("\nNOTICE: graceful_exit(): received signal: " + str(signum))
+
+	# Wait for any orders that are still being placed in the background
+	if ( tda_gobotv2_helper.order_executor != None ):
+		tda_gobotv2_helper.order_executor.wait(timeout=30)
+
 	tda_gobotv2_helper.export_pricehistory()
+	tda_gobotv2_helper.print_indicator_cache_stats()
 
 	# FIXME: I don't think this actually works
 	try:
@@ -1825,6 +1799,32 @@ tda_gobotv2_helper.args					= args
 tda_gobotv2_helper.algos				= algos
 tda_gobotv2_helper.tx_log_dir				= args.tx_log_dir
 tda_gobotv2_helper.stocks				= stocks
+tda_gobotv2_helper.build_stream_index()
+
+# Place equity orders in the background so that the stream handlers never block
+if ( args.sync_orders == False ):
+	tda_gobotv2_helper.order_executor = tda_order_helper.OrderExecutor( max_workers=args.order_workers )
+
+# Bounded history retention (see tda_gobotv2_helper.trim_history())
+# Size the candle history from the longest lookback period used by any of the algos
+history_max_candles = args.history_max_candles
+if ( history_max_candles == 0 ):
+	max_period = 0
+	for algo in algos:
+		for key in algo.keys():
+			try:
+				if ( re.search('_period$', key) != None ):
+					max_period = max( max_period, int(algo[key]) )
+
+				elif ( re.search('_periods(_primary|_secondary)?$', key) != None ):
+					max_period = max( [max_period] + [ int(p) for p in str(algo[key]).split(',') if p != '' ] )
+			except:
+				pass
+
+	history_max_candles = max( args.history_min_candles, max_period * args.history_lookback_mult )
+
+tda_gobotv2_helper.history_max_candles			= history_max_candles
+tda_gobotv2_helper.stream_history_max			= args.stream_history_max
 tda_gobotv2_helper.prev_timestamp			= 0
 
 # StochRSI / RSI
@@ -1853,13 +1853,6 @@ tda_gobotv2_helper.default_chop_high_limit		= 61.8
 # Initialize pricehistory for each stock ticker
 print( 'Populating pricehistory for stock tickers: ' + str(list(stocks.keys())) )
 
-# TDA API is limited to 150 non-transactional calls per minute. It's best to sleep
-#  a bit here to avoid spurious errors later.
-if ( len(stocks) > 30 ):
-	time.sleep(60)
-else:
-	time.sleep(len(stocks))
-
 # Log in again - avoids failing later and we can call this as often as we want
 if ( tda_gobot_helper.tdalogin(passcode, token_fname) != True ):
 	print('Error: tdalogin(): Login failure', file=sys.stderr)
@@ -1880,6 +1873,36 @@ time_prev = tda_gobot_helper.fix_timestamp(time_prev)
 time_now_epoch = int( time_now.timestamp() * 1000 )
 time_prev_epoch = int( time_prev.timestamp() * 1000 )
 
+# Use weekly_ifile/daily_ifile if configured, otherwise the weekly and daily candle data
+#  is downloaded below with the rest of the warmup calls
+def load_ifile(ticker=None, ifile=None):
+	import pickle
+
+	parent_path	= os.path.dirname( os.path.realpath(__file__) )
+	ifile		= str(parent_path) + '/' + re.sub('TICKER', ticker, ifile)
+	print('Using ' + str(ifile))
+
+	try:
+		with open(ifile, 'rb') as handle:
+			return pickle.loads( handle.read() )
+
+	except Exception as e:
+		print(str(e) + ', falling back to get_pricehistory().')
+
+	return {}
+
+# Returns True if a weekly or daily pricehistory result is usable
+def check_candles(data=None):
+	if ( (isinstance(data, bool) and data == False) or data == {} or
+			('empty' in data and str(data['empty']).lower() == 'true') ):
+		return False
+
+	return True
+
+# Queue all the API calls needed for each ticker and run them concurrently
+# The TDA API is limited to 120 non-transactional calls per minute, Warmup() rate limits
+#  the calls to --warmup_rate and retries failed calls (logging in again before each retry).
+warmup = tda_warmup_helper.Warmup( max_workers=args.warmup_workers, rate=args.warmup_rate, login=lambda: tda_gobot_helper.tdalogin(passcode, token_fname), debug=args.debug )
 for ticker in list(stocks.keys()):
 	if ( stocks[ticker]['isvalid'] == False ):
 		continue
@@ -1890,45 +1913,93 @@ for ticker in list(stocks.keys()):
 		# Disable extended hours for indicator tickers
 		extended_hours = False
 
-	data	= False
-	count	= 0
-	while ( isinstance(data, bool) and data == False ):
+	def get_pricehistory_1m(attempt=1, ticker=ticker, extended_hours=extended_hours):
+
+		# BUG: data corruption on TDAs side can lead to truncated data.
+		# Disabling extended hours for this particular stock can allow the bot
+		#  to move forward. The alternative is to disable the ticker altogether.
+		if ( attempt >= 3 and stocks[ticker]['tradeable'] == False ):
+			extended_hours = False
+
 		data, epochs = tda_gobot_helper.get_pricehistory(ticker, p_type, f_type, freq, period, time_prev_epoch, time_now_epoch, needExtendedHoursData=extended_hours, debug=False)
-		if ( isinstance(data, bool) and data == False ):
-			time.sleep(5)
-			if ( tda_gobot_helper.tdalogin(passcode, token_fname) != True ):
-				print('Error: (' + str(ticker) + '): Login failure')
+		return data
+
+	# TDA can sometimes return less data than we need, but if we try again it will work
+	# BUG: TDA's pricehistory is particularly buggy with $TRINQ for some reason, so don't
+	#  bother retrying if there is not enough data (see the workaround below).
+	min_candles = 400 if ( ticker != '$TRINQ' ) else 0
+	warmup.add( ticker, 'pricehistory', func=get_pricehistory_1m,
+			check=lambda data, min_candles=min_candles: not isinstance(data, bool) and len(data['candles']) >= min_candles )
+
+	# Skip the rest of the setup procedure for indicator tickers
+	if ( re.search('^\$', ticker) != None ):
+		continue
+
+	# Get general information about the stock that we can use later
+	# I.e. volatility, resistance, etc.
+	# 3-week and 20-week high / low / average
+	check_stats = lambda stats: not ( isinstance(stats[0], bool) and stats[0] == False )
+	warmup.add( ticker, 'three_week', func=lambda attempt, ticker=ticker: tda_gobot_helper.get_price_stats(ticker, days=15), check=check_stats, attempts=3 )
+	warmup.add( ticker, 'twenty_week', func=lambda attempt, ticker=ticker: tda_gobot_helper.get_price_stats(ticker, days=100), check=check_stats, attempts=3 )
+
+	# Key Levels
+	# Use weekly_ifile or download weekly candle data
+	if ( args.weekly_ifile != None ):
+		stocks[ticker]['pricehistory_weekly'] = load_ifile( ticker, args.weekly_ifile )
+
+	if ( stocks[ticker]['pricehistory_weekly'] == {} ):
+		warmup.add( ticker, 'pricehistory_weekly', check=check_candles,
+				func=lambda attempt, ticker=ticker: tda_gobot_helper.get_pricehistory(ticker, 'year', 'weekly', '1', '2', needExtendedHoursData=False)[0] )
+
+	# Use daily_ifile or download daily candle data
+	if ( args.daily_ifile != None ):
+		stocks[ticker]['pricehistory_daily'] = load_ifile( ticker, args.daily_ifile )
+
+	if ( stocks[ticker]['pricehistory_daily'] == {} ):
+		warmup.add( ticker, 'pricehistory_daily', check=check_candles,
+				func=lambda attempt, ticker=ticker: tda_gobot_helper.get_pricehistory(ticker, 'year', 'daily', '1', '2', needExtendedHoursData=False)[0] )
+
+warmup_results = warmup.run()
+
+for ticker in list(stocks.keys()):
+	if ( stocks[ticker]['isvalid'] == False or ticker not in warmup_results ):
+		continue
+
+	results = warmup_results[ticker]
+
+	# 3-week and 20-week high / low / average
+	for stat, days in [ ('three_week', 15), ('twenty_week', 100) ]:
+		if ( stat not in results ):
 			continue
 
-		else:
-			if ( len(data['candles']) < 400 ):
-
-				# BUG: TDA's pricehistory is particularly buggy with $TRINQ for some reason.
-				#  As a workaround, we'll set $TRINQ history to $TRIN, and the equity stream will
-				#  eventually fill in the real-time $TRINQ data.
-				if ( ticker == '$TRINQ' ):
-					stocks['$TRINQ']['isvalid']		= True
-					stocks['$TRINQ']['pricehistory']	= stocks['$TRIN']['pricehistory']
-					break
-
-				# TDA can sometimes return less data than we need, but if we try again it will work
-				count += 1
-				if ( count >= 3 ):
-					break
-
-				# BUG: data corruption on TDAs side can lead to truncated data.
-				# Disabling extended hours for this particular stock can allow the bot
-				#  to move forward. The alternative is to disable the ticker altogether.
-				elif ( count == 2 ):
-					if ( stocks[ticker]['tradeable'] == False ):
-						extended_hours = False
-
-				data = False
-				time.sleep(5)
+		high, low, avg = results[stat]
+		if ( isinstance(high, bool) and high == False ):
+			print('Error: get_price_stats(' + str(ticker) + ', days=' + str(days) + '): invalidating ticker')
+			stocks[ticker]['isvalid'] = False
+			continue
 
-			else:
-				stocks[ticker]['pricehistory'] = data
-				break
+		stocks[ticker][stat + '_high']	= high
+		stocks[ticker][stat + '_low']	= low
+		stocks[ticker][stat + '_avg']	= avg
+
+	if ( stocks[ticker]['isvalid'] == False ):
+		continue
+
+	data = results['pricehistory']
+	if ( isinstance(data, bool) and data == False ):
+		data = { 'candles': [] }
+
+	if ( len(data['candles']) < 400 ):
+
+		# BUG: TDA's pricehistory is particularly buggy with $TRINQ for some reason.
+		#  As a workaround, we'll set $TRINQ history to $TRIN, and the equity stream will
+		#  eventually fill in the real-time $TRINQ data.
+		if ( ticker == '$TRINQ' ):
+			stocks['$TRINQ']['isvalid']		= True
+			stocks['$TRINQ']['pricehistory']	= stocks['$TRIN']['pricehistory']
+
+	else:
+		stocks[ticker]['pricehistory'] = data
 
 	if ( len(data['candles']) < 400 ):
 		print('Warning: stock(' + str(ticker) + '): len(pricehistory[candles]) is very low (' + str(len(data['candles'])) + ') - is this a new stock ticker? Removing from the list.')
@@ -1941,7 +2012,10 @@ for ticker in list(stocks.keys()):
 		continue
 
 	# 5-minute candles to calculate things like Average True Range
+	# Any 1-minute candles at the end of pricehistory that belong to the current 5-minute interval
+	#  are passed to aggregator_5m, so gobot_run() can complete that interval with the streamed candles.
 	stocks[ticker]['pricehistory_5m'] = tda_gobot_helper.translate_1m( pricehistory=stocks[ticker]['pricehistory'], candle_type=5 )
+	stocks[ticker]['aggregator_5m'].seed( stocks[ticker]['pricehistory'] )
 
 	# Translate and add Heiken Ashi candles to pricehistory (will add new array called stocks[ticker]['pricehistory']['hacandles'])
 	stocks[ticker]['pricehistory'] = tda_gobot_helper.translate_heikin_ashi(stocks[ticker]['pricehistory'])
@@ -1951,98 +2025,18 @@ for ticker in list(stocks.keys()):
 		continue
 
 	# Key Levels
-	# Use weekly_ifile or download weekly candle data
-	if ( args.weekly_ifile != None ):
-		import pickle
-
-		parent_path	= os.path.dirname( os.path.realpath(__file__) )
-		weekly_ifile	= str(parent_path) + '/' + re.sub('TICKER', ticker, args.weekly_ifile)
-		print('Using ' + str(weekly_ifile))
-
-		try:
-			with open(weekly_ifile, 'rb') as handle:
-				stocks[ticker]['pricehistory_weekly'] = handle.read()
-				stocks[ticker]['pricehistory_weekly'] = pickle.loads(stocks[ticker]['pricehistory_weekly'])
-
-		except Exception as e:
-			print(str(e) + ', falling back to get_pricehistory().')
-			stocks[ticker]['pricehistory_weekly'] = {}
-
-	if ( stocks[ticker]['pricehistory_weekly'] == {} ):
-
-		# Use get_pricehistory() to download weekly data
-		wkly_p_type	= 'year'
-		wkly_period	= '2'
-		wkly_f_type	= 'weekly'
-		wkly_freq	= '1'
-
-		count		= 0
-		print('(' + str(ticker) + '): Using TDA API for weekly pricehistory...')
-		while ( stocks[ticker]['pricehistory_weekly'] == {} ):
-			count += 1
-			if ( count > 2 ):
-				print('(' + str(ticker) + '): Using TDA API for weekly pricehistory... attempt ' + str(count))
-
-			stocks[ticker]['pricehistory_weekly'], ep = tda_gobot_helper.get_pricehistory(ticker, wkly_p_type, wkly_f_type, wkly_freq, wkly_period, needExtendedHoursData=False)
-			if ( (isinstance(stocks[ticker]['pricehistory_weekly'], bool) and stocks[ticker]['pricehistory_weekly'] == False) or
-					stocks[ticker]['pricehistory_weekly'] == {} or
-					('empty' in stocks[ticker]['pricehistory_weekly'] and str(stocks[ticker]['pricehistory_weekly']['empty']).lower() == 'true') ):
-				time.sleep(5)
-				if ( tda_gobot_helper.tdalogin(passcode, token_fname) != True ):
-					print('Error: (' + str(ticker) + '): Login failure')
-
-				continue
+	if ( 'pricehistory_weekly' in results ):
+		stocks[ticker]['pricehistory_weekly'] = results['pricehistory_weekly'] if ( check_candles(results['pricehistory_weekly']) == True ) else {}
 
 	if ( stocks[ticker]['pricehistory_weekly'] == {} ):
 		print('(' + str(ticker) + '): Warning: unable to retrieve weekly data to calculate key levels, skipping.')
 		continue
 
-	# Use daily_ifile or download daily candle data
-	if ( args.daily_ifile != None ):
-		import pickle
-
-		parent_path = os.path.dirname( os.path.realpath(__file__) )
-		daily_ifile = str(parent_path) + '/' + re.sub('TICKER', ticker, args.daily_ifile)
-		print('Using ' + str(daily_ifile))
-
-		try:
-			with open(daily_ifile, 'rb') as handle:
-				stocks[ticker]['pricehistory_daily'] = handle.read()
-				stocks[ticker]['pricehistory_daily'] = pickle.loads(stocks[ticker]['pricehistory_daily'])
-
-		except Exception as e:
-			print(str(e) + ', falling back to get_pricehistory().')
-			stocks[ticker]['pricehistory_daily'] = {}
-
-	if ( stocks[ticker]['pricehistory_daily'] == {} ):
-
-		# Use get_pricehistory() to download daily data
-		daily_p_type	= 'year'
-		daily_period	= '2'
-		daily_f_type	= 'daily'
-		daily_freq	= '1'
-
-		count		= 0
-		print('(' + str(ticker) + '): Using TDA API for daily pricehistory...')
-		while ( stocks[ticker]['pricehistory_daily'] == {} ):
-			count += 1
-			if ( count > 2 ):
-				print('(' + str(ticker) + '): Using TDA API for daily pricehistory... attempt ' + str(count))
-
-			stocks[ticker]['pricehistory_daily'], ep = tda_gobot_helper.get_pricehistory(ticker, daily_p_type, daily_f_type, daily_freq, daily_period, needExtendedHoursData=False)
-			if ( (isinstance(stocks[ticker]['pricehistory_daily'], bool) and stocks[ticker]['pricehistory_daily'] == False) or
-					stocks[ticker]['pricehistory_daily'] == {} or
-					('empty' in stocks[ticker]['pricehistory_daily'] and str(stocks[ticker]['pricehistory_daily']['empty']).lower() == 'true') ):
-
-				time.sleep(5)
-				stocks[ticker]['pricehistory_daily'] = {}
-				if ( tda_gobot_helper.tdalogin(passcode, token_fname) != True ):
-					print('Error: (' + str(ticker) + '): Login failure')
-				continue
+	if ( 'pricehistory_daily' in results ):
+		stocks[ticker]['pricehistory_daily'] = results['pricehistory_daily'] if ( check_candles(results['pricehistory_daily']) == True ) else {}
 
 	if ( stocks[ticker]['pricehistory_daily'] == {} ):
 		print('(' + str(ticker) + '): Warning: unable to retrieve daily data, skipping.')
-		stocks[ticker]['pricehistory_daily'] = {}
 		continue
 
 	# Calculate the keylevels
@@ -2095,7 +2089,7 @@ for ticker in list(stocks.keys()):
 	else:
 		mprofile = {}
 		try:
-			mprofile = tda_algo_helper.get_market_profile(pricehistory=stocks[ticker]['pricehistory'], close_type='hl2', mp_mode='vol', tick_size=0.01)
+			mprofile = tda_algo_helper.get_market_profile(pricehistory=stocks[ticker]['pricehistory'], close_type='hl2', mp_mode='vol', tick_size=0.01, sessions=3)
 
 		except Exception as e:
 			print('Exception caught: get_market_profile(' + str(ticker) + '): ' + str(e) + '. VAH/VAL will not be used.')
@@ -2119,12 +2113,10 @@ for ticker in list(stocks.keys()):
 	# End Volume Profile
 
 	# Today's open + previous day high/low/close (PDH/PDL/PDC)
-	cur_day_start = time_now.strftime('%Y-%m-%d')
-	for key in stocks[ticker]['pricehistory']['candles']:
-		tmp_t = datetime.datetime.fromtimestamp(int(key['datetime'])/1000, tz=mytimezone).strftime('%Y-%m-%d %H:%M')
-		if ( tmp_t == str(cur_day_start) + ' 09:30' ):
-			stocks[ticker]['today_open'] = key['open']
-			break
+	cur_day_start	= time_now.strftime('%Y-%m-%d')
+	open_idx	= tda_candle_helper.get_sessions( stocks[ticker]['pricehistory'] ).find( cur_day_start, minute=570 )
+	if ( open_idx >= 0 ):
+		stocks[ticker]['today_open'] = stocks[ticker]['pricehistory']['candles'][open_idx]['open']
 
 	try:
 		stocks[ticker]['previous_day_high']	= stocks[ticker]['pricehistory_daily']['candles'][-1]['high']
@@ -2193,6 +2185,14 @@ for ticker in list(stocks.keys()):
 		stocks[ticker]['cur_daily_ma'] = ( ma3[-1], ma5[-1], ma8[-1] )
 
 
+# Streaming archive (see tda_archive_helper.py)
+# Start by archiving the candles loaded at startup
+if ( args.no_archive == False ):
+	tda_gobotv2_helper.archiver = tda_archive_helper.Archiver( base_dir=args.tx_log_dir, codec=args.archive_codec )
+	for ticker in stocks.keys():
+		tda_gobotv2_helper.archiver.extend( ticker, 'candles', [ c for c in stocks[ticker]['pricehistory']['candles'] if c['datetime'] != 9999999999999 ] )
+
+
 # Initializes and reads from TDA stream API
 async def read_stream():
 	loop = asyncio.get_running_loop()
@@ -6,11 +6,15 @@
 # Returns stock information as obtained from TDA's Get Quote API (https://api.tdameritrade.com/v1/marketdata/)
 #
 # Example: ./tda-quote-stock.py AAPL --pretty
+#
+# Use --json to print the quote, instrument or history data as JSON for use by other tools, i.e.:
+#   ./tda-quote-stock.py --stocks=AAPL,MSFT --json
 
 import os, sys
 import time, datetime, pytz
 import argparse
 import re
+import json
 
 import robin_stocks.tda as tda
 
@@ -31,6 +35,7 @@ parser.add_argument("--token_fname", help='Filename containing the account token
 
 parser.add_argument("-c", "--checkticker", help="Check if ticker is valid", action="store_true")
 parser.add_argument("-p", "--pretty", help="Pretty print the stock data", action="store_true")
+parser.add_argument("-j", "--json", help="Print the stock data as JSON (--rawquote, --quote, --history and --get_instrument)", action="store_true")
 parser.add_argument("-n", "--lines", help="Number of lines to output (relevant for indicators like vwap, etc.)", default=10, type=int)
 parser.add_argument("--skip_check", help="Skip fixup and check of stock ticker", action="store_true")
 
@@ -77,6 +82,20 @@ if args.debug:
 
 mytimezone = pytz.timezone("US/Eastern")
 
+# Print data as JSON, pretty printed, or as is
+def print_data(data=None, end='\n'):
+	if ( args.json == True ):
+		indent = 4 if ( args.pretty == True ) else None
+		print( json.dumps(data, indent=indent, default=str) )
+
+	elif ( args.pretty == True ):
+		import pprint
+		pp = pprint.PrettyPrinter(indent=4)
+		pp.pprint(data)
+
+	else:
+		print(data, end=end)
+
 if ( args.end_date == -1 ):
 	args.end_date	= datetime.datetime.now( mytimezone )
 	args.end_date	= int( args.end_date.timestamp() * 1000 )
@@ -163,13 +182,7 @@ if ( args.get_instrument == True ):
 		print('Error: search_instruments(' + str(stock) + '): Empty data set', file=sys.stderr)
 		exit(1)
 
-	if ( args.pretty == True ):
-		import pprint
-		pp = pprint.PrettyPrinter(indent=4)
-		pp.pprint(data)
-	else:
-		print(data, end='')
-
+	print_data(data, end='')
 	sys.exit(0)
 
 # Get option chains for ticker
@@ -299,19 +312,36 @@ elif ( args.get_earnings_calendar == True ):
 	sys.exit(0)
 
 
+# Get the latest price for one or more tickers
+# With --json the full quote record is printed for each ticker
 elif ( args.quote == True ):
 
 	try:
-		last_price = tda_gobot_helper.get_lastprice(stock, WarnDelayed=False)
+		quotes = tda_gobot_helper.get_quote_records(stock)
 
 	except Exception as e:
-		print('Caught Exception: get_lastprice(' + str(ticker) + '): ' + str(e), file=sys.stderr)
+		print('Caught Exception: get_quote_records(' + str(stock) + '): ' + str(e), file=sys.stderr)
 		exit(1)
 
-	if ( last_price == False ):
+	if ( isinstance(quotes, bool) and quotes == False ):
 		exit(1)
 
-	print( str(stock) + "\t" + str(last_price))
+	if ( args.json == True ):
+		data = {}
+		for ticker, quote in quotes.items():
+			data[ticker] = quote._asdict()
+			del data[ticker]['data']
+
+		print_data(data)
+		exit(0)
+
+	for ticker, quote in quotes.items():
+		last_price = quote.last_price
+		if ( last_price == 0 ):
+			last_price = quote.mark
+
+		print( str(ticker) + "\t" + str(last_price))
+
 	exit(0)
 
 
@@ -338,16 +368,11 @@ elif ( args.history == True ):
 	if ( data == False ):
 		exit(1)
 
-	if ( args.pretty == True ):
+	if ( args.pretty == True and args.json == False ):
 		for idx,key in enumerate(data['candles']):
 			data['candles'][idx]['datetime'] = datetime.datetime.fromtimestamp(float(data['candles'][idx]['datetime'])/1000, tz=mytimezone).strftime('%Y-%m-%d %H:%M:%S.%f')
 
-		import pprint
-		pp = pprint.PrettyPrinter(indent=4)
-		pp.pprint(data)
-	else:
-		print(data)
-
+	print_data(data)
 
 	exit(0)
 
@@ -436,24 +461,17 @@ else:
 
 if ( args.rawquote == True ):
 
+	# Large lists of tickers are split into batches, see tda_rest_helper.get_quotes_batch()
 	try:
-		data,err = tda.stocks.get_quotes(stock, True)
+		data = tda_gobot_helper.get_quotes(stock)
 	except Exception as e:
-		print('Exception caught: ' + str(e))
-
-	if ( err != None ):
-		print('Error: get_quotes(' + str(stock) + '): ' + str(err), file=sys.stderr)
+		print('Exception caught: get_quotes(' + str(stock) + '): ' + str(e), file=sys.stderr)
 		exit(1)
-	elif ( data == {} ):
-		print('Error: get_quotes(' + str(stock) + '): Empty data set', file=sys.stderr)
+
+	if ( isinstance(data, bool) and data == False ):
 		exit(1)
 
-	if ( args.pretty == True ):
-		import pprint
-		pp = pprint.PrettyPrinter(indent=4)
-		pp.pprint(data)
-	else:
-		print(data, end='')
+	print_data(data, end='')
 
 
 
@@ -6,7 +6,7 @@
 # Sell all owned stock of <ticker>
 # If the stock is shorted, it will initiate a buy_to_cover instead of a sell
 import robin_stocks.tda as tda
-import os, time
+import os
 import argparse
 
 parser = argparse.ArgumentParser()
@@ -151,27 +151,42 @@ elif ( args.panic == True ): ## Panic button
 			print('Not confirmed, exiting.')
 			exit(0)
 
-	found = False
+	# Get the quotes for all the positions at once, and then submit the orders concurrently
+	#  (tda_rest_helper rate-limits the order requests)
 	data = tda.get_account(args.account_number, options='positions', jsonify=True)
-	for asset in data[0]['securitiesAccount']['positions']:
-		if ( asset['instrument']['assetType'] != 'EQUITY' ):
-			continue
+	positions = [ asset for asset in data[0]['securitiesAccount']['positions'] if ( asset['instrument']['assetType'] == 'EQUITY' ) ]
+
+	found = False
+	if ( len(positions) > 0 ):
+		found = True
 
-		stock = str(asset['instrument']['symbol']).upper()
-		last_price = tda_gobot_helper.get_lastprice(stock)
+		quotes = tda_gobot_helper.get_quote_records( [ str(asset['instrument']['symbol']).upper() for asset in positions ] )
+		if ( isinstance(quotes, bool) and quotes == False ):
+			quotes = {}
 
-		if ( float(asset['shortQuantity']) > 0 ):
-			sell_value = float(last_price) * float(asset['shortQuantity'])
-			print('Covering ' + str(asset['shortQuantity']) + ' shares of ' + str(stock) + ' at market price (~$' + str(sell_value) + ")\n")
-			data = tda_gobot_helper.buytocover_stock_marketprice(stock, asset['shortQuantity'], fillwait=False, account_number=args.account_number, debug=True)
-		else:
-			sell_value = float(last_price) * float(asset['longQuantity'])
-			print('Selling ' + str(asset['longQuantity']) + ' shares of ' + str(stock) + ' at market price (~$' + str(sell_value) + ")\n")
-			data = tda_gobot_helper.sell_stock_marketprice(stock, asset['longQuantity'], fillwait=False, account_number=args.account_number, debug=True)
+		import tda_order_helper
+		executor = tda_order_helper.OrderExecutor( max_workers=8 )
 
-		time.sleep(0.2) # Avoid hammering
+		for asset in positions:
+			stock = str(asset['instrument']['symbol']).upper()
 
-		found = True
+			last_price = 0
+			if ( stock in quotes ):
+				last_price = quotes[stock].last_price
+
+			if ( float(asset['shortQuantity']) > 0 ):
+				sell_value = float(last_price) * float(asset['shortQuantity'])
+				print('Covering ' + str(asset['shortQuantity']) + ' shares of ' + str(stock) + ' at market price (~$' + str(sell_value) + ")\n")
+				executor.submit( stock, tda_gobot_helper.buytocover_stock_marketprice, args=(stock, asset['shortQuantity']),
+							kwargs={ 'fillwait': False, 'account_number': args.account_number, 'debug': True } )
+			else:
+				sell_value = float(last_price) * float(asset['longQuantity'])
+				print('Selling ' + str(asset['longQuantity']) + ' shares of ' + str(stock) + ' at market price (~$' + str(sell_value) + ")\n")
+				executor.submit( stock, tda_gobot_helper.sell_stock_marketprice, args=(stock, asset['longQuantity']),
+							kwargs={ 'fillwait': False, 'account_number': args.account_number, 'debug': True } )
+
+		# Wait for all the orders to complete
+		executor.shutdown()
 
 	if ( found == False ):
 		print('Error: no stocks found under account number ' + str(args.account_number))
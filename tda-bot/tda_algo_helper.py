@@ -1,6 +1,7 @@
 #!/usr/bin/python3 -u
 
 import os, sys
+import bisect
 from datetime import datetime, timedelta
 from pytz import timezone
 
@@ -12,6 +13,7 @@ import tulipy as ti
 import talib
 
 import tda_gobot_helper
+from tda_candle_helper import CandleStore, get_prices, num_candles, price_types, get_sessions
 
 
 # Return the N-period simple moving average (SMA)
@@ -27,40 +29,7 @@ def get_sma(pricehistory=None, period=200, type='close', debug=False):
 		pass
 
 	# Put pricehistory data into a numpy array
-	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(int(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
-
-	prices = np.array( prices )
+	prices = get_prices(pricehistory, type)
 
 	# Get the N-day SMA
 	sma = []
@@ -94,40 +63,7 @@ def get_ema(pricehistory=None, period=50, type='close', debug=False):
 		pass
 
 	# Put pricehistory data into a numpy array
-	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(int(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
-
-	prices = np.array( prices )
+	prices = get_prices(pricehistory, type)
 
 	# Get the N-day EMA
 	ema = []
@@ -185,41 +121,8 @@ def get_alt_ma(pricehistory=None, period=50, ma_type='kama', type='hlc3', mama_f
 	if ( isinstance(pricehistory, (list, np.ndarray)) == True ):
 		prices = np.array( pricehistory )
 
-	elif ( isinstance(pricehistory['candles'], list) == True ):
-		prices = []
-		if ( type == 'close' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['close']))
-
-		elif ( type == 'high' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['high']))
-
-		elif ( type == 'low' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['low']))
-
-		elif ( type == 'open' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['open']))
-
-		elif ( type == 'volume' ):
-			for key in pricehistory['candles']:
-				prices.append(int(key['volume']))
-
-		elif ( type == 'hl2' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-		elif ( type == 'hlc3' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-		elif ( type == 'ohlc4' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
-
-		prices = np.array( prices )
+	elif ( isinstance(pricehistory, CandleStore) or isinstance(pricehistory['candles'], list) == True ):
+		prices = get_prices(pricehistory, type)
 
 	else:
 		return False
@@ -338,12 +241,9 @@ def get_alt_ma(pricehistory=None, period=50, ma_type='kama', type='hlc3', mama_f
 
 	# The Volume Weighted Moving Average is simalair to a Simple Moving Average, but it weights each bar by its volume
 	elif ( ma_type == 'vwma' ):
-		volume = []
-		for key in pricehistory['candles']:
-			# Note: in python the volume is essentially an "int" type, but ti.vwma expects 'float64_t' type
-			#   for volume data instead of 'long'
-			volume.append( float(key['volume']) )
-		volume = np.array( volume )
+		# Note: in python the volume is essentially an "int" type, but ti.vwma expects 'float64_t' type
+		#   for volume data instead of 'long'
+		volume = get_prices(pricehistory, 'volume')
 
 		try:
 			ma = ti.vwma(prices, volume, period=period)
@@ -460,39 +360,10 @@ def get_frama(pricehistory=None, type='hl2', period=20, fastma=1, slowma=198, pl
 	if ( isinstance(pricehistory, (list, np.ndarray)) == True ):
 		prices = np.array( pricehistory )
 
-	elif ( isinstance(pricehistory['candles'], list) == True ):
+	elif ( isinstance(pricehistory, CandleStore) or isinstance(pricehistory['candles'], list) == True ):
 		prices = []
-		if ( type == 'close' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['close']))
-
-		elif ( type == 'high' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['high']))
-
-		elif ( type == 'low' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['low']))
-
-		elif ( type == 'open' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['open']))
-
-		elif ( type == 'volume' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['volume']))
-
-		elif ( type == 'hl2' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-		elif ( type == 'hlc3' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-		elif ( type == 'ohlc4' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+		if ( type in price_types ):
+			prices = get_prices(pricehistory, type)
 
 		else:
 			# Undefined type
@@ -612,45 +483,12 @@ def get_historic_volatility_ti(ticker=None, period=21, type='close', debug=False
 		print('Error: get_historic_volatility(' + str(ticker) + '): get_pricehistory() returned False', file=sys.stderr)
 		return False, []
 
-	if ( len(pricehistory['candles']) < period ):
+	if ( num_candles(pricehistory) < period ):
 		# Possibly this ticker is too new, not enough history
-		print('Error: get_historic_volatility(' + str(ticker) + '): len(pricehistory) is less than period (' + str(len(pricehistory['candles'])) + ')')
+		print('Error: get_historic_volatility(' + str(ticker) + '): len(pricehistory) is less than period (' + str(num_candles(pricehistory)) + ')')
 
 	# Put pricehistory data into a numpy array
-	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
-
-	prices = np.array( prices )
+	prices = get_prices(pricehistory, type)
 
 	# Get the N-day historical volatility
 	try:
@@ -705,9 +543,9 @@ def get_historic_volatility(ticker=None, period=21, type='close', debug=False):
 		print('Error: get_historic_volatility(' + str(ticker) + '): get_pricehistory() returned False', file=sys.stderr)
 		return False
 
-	if ( len(pricehistory['candles']) < period ):
+	if ( num_candles(pricehistory) < period ):
 		# Possibly this ticker is too new, not enough history
-		print('Warning: get_historic_volatility(' + str(ticker) + '): len(pricehistory) is less than period (' + str(len(pricehistory['candles'])) + ')')
+		print('Warning: get_historic_volatility(' + str(ticker) + '): len(pricehistory) is less than period (' + str(num_candles(pricehistory)) + ')')
 
 	# Put pricehistory data into a numpy array
 	prices = np.array([[1,1]])
@@ -799,24 +637,16 @@ def get_atr(pricehistory=None, period=14, debug=False):
 	except:
 		pass
 
-	if ( len(pricehistory['candles']) < period ):
+	if ( num_candles(pricehistory) < period ):
 		# Possibly this ticker is too new, not enough history
 		print( 'Warning: get_atr(' + str(ticker) + ', ' + str(period) + '): len(pricehistory) is less than period (' +
-			str(len(pricehistory['candles'])) + ') - unable to calculate ATR/NATR')
+			str(num_candles(pricehistory)) + ') - unable to calculate ATR/NATR')
 		return False, []
 
 	# Put pricehistory data into a numpy array
-	high = []
-	low = []
-	close = []
-	for key in pricehistory['candles']:
-		high.append( float(key['high']) )
-		low.append( float(key['low']) )
-		close.append( float(key['close']) )
-
-	high = np.array( high )
-	low = np.array( low )
-	close = np.array( close )
+	high	= get_prices(pricehistory, 'high')
+	low	= get_prices(pricehistory, 'low')
+	close	= get_prices(pricehistory, 'close')
 
 	# Get the N-day ATR / NATR
 	atr = []
@@ -869,30 +699,22 @@ def get_adx(pricehistory=None, period=14, debug=False):
 	except:
 		pass
 
-	if ( len(pricehistory['candles']) < period ):
+	if ( num_candles(pricehistory) < period ):
 		# Possibly this ticker is too new, not enough history
 		print( 'Warning: get_adx(' + str(ticker) + ', ' + str(period) + '): len(pricehistory) is less than period (' +
-			str(len(pricehistory['candles'])) + ') - unable to calculate ADX/-DI/+DI')
+			str(num_candles(pricehistory)) + ') - unable to calculate ADX/-DI/+DI')
 		return False, [], []
 
 	# Put pricehistory data into a numpy array
-	high = []
-	low = []
-	close = []
 	try:
-		for key in pricehistory['candles']:
-			high.append( float(key['high']) )
-			low.append( float(key['low']) )
-			close.append( float(key['close']) )
+		high	= get_prices(pricehistory, 'high')
+		low	= get_prices(pricehistory, 'low')
+		close	= get_prices(pricehistory, 'close')
 
 	except Exception as e:
 		print('Caught Exception: get_adx(' + str(ticker) + '): while populating numpy arrays: ' + str(e))
 		return False, [], []
 
-	high = np.array( high )
-	low = np.array( low )
-	close = np.array( close )
-
 	# Get the N-day ADX / -DI / +DI
 	adx = []
 	plus_di = []
@@ -936,32 +758,26 @@ def get_vpt(pricehistory=None, period=128, debug=False):
 	except:
 		pass
 
-	if ( len(pricehistory['candles']) < period ):
+	if ( num_candles(pricehistory) < period ):
 		# Possibly this ticker is too new, not enough history
 		print( 'Warning: get_vpt(' + str(ticker) + ', ' + str(period) + '): len(pricehistory) is less than period (' +
-			str(len(pricehistory['candles'])) + ') - unable to calculate VPT')
+			str(num_candles(pricehistory)) + ') - unable to calculate VPT')
 		return False, []
 
-	vpt = []
-	vpt_sum = 0
-	for idx,key in enumerate(pricehistory['candles']):
-		if ( idx == 0 ):
-			vpt.append(0)
-			continue
-
-		cur_volume = float( pricehistory['candles'][idx]['volume'] )
-		cur_close = float( pricehistory['candles'][idx]['close'] )
-		prev_close = float( pricehistory['candles'][idx-1]['close'] )
+	volume	= get_prices(pricehistory, 'volume')
+	close	= get_prices(pricehistory, 'close')
 
-		# Avoid division by 0 errors
-		if ( prev_close == 0 ):
-			prev_close = cur_close
+	# Avoid division by 0 errors
+	prev_close		= np.empty_like( close )
+	prev_close[0]		= close[0]
+	prev_close[1:]		= close[:-1]
+	prev_close[prev_close == 0] = close[prev_close == 0]
 
-		vpt_sum = vpt_sum + ( cur_volume * ((cur_close - prev_close) / prev_close) )
-		vpt.append(vpt_sum)
+	vpt	= volume * ( (close - prev_close) / prev_close )
+	vpt[0]	= 0
+	vpt	= np.cumsum( vpt )
 
 	# Get the vpt signal line
-	vpt = np.array( vpt )
 	vpt_sma = []
 	try:
 		vpt_sma = ti.sma(vpt, period=period)
@@ -986,27 +802,21 @@ def get_aroon_osc(pricehistory=None, period=25, debug=False):
 	except:
 		pass
 
-	if ( len(pricehistory['candles']) < period ):
+	if ( num_candles(pricehistory) < period ):
 		# Possibly this ticker is too new, not enough history
 		print( 'Warning: get_aroon_osc(' + str(ticker) + ', ' + str(period) + '): len(pricehistory) is less than period (' +
-			str(len(pricehistory['candles'])) + ') - unable to calculate the aroon oscillator')
+			str(num_candles(pricehistory)) + ') - unable to calculate the aroon oscillator')
 		return False
 
 	# Put pricehistory data into a numpy array
-	high = []
-	low = []
 	try:
-		for key in pricehistory['candles']:
-			high.append( float(key['high']) )
-			low.append( float(key['low']) )
+		high	= get_prices(pricehistory, 'high')
+		low	= get_prices(pricehistory, 'low')
 
 	except Exception as e:
 		print('Caught Exception: get_aroon_osc(' + str(ticker) + '): while populating numpy arrays: ' + str(e))
 		return False
 
-	high = np.array( high )
-	low = np.array( low )
-
 	# Get the N-day ADX / -DI / +DI
 	aroonosc = []
 	try:
@@ -1051,37 +861,8 @@ def get_rsi(pricehistory=None, rsi_period=14, type='close', debug=False):
 		pass
 
 	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+	if ( type in price_types ):
+		prices = get_prices(pricehistory, type)
 
 	else:
 		# Undefined type
@@ -1121,15 +902,10 @@ def get_mfi(pricehistory=None, period=14, debug=False):
 	except:
 		pass
 
-	high	= []
-	low	= []
-	close	= []
-	volume	= []
-	for key in pricehistory['candles']:
-		high.append(	float(key['high'])	)
-		low.append(	float(key['low'])	)
-		close.append(	float(key['close'])	)
-		volume.append(	float(key['volume'])	)
+	high	= get_prices(pricehistory, 'high')
+	low	= get_prices(pricehistory, 'low')
+	close	= get_prices(pricehistory, 'close')
+	volume	= get_prices(pricehistory, 'volume')
 
 	if ( len(high) < period ):
 		# Something is wrong with the data we got back from tda.get_price_history()
@@ -1173,37 +949,8 @@ def get_stochrsi(pricehistory=None, rsi_period=14, stochrsi_period=128, type='cl
 		return False, [], []
 
 	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+	if ( type in price_types ):
+		prices = get_prices(pricehistory, type)
 
 	else:
 		# Undefined type
@@ -1221,7 +968,7 @@ def get_stochrsi(pricehistory=None, rsi_period=14, stochrsi_period=128, type='cl
 		stochrsi = ti.stochrsi( prices, period=rsi_period )
 
 	except Exception as e:
-		print( 'Caught Exception: get_stochrsi(' + str(ticker) + '): ti.stochrsi(): ' + str(e) + ', len(pricehistory)=' + str(len(pricehistory['candles'])) )
+		print( 'Caught Exception: get_stochrsi(' + str(ticker) + '): ti.stochrsi(): ' + str(e) + ', len(pricehistory)=' + str(num_candles(pricehistory)) )
 		return False, [], []
 
 	# ti.rsi + ti.stoch
@@ -1239,7 +986,7 @@ def get_stochrsi(pricehistory=None, rsi_period=14, stochrsi_period=128, type='cl
 		#k, d = talib.STOCH( rsi, rsi, rsi, fastk_period=rsi_k_period, slowk_period=slow_period, slowk_matype=0, slowd_period=rsi_d_period, slowd_matype=0 )
 
 	except Exception as e:
-		print( 'Caught Exception: get_stochrsi(' + str(ticker) + '): ti.stoch(): ' + str(e) + ', len(pricehistory)=' + str(len(pricehistory['candles'])) )
+		print( 'Caught Exception: get_stochrsi(' + str(ticker) + '): ti.stoch(): ' + str(e) + ', len(pricehistory)=' + str(num_candles(pricehistory)) )
 		return False, [], []
 
 	return stochrsi, k, d
@@ -1272,7 +1019,7 @@ def get_stochmfi(pricehistory=None, mfi_period=14, mfi_k_period=128, mfi_d_perio
 		mfi_k, mfi_d = ti.stoch( mfi, mfi, mfi, mfi_k_period, slow_period, mfi_d_period )
 
 	except Exception as e:
-		print( 'Caught Exception: get_stochmfi(' + str(ticker) + '): ti.stoch(): ' + str(e) + ', len(pricehistory)=' + str(len(pricehistory['candles'])) )
+		print( 'Caught Exception: get_stochmfi(' + str(ticker) + '): ti.stoch(): ' + str(e) + ', len(pricehistory)=' + str(num_candles(pricehistory)) )
 		return False, []
 
 	return mfi_k, mfi_d
@@ -1297,28 +1044,16 @@ def get_stoch_oscillator(pricehistory=None, type=None, k_period=14, d_period=3,
 		pass
 
 	if ( type == None ):
-		high = []
-		low = []
-		close = []
-		for key in pricehistory['candles']:
-			high.append(float(key['high']))
-			low.append(float(key['low']))
-			close.append(float(key['close']))
+		high	= get_prices(pricehistory, 'high')
+		low	= get_prices(pricehistory, 'low')
+		close	= get_prices(pricehistory, 'close')
 
 	elif ( type == 'hlc3' ):
-		high = []
-		low = []
-		close = []
-		for key in pricehistory['candles']:
-			close.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
+		close = get_prices(pricehistory, 'hlc3')
 		high = low = close
 
 	elif ( type == 'hlc4' ):
-		high = []
-		low = []
-		close = []
-		for key in pricehistory['candles']:
-			close.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+		close = get_prices(pricehistory, 'ohlc4')
 		high = low = close
 
 	else:
@@ -1339,7 +1074,7 @@ def get_stoch_oscillator(pricehistory=None, type=None, k_period=14, d_period=3,
 	return fastk, fastd
 
 
-# Takes the pricehistory and returns a pandas dataframe with the VWAP
+# Takes the pricehistory and returns numpy arrays with the VWAP and upper/lower bands
 # Example:
 #   data, epochs = tda_gobot_helper.get_pricehistory(stock, 'day', 'minute', '1', 1, needExtendedHoursData=True, debug=False)
 #   tda_gobot_helper.get_vwap(data)
@@ -1387,76 +1122,159 @@ def get_vwap(pricehistory=None, day='today', end_timestamp=None, use_bands=True,
 		day_start = mytimezone.localize(day_start)
 		day_start = int( day_start.timestamp() * 1000 )
 
-	# Calculate VWAP
-	prices = np.array([[1,1,1]])
-	for key in pricehistory['candles']:
-		if ( day != None and float(key['datetime']) < day_start ):
-			continue
+	# Select the candles from day_start up to and including the first candle at or
+	#  after end_timestamp
+	dt	= get_datetimes(pricehistory)
+	price	= get_prices(pricehistory, 'hlc3')
+	volume	= get_prices(pricehistory, 'volume')
 
-		price = ( float(key['high']) + float(key['low']) + float(key['close']) ) / 3
-		prices = np.append( prices, [[float(key['datetime']), price, float(key['volume'])]], axis=0 )
+	idx = np.arange( len(dt) )
+	if ( day != None ):
+		idx = idx[dt >= day_start]
+	if ( end_timestamp != None ):
+		end = np.flatnonzero( dt[idx] >= float(end_timestamp) )
+		if ( len(end) > 0 ):
+			idx = idx[:end[0]+1]
 
-		if ( end_timestamp != None ):
-			if ( float(key['datetime']) >= float(end_timestamp) ):
-				break
+	try:
+		vwap, vwap_up, vwap_down = vwap_sessions( price[idx], volume[idx], np.zeros(len(idx), dtype=np.int64), use_bands=use_bands, num_stddev=num_stddev )
 
-	# Remove the first value used to initialize np array
-	prices = np.delete(prices, 0, axis=0)
+	except Exception as e:
+		print('Caught exception: get_vwap(' + str(ticker) + '): ' + str(e), file=sys.stderr)
+		return False, [], []
 
-	columns = ['DateTime', 'AvgPrice', 'Volume']
-	df = pd.DataFrame(data=prices, columns=columns)
-	q = df.Volume.values
-	p = df.AvgPrice.values
+	if ( use_bands == False ):
+		return vwap, [], []
+
+	if ( debug == True ):
+		for i in range( len(idx) ):
+			date = datetime.fromtimestamp(float(dt[idx[i]])/1000, tz=mytimezone).strftime('%Y-%m-%d %H:%M:%S.%f')
+			print( 'Date: ' + str(date) +
+				', VWAP: ' + str(vwap[i]) +
+				', VWAP_UP: ' + str(vwap_up[i]) +
+				', VWAP_DOWN: ' + str(vwap_down[i]) )
+
+	return vwap, vwap_up, vwap_down
+
+
+# Return the VWAP and bands for every session in pricehistory
+#
+# This computes the same values as calling get_vwap(pricehistory, day=<day>) for each
+#  day, but in one pass over the candles. Each calendar day (local time) is a session that
+#  starts at 01:00, as with get_vwap(). Candles before 01:00 are not part of any session
+#  and their values are set to nan.
+#
+# Returns vwap[], vwap_up[], vwap_down[] with one value per candle in pricehistory.
+def get_vwap_all(pricehistory=None, use_bands=True, num_stddev=2, debug=False):
+
+	if ( pricehistory == None ):
+		return False, [], []
 
-	# Check for 0 values in q (volume), which would mess up our vwap calculation below
-	for idx,val in enumerate(q):
-		if ( val == 0 ):
-			q[idx] = 1
-	for idx,val in enumerate(p):
-		if ( val == 0 or str(val) == '.0' ):
-			p[idx] = p[-5] # arbitrary price value
+	ticker = ''
+	try:
+		ticker = pricehistory['symbol']
+	except:
+		pass
 
-	# vwap = Cumulative(Typical Price x Volume) / Cumulative(Volume)
 	try:
-		vwap = df.assign(vwap=(p * q).cumsum() / q.cumsum())
+		session, days = get_session_index( pricehistory, session_start_hour=1 )
+		vwap, vwap_up, vwap_down = vwap_sessions( get_prices(pricehistory, 'hlc3'), get_prices(pricehistory, 'volume'), session, use_bands=use_bands, num_stddev=num_stddev )
 
 	except Exception as e:
-		print('Caught exception: get_vwap(' + str(ticker) + '): ' + str(e), file=sys.stderr)
+		print('Caught exception: get_vwap_all(' + str(ticker) + '): ' + str(e), file=sys.stderr)
 		return False, [], []
 
-	vwap = vwap['vwap'].to_numpy()
 	if ( use_bands == False ):
 		return vwap, [], []
 
-	# Calculate the standard deviation for each bar and the upper/lower bands
-	vwap_up = []
-	vwap_down = []
-	vwap_sum = float(0)
-	vwap_stddev_cumsum = float(0)
+	return vwap, vwap_up, vwap_down
 
-	for idx,val in enumerate(vwap):
-		vwap_sum += val
-		vwap_avg = vwap_sum / (idx + 1)
-		vwap_stddev_cumsum += (val - vwap_avg) ** 2
 
-		stdev = np.sqrt( vwap_stddev_cumsum / (idx + 1) )
+# Return the datetime (epoch ms) of each candle as a numpy array
+def get_datetimes(pricehistory=None):
+	if ( isinstance(pricehistory, CandleStore) ):
+		return pricehistory.datetime
 
-		vwap_up.append( val + stdev * num_stddev )
-		vwap_down.append( val - stdev * num_stddev )
+	return np.array( [ key['datetime'] for key in pricehistory['candles'] ], dtype=np.int64 )
 
-	if ( debug == True ):
-		idx = 0
-		for key in pricehistory['candles']:
-			if ( day == True and float(key['datetime']) < day_start ):
-				continue
 
-			date = datetime.fromtimestamp(float(key['datetime'])/1000, tz=mytimezone).strftime('%Y-%m-%d %H:%M:%S.%f')
-			print( 'Date: ' + str(date) +
-				', VWAP: ' + str(vwap[idx]) +
-				', VWAP_UP: ' + str(vwap_up[idx]) +
-				', VWAP_DOWN: ' + str(vwap_down[idx]) )
+# Return the session index of each timestamp (epoch ms) in datetimes, and the list
+#  of days (%Y-%m-%d) that correspond to each session index.
+#
+# datetimes may also be a CandleStore or pricehistory dict, in which case the session
+#  data cached by the CandleStore is used (see tda_candle_helper.Sessions).
+#
+# Each calendar day in local time is one session, starting at session_start_hour.
+#  Timestamps before session_start_hour are assigned session index -1.
+def get_session_index(datetimes=None, session_start_hour=0):
+
+	sessions	= get_sessions( datetimes )
+	days, session	= sessions.days()
 
-			idx += 1
+	session = session.astype(np.int64)
+	session[sessions.minute < session_start_hour * 60] = -1
+
+	return session, days.astype('datetime64[D]').astype(str).tolist()
+
+
+# Compute the VWAP and stddev bands for each session in one pass
+#
+# price, volume and session must have the same length, and the candles for each session
+#  must be contiguous. Candles with a session index of -1 are skipped and set to nan.
+#
+# The running sums are calculated with a single cumsum over all candles, and the value
+#  of the cumsum at the start of each session is subtracted from the candles in that
+#  session. Within a session:
+#
+#   vwap      = Cumulative(Typical Price x Volume) / Cumulative(Volume)
+#   stddev    = sqrt( Cumulative((vwap - Average(vwap))^2) / N )
+#   vwap_up   = vwap + stddev * num_stddev
+#   vwap_down = vwap - stddev * num_stddev
+#
+# As in the original get_vwap(), zero volume is replaced with 1 and a zero price is
+#  replaced with the fifth most recent price in the session.
+def vwap_sessions(price=None, volume=None, session=None, use_bands=True, num_stddev=2):
+
+	num		= len(price)
+	vwap		= np.full( num, np.nan )
+	vwap_up		= np.full( num, np.nan )
+	vwap_down	= np.full( num, np.nan )
+
+	valid	= np.flatnonzero( np.asarray(session) >= 0 )
+	if ( len(valid) == 0 ):
+		return vwap, vwap_up, vwap_down
+
+	p = np.array( price, dtype=np.float64 )[valid]
+	q = np.array( volume, dtype=np.float64 )[valid]
+	s = np.asarray( session )[valid]
+
+	# Start/end of each session, the session number of each candle and the
+	#  number of candles in the session so far
+	starts	= np.flatnonzero( np.concatenate(([True], s[1:] != s[:-1])) )
+	ends	= np.append( starts[1:], len(s) )
+	seg	= np.repeat( np.arange(len(starts)), ends - starts )
+	count	= np.arange( len(s) ) - starts[seg] + 1
+
+	q[q == 0] = 1
+	zero = np.flatnonzero( p == 0 )
+	if ( len(zero) > 0 ):
+		p[zero] = p[ np.maximum(ends[seg[zero]] - 5, starts[seg[zero]]) ]
+
+	def session_cumsum(x):
+		cs = np.cumsum(x)
+		return cs - np.concatenate( ([0], cs) )[starts][seg]
+
+	v = session_cumsum( p * q ) / session_cumsum( q )
+	vwap[valid] = v
+
+	if ( use_bands == False ):
+		return vwap, vwap_up, vwap_down
+
+	avg	= session_cumsum( v ) / count
+	stdev	= np.sqrt( session_cumsum( (v - avg) ** 2 ) / count )
+
+	vwap_up[valid]		= v + stdev * num_stddev
+	vwap_down[valid]	= v - stdev * num_stddev
 
 	return vwap, vwap_up, vwap_down
 
@@ -1475,37 +1293,8 @@ def get_bbands(pricehistory=None, type='hlc3', period=20, stddev=2, matype=0, de
 		return False, [], []
 
 	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+	if ( type in price_types ):
+		prices = get_prices(pricehistory, type)
 
 	else:
 		# Undefined type
@@ -1528,7 +1317,7 @@ def get_bbands(pricehistory=None, type='hlc3', period=20, stddev=2, matype=0, de
 		bbands_upper, bbands_middle, bbands_lower = talib.BBANDS(df['prices'], timeperiod=period, nbdevup=stddev, nbdevdn=stddev, matype=matype)
 
 	except Exception as e:
-		print( 'Caught Exception: get_bbands(' + str(ticker) + '): ti.bbands(): ' + str(e) + ', len(pricehistory)=' + str(len(pricehistory['candles'])) )
+		print( 'Caught Exception: get_bbands(' + str(ticker) + '): ti.bbands(): ' + str(e) + ', len(pricehistory)=' + str(num_candles(pricehistory)) )
 		return False, [], []
 
 	# Normalize the size of bbands_*[] to match the input size
@@ -1595,7 +1384,7 @@ def get_kchannels(pricehistory=None, type='hlc3', period=20, matype='ema', atr_p
 	atr = tmp + list(atr)
 
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(ma)):
+	for i in range(0, num_candles(pricehistory) - len(ma)):
 		tmp.append(0)
 	ma = tmp + list(ma)
 
@@ -1622,19 +1411,16 @@ def get_macd(pricehistory=None, short_period=12, long_period=26, signal_period=9
 	except:
 		pass
 
-	if ( len(pricehistory['candles']) < short_period ):
+	if ( num_candles(pricehistory) < short_period ):
 		# Possibly this ticker is too new, not enough history
 		print( 'Warning: get_macd(' + str(ticker) + ', ' + str(period) + '): len(pricehistory) is less than short_period (' +
-			str(len(pricehistory['candles'])) + ') - unable to calculate MACD')
+			str(num_candles(pricehistory)) + ') - unable to calculate MACD')
 		return False, [], []
 
 	# Put pricehistory close prices into a numpy array
 	prices = []
 	try:
-		for key in pricehistory['candles']:
-			prices.append( float(key['close']) )
-
-		prices = np.array( prices )
+		prices = get_prices(pricehistory, 'close')
 
 	except Exception as e:
 		print('Caught Exception: get_macd(' + str(ticker) + '): ' + str(e))
@@ -1669,14 +1455,8 @@ def get_chop_index(pricehistory=None, period=20, debug=False):
 		pass
 
 	# Put pricehistory data into a numpy array
-	high = []
-	low = []
-	for key in pricehistory['candles']:
-		high.append( float(key['high']) )
-		low.append( float(key['low']) )
-
-	high = np.array( high )
-	low = np.array( low )
+	high	= get_prices(pricehistory, 'high')
+	low	= get_prices(pricehistory, 'low')
 
 	# Get ATR
 	atr = []
@@ -1722,6 +1502,9 @@ def get_chop_index(pricehistory=None, period=20, debug=False):
 
 
 # Supertrend index
+# The basic bands are calculated with numpy, and the final bands and supertrend
+#  (which each depend on the previous value) are calculated together in a single pass.
+#  See also tda_incremental_helper.Supertrend for the streaming version.
 def get_supertrend(pricehistory=None, multiplier=3, atr_period=128):
 
 	if ( pricehistory == None ):
@@ -1742,79 +1525,43 @@ def get_supertrend(pricehistory=None, multiplier=3, atr_period=128):
 		print('Caught exception: get_supertrend(' + str(ticker) + '): ' + str(e))
 		return False
 
-	# Ensure length of atr[] matches length of pricehistory['candles']
-	atr = list(atr)
-	filler = len(pricehistory['candles']) - len(atr)
-	for i in range(filler):
-		atr.insert(0,0)
-
-	# Calculate the initial upper/lower bands
-	avg_price	= 0
-	upper_band	= []
-	lower_band	= []
-	for i in range(0, len(pricehistory['candles'])):
-		cur_high = float( pricehistory['candles'][i]['high'] )
-		cur_low = float( pricehistory['candles'][i]['low'] )
-
-		# Average Price
-		avg_price = (cur_high + cur_low) / 2
-
-		# Basic Upper Band
-		upper_band.append( avg_price + (multiplier * atr[i]) )
-
-		# Lower Band
-		lower_band.append( avg_price - (multiplier * atr[i]) )
-
-	# Final Upper Band
-	final_upper = []
-	for i in range(0, len(pricehistory['candles'])):
-		prev_close = float( pricehistory['candles'][i-1]['close'] )
-
-		if ( i == 0 ):
-			final_upper.append(0)
-
-		else:
-			if ( upper_band[i] < final_upper[i-1] or prev_close > final_upper[i-1] ):
-				final_upper.append( upper_band[i] )
-
-			else:
-				final_upper.append( final_upper[i-1] )
+	if ( isinstance(atr, bool) and atr == False ):
+		return False
 
-	# Final Lower Band
-	final_lower = []
-	for i in range(0, len(pricehistory['candles'])):
-		prev_close = float( pricehistory['candles'][i-1]['close'] )
+	high	= get_prices(pricehistory, 'high')
+	low	= get_prices(pricehistory, 'low')
+	close	= get_prices(pricehistory, 'close')
 
-		if ( i == 0 ):
-			final_lower.append(0)
+	# Ensure length of atr[] matches length of pricehistory['candles']
+	full_atr = np.zeros( len(close) )
+	full_atr[len(close)-len(atr):] = atr
 
+	# Calculate the initial upper/lower bands
+	avg_price	= ( high + low ) / 2
+	upper_band	= ( avg_price + (multiplier * full_atr) ).tolist()
+	lower_band	= ( avg_price - (multiplier * full_atr) ).tolist()
+	close		= close.tolist()
+
+	supertrend	= [0] * len(close)
+	final_upper	= final_lower = 0
+	for i in range(1, len(close)):
+		prev_close	= close[i-1]
+		prev_upper	= final_upper
+		prev_lower	= final_lower
+
+		# Final Upper Band
+		if ( upper_band[i] < prev_upper or prev_close > prev_upper ):
+			final_upper = upper_band[i]
+
+		# Final Lower Band
+		if ( lower_band[i] > prev_lower or prev_close < prev_lower ):
+			final_lower = lower_band[i]
+
+		# SuperTrend
+		if ( supertrend[i-1] == prev_upper ):
+			supertrend[i] = final_upper if ( close[i] <= final_upper ) else final_lower
 		else:
-			if ( lower_band[i] > final_lower[i-1] or prev_close < final_lower[i-1] ):
-				final_lower.append(lower_band[i])
-
-			else:
-				final_lower.append(final_lower[i-1])
-
-	# SuperTrend
-	supertrend = []
-	for i in range(0, len(pricehistory['candles'])):
-		cur_close = float( pricehistory['candles'][i]['close'] )
-
-		if ( i == 0 ):
-			supertrend.append(0)
-
-		elif ( supertrend[i-1] == final_upper[i-1] and cur_close <= final_upper[i] ):
-			supertrend.append(final_upper[i])
-
-		elif ( supertrend[i-1] == final_upper[i-1] and cur_close > final_upper[i] ):
-			supertrend.append(final_lower[i])
-
-		elif ( supertrend[i-1] == final_lower[i-1] and cur_close >= final_lower[i] ):
-			supertrend.append(final_lower[i])
-
-		elif ( supertrend[i-1] == final_lower[i-1] and cur_close < final_lower[i] ):
-			 supertrend.append(final_upper[i])
-
+			supertrend[i] = final_lower if ( close[i] >= final_lower ) else final_upper
 
 	return supertrend
 
@@ -1835,84 +1582,130 @@ def get_keylevels(pricehistory=None, atr_period=14, filter=True, plot=False, deb
 	except:
 		pass
 
-	# Determine if level is a support pivot based on five-candle fractal
-	def is_support(df, i, filter=True):
-		support = False
-		try:
-
-			# Use five-candle fractal
-			support_1 =	df['low'][i] <= df['low'][i-1] and \
-					df['low'][i] <= df['low'][i+1] and \
-					df['low'][i+1] <= df['low'][i+2] and \
-					df['low'][i-1] <= df['low'][i-2]
-
-
-			# Test four-candle fractals
-			support_2 =	df['low'][i] <= df['low'][i-1] and \
-					df['low'][i] <= df['low'][i+1] and \
-					df['low'][i+1] <= df['low'][i+2]
+	high	= get_prices(pricehistory, 'high')
+	low	= get_prices(pricehistory, 'low')
+	dt	= get_datetimes(pricehistory)
+	num	= len(high)
 
-			support_3 =	df['low'][i] <= df['low'][i-1] and \
-					df['low'][i] <= df['low'][i+1] and \
-					df['low'][i-1] <= df['low'][i-2]
+	# Find the support and resistance pivots using five-candle and four-candle fractals
+	#  Support:	low[i] <= low[i-1] and low[i] <= low[i+1] and ( low[i+1] <= low[i+2] or low[i-1] <= low[i-2] )
+	#  Resistance:	high[i] >= high[i-1] and high[i] >= high[i+1] and ( high[i+1] >= high[i+2] or high[i-1] >= high[i-2] )
+	#
+	# A candle that is both a support and resistance pivot is only used as a support level.
+	support = resistance = np.zeros( 0, dtype=bool )
+	if ( num >= 5 ):
+		i = np.arange( 2, num-2 )
+		support		= ( low[i] <= low[i-1] ) & ( low[i] <= low[i+1] ) & \
+				  ( (low[i+1] <= low[i+2]) | (low[i-1] <= low[i-2]) )
+
+		resistance	= ( high[i] >= high[i-1] ) & ( high[i] >= high[i+1] ) & \
+				  ( (high[i+1] >= high[i+2]) | (high[i-1] >= high[i-2]) )
+
+		resistance	&= ~support
+
+	# Find the average true range at each pivot, which we use with filter=True to reduce
+	#  noise by eliminating levels that are within one ATR of levels that have already
+	#  been discovered. The ATR for the pivot at candle i is the ATR of candles 0..i-1
+	#  (or 0..atr_period for the first few candles), so ATR only needs to be calculated
+	#  once for the full pricehistory.
+	atr = []
+	if ( filter == True and num > atr_period ):
+		try:
+			atr, natr = get_atr(pricehistory=pricehistory, period=atr_period)
 
 		except Exception as e:
-			print('Exception caught: get_keylevels(' + str(ticker) + '): is_support(): ' + str(e) + '. Ignoring level (' + str(df['low'][i]) + ').' )
-			return False, []
-
-		if ( support_1 == True or support_2 == True or support_3 == True ):
-			return True
-
-		return False
+			print('Exception caught: get_keylevels(' + str(ticker) + '): get_atr(): ' + str(e) + '. Falling back to np.mean().')
+			atr = []
 
-	# Determine if level is a resistance pivot based on five-candle fractal
-	def is_resistance(df, i, filter=True):
-		resistance = False
-		try:
+	if ( isinstance(atr, bool) or len(atr) == 0 ):
+		atr = np.full( max(num, 1), np.mean(high - low) if ( num > 0 ) else 0 )
+		atr_offset = 0
+	else:
+		atr = np.asarray( atr )
+		atr_offset = num - len(atr)
+
+	def atr_at(i):
+		if ( atr_offset == 0 ):
+			return atr[i]
+		return atr[ max(i-1, atr_period) - atr_offset ]
+
+	# Returns False if lvl is within atr of a level in sorted_levels
+	def check_atr_level( lvl=None, atr=1, sorted_levels=[] ):
+		pos = bisect.bisect_left( sorted_levels, lvl )
+		if ( pos > 0 and abs(lvl - sorted_levels[pos-1]) < atr ):
+			return False
+		if ( pos < len(sorted_levels) and abs(lvl - sorted_levels[pos]) < atr ):
+			return False
 
-			# Use five-candle fractal
-			resistance_1 =	df['high'][i] >= df['high'][i-1] and \
-					df['high'][i] >= df['high'][i+1] and \
-					df['high'][i+1] >= df['high'][i+2] and \
-					df['high'][i-1] >= df['high'][i-2]
+		return True
+
+	# Process all pivots in order and append them to long_support[] or long_resistance[]
+	long_support		= []
+	long_resistance		= []
+	plot_support_levels	= []
+	plot_resistance_levels	= []
+	sorted_support		= []
+	sorted_resistance	= []
+	for i in np.flatnonzero( support | resistance ) + 2:
+		i = int(i)
+		if ( support[i-2] == True ):
+			lvl, levels, sorted_levels, plot_levels = float(low[i]), long_support, sorted_support, plot_support_levels
+		else:
+			lvl, levels, sorted_levels, plot_levels = float(high[i]), long_resistance, sorted_resistance, plot_resistance_levels
 
+		# Check if this level is at least one ATR value away from a previously
+		#   discovered level
+		if ( filter == True and check_atr_level(lvl, atr_at(i), sorted_levels) == False ):
+			continue
 
-			# Test four-candle fractals
-			resistance_2 =	df['high'][i] >= df['high'][i-1] and \
-					df['high'][i] >= df['high'][i+1] and \
-					df['high'][i+1] >= df['high'][i+2]
+		levels.append( (lvl, int(dt[i])) )
+		bisect.insort( sorted_levels, lvl )
+		if ( plot == True ):
+			plot_levels.append( (i, lvl) )
 
-			resistance_3 =	df['high'][i] >= df['high'][i-1] and \
-					df['high'][i] >= df['high'][i+1] and \
-					df['high'][i-1] >= df['high'][i-2]
+	# Count how many times a keylevel has been hit (within 1.5%) by the levels that
+	#  follow it. We can use the later to help gauge importance.
+	#
+	# Levels are processed in reverse order so that sorted_levels only contains the
+	#  later levels. The bisect bounds are a little wider than 1.5%, and then narrowed
+	#  using the same comparison as before.
+	def count_hits(levels=[]):
 
-		except Exception as e:
-			print('Exception caught: get_keylevels(' + str(ticker) + '): is_resistance(): ' + str(e) + '. Ignoring level (' + str(df['high'][i]) + ').' )
-			return False, []
+		def is_hit(lvl, lvl2):
+			return abs(lvl / lvl2 - 1) * 100 < 1.5
 
-		if ( resistance_1 == True or resistance_2 == True or resistance_3 == True ):
-			return True
+		counts		= [1] * len(levels)
+		sorted_levels	= []
+		for idx in range( len(levels)-1, -1, -1 ):
+			lvl	= levels[idx][0]
+			lo	= bisect.bisect_left( sorted_levels, lvl / 1.016 )
+			hi	= bisect.bisect_right( sorted_levels, lvl / 0.984 )
+			while ( lo < hi and is_hit(lvl, sorted_levels[lo]) == False ):
+				lo += 1
+			while ( hi > lo and is_hit(lvl, sorted_levels[hi-1]) == False ):
+				hi -= 1
 
-		return False
+			counts[idx] += hi - lo
+			bisect.insort( sorted_levels, lvl )
 
-	# Reduce noise by eliminating levels that are close to levels that
-	#   have already been discovered
-	def check_atr_level( lvl=None, atr=1, levels=[] ):
-		levels_t = []
-		if ( len(levels) > 0 and isinstance(levels[0], tuple) ):
-			for i in levels:
-				levels_t.append(i[0])
+		return [ (lvl, dt, counts[idx]) for idx, (lvl, dt) in enumerate(levels) ]
 
-		return np.sum( [abs(lvl - x) < atr for x in levels_t] ) == 0
+	long_support_new	= count_hits( long_support )
+	long_resistance_new	= count_hits( long_resistance )
 
 
-	# Need to massage the data to ensure matplotlib works
+	# Plot the result if requested
 	if ( plot == True ):
+		from mplfinance.original_flavor import candlestick_ohlc
+		import matplotlib.dates as mpl_dates
+		import matplotlib.pyplot as plt
+
 		try:
 			assert mytimezone
 		except:
 			mytimezone = timezone("US/Eastern")
 
+		# Need to massage the data to ensure matplotlib works
 		ph = []
 		for key in pricehistory['candles']:
 
@@ -1929,136 +1722,6 @@ def get_keylevels(pricehistory=None, atr_period=14, filter=True, plot=False, deb
 		df = pd.DataFrame(data=ph, columns = ['Date', 'open', 'high', 'low', 'close', 'volume', 'datetime'])
 		df = df.loc[:,['Date', 'open', 'high', 'low', 'close', 'volume', 'datetime']]
 
-	else:
-		df = pd.DataFrame(data=pricehistory['candles'], columns = ['open', 'high', 'low', 'close', 'volume', 'datetime'])
-
-	# Process all candles and check for five-candle fractal levels, and append them to long_support[] or long_resistance[]
-	long_support = []
-	long_resistance = []
-	plot_support_levels = []
-	plot_resistance_levels = []
-	for i in range( 2, df.shape[0]-2 ):
-
-		# SUPPORT
-		if ( is_support(df, i, filter) ):
-			lvl	= float( df['low'][i] )
-			dt	= int( df['datetime'][i] )
-			if ( filter == False ):
-				long_support.append( (lvl, dt) )
-				if ( plot == True ):
-					plot_support_levels.append( (i, lvl) )
-
-				continue
-
-			# Find the average true range for this particular time period, which we
-			#  will pass to check_atr_level() to reduce noise
-			#
-			# Alternative solution:
-			#   atr = np.mean( df['high'] - df['low'] )
-			atr = []
-			tmp_ph = { 'candles': [], 'ticker': ticker }
-			if ( i < atr_period + 1 ):
-				for idx in range( 0, atr_period + 1 ):
-					tmp_ph['candles'].append( pricehistory['candles'][idx] )
-
-			else:
-				for idx in range( 0, i ):
-					tmp_ph['candles'].append( pricehistory['candles'][idx] )
-
-			try:
-				atr, natr = get_atr(pricehistory=tmp_ph, period=atr_period)
-
-			except Exception as e:
-				print('Exception caught: get_keylevels(' + str(ticker) + '): get_atr(): ' + str(e) + '. Falling back to np.mean().')
-				atr.append( np.mean(df['high'] - df['low']) )
-
-			# Check if this level is at least one ATR value away from a previously
-			#   discovered level
-			if ( check_atr_level(lvl, atr[-1], long_support) ):
-				long_support.append( (lvl, dt) )
-				if ( plot == True ):
-					plot_support_levels.append( (i, lvl) )
-
-		# RESISTANCE
-		elif ( is_resistance(df, i, filter) ):
-			lvl	= float( df['high'][i] )
-			dt	= int( df['datetime'][i] )
-			if ( filter == False ):
-				long_resistance.append( (lvl, dt) )
-				if ( plot == True ):
-					plot_resistance_levels.append( (i, lvl) )
-
-				continue
-
-			# Find the average true range for this particular time period, which we
-			#  will pass to check_atr_level() to reduce noise
-			#
-			# Alternative solution:
-			#   atr = np.mean( df['high'] - df['low'] )
-			atr = []
-			tmp_ph = { 'candles': [], 'ticker': ticker }
-			if ( i < atr_period + 1 ):
-				for idx in range( 0, atr_period + 1 ):
-					tmp_ph['candles'].append( pricehistory['candles'][idx] )
-			else:
-				for idx in range( 0, i ):
-					tmp_ph['candles'].append( pricehistory['candles'][idx] )
-
-			try:
-				atr, natr = get_atr(pricehistory=tmp_ph, period=atr_period)
-
-			except Exception as e:
-				print('Exception caught: get_keylevels(' + str(ticker) + '): get_atr(): ' + str(e) + '. Falling back to np.mean().')
-				atr.append( np.mean(float(df['high']) - float(df['low'])) )
-
-			# Check if this level is at least one ATR value away from a previously
-			#   discovered level
-			if ( check_atr_level(lvl, atr[-1], long_resistance) ):
-				long_resistance.append( (lvl, dt) )
-				if ( plot == True ):
-					plot_resistance_levels.append( (i, lvl) )
-
-
-	# Iterate through long_support and long_resistance and count how many times
-	#  a keylevel has been hit (within 1.5%). We can use the later to help
-	#  gauge importance.
-	long_support_new	= []
-	for idx in range( len(long_support) ):
-		lvl	= long_support[idx][0]
-		dt	= long_support[idx][1]
-		count	= 1
-		for idx2 in range( idx, len(long_support) ):
-			if ( idx == idx2 ):
-				continue
-
-			lvl2 = long_support[idx2][0]
-			if ( abs(lvl / lvl2 - 1) * 100 < 1.5 ):
-				count += 1
-
-		long_support_new.append( (lvl, dt, count) )
-
-	long_resistance_new	= []
-	for idx in range( len(long_resistance) ):
-		lvl	= long_resistance[idx][0]
-		dt	= long_resistance[idx][1]
-		count	= 1
-		for idx2 in range( idx, len(long_resistance) ):
-			if ( idx == idx2 ):
-				continue
-
-			lvl2 = long_resistance[idx2][0]
-			if ( abs(lvl / lvl2 - 1) * 100 < 1.5 ):
-				count += 1
-
-		long_resistance_new.append( (lvl, dt, count) )
-
-
-	# Plot the result if requested
-	if ( plot == True ):
-		from mplfinance.original_flavor import candlestick_ohlc
-		import matplotlib.dates as mpl_dates
-		import matplotlib.pyplot as plt
-
 		plt.rcParams['figure.figsize'] = [12, 7]
 		plt.rc('font', size=14)
 
@@ -2100,39 +1763,10 @@ def get_roc(pricehistory=None, type='hlc3', period=50, calc_percentage=False, de
 	if ( isinstance(pricehistory, (list, np.ndarray)) == True ):
 		prices = np.array( pricehistory )
 
-	elif ( isinstance(pricehistory['candles'], list) == True ):
+	elif ( isinstance(pricehistory, CandleStore) or isinstance(pricehistory['candles'], list) == True ):
 		prices = []
-		if ( type == 'close' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['close']))
-
-		elif ( type == 'high' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['high']))
-
-		elif ( type == 'low' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['low']))
-
-		elif ( type == 'open' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['open']))
-
-		elif ( type == 'volume' ):
-			for key in pricehistory['candles']:
-				prices.append(float(key['volume']))
-
-		elif ( type == 'hl2' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-		elif ( type == 'hlc3' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-		elif ( type == 'ohlc4' ):
-			for key in pricehistory['candles']:
-				prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+		if ( type in price_types ):
+			prices = get_prices(pricehistory, type)
 
 		else:
 			# Undefined type
@@ -2187,37 +1821,8 @@ def get_momentum(pricehistory=None, type='hl2', period=12, debug=False):
 		return False, [], []
 
 	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+	if ( type in price_types ):
+		prices = get_prices(pricehistory, type)
 
 	else:
 		# Undefined type
@@ -2247,17 +1852,17 @@ def get_momentum(pricehistory=None, type='hl2', period=12, debug=False):
 
 	# Normalize the size of the arrays to match the input size
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(mom)):
+	for i in range(0, num_candles(pricehistory) - len(mom)):
 		tmp.append(0)
 	mom = tmp + list(mom)
 
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(trix)):
+	for i in range(0, num_candles(pricehistory) - len(trix)):
 		tmp.append(0)
 	trix = tmp + list(trix)
 
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(trix_signal)):
+	for i in range(0, num_candles(pricehistory) - len(trix_signal)):
 		tmp.append(0)
 	trix_signal = tmp + list(trix_signal)
 
@@ -2278,37 +1883,8 @@ def get_trix_altma(pricehistory=None, ma_type='kama', type='hl2', period=24, sig
 		return False, []
 
 	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+	if ( type in price_types ):
+		prices = get_prices(pricehistory, type)
 
 	else:
 		# Undefined type
@@ -2371,12 +1947,12 @@ def get_trix_altma(pricehistory=None, ma_type='kama', type='hl2', period=24, sig
 		return False, []
 
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(trix)):
+	for i in range(0, num_candles(pricehistory) - len(trix)):
 		tmp.append(0)
 	trix = tmp + list(trix)
 
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(trix_signal)):
+	for i in range(0, num_candles(pricehistory) - len(trix_signal)):
 		tmp.append(0)
 	trix_signal = tmp + list(trix_signal)
 
@@ -2397,37 +1973,8 @@ def get_mesa_sine(pricehistory=None, type='hl2', period=25, debug=False):
 		return False
 
 	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+	if ( type in price_types ):
+		prices = get_prices(pricehistory, type)
 
 	else:
 		# Undefined type
@@ -2445,7 +1992,7 @@ def get_mesa_sine(pricehistory=None, type='hl2', period=25, debug=False):
 
 	sine_out = []
 	lead_out = []
-	for idx,key in enumerate(pricehistory['candles']):
+	for idx in range(len(prices)):
 		try:
 			assert idx > period
 		except:
@@ -2486,7 +2033,7 @@ def get_mesa_sine(pricehistory=None, type='hl2', period=25, debug=False):
 
 	# Normalize the size of sine_out[] and lead_out[] to match the input size
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(sine_out) ):
+	for i in range(0, num_candles(pricehistory) - len(sine_out) ):
 		tmp.append(0)
 	sine_out = tmp + list(sine_out)
 	lead_out = tmp + list(lead_out)
@@ -2518,37 +2065,8 @@ def get_mesa_emd(pricehistory=None, type='hl2', period=20, delta=0.5, fraction=0
 		return False
 
 	prices = []
-	if ( type == 'close' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['close']))
-
-	elif ( type == 'high' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['high']))
-
-	elif ( type == 'low' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['low']))
-
-	elif ( type == 'open' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['open']))
-
-	elif ( type == 'volume' ):
-		for key in pricehistory['candles']:
-			prices.append(float(key['volume']))
-
-	elif ( type == 'hl2' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low'])) / 2 )
-
-	elif ( type == 'hlc3' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
-
-	elif ( type == 'ohlc4' ):
-		for key in pricehistory['candles']:
-			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+	if ( type in price_types ):
+		prices = get_prices(pricehistory, type)
 
 	else:
 		# Undefined type
@@ -2689,11 +2207,8 @@ def get_fisher_transform(pricehistory=None, period=20, debug=False):
 		return False, []
 
 	# Fisher transform takes two arrays that contain the high and low prices
-	high_p	= []
-	low_p	= []
-	for key in pricehistory['candles']:
-		high_p.append( float(key['high']) )
-		low_p.append( float(key['low']) )
+	high_p	= get_prices(pricehistory, 'high')
+	low_p	= get_prices(pricehistory, 'low')
 
 	if ( len(high_p) < period ):
 		# Something is wrong with the data we got back from tda.get_price_history()
@@ -2715,7 +2230,7 @@ def get_fisher_transform(pricehistory=None, period=20, debug=False):
 
 	# Normalize the size of returned arrays[] to match the input size
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(fisher)):
+	for i in range(0, num_candles(pricehistory) - len(fisher)):
 		tmp.append(0)
 	fisher		= tmp + list(fisher)
 	fisher_signal	= tmp + list(fisher_signal)
@@ -2752,10 +2267,12 @@ def get_mesa_fisher_transform(pricehistory=None, period=20, debug=False):
 	# Calculate the Fisher transform
 	import math
 
+	hl2_p		= get_prices(pricehistory, 'hl2')
+
 	n_val		= []
 	fisher		= []
 	fisher_signal	= []
-	for idx,key in enumerate(pricehistory['candles']):
+	for idx in range(len(hl2_p)):
 		try:
 			assert idx > period - 1
 		except:
@@ -2766,15 +2283,9 @@ def get_mesa_fisher_transform(pricehistory=None, period=20, debug=False):
 			fisher.append(1)
 			continue
 
-		high_p	= 0
-		low_p	= 0
-		hl2	= []
-		for i in range(idx, idx-period, -1):
-			hl2.append( (pricehistory['candles'][i]['high'] + pricehistory['candles'][i]['low']) / 2 )
-
-		high_p	= max(hl2)
-		low_p	= min(hl2)
-		cur_hl2	= ( pricehistory['candles'][idx]['high'] + pricehistory['candles'][idx]['low'] ) / 2
+		high_p	= float( hl2_p[idx-period+1:idx+1].max() )
+		low_p	= float( hl2_p[idx-period+1:idx+1].min() )
+		cur_hl2	= float( hl2_p[idx] )
 
 		n_val.append( 0.33 * 2 * ( (cur_hl2 - low_p)/(high_p - low_p) - 0.5 ) + 0.67 * n_val[-1] )
 
@@ -2794,12 +2305,12 @@ def get_mesa_fisher_transform(pricehistory=None, period=20, debug=False):
 
 	# Normalize the size of returned arrays[] to match the input size
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(fisher)):
+	for i in range(0, num_candles(pricehistory) - len(fisher)):
 		tmp.append(0)
 	fisher = tmp + list(fisher)
 
 	tmp = []
-	for i in range(0, len(pricehistory['candles']) - len(fisher_signal)):
+	for i in range(0, num_candles(pricehistory) - len(fisher_signal)):
 		tmp.append(0)
 	fisher_signal = tmp + list(fisher_signal)
 
@@ -2811,7 +2322,14 @@ def get_mesa_fisher_transform(pricehistory=None, period=20, debug=False):
 # close_type: close, hl2 (default), hlc3, ohlc4
 # mp_mode: vol (volume, default), tpo (trade price opportunity)
 # tick_size: 0.01 (default), market_profile module default is actually 0.05
-def get_market_profile(pricehistory=None, close_type='hl2', mp_mode='vol', tick_size=0.01, debug=False):
+# sessions: only calculate the profile for the most recent N days (Default: all days)
+#
+# Returns an OrderedDict of days (%Y-%m-%d), each containing the same values that the
+#  market_profile module (pip3 install marketprofile) provides - val, vah, poc_price,
+#  profile, profile_range, initial_balance, open_range, balanced_target, low_value_nodes
+#  and high_value_nodes. The profile for each day is built with np.bincount() over the
+#  tick-quantized prices instead of building a DataFrame and MarketProfile object per day.
+def get_market_profile(pricehistory=None, close_type='hl2', mp_mode='vol', tick_size=0.01, sessions=None, debug=False):
 
 	if ( pricehistory == None ):
 		print('Error: get_market_profile(): pricehistory is empty', file=sys.stderr)
@@ -2823,11 +2341,6 @@ def get_market_profile(pricehistory=None, close_type='hl2', mp_mode='vol', tick_
 	except:
 		pass
 
-	try:
-		assert mytimezone
-	except:
-		mytimezone = timezone("US/Eastern")
-
 	try:
 		float( tick_size )
 	except Exception as e:
@@ -2838,63 +2351,135 @@ def get_market_profile(pricehistory=None, close_type='hl2', mp_mode='vol', tick_
 		print('Error: get_market_profile(): mode must be either "vol" or "tpo"', file=sys.stderr)
 		return False
 
-	# Import the market_profile module (pip3 install marketprofile)
-	from market_profile import MarketProfile
+	if ( close_type not in ('close', 'hl2', 'hlc3', 'ohlc4') ):
+		return False
 
 	mprofile = OrderedDict()
-	for key in pricehistory['candles']:
-		open		= float( key['open'] )
-		high		= float( key['high'] )
-		low		= float( key['low'] )
-		close		= float( key['close'] )
-		volume		= int( key['volume'] )
-		dt		= int( key['datetime'] / 1000 )
-
-		if ( close_type == 'hl2' ):
-			close = ( high + low) / 2
-		elif ( close_type == 'hlc3' ):
-			close = ( high + low + close ) / 3
-		elif ( close_type == 'ohlc4' ):
-			close = ( open + high + low + close ) / 4
-		elif ( close_type == 'close' ):
-			pass
-		else:
-			return False
+	if ( num_candles(pricehistory) == 0 ):
+		return mprofile
+
+	dt	= get_datetimes(pricehistory)
+	high	= get_prices(pricehistory, 'high')
+	low	= get_prices(pricehistory, 'low')
+	price	= get_prices(pricehistory, close_type)
+	volume	= get_prices(pricehistory, 'volume')
+
+	# Group the candles by day, and only keep the most recent N days if requested
+	session, days = get_session_index( pricehistory, session_start_hour=0 )
+	first_session = 0
+	if ( sessions != None ):
+		first_session = max( 0, len(days) - int(sessions) )
+
+	order	= np.argsort( session, kind='stable' )
+	bounds	= np.searchsorted( session[order], np.arange(len(days) + 1) )
+
+	roundoff = 1 / float(tick_size)
+	for s in range( first_session, len(days) ):
+		idx = order[bounds[s]:bounds[s+1]]
+		if ( len(idx) == 0 ):
+			continue
 
-		day = datetime.fromtimestamp(dt, tz=mytimezone).strftime('%Y-%m-%d')
-		if ( day not in mprofile ):
-			mprofile[day] = { 'p_history': np.array([[1,1,1,1,1,1]]) }
+		# Quantize the prices to tick_size, rounding up as market_profile does
+		ticks	= np.ceil( price[idx] * roundoff ).astype(np.int64)
+		weights	= volume[idx] if ( mp_mode == 'vol' ) else None
 
-		mprofile[day]['p_history'] = np.append( mprofile[day]['p_history'], [[dt,open,high,low,close,volume]], axis=0 )
+		mprofile[days[s]] = build_market_profile( ticks, weights, roundoff )
 
-	for day in mprofile.keys():
-		mprofile[day]['p_history']	= np.delete( mprofile[day]['p_history'], 0, axis=0 )
-		mprofile[day]['p_history']	= pd.DataFrame( data=mprofile[day]['p_history'], columns=['datetime', 'Open', 'High', 'Low', 'Close', 'Volume'] )
-		posix_time			= pd.to_datetime( mprofile[day]['p_history']['datetime'], unit='s' )
+		# Open range (first 10 minutes) and initial balance (first hour)
+		day_dt = ( dt[idx] / 1000 ).astype(np.int64)
+		for key, delta in ( ('open_range', 600), ('initial_balance', 3600) ):
+			end = np.searchsorted( day_dt, day_dt[0] + delta, side='right' )
+			mprofile[days[s]][key] = ( np.min(low[idx[:end]]), np.max(high[idx[:end]]) )
 
-		mprofile[day]['p_history'].insert( 0, "Date", posix_time )
-		mprofile[day]['p_history'].drop( "datetime", axis = 1, inplace = True )
+	return mprofile
 
-		mprofile[day]['p_history']	= mprofile[day]['p_history'].set_index( pd.DatetimeIndex(mprofile[day]['p_history']['Date'].values) )
-		mprofile[day]['p_history'].Date	= mprofile[day]['p_history'].Date.dt.tz_localize(tz='UTC').dt.tz_convert(tz=mytimezone)
-		mprofile[day]['p_history'].drop( columns=['Date'], axis=1, inplace=True )
 
-	# Create MarketProfile object and populate the mprofile
-	for day in mprofile.keys():
-		mp		= MarketProfile( mprofile[day]['p_history'], tick_size=tick_size, mode='vol' )
-		mp_slice	= mp[ mprofile[day]['p_history'].index.min():mprofile[day]['p_history'].index.max() ]
+# Return the market profile for one day from the quantized prices (ticks, i.e. price * 100
+#  for a tick_size of 0.01) and the volume of each candle (or None for TPO mode)
+#
+# The point of control (poc) is the price level with the most volume, or the one closest
+#  to the middle of the profile if there is more than one. The value area is grown one
+#  price level at a time from the poc, toward the side with more volume, until it
+#  contains value_area_pct of the total volume. Only price levels that were traded are
+#  included, which matches the market_profile module.
+def build_market_profile(ticks=None, volume=None, roundoff=100, value_area_pct=0.70):
+
+	ticks	= np.asarray( ticks, dtype=np.int64 )
+	base	= ticks.min()
+	counts	= np.bincount( ticks - base )
+	levels	= np.flatnonzero( counts )
+
+	if ( volume is None ):
+		profile_vol = counts[levels].astype(np.float64)
+	else:
+		profile_vol = np.bincount( ticks - base, weights=volume )[levels]
 
-		mprofile[day]['val']			= mp_slice.value_area[0]
-		mprofile[day]['vah']			= mp_slice.value_area[1]
-		mprofile[day]['profile']		= mp_slice.profile
-		mprofile[day]['initial_balance']	= mp_slice.initial_balance()
-		mprofile[day]['open_range']		= mp_slice.open_range()
-		mprofile[day]['poc_price']		= mp_slice.poc_price
-		mprofile[day]['profile_range']		= mp_slice.profile_range
-		mprofile[day]['balanced_target']	= mp_slice.balanced_target
-		mprofile[day]['low_value_nodes']	= mp_slice.low_value_nodes
-		mprofile[day]['high_value_nodes']	= mp_slice.high_value_nodes
+	prices		= ( levels + base ) / roundoff
+	vol		= profile_vol.tolist()
+	total_volume	= float( profile_vol.sum() )
 
+	mp = {	'profile':		pd.Series( profile_vol, index=prices ),
+		'profile_range':	( prices[0], prices[-1] ) }
 
-	return mprofile
+	# Point of control
+	poc_idx = None
+	maxima	= np.flatnonzero( profile_vol == np.max(profile_vol) )
+	if ( len(maxima) == 1 ):
+		poc_idx = int( maxima[0] )
+	elif ( len(maxima) > 1 ):
+		poc_idx = int( maxima[np.argmin(np.abs(maxima - len(vol) / 2))] )
+
+	if ( poc_idx == None ):
+		mp['poc_price']		= None
+		mp['val']		= None
+		mp['vah']		= None
+		mp['balanced_target']	= None
+
+	else:
+		target_vol	= total_volume * value_area_pct
+		trial_vol	= vol[poc_idx]
+		min_idx		= poc_idx
+		max_idx		= poc_idx
+		while ( trial_vol <= target_vol ):
+			next_min_idx	= max( min_idx - 1, 0 )
+			next_max_idx	= min( max_idx + 1, len(vol) - 1 )
+
+			low_volume	= vol[next_min_idx] if ( next_min_idx != min_idx ) else None
+			high_volume	= vol[next_max_idx] if ( next_max_idx != max_idx ) else None
+
+			# Note that a price level with zero volume is treated the same as no level
+			if ( not high_volume or (low_volume and low_volume > high_volume) ):
+				if ( low_volume == None ):
+					break
+				trial_vol	+= low_volume
+				min_idx		= next_min_idx
+
+			elif ( not low_volume or (high_volume and low_volume <= high_volume) ):
+				trial_vol	+= high_volume
+				max_idx		= next_max_idx
+
+			else:
+				break
+
+		poc_price = prices[poc_idx]
+		if ( prices[-1] - poc_price >= poc_price - prices[0] ):
+			balanced_target = poc_price - ( prices[-1] - poc_price )
+		else:
+			balanced_target = poc_price + ( poc_price - prices[0] )
+
+		mp['poc_price']		= poc_price
+		mp['val']		= prices[min_idx]
+		mp['vah']		= prices[max_idx]
+		mp['balanced_target']	= balanced_target
+
+	# Low and high value nodes are the local minima and maxima of the profile
+	lvn = hvn = np.zeros( len(vol), dtype=bool )
+	if ( len(vol) > 2 ):
+		lvn = np.concatenate( ([False], (profile_vol[1:-1] < profile_vol[:-2]) & (profile_vol[1:-1] < profile_vol[2:]), [False]) )
+		hvn = np.concatenate( ([False], (profile_vol[1:-1] > profile_vol[:-2]) & (profile_vol[1:-1] > profile_vol[2:]), [False]) )
+
+	mp['low_value_nodes']	= mp['profile'][lvn]
+	mp['high_value_nodes']	= mp['profile'][hvn]
+
+	return mp
 
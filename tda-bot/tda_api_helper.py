@@ -5,16 +5,34 @@
 import tda as tda_api
 from tda.client import Client
 
+import sys
 import json
 
+# HTTP requests are made through the shared REST client, see tda_rest_helper.py
+import tda_rest_helper
+
+
+# Return the shared REST client
+# If the client does not have an access token yet (i.e. tda_gobot_helper.tdalogin() was
+#  not called) then use the token from the tda-api client.
+def get_rest_client( tda_client=None ):
+
+	client = tda_rest_helper.get_client()
+	if ( client.authorized() == False and tda_client != None ):
+		client.set_token( tda_rest_helper.tda_api_token(tda_client) )
+
+	return client
+
 
 def get_watchlist_id( tda_client=None, tda_account=None, watchlist_name=None ):
 
-	if ( tda_client == None or tda_account == None or watchlist_name == None ):
+	if ( tda_account == None or watchlist_name == None ):
 		return None
 
-	watchlists = tda_client.get_watchlists_for_single_account(tda_account)
-	watchlists = watchlists.json()
+	watchlists, err = get_rest_client(tda_client).get_watchlists(tda_account)
+	if ( err != None ):
+		print('Error: get_watchlist_id(' + str(watchlist_name) + '): ' + str(err), file=sys.stderr)
+		return None
 
 	for list in watchlists:
 		if ( list['name'] == watchlist_name ):
@@ -25,14 +43,17 @@ def get_watchlist_id( tda_client=None, tda_account=None, watchlist_name=None ):
 
 def delete_watchlist_byname( tda_client=None, tda_account=None, watchlist_name=None ):
 
-	if ( tda_client == None or tda_account == None or watchlist_name == None ):
+	if ( tda_account == None or watchlist_name == None ):
 		return False
 
 	watchlist_id = get_watchlist_id(tda_client, tda_account, watchlist_name)
 	if ( watchlist_id == None ):
 		return False
 
-	tda_client.delete_watchlist( tda_account, watchlist_id )
+	data, err = get_rest_client(tda_client).delete_watchlist( tda_account, watchlist_id )
+	if ( err != None ):
+		print('Error: delete_watchlist_byname(' + str(watchlist_name) + '): ' + str(err), file=sys.stderr)
+		return False
 
 	return True
 
@@ -0,0 +1,443 @@
+#!/usr/bin/python3 -u
+
+# Streaming archive for candle, level1, level2 and time/sales data
+#
+# tda-gobot-v2 used to keep all of the streamed data in memory and pickle it at
+#  shutdown, which is slow, and the whole day is lost if the process is killed.
+#  Archiver instead appends records in the background to per-ticker, per-stream
+#  segment files while the bot is running.
+#
+# Segment files are written to <base_dir>/<YYYY-MM-DD>/<ticker>_<stream>.<NNNN>.seg and
+#  contain fixed-width numpy records (see stream_dtypes) in compressed blocks:
+#
+#   File header:	b'TDASEG1\n', uint32 header length, JSON header (stream, ticker, dtype, codec)
+#   Block:		b'BLK1', uint32 num_records, uint32 raw length, uint32 stored length, payload
+#
+# Each block is written in one call and flushed, so a killed process loses at most
+#  the records that were still buffered. A truncated final block is ignored by the
+#  reader. The segment files are memory mapped by the reader, but only segments written
+#  with codec='none' (--archive_codec=none) are read zero-copy, as views into the map.
+#  The default codec (lz4, or zlib) is compressed, so each block is decompressed into a
+#  new array as it is read.
+#
+# Reader example:
+#   import tda_archive_helper
+#   candles = tda_archive_helper.load('TX_LOGS', 'MSFT', 'candles', day='2022-03-01')
+#   pricehistory = tda_archive_helper.to_pricehistory(candles, 'MSFT')
+
+import os, sys
+import re
+import glob
+import json
+import mmap
+import queue
+import struct
+import threading
+import time, datetime
+import zlib
+
+import numpy as np
+from pytz import timezone
+
+# lz4 is much faster than zlib, use it if it is available
+try:
+	import lz4.frame as lz4
+except:
+	lz4 = None
+
+try:
+	mytimezone
+except:
+	mytimezone = timezone('US/Eastern')
+
+# Queued by flush() and close() for the worker thread
+control		= object()
+
+file_magic	= b'TDASEG1\n'
+block_magic	= b'BLK1'
+block_header	= struct.Struct('<4sIII')
+
+# Record layout for each stream
+stream_dtypes = {
+	'candles':	np.dtype([	('datetime',		'<i8'),
+					('open',		'<f8'),
+					('high',		'<f8'),
+					('low',			'<f8'),
+					('close',		'<f8'),
+					('volume',		'<i8') ]),
+
+	'level1':	np.dtype([	('datetime',		'<i8'),
+					('bid_price',		'<f8'),
+					('bid_size',		'<i8'),
+					('ask_price',		'<f8'),
+					('ask_size',		'<i8'),
+					('last_price',		'<f8'),
+					('last_size',		'<i8'),
+					('total_volume',	'<i8') ]),
+
+	# One record per price level, side is 0 for bids and 1 for asks
+	'level2':	np.dtype([	('datetime',		'<i8'),
+					('side',		'<i1'),
+					('price',		'<f8'),
+					('num',			'<i4'),
+					('total_volume',	'<i8') ]),
+
+	'ets':		np.dtype([	('datetime',		'<i8'),
+					('price',		'<f8'),
+					('size',		'<f8'),
+					('seq',			'<i8') ])
+}
+
+
+# Convert the data structures used by tda-gobot-v2 to record tuples
+def candle_records(candle=None):
+	return [ ( int(candle['datetime']), float(candle['open']), float(candle['high']), float(candle['low']),
+			float(candle['close']), int(candle['volume']) ) ]
+
+def level1_records(l1=None):
+	return [ ( int(l1['datetime']), float(l1['BID_PRICE']), int(l1['BID_SIZE']), float(l1['ASK_PRICE']), int(l1['ASK_SIZE']),
+			float(l1['LAST_PRICE']), int(l1['LAST_SIZE']), int(l1['TOTAL_VOLUME']) ) ]
+
+# l2 is { 'datetime': dt, 'asks': {price: {'num_asks', 'total_volume'}}, 'bids': {...} }
+#  or { 'datetime': dt, 'records': [...] } if the records were already built by tda_level2_helper.OrderBook.records()
+def level2_records(l2=None):
+	if ( 'records' in l2 ):
+		return l2['records']
+
+	dt	= int( l2['datetime'] )
+	records	= []
+	for price,val in l2['bids'].items():
+		records.append( (dt, 0, float(price), int(val['num_bids']), int(val['total_volume'])) )
+	for price,val in l2['asks'].items():
+		records.append( (dt, 1, float(price), int(val['num_asks']), int(val['total_volume'])) )
+
+	return records
+
+def ets_records(tx=None):
+	return [ ( int(tx['TRADE_TIME']), float(tx['LAST_PRICE']), float(tx['LAST_SIZE']), int(tx.get('LAST_SEQUENCE', 0)) ) ]
+
+record_converters = {
+	'candles':	candle_records,
+	'level1':	level1_records,
+	'level2':	level2_records,
+	'ets':		ets_records
+}
+
+
+def compress(data=None, codec='zlib'):
+	if ( codec == 'lz4' ):
+		return lz4.compress(data)
+	elif ( codec == 'zlib' ):
+		return zlib.compress(data, 1)
+
+	return data
+
+def decompress(data=None, codec='zlib'):
+	if ( codec == 'lz4' ):
+		return lz4.decompress(data)
+	elif ( codec == 'zlib' ):
+		return zlib.decompress(data)
+
+	return data
+
+def default_codec():
+	return 'lz4' if ( lz4 != None ) else 'zlib'
+
+
+# A single segment file
+class SegmentWriter:
+	def __init__(self, fname=None, ticker=None, stream=None, codec='zlib'):
+		self.fname	= fname
+		self.dtype	= stream_dtypes[stream]
+		self.codec	= codec
+		self.size	= 0
+
+		header = json.dumps( { 'ticker': ticker, 'stream': stream, 'codec': codec, 'dtype': self.dtype.descr } ).encode()
+
+		self.handle = open(fname, 'ab')
+		if ( self.handle.tell() == 0 ):
+			self.handle.write( file_magic + struct.pack('<I', len(header)) + header )
+
+		self.size = self.handle.tell()
+
+	def write(self, records=None):
+		arr	= np.array( records, dtype=self.dtype )
+		raw	= arr.tobytes()
+		data	= compress( raw, self.codec )
+
+		self.handle.write( block_header.pack(block_magic, len(arr), len(raw), len(data)) + data )
+		self.handle.flush()
+		self.size += block_header.size + len(data)
+
+	def close(self):
+		self.handle.close()
+
+
+# Background archiver
+#
+# append() only queues the data, which is safe to call from the asyncio event loop.
+#  A worker thread converts the data to records, buffers them per ticker/stream and
+#  writes a block when flush_records have accumulated or every flush_interval seconds.
+#  Segments are rotated after segment_bytes, and whenever the date changes.
+class Archiver:
+	def __init__(self, base_dir='TX_LOGS', codec=None, flush_records=4096, flush_interval=10, segment_bytes=64*1024*1024):
+		self.base_dir		= base_dir
+		self.codec		= codec if ( codec != None ) else default_codec()
+		self.flush_records	= flush_records
+		self.flush_interval	= flush_interval
+		self.segment_bytes	= segment_bytes
+
+		if ( self.codec == 'lz4' and lz4 == None ):
+			print('Warning: Archiver(): lz4 module not found, using zlib', file=sys.stderr)
+			self.codec = 'zlib'
+
+		self.queue	= queue.Queue()
+		self.buffers	= {}	# (ticker, stream) -> [records]
+		self.writers	= {}	# (ticker, stream) -> SegmentWriter
+		self.day	= None
+		self.errors	= 0
+
+		self.thread = threading.Thread( target=self._run, name='tda-archiver', daemon=True )
+		self.thread.start()
+
+	# Queue data for archiving
+	# data is one item in the format used by tda-gobot-v2, see record_converters
+	# Level2 books in the legacy dict format are converted to records before they are
+	#  queued, since the caller may update the same dicts before the worker gets to them.
+	def append(self, ticker=None, stream=None, data=None):
+		if ( stream == 'level2' and 'records' not in data ):
+			data = { 'datetime': data['datetime'], 'records': level2_records(data) }
+
+		self.queue.put( (ticker, stream, data) )
+
+	# Queue a list of items, i.e. the candles loaded at startup
+	def extend(self, ticker=None, stream=None, data=None):
+		self.queue.put( (ticker, stream, list(data), True) )
+
+	# Write all buffered records and wait for the worker to finish
+	def flush(self):
+		if ( self.thread.is_alive() == False ):
+			return
+
+		done = threading.Event()
+		self.queue.put( (control, 'flush', done) )
+		done.wait()
+
+	def close(self):
+		if ( self.thread.is_alive() == False ):
+			return
+
+		done = threading.Event()
+		self.queue.put( (control, 'close', done) )
+		done.wait()
+		self.thread.join()
+
+	def _run(self):
+		last_flush = time.time()
+		while True:
+			try:
+				item = self.queue.get( timeout=1 )
+			except queue.Empty:
+				item = None
+
+			if ( item != None and item[0] is control ):
+				self._flush_all()
+				if ( item[1] == 'close' ):
+					for writer in self.writers.values():
+						writer.close()
+					self.writers = {}
+					item[2].set()
+					return
+
+				item[2].set()
+				continue
+
+			if ( item != None ):
+				try:
+					ticker, stream, data = item[0:3]
+					convert = record_converters[stream]
+					records = self.buffers.setdefault( (ticker, stream), [] )
+
+					if ( len(item) > 3 ):
+						for d in data:
+							records.extend( convert(d) )
+					else:
+						records.extend( convert(data) )
+
+					if ( len(records) >= self.flush_records ):
+						self._flush(ticker, stream)
+
+				except Exception as e:
+					self.errors += 1
+					print('Error: Archiver(): unable to archive ' + str(item[1]) + ' data for ' + str(item[0]) + ': ' + str(e), file=sys.stderr)
+
+			if ( time.time() - last_flush >= self.flush_interval ):
+				self._flush_all()
+				last_flush = time.time()
+
+	def _writer(self, ticker=None, stream=None):
+		day = datetime.datetime.now(mytimezone).strftime('%Y-%m-%d')
+		if ( day != self.day ):
+			for writer in self.writers.values():
+				writer.close()
+
+			self.writers	= {}
+			self.day	= day
+
+		writer = self.writers.get( (ticker, stream), None )
+		if ( writer != None and writer.size < self.segment_bytes ):
+			return writer
+
+		if ( writer != None ):
+			writer.close()
+
+		out_dir = os.path.join( self.base_dir, day )
+		os.makedirs( out_dir, mode=0o755, exist_ok=True )
+
+		# Continue with a new segment number so that existing segments (i.e. from
+		#  an earlier run on the same day) are never appended to with a different codec
+		seq = len( segment_files(self.base_dir, ticker, stream, day) ) + 1
+		writer = SegmentWriter( os.path.join(out_dir, segment_name(ticker, stream, seq)), ticker, stream, self.codec )
+
+		self.writers[(ticker, stream)] = writer
+		return writer
+
+	def _flush(self, ticker=None, stream=None):
+		records = self.buffers.get( (ticker, stream), [] )
+		if ( len(records) == 0 ):
+			return
+
+		try:
+			self._writer(ticker, stream).write(records)
+
+		except Exception as e:
+			self.errors += 1
+			print('Error: Archiver(): unable to write ' + str(stream) + ' data for ' + str(ticker) + ': ' + str(e), file=sys.stderr)
+
+		self.buffers[(ticker, stream)] = []
+
+	def _flush_all(self):
+		for ticker, stream in list( self.buffers.keys() ):
+			self._flush(ticker, stream)
+
+
+# Reader API
+
+# Ticker names can contain '/', i.e. BRK/A
+def segment_name(ticker=None, stream=None, seq=1):
+	return re.sub('/', '_', str(ticker)) + '_' + str(stream) + '.' + str(seq).zfill(4) + '.seg'
+
+# Return the segment files for ticker/stream, in order
+def segment_files(base_dir='TX_LOGS', ticker=None, stream=None, day=None):
+	day	= '*' if ( day == None ) else str(day)
+	pattern	= os.path.join( base_dir, day, glob.escape(re.sub('/', '_', str(ticker))) + '_' + str(stream) + '.[0-9][0-9][0-9][0-9].seg' )
+
+	return sorted( glob.glob(pattern) )
+
+# Return the header dict for a segment file
+def read_header(fname=None):
+	with open(fname, 'rb') as handle:
+		if ( handle.read(len(file_magic)) != file_magic ):
+			raise ValueError( str(fname) + ' is not a segment file' )
+
+		header_len = struct.unpack( '<I', handle.read(4) )[0]
+		return json.loads( handle.read(header_len) )
+
+# Yield a numpy record array for each block in a segment file
+# With codec 'none' these are read-only views into a memory map of the file, with the
+#  compressed codecs each block is decompressed into a new array.
+def iter_blocks(fname=None):
+	header	= read_header(fname)
+	dtype	= np.dtype( [ tuple(f) for f in header['dtype'] ] )
+	codec	= header['codec']
+
+	with open(fname, 'rb') as handle:
+		if ( os.fstat(handle.fileno()).st_size == 0 ):
+			return
+
+		mm	= mmap.mmap( handle.fileno(), 0, access=mmap.ACCESS_READ )
+		pos	= len(file_magic) + 4 + struct.unpack_from('<I', mm, len(file_magic))[0]
+		while ( pos + block_header.size <= len(mm) ):
+			magic, num, raw_len, stored_len = block_header.unpack_from(mm, pos)
+			pos += block_header.size
+
+			# Stop at a truncated or corrupt block (i.e. the process was killed mid-write)
+			if ( magic != block_magic or pos + stored_len > len(mm) ):
+				break
+
+			if ( codec == 'none' ):
+				yield np.frombuffer( mm, dtype=dtype, count=num, offset=pos )
+			else:
+				yield np.frombuffer( decompress(mm[pos:pos+stored_len], codec), dtype=dtype, count=num )
+
+			pos += stored_len
+
+# Return all records from a segment file as a single array
+def read_segment(fname=None):
+	blocks = list( iter_blocks(fname) )
+	if ( len(blocks) == 0 ):
+		header = read_header(fname)
+		return np.array( [], dtype=[tuple(f) for f in header['dtype']] )
+	elif ( len(blocks) == 1 ):
+		return blocks[0]
+
+	return np.concatenate( blocks )
+
+# Return all records for ticker/stream (optionally only for one day) as a single array
+def load(base_dir='TX_LOGS', ticker=None, stream=None, day=None):
+	arrays = [ read_segment(f) for f in segment_files(base_dir, ticker, stream, day) ]
+	if ( len(arrays) == 0 ):
+		return np.array( [], dtype=stream_dtypes[stream] )
+
+	return np.concatenate( arrays )
+
+
+# Convert records back to the data structures used elsewhere in this repo, i.e.
+#  for the backtesting tools that expect the output of export_pricehistory()
+def to_pricehistory(records=None, ticker=None):
+
+	# The startup candles are archived on every run, so drop any duplicates if the
+	#  bot was restarted during the day
+	dts, idx	= np.unique( records['datetime'][::-1], return_index=True )
+	records		= records[::-1][idx]
+
+	ph = { 'candles': [], 'symbol': ticker }
+	for dt,o,h,l,c,v in records.tolist():
+		ph['candles'].append( { 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v, 'datetime': dt } )
+
+	return ph
+
+def to_level1(records=None, ticker=None):
+	l1 = {}
+	for dt,bid_p,bid_s,ask_p,ask_s,last_p,last_s,vol in records.tolist():
+		l1[dt] = {	'ASK_PRICE':	ask_p,
+				'ASK_SIZE':	ask_s,
+				'BID_PRICE':	bid_p,
+				'BID_SIZE':	bid_s,
+				'LAST_PRICE':	last_p,
+				'LAST_SIZE':	last_s,
+				'TOTAL_VOLUME':	vol,
+				'datetime':	dt,
+				'key':		ticker }
+
+	return l1
+
+def to_level2(records=None):
+	l2 = {}
+	for dt,side,price,num,vol in records.tolist():
+		if ( dt not in l2 ):
+			l2[dt] = { 'asks': {}, 'bids': {} }
+
+		if ( side == 0 ):
+			l2[dt]['bids'][price] = { 'num_bids': num, 'total_volume': vol }
+		else:
+			l2[dt]['asks'][price] = { 'num_asks': num, 'total_volume': vol }
+
+	return l2
+
+def to_ets(records=None, ticker=None):
+	ets = []
+	for dt,price,size,seq in records.tolist():
+		ets.append( { 'TRADE_TIME': dt, 'LAST_PRICE': price, 'LAST_SIZE': size, 'LAST_SEQUENCE': seq, 'key': ticker } )
+
+	return ets
@@ -0,0 +1,308 @@
+#!/usr/bin/python3 -u
+
+# Indexed stock blacklist
+#
+# The blacklist (.stock-blacklist) is an append-only log of tickers that were recently
+#  sold at a loss (to avoid wash sales) or that are permanently banned:
+#
+#   stock|stock_qty|orig_base_price|last_price|net_change|percent_change|timestamp
+#
+# check_blacklist() used to open and parse the whole file on every call, and since
+#  write_blacklist() only appends, duplicate entries for the same ticker would pile up
+#  until clean_blacklist() was run. Blacklist loads the file once into a dict keyed by
+#  ticker, with the expiration time of each ticker, and reloads it only when the file
+#  changes (mtime/size/inode), so each lookup is O(1).
+#
+# compact() rewrites the file with one entry per ticker and no expired entries. The new
+#  file is written to a temporary file which then replaces the blacklist, all while
+#  holding an fcntl lock on the blacklist. Writers take the same lock before appending
+#  and check that the file they opened has not been replaced in the meantime, so
+#  entries added during a compaction are never lost.
+
+import os, sys, re
+import tempfile
+from datetime import datetime, timedelta
+from pytz import timezone
+
+try:
+	import fcntl
+except:
+	fcntl = None
+
+# Timestamp used for permanently blacklisted tickers
+permanent_time_stamp = 9999999999
+
+# Number of days a ticker stays on the blacklist
+blacklist_days = 32
+
+
+class Blacklist:
+	def __init__(self, fname=None, days=blacklist_days):
+		if ( fname == None ):
+			parent_path	= os.path.dirname( os.path.realpath(__file__) )
+			fname		= str(parent_path) + '/.stock-blacklist'
+
+		self.fname	= fname
+		self.days	= days
+		self.entries	= {}		# ticker -> { 'time_stamp', 'permanent', 'line' }
+		self.file_id	= None		# (inode, size, mtime) of the file when it was loaded
+		self.exists	= False
+
+	# Parse one line of the blacklist file
+	# Returns (ticker, time_stamp, permanent, line), or None for comments, blank lines or invalid entries
+	@staticmethod
+	def parse_line(line=None):
+		line = re.sub('[\r\n]', '', line)
+		if ( re.match(r'^[\s\t]*#', line) ):
+			return None
+
+		# Comments at the end of each line cannot be supported, strip them
+		line = re.sub(r'[\s\t]*#.*', '', line)
+		line = line.replace(' ', '')
+
+		try:
+			stock, stock_qty, orig_base_price, last_price, net_change, percent_change, time_stamp = line.split('|', 7)
+			time_stamp = int( float(time_stamp) )
+
+		except:
+			return None
+
+		return stock, time_stamp, ( time_stamp >= permanent_time_stamp ), line
+
+	# Add an entry to the index, keeping the permanent or most recent entry for each ticker
+	def _index(self, ticker=None, time_stamp=0, permanent=False, line=None):
+		cur = self.entries.get( ticker, None )
+		if ( cur != None and (cur['permanent'] == True or cur['time_stamp'] > time_stamp) ):
+			return
+
+		self.entries[ticker] = { 'time_stamp': time_stamp, 'permanent': permanent, 'line': line }
+
+	# Reload the blacklist if the file has changed since it was last loaded
+	def reload(self, force=False):
+		try:
+			st = os.stat( self.fname )
+
+		except FileNotFoundError:
+			self.entries	= {}
+			self.file_id	= None
+			self.exists	= False
+			return True
+
+		except OSError as e:
+			print('Error: Blacklist.reload(): Unable to stat file ' + str(self.fname) + ': ' + str(e), file=sys.stderr)
+			return False
+
+		file_id = ( st.st_ino, st.st_size, st.st_mtime_ns )
+		if ( force == False and file_id == self.file_id ):
+			return True
+
+		try:
+			with open( self.fname, 'rt' ) as fh:
+				self.entries = {}
+				for line in fh:
+					entry = self.parse_line( line )
+					if ( entry != None ):
+						self._index( *entry )
+
+		except OSError as e:
+			print('Error: Blacklist.reload(): Unable to open file ' + str(self.fname) + ': ' + str(e), file=sys.stderr)
+			return False
+
+		self.file_id	= file_id
+		self.exists	= True
+
+		return True
+
+	# Returns True if ticker is blacklisted, i.e. its most recent entry is less than
+	#  self.days old or it is permanently blacklisted
+	# If permaban_only=True, then only returns True for permanently blacklisted tickers
+	def check(self, ticker=None, permaban_only=False):
+		self.reload()
+
+		entry = self.entries.get( str(ticker), None )
+		if ( entry == None ):
+			return False
+
+		if ( entry['permanent'] == True ):
+			return True
+
+		if ( permaban_only == True ):
+			return False
+
+		return self.is_current( entry['time_stamp'] )
+
+	def is_current(self, time_stamp=0, now=None):
+		if ( now == None ):
+			now = datetime.now( timezone('US/Eastern') )
+
+		return ( datetime.fromtimestamp(time_stamp, tz=now.tzinfo) + timedelta(days=self.days) > now )
+
+	# Open the blacklist and take an exclusive lock on it
+	# If the file was replaced by compact() while waiting for the lock then open the new file
+	def _open_locked(self, mode='at'):
+		while True:
+			fh = open( self.fname, mode )
+			if ( fcntl == None ):
+				return fh
+
+			fcntl.lockf( fh, fcntl.LOCK_EX )
+			try:
+				if ( os.fstat(fh.fileno()).st_ino == os.stat(self.fname).st_ino ):
+					return fh
+			except FileNotFoundError:
+				pass
+
+			fh.close()
+
+	# Append an entry to the blacklist
+	def add(self, ticker=None, stock_qty=-1, orig_base_price=-1, last_price=-1, net_change=-1, percent_change=-1, permanent=False):
+
+		time_stamp = permanent_time_stamp
+		if ( permanent == False ):
+			time_stamp = round( datetime.now(timezone('US/Eastern')).timestamp() )
+
+		# Log format - stock|stock_qty|orig_base_price|last_price|net_change|percent_change|timestamp
+		if ( float(last_price) < float(orig_base_price) ):
+			percent_change = '-' + str(round(percent_change,2))
+		else:
+			percent_change = '+' + str(round(percent_change,2))
+
+		msg =	str(ticker)		+ '|' + \
+			str(stock_qty)		+ '|' + \
+			str(orig_base_price)	+ '|' + \
+			str(last_price)		+ '|' + \
+			str(net_change)		+ '|' + \
+			str(percent_change)	+ '|' + \
+			str(time_stamp)
+
+		try:
+			fh = self._open_locked( 'at' )
+
+		except OSError as e:
+			print('Error: Blacklist.add(): Unable to open file ' + str(self.fname) + ': ' + str(e), file=sys.stderr)
+			return False
+
+		# Nobody else can write to the file while we hold the lock, so the index can be
+		#  brought up to date and then updated with the new entry without reading it again
+		self.reload()
+		print( msg, file=fh, flush=True )
+
+		st		= os.fstat( fh.fileno() )
+		self.file_id	= ( st.st_ino, st.st_size, st.st_mtime_ns )
+		self.exists	= True
+		self._index( str(ticker), time_stamp, permanent, msg )
+
+		fh.close()
+
+		return True
+
+	# Rewrite the blacklist with one entry per ticker, removing expired entries
+	# Comments are kept intact, stale comments must be cleaned manually.
+	def compact(self, debug=False):
+		if ( os.path.exists(self.fname) == False ):
+			return True
+
+		try:
+			fh = self._open_locked( 'r+t' )
+
+		except OSError as e:
+			print('Error: Blacklist.compact(): Unable to open file ' + str(self.fname) + ': ' + str(e), file=sys.stderr)
+			return False
+
+		red		= '\033[0;31m'
+		green		= '\033[0;32m'
+		reset_color	= '\033[0m'
+
+		try:
+			lines	= fh.read().splitlines()
+			now	= datetime.now( timezone('US/Eastern') )
+
+			# Find the line to keep for each ticker
+			entries = {}
+			parsed	= set()
+			for idx, line in enumerate(lines):
+				entry = self.parse_line( line )
+				if ( entry == None ):
+					continue
+
+				parsed.add( idx )
+				ticker, time_stamp, permanent, line = entry
+				cur = entries.get( ticker, None )
+				if ( cur == None or (cur['permanent'] == False and (permanent == True or time_stamp >= cur['time_stamp'])) ):
+					entries[ticker] = { 'idx': idx, 'time_stamp': time_stamp, 'permanent': permanent, 'line': line }
+
+			keep = {}
+			if ( debug == True ):
+				print( '{0:10} {1:15} {2:15}'.format('Ticker', 'Entry Date', 'Expiration Date') )
+
+			for ticker, entry in entries.items():
+				current = ( entry['permanent'] == True or self.is_current(entry['time_stamp'], now) )
+				if ( current == True ):
+					keep[entry['idx']] = entry['line']
+
+				if ( debug == True ):
+					print( red if ( current == True ) else green, end='' )
+					if ( entry['permanent'] == True ):
+						print( '{0:10} {1:15} {2:15}'.format(ticker, '----------', 'permanent'), end='' )
+					else:
+						time_stamp = datetime.fromtimestamp( entry['time_stamp'], tz=now.tzinfo )
+						expiration = time_stamp + timedelta(days=self.days)
+						print( '{0:10} {1:15} {2:15}'.format(ticker, time_stamp.strftime('%Y-%m-%d'), expiration.strftime('%Y-%m-%d')), end='' )
+
+					print( reset_color )
+
+			# Comments, blank lines and lines that cannot be parsed are kept, entries are only
+			#  kept if they are the current entry for their ticker
+			new_lines = []
+			for idx, line in enumerate(lines):
+				if ( idx in keep ):
+					new_lines.append( keep[idx] )
+
+				elif ( idx in parsed ):
+					continue
+
+				elif ( re.match(r'^[\s\t]*#', line) ):
+					new_lines.append( line.rstrip() )
+
+				else:
+					# Comments at the end of each line cannot be supported, strip them
+					line = re.sub(r'[\s\t]*#.*', '', line.rstrip())
+					new_lines.append( line.replace(' ', '') )
+
+			# Write the new file and replace the blacklist while still holding the lock
+			tmp_fh = tempfile.NamedTemporaryFile( mode='wt', dir=os.path.dirname(os.path.realpath(self.fname)), prefix='.stock-blacklist.', delete=False )
+			try:
+				for line in new_lines:
+					print( line, file=tmp_fh )
+
+				tmp_fh.flush()
+				os.fsync( tmp_fh.fileno() )
+				tmp_fh.close()
+
+				os.chmod( tmp_fh.name, os.stat(self.fname).st_mode & 0o777 )
+				os.replace( tmp_fh.name, self.fname )
+
+			except:
+				tmp_fh.close()
+				os.remove( tmp_fh.name )
+				raise
+
+		except Exception as e:
+			print('Error: Blacklist.compact(): Unable to rewrite file ' + str(self.fname) + ': ' + str(e), file=sys.stderr)
+			fh.close()
+			return False
+
+		fh.close()
+		self.reload( force=True )
+
+		return True
+
+
+# Shared Blacklist instances, one per file
+blacklists = {}
+
+def get_blacklist(fname=None):
+	if ( fname not in blacklists ):
+		blacklists[fname] = Blacklist( fname )
+
+	return blacklists[fname]
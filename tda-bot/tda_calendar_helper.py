@@ -0,0 +1,447 @@
+#!/usr/bin/python3 -u
+
+# US market calendar
+#
+# ismarketopen_US() and isendofday() used to rebuild the lists of holidays and early
+#  close days, and call strftime() several times, on every call. gobot_ets() calls
+#  ismarketopen_US() for every trade, and the backtest calls it for every candle.
+#
+# MarketCalendar precomputes the trading days for a range of years, along with the
+#  start of each day and the open/close times of each session, as epoch milliseconds.
+#  Each question ("is the market open", "how many minutes until the close", "which
+#  session does this timestamp belong to") is then a bisect on the start of day array
+#  and a couple of integer comparisons. Datetimes are looked up by their date instead,
+#  which avoids converting them to a timestamp. The *_array() versions take a numpy
+#  array of timestamps and use np.searchsorted() instead.
+#
+# Session times (US/Eastern):
+#   Regular hours:	09:30 - 16:00 (13:00 on early close days)
+#   safe_open:		10:15 - close, to avoid some of the volatility of the open
+#   Extended hours:	07:00 - 18:30 (the 18:30 minute is included)
+#
+# Holidays and early close days come from the tables below, or for years that are not
+#  in the tables, from the NYSE holiday rules.
+
+import time
+import bisect
+from datetime import datetime, date, timedelta
+from pytz import timezone
+
+import numpy as np
+
+mytimezone = timezone('US/Eastern')
+
+# US market holidays - source: https://www.marketbeat.com/stock-market-holidays/
+# Holidays:
+#   New Year's Day
+#   Martin Luther King Jr. Day
+#   President's Day
+#   Good Friday
+#   Memorial Day
+#   Juneteenth
+#   Independence Day
+#   Labor Day
+#   Thanksgiving
+#   Christmas
+holidays = [	'2021-01-01',
+		'2021-01-18',
+		'2021-02-15',
+		'2021-04-02',
+		'2021-05-31',
+		'2021-07-05',
+		'2021-09-06',
+		'2021-11-25',
+		'2021-12-24',
+
+		# 2022
+		'2022-01-17',
+		'2022-02-21',
+		'2022-04-15',
+		'2022-05-30',
+		'2022-06-20',
+		'2022-07-04',
+		'2022-09-05',
+		'2022-11-24',
+		'2022-12-26',
+
+		# 2023
+		'2023-01-02',
+		'2023-01-16',
+		'2023-02-20',
+		'2023-04-07',
+		'2023-05-29',
+		'2023-06-19',
+		'2023-07-04',
+		'2023-09-04',
+		'2023-11-23',
+		'2023-12-25',
+
+		# 2024
+		'2024-01-01',
+		'2024-01-15',
+		'2024-02-19',
+		'2024-03-29',
+		'2024-05-27',
+		'2024-06-19',
+		'2024-07-04',
+		'2024-09-02',
+		'2024-11-28',
+		'2024-12-25',
+
+		# 2025
+		'2025-01-01',
+		'2025-01-09',	# National Day of Mourning
+		'2025-01-20',
+		'2025-02-17',
+		'2025-04-18',
+		'2025-05-26',
+		'2025-06-19',
+		'2025-07-04',
+		'2025-09-01',
+		'2025-11-27',
+		'2025-12-25',
+
+		# 2026
+		'2026-01-01',
+		'2026-01-19',
+		'2026-02-16',
+		'2026-04-03',
+		'2026-05-25',
+		'2026-06-19',
+		'2026-07-03',
+		'2026-09-07',
+		'2026-11-26',
+		'2026-12-25' ]
+
+# Early close (1:00PM Eastern) days
+early_close = [	'2021-07-02',
+		'2021-11-26',
+		'2021-12-23',
+
+		# 2022
+		#'2022-07-01',
+		'2022-11-25',
+		'2022-12-23',
+
+		# 2023
+		'2023-07-03',
+		'2023-11-24',
+		'2023-12-22',
+
+		# 2024
+		'2024-07-03',
+		'2024-11-29',
+		'2024-12-24',
+
+		# 2025
+		'2025-07-03',
+		'2025-11-28',
+		'2025-12-24',
+
+		# 2026
+		'2026-11-27',
+		'2026-12-24' ]
+
+# Years covered by the tables above
+table_years = ( 2021, 2026 )
+
+# Session times, in minutes from midnight
+regular_open	= 9 * 60 + 30
+safe_open_time	= 10 * 60 + 15
+regular_close	= 16 * 60
+early_close_time = 13 * 60
+ext_open	= 7 * 60
+ext_close	= 18 * 60 + 31
+
+minute	= 60 * 1000
+day_ms	= 86400 * 1000
+
+
+# Return the date of the nth weekday (0=Monday) of a month, or the last one if n=-1
+def nth_weekday(year=None, month=None, weekday=0, n=1):
+	if ( n > 0 ):
+		d = date(year, month, 1)
+		d += timedelta( days=(weekday - d.weekday()) % 7 )
+		return d + timedelta( weeks=n-1 )
+
+	d = date(year + (month // 12), month % 12 + 1, 1) - timedelta( days=1 )
+	return d - timedelta( days=(d.weekday() - weekday) % 7 )
+
+# Easter Sunday (Anonymous Gregorian algorithm)
+def easter(year=None):
+	a = year % 19
+	b = year // 100
+	c = year % 100
+	d = ( 19 * a + b - b // 4 - ((b - (b + 8) // 25 + 1) // 3) + 15 ) % 30
+	e = ( 32 + 2 * (b % 4) + 2 * (c // 4) - d - (c % 4) ) % 7
+	f = d + e - 7 * ((a + 11 * d + 22 * e) // 451) + 114
+
+	return date( year, f // 31, f % 31 + 1 )
+
+# Holidays that fall on a weekend are observed on the Friday before or the Monday after
+def observed(d=None):
+	if ( d.weekday() == 5 ):
+		return d - timedelta( days=1 )
+	elif ( d.weekday() == 6 ):
+		return d + timedelta( days=1 )
+
+	return d
+
+# NYSE holidays and early close days for a year
+# Returns two lists of '%Y-%m-%d' strings (holidays, early_close)
+def nyse_holidays(year=None):
+	days = []
+
+	# New Year's Day is not observed on the previous Friday
+	new_year = date(year, 1, 1)
+	if ( new_year.weekday() != 5 ):
+		days.append( observed(new_year) )
+
+	days.append( nth_weekday(year, 1, 0, 3) )			# Martin Luther King Jr. Day
+	days.append( nth_weekday(year, 2, 0, 3) )			# President's Day
+	days.append( easter(year) - timedelta(days=2) )			# Good Friday
+	days.append( nth_weekday(year, 5, 0, -1) )			# Memorial Day
+	if ( year >= 2022 ):
+		days.append( observed(date(year, 6, 19)) )		# Juneteenth
+	days.append( observed(date(year, 7, 4)) )			# Independence Day
+	days.append( nth_weekday(year, 9, 0, 1) )			# Labor Day
+	thanksgiving = nth_weekday(year, 11, 3, 4)
+	days.append( thanksgiving )					# Thanksgiving
+	days.append( observed(date(year, 12, 25)) )			# Christmas
+
+	early = [ thanksgiving + timedelta(days=1) ]
+	for d in [ date(year, 7, 3), date(year, 12, 24) ]:
+		if ( d.weekday() <= 3 ):
+			early.append( d )
+
+	return [ d.strftime('%Y-%m-%d') for d in days ], [ d.strftime('%Y-%m-%d') for d in sorted(early) ]
+
+
+class MarketCalendar:
+	def __init__(self, start_year=None, end_year=None):
+		if ( start_year == None ):
+			start_year = table_years[0]
+		if ( end_year == None ):
+			end_year = max( table_years[1], datetime.now(mytimezone).year + 1 )
+
+		self.build( start_year, end_year )
+
+	# Precompute the sessions for each trading day from start_year to end_year
+	def build(self, start_year=None, end_year=None):
+		self.start_year	= int( start_year )
+		self.end_year	= int( end_year )
+
+		closed	= set()
+		early	= set()
+		for year in range( self.start_year, self.end_year + 1 ):
+			if ( table_years[0] <= year <= table_years[1] ):
+				closed.update( [ d for d in holidays if d.startswith(str(year)) ] )
+				early.update( [ d for d in early_close if d.startswith(str(year)) ] )
+			else:
+				h, e = nyse_holidays( year )
+				closed.update( h )
+				early.update( e )
+
+		days = np.arange( np.datetime64(str(self.start_year) + '-01-01'), np.datetime64(str(self.end_year + 1) + '-01-01') )
+		days = days[ np.is_busday(days, holidays=sorted(closed)) ]
+
+		# Start of each trading day in US/Eastern
+		# DST changes happen on Sundays, so the session times can be added to midnight
+		day_start = [ int(mytimezone.localize(datetime(d.year, d.month, d.day)).timestamp() * 1000) for d in days.astype(object) ]
+		is_early = np.isin( days.astype(str), sorted(early) )
+
+		self.days	= days
+		self.holidays	= sorted( closed )		# for np.busday_offset(), etc.
+		self.day_start	= day_start			# list, for bisect
+		self.day_start_a = np.array( day_start, dtype=np.int64 )
+		self.open	= self.day_start_a + regular_open * minute
+		self.close	= self.day_start_a + np.where( is_early, early_close_time, regular_close ) * minute
+		self.safe_open	= self.day_start_a + safe_open_time * minute
+		self.ext_open	= self.day_start_a + ext_open * minute
+		self.ext_close	= self.day_start_a + ext_close * minute
+		self.session_ids = ( days - np.datetime64('1970-01-01') ).astype(np.int64)
+
+		self.first_ms	= int( mytimezone.localize(datetime(self.start_year, 1, 1)).timestamp() * 1000 )
+		self.last_ms	= int( mytimezone.localize(datetime(self.end_year + 1, 1, 1)).timestamp() * 1000 )
+
+		# Plain lists and dicts are faster than indexing numpy arrays for scalar lookups
+		self._ids	= self.session_ids.tolist()
+		self._index	= { sid: i for i, sid in enumerate(self._ids) }
+		self._close	= ( self.close - self.day_start_a ).tolist()	# ms from midnight
+
+	# Extend the calendar if needed so that it covers the timestamp(s) in ms
+	def _cover(self, first=None, last=None):
+		if ( first >= self.first_ms and last < self.last_ms ):
+			return
+
+		start_year	= min( self.start_year, datetime.fromtimestamp(first / 1000, tz=mytimezone).year )
+		end_year	= max( self.end_year, datetime.fromtimestamp(last / 1000, tz=mytimezone).year )
+		self.build( start_year, end_year )
+
+	# Return the index of the trading day for t, and the number of ms since midnight
+	# t may be epoch ms, or a datetime in which case its date and time are used as the
+	#  US/Eastern date and time (as ismarketopen_US() has always done). The index is -1
+	#  if t is not on a trading day.
+	def _locate(self, t=None):
+		if ( isinstance(t, datetime) ):
+			if ( t.year < self.start_year or t.year > self.end_year ):
+				self.build( min(self.start_year, t.year), max(self.end_year, t.year) )
+
+			offset = ( (t.hour * 60 + t.minute) * 60 + t.second ) * 1000 + t.microsecond // 1000
+			return self._index.get( t.toordinal() - 719163, -1 ), offset
+
+		ms = int( t )
+		self._cover( ms, ms )
+
+		i = bisect.bisect_right( self.day_start, ms ) - 1
+		if ( i < 0 or ms >= self.day_start[i] + day_ms ):
+			return -1, 0
+
+		return i, ms - self.day_start[i]
+
+	# Return the date of the trading day n trading days before the US/Eastern date of t (epoch ms)
+	# If t is not on a trading day the previous trading day is used as day 0
+	def trading_day_offset(self, t=None, n=0):
+		t = int( t )
+		self._cover( t - (n // 5 + 2) * 7 * day_ms, t )
+
+		day = datetime.fromtimestamp( t / 1000, tz=mytimezone ).date()
+		return np.busday_offset( np.datetime64(day, 'D'), -int(n), roll='backward', holidays=self.holidays ).astype(object)
+
+	# Return the index of the trading day that t falls on, or -1 if it is not a trading day
+	def day_index(self, t=None):
+		return self._locate( t )[0]
+
+	# Returns True if the market is open at time t (epoch ms or datetime)
+	# See ismarketopen_US() for safe_open, check_day_only and extended_hours
+	def is_open(self, t=None, safe_open=False, check_day_only=False, extended_hours=False):
+		i, offset = self._locate( t )
+		if ( i == -1 ):
+			return False
+		if ( check_day_only == True ):
+			return True
+
+		if ( extended_hours == True ):
+			return ( ext_open * minute <= offset < ext_close * minute )
+
+		start = safe_open_time if ( safe_open == True ) else regular_open
+		return ( start * minute <= offset < self._close[i] )
+
+	# Minutes until the close of regular hours on the trading day of t
+	# Negative after the close, None if t is not on a trading day
+	def minutes_to_close(self, t=None):
+		i, offset = self._locate( t )
+		if ( i == -1 ):
+			return None
+
+		return ( self._close[i] - offset ) / minute
+
+	# Returns True if it is mins or less before the close (for up to 60 minutes)
+	# On days that are not trading days (weekends and holidays) the regular close time is
+	#  used, as isendofday() always has
+	def is_end_of_day(self, t=None, mins=5):
+		if ( mins < 0 ):
+			return False
+
+		i, offset = self._locate( t )
+		if ( i == -1 ):
+			close = regular_close * minute
+			if ( isinstance(t, datetime) == False ):
+				t	= datetime.fromtimestamp( int(t) / 1000, tz=mytimezone )
+				offset	= ( (t.hour * 60 + t.minute) * 60 + t.second ) * 1000 + t.microsecond // 1000
+
+		else:
+			close = self._close[i]
+
+		return ( close - min(int(mins), 60) * minute <= offset < close )
+
+	# Session id of t (number of days since 1970-01-01 for the trading day), or -1 if
+	#  t is not on a trading day
+	def session_id(self, t=None):
+		i = self._locate( t )[0]
+		if ( i == -1 ):
+			return -1
+
+		return self._ids[i]
+
+	# Vectorized versions
+	# These take an array of timestamps (epoch ms) and return an array of results
+	def day_index_array(self, ms=None):
+		ms = np.asarray( ms, dtype=np.int64 )
+		if ( ms.size == 0 ):
+			return np.zeros( ms.shape, dtype=np.int64 )
+
+		self._cover( int(ms.min()), int(ms.max()) )
+
+		idx = np.searchsorted( self.day_start_a, ms, side='right' ) - 1
+		valid = idx >= 0
+		valid[valid] = ms[valid] < self.day_start_a[idx[valid]] + day_ms
+
+		return np.where( valid, idx, -1 )
+
+	def is_open_array(self, ms=None, safe_open=False, check_day_only=False, extended_hours=False):
+		ms	= np.asarray( ms, dtype=np.int64 )
+		idx	= self.day_index_array( ms )
+		valid	= idx >= 0
+		i	= np.where( valid, idx, 0 )
+		if ( check_day_only == True ):
+			return valid
+
+		if ( extended_hours == True ):
+			start, end = self.ext_open[i], self.ext_close[i]
+		else:
+			start, end = ( self.safe_open[i] if safe_open == True else self.open[i] ), self.close[i]
+
+		return valid & ( ms >= start ) & ( ms < end )
+
+	def minutes_to_close_array(self, ms=None):
+		ms	= np.asarray( ms, dtype=np.int64 )
+		idx	= self.day_index_array( ms )
+		i	= np.where( idx >= 0, idx, 0 )
+
+		return np.where( idx >= 0, (self.close[i] - ms) / minute, np.nan )
+
+	def session_id_array(self, ms=None):
+		idx = self.day_index_array( ms )
+		return np.where( idx >= 0, self.session_ids[np.where(idx >= 0, idx, 0)], -1 )
+
+	# Return the '%Y-%m-%d' date for a session id
+	@staticmethod
+	def session_date(session_id=None):
+		return str( np.datetime64(int(session_id), 'D') )
+
+
+# Shared calendar, built on first use
+calendar = None
+
+def get_calendar():
+	global calendar
+	if ( calendar == None ):
+		calendar = MarketCalendar()
+
+	return calendar
+
+# Return dt, or the current time in epoch ms if dt is None
+def now(dt=None):
+	if ( dt == None ):
+		return int( time.time() * 1000 )
+
+	return dt
+
+def is_open(ms=None, safe_open=False, check_day_only=False, extended_hours=False):
+	return get_calendar().is_open( ms, safe_open=safe_open, check_day_only=check_day_only, extended_hours=extended_hours )
+
+def minutes_to_close(ms=None):
+	return get_calendar().minutes_to_close( ms )
+
+def session_id(ms=None):
+	return get_calendar().session_id( ms )
+
+def is_open_array(ms=None, safe_open=False, check_day_only=False, extended_hours=False):
+	return get_calendar().is_open_array( ms, safe_open=safe_open, check_day_only=check_day_only, extended_hours=extended_hours )
+
+def minutes_to_close_array(ms=None):
+	return get_calendar().minutes_to_close_array( ms )
+
+def session_id_array(ms=None):
+	return get_calendar().session_id_array( ms )
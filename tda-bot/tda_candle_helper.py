@@ -0,0 +1,721 @@
+#!/usr/bin/python3 -u
+
+# Columnar candle storage
+#
+# The TDA API (and most of the code in this repo) represents pricehistory as a dict
+#  that contains a list of per-candle dicts:
+#
+#   { 'symbol': 'MSFT', 'candles': [ {'open': 1.0, 'high': 1.1, ..., 'datetime': 1640000000000}, ... ] }
+#
+# Every indicator in tda_algo_helper then has to walk that list and build a new numpy
+#  array, which becomes expensive when called for many tickers on every new candle.
+#  CandleStore keeps the same data in contiguous numpy arrays (float64 for OHLC,
+#  int64 for volume/datetime) that grow by doubling their capacity, so appending a
+#  candle is amortized O(1) and reading a column is a zero-copy view.
+#
+# CandleStore also behaves enough like the legacy dict that older code keeps working:
+#  ph['symbol'] and ph['candles'] are supported, as are any other keys that callers
+#  attach (i.e. 'hacandles'). ph['candles'] returns a list of dicts that is rebuilt
+#  only after the store changes. It is a read-only snapshot - use append() to add data.
+
+from datetime import datetime, timedelta
+from pytz import timezone
+
+import numpy as np
+
+import tda_calendar_helper
+
+mytimezone = timezone('US/Eastern')
+
+# Price types supported by get_prices()
+price_types = ( 'close', 'high', 'low', 'open', 'volume', 'hl2', 'hlc3', 'ohlc4' )
+
+
+class CandleStore:
+
+	float_fields	= ( 'open', 'high', 'low', 'close' )
+	int_fields	= ( 'volume', 'datetime' )
+	fields		= float_fields + int_fields
+
+	def __init__(self, symbol='', candles=None, capacity=1024):
+
+		self.symbol	= symbol
+		self.extra	= {}		# Any other keys that callers attach, i.e. 'hacandles'
+
+		self._len	= 0
+		self._cap	= max( int(capacity), 16 )
+		self._data	= {}
+		self._candles	= None		# Cached list-of-dicts view, see candles_list()
+		self._sessions	= None		# Cached Sessions for the first len(self._sessions) candles, see sessions()
+
+		for f in self.float_fields:
+			self._data[f] = np.zeros( self._cap, dtype=np.float64 )
+		for f in self.int_fields:
+			self._data[f] = np.zeros( self._cap, dtype=np.int64 )
+
+		if ( candles != None ):
+			self.extend( candles )
+
+	# Build a CandleStore from a legacy pricehistory dict
+	@classmethod
+	def from_pricehistory(cls, pricehistory=None):
+
+		if ( isinstance(pricehistory, CandleStore) ):
+			return pricehistory
+
+		symbol = ''
+		try:
+			symbol = pricehistory['symbol']
+		except:
+			pass
+
+		candles = []
+		try:
+			candles = pricehistory['candles']
+		except:
+			pass
+
+		store = cls( symbol=symbol, capacity=len(candles) * 2 )
+		store.extend( candles )
+
+		for key in pricehistory:
+			if ( key != 'symbol' and key != 'candles' ):
+				store.extra[key] = pricehistory[key]
+
+		return store
+
+	# Build a CandleStore from numpy arrays (or lists) for each of the candle fields
+	@classmethod
+	def from_arrays(cls, symbol='', open=None, high=None, low=None, close=None, volume=None, datetime=None):
+
+		columns	= { 'open': open, 'high': high, 'low': low, 'close': close, 'volume': volume, 'datetime': datetime }
+		n	= len( datetime )
+
+		store = cls( symbol=symbol, capacity=n )
+		for f in cls.fields:
+			store._data[f][:n] = columns[f]
+
+		store._len = n
+
+		return store
+
+	# Convert back to the legacy pricehistory dict
+	def to_pricehistory(self):
+		ph = { 'candles': self.candles_list(), 'symbol': self.symbol }
+		ph.update( self.extra )
+
+		return ph
+
+	def _grow(self, min_cap=0):
+		new_cap = self._cap * 2
+		while ( new_cap < min_cap ):
+			new_cap *= 2
+
+		for f in self.fields:
+			arr = np.zeros( new_cap, dtype=self._data[f].dtype )
+			arr[:self._len] = self._data[f][:self._len]
+			self._data[f] = arr
+
+		self._cap = new_cap
+
+	# Append a single candle
+	# Accepts either a candle dict (as returned by TDA) or keyword arguments
+	def append(self, candle=None, **kwargs):
+		if ( candle == None ):
+			candle = kwargs
+
+		if ( self._len >= self._cap ):
+			self._grow()
+
+		i = self._len
+		self._data['open'][i]		= float( candle['open'] )
+		self._data['high'][i]		= float( candle['high'] )
+		self._data['low'][i]		= float( candle['low'] )
+		self._data['close'][i]		= float( candle['close'] )
+		self._data['volume'][i]		= int( candle['volume'] )
+		self._data['datetime'][i]	= int( candle['datetime'] )
+
+		self._len	+= 1
+		self._candles	= None
+
+	# Append a list of candle dicts, or another CandleStore
+	def extend(self, candles=None):
+		if ( candles == None ):
+			return
+
+		if ( isinstance(candles, CandleStore) ):
+			n = len(candles)
+			if ( self._len + n > self._cap ):
+				self._grow( self._len + n )
+
+			for f in self.fields:
+				self._data[f][self._len:self._len+n] = candles._data[f][:n]
+
+			self._len	+= n
+			self._candles	= None
+			return
+
+		n = len(candles)
+		if ( self._len + n > self._cap ):
+			self._grow( self._len + n )
+
+		for f in self.fields:
+			self._data[f][self._len:self._len+n] = [ candle[f] for candle in candles ]
+
+		self._len	+= n
+		self._candles	= None
+
+	# Replace the most recent candle (i.e. when a candle is updated before it closes)
+	def update_last(self, candle=None, **kwargs):
+		if ( self._len == 0 ):
+			return self.append( candle, **kwargs )
+
+		self._len	-= 1
+		self._sessions	= None
+		self.append( candle, **kwargs )
+
+	# Remove the oldest N candles, retaining the newest candles in place
+	def trim(self, n=0):
+		n = min( int(n), self._len )
+		if ( n <= 0 ):
+			return
+
+		for f in self.fields:
+			self._data[f][:self._len-n] = self._data[f][n:self._len]
+
+		self._len	-= n
+		self._candles	= None
+
+		if ( self._sessions != None ):
+			self._sessions = self._sessions.slice( n )
+
+	# Column views
+	# These are views into the underlying buffers, so they must be copied if the caller
+	#  needs to hold onto them across append() calls.
+	@property
+	def open(self):
+		return self._data['open'][:self._len]
+
+	@property
+	def high(self):
+		return self._data['high'][:self._len]
+
+	@property
+	def low(self):
+		return self._data['low'][:self._len]
+
+	@property
+	def close(self):
+		return self._data['close'][:self._len]
+
+	@property
+	def volume(self):
+		return self._data['volume'][:self._len]
+
+	@property
+	def datetime(self):
+		return self._data['datetime'][:self._len]
+
+	# Derived prices
+	@property
+	def hl2(self):
+		return ( self.high + self.low ) / 2
+
+	@property
+	def hlc3(self):
+		return ( self.high + self.low + self.close ) / 3
+
+	@property
+	def ohlc4(self):
+		return ( self.open + self.high + self.low + self.close ) / 4
+
+	# Return a float64 array for any supported price type
+	#  (open, high, low, close, volume, hl2, hlc3, ohlc4)
+	def get_prices(self, type='close'):
+		if ( type in self.float_fields ):
+			return self._data[type][:self._len]
+
+		elif ( type == 'volume' ):
+			return self.volume.astype( np.float64 )
+
+		elif ( type == 'hl2' ):
+			return self.hl2
+
+		elif ( type == 'hlc3' ):
+			return self.hlc3
+
+		elif ( type == 'ohlc4' ):
+			return self.ohlc4
+
+		return np.array( [], dtype=np.float64 )
+
+	# Return the Sessions (day, minute of the day, regular hours) for all candles
+	# Appended candles are converted when sessions() is next called, the candles that
+	#  were already converted are not converted again.
+	def sessions(self):
+		if ( self._sessions == None ):
+			self._sessions = Sessions( self.datetime.copy() )
+
+		elif ( len(self._sessions) < self._len ):
+			self._sessions = self._sessions.concat( Sessions(self.datetime[len(self._sessions):].copy()) )
+
+		return self._sessions
+
+	# Return the legacy list-of-dicts representation of the candles
+	def candles_list(self):
+		if ( self._candles == None ):
+			self._candles = [ {	'open':		float(o),
+						'high':		float(h),
+						'low':		float(l),
+						'close':	float(c),
+						'volume':	int(v),
+						'datetime':	int(d) } for o,h,l,c,v,d in zip( self.open.tolist(), self.high.tolist(), self.low.tolist(),
+												 self.close.tolist(), self.volume.tolist(), self.datetime.tolist() ) ]
+
+		return self._candles
+
+	# Return the candle at index idx as a dict
+	def candle(self, idx=-1):
+		if ( idx < 0 ):
+			idx += self._len
+		if ( idx < 0 or idx >= self._len ):
+			raise IndexError( 'CandleStore index out of range' )
+
+		return {	'open':		float(self._data['open'][idx]),
+				'high':		float(self._data['high'][idx]),
+				'low':		float(self._data['low'][idx]),
+				'close':	float(self._data['close'][idx]),
+				'volume':	int(self._data['volume'][idx]),
+				'datetime':	int(self._data['datetime'][idx]) }
+
+	# Dict-like compatibility with legacy pricehistory
+	def __len__(self):
+		return self._len
+
+	def __getitem__(self, key):
+		if ( key == 'symbol' ):
+			return self.symbol
+		elif ( key == 'candles' ):
+			return self.candles_list()
+
+		return self.extra[key]
+
+	def __setitem__(self, key, value):
+		if ( key == 'symbol' ):
+			self.symbol = value
+
+		elif ( key == 'candles' ):
+			self._len	= 0
+			self._candles	= None
+			self._sessions	= None
+			self.extend( value )
+
+		else:
+			self.extra[key] = value
+
+	def __contains__(self, key):
+		return ( key == 'symbol' or key == 'candles' or key in self.extra )
+
+	def __iter__(self):
+		return iter( self.keys() )
+
+	def keys(self):
+		return [ 'candles', 'symbol' ] + list( self.extra.keys() )
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __repr__(self):
+		return 'CandleStore(symbol=' + str(self.symbol) + ', len=' + str(self._len) + ')'
+
+
+# Return a numpy array of prices of the requested type from either a CandleStore or
+#  a legacy pricehistory dict
+def get_prices(pricehistory=None, type='close'):
+
+	if ( isinstance(pricehistory, CandleStore) ):
+		return pricehistory.get_prices(type)
+
+	prices = []
+	if ( type == 'close' ):
+		for key in pricehistory['candles']:
+			prices.append(float(key['close']))
+
+	elif ( type == 'high' ):
+		for key in pricehistory['candles']:
+			prices.append(float(key['high']))
+
+	elif ( type == 'low' ):
+		for key in pricehistory['candles']:
+			prices.append(float(key['low']))
+
+	elif ( type == 'open' ):
+		for key in pricehistory['candles']:
+			prices.append(float(key['open']))
+
+	elif ( type == 'volume' ):
+		for key in pricehistory['candles']:
+			prices.append(float(key['volume']))
+
+	elif ( type == 'hl2' ):
+		for key in pricehistory['candles']:
+			prices.append( (float(key['high']) + float(key['low'])) / 2 )
+
+	elif ( type == 'hlc3' ):
+		for key in pricehistory['candles']:
+			prices.append( (float(key['high']) + float(key['low']) + float(key['close'])) / 3 )
+
+	elif ( type == 'ohlc4' ):
+		for key in pricehistory['candles']:
+			prices.append( (float(key['open']) + float(key['high']) + float(key['low']) + float(key['close'])) / 4 )
+
+	return np.array( prices, dtype=np.float64 )
+
+
+# Return the number of candles in either a CandleStore or a legacy pricehistory dict
+def num_candles(pricehistory=None):
+
+	if ( isinstance(pricehistory, CandleStore) ):
+		return len(pricehistory)
+
+	return len(pricehistory['candles'])
+
+
+# Trading sessions
+#
+# Finding the day, hour or minute of a candle used to require converting each candle's
+#  datetime to US/Eastern with datetime.fromtimestamp() and then calling strftime().
+#  Sessions does this for a whole array of candle datetimes (epoch ms) at once:
+#
+#  local:	local time of each candle, as ms since the epoch in US/Eastern
+#  session:	session id of each candle, the number of days since 1970-01-01 in US/Eastern
+#		 (this is the same id as tda_calendar_helper.session_id())
+#  minute:	minute of the day of each candle, i.e. 570 for 09:30
+#  regular:	True if the candle is within regular market hours on a trading day
+#
+# The UTC offset can only change on an hour boundary, so it is looked up once per hour
+#  and cached in utc_offsets{}.
+utc_offsets	= {}		# Epoch hour -> ( UTC offset in ms, tzinfo )
+epoch		= datetime( 1970, 1, 1 )
+
+def get_utc_offsets(hours=None):
+
+	hours	= np.asarray( hours, dtype=np.int64 )
+	offsets	= np.zeros( len(hours), dtype=np.int64 )
+	for i,h in enumerate( hours.tolist() ):
+		if ( h not in utc_offsets ):
+			dt		= datetime.fromtimestamp( h * 3600, tz=mytimezone )
+			utc_offsets[h]	= ( int(dt.utcoffset().total_seconds()) * 1000, dt.tzinfo )
+
+		offsets[i] = utc_offsets[h][0]
+
+	return offsets
+
+class Sessions:
+
+	fields = ( 'datetime', 'local', 'session', 'minute', 'regular' )
+
+	def __init__(self, datetimes=None):
+
+		self.datetime	= np.asarray( datetimes if ( datetimes is not None ) else [], dtype=np.int64 )
+		self._day_str	= None
+
+		# Look up the UTC offset for each distinct hour. Candle datetimes are usually
+		#  sorted, in which case this avoids sorting them again with np.unique().
+		hours = self.datetime // 3600000
+		if ( len(hours) > 1 and np.all(hours[1:] >= hours[:-1]) ):
+			first		= np.concatenate( ([True], hours[1:] != hours[:-1]) )
+			hour_inv	= np.cumsum( first ) - 1
+			hours		= hours[first]
+		else:
+			hours, hour_inv = np.unique( hours, return_inverse=True )
+
+		self.local	= self.datetime + get_utc_offsets( hours )[hour_inv]
+		self.session	= self.local // 86400000
+		self.minute	= ( self.local % 86400000 ) // 60000
+
+		self.regular	= np.zeros( len(self.datetime), dtype=bool )
+		if ( len(self.datetime) > 0 ):
+			self.regular = tda_calendar_helper.is_open_array( self.datetime )
+
+	# Build a Sessions object from existing arrays, without any conversion
+	@classmethod
+	def from_arrays(cls, **kwargs):
+		sessions = cls.__new__( cls )
+		for f in cls.fields:
+			setattr( sessions, f, kwargs[f] )
+
+		sessions._day_str = None
+		return sessions
+
+	# Return a new Sessions with the candles in other appended
+	def concat(self, other=None):
+		return Sessions.from_arrays( **{ f: np.concatenate((getattr(self, f), getattr(other, f))) for f in self.fields } )
+
+	# Return a new Sessions with only the candles in the slice
+	def slice(self, start=None, end=None):
+		return Sessions.from_arrays( **{ f: getattr(self, f)[start:end] for f in self.fields } )
+
+	def __len__(self):
+		return len( self.datetime )
+
+	@property
+	def hour(self):
+		return self.minute // 60
+
+	# Return the day of each candle as a '%Y-%m-%d' string
+	@property
+	def day_str(self):
+		if ( self._day_str is None ):
+			days, day_inv	= np.unique( self.session, return_inverse=True )
+			self._day_str	= days.astype( 'datetime64[D]' ).astype( str )[day_inv]
+
+		return self._day_str
+
+	# Return the distinct session ids, in order, and the index into them of each candle
+	def days(self):
+		return np.unique( self.session, return_inverse=True )
+
+	# Return the timezone-aware datetime of the candle at index idx
+	# Same as datetime.fromtimestamp(datetime/1000, tz=mytimezone), but the result is
+	#  built from the precomputed local time.
+	def date(self, idx=-1):
+		tzinfo = utc_offsets[ int(self.datetime[idx]) // 3600000 ][1]
+		return ( epoch + timedelta(milliseconds=int(self.local[idx])) ).replace( tzinfo=tzinfo )
+
+	# Return the index of the first candle at the given day ('%Y-%m-%d') and minute of
+	#  the day, or -1 if there is no such candle
+	def find(self, day=None, minute=570):
+		session = np.datetime64( day, 'D' ).astype( np.int64 )
+		idx	= np.flatnonzero( (self.session == session) & (self.minute == int(minute)) )
+		if ( len(idx) == 0 ):
+			return -1
+
+		return int( idx[0] )
+
+# Return the Sessions for a CandleStore, a legacy pricehistory dict or an array of
+#  datetimes (epoch ms)
+def get_sessions(pricehistory=None):
+
+	if ( isinstance(pricehistory, CandleStore) ):
+		return pricehistory.sessions()
+
+	elif ( isinstance(pricehistory, Sessions) ):
+		return pricehistory
+
+	elif ( isinstance(pricehistory, dict) ):
+		return Sessions( [ key['datetime'] for key in pricehistory['candles'] ] )
+
+	return Sessions( pricehistory )
+
+
+# Heikin Ashi and N-minute candles
+#
+# heikin_ashi() and aggregate() transform the whole history at once using numpy, and
+#  heikin_ashi_candle() and CandleAggregator do the same thing one candle at a time for
+#  candles arriving from the stream.
+#
+# Heikin Ashi formula:
+#  ha_open	= [ha_open(Previous Bar) + ha_close(Previous Bar)]/2
+#  ha_close	= (open+high+low+close)/4
+#  ha_low	= Min(low, ha_open, ha_close)
+#  ha_high	= Max(high, ha_open, ha_close)
+#
+# If decimals is set then candles with ha_close > 1 are rounded, as tda_gobot_helper.translate_heikin_ashi()
+#  has always done. The rounded values are then used for the next ha_open.
+def heikin_ashi(pricehistory=None, decimals=None):
+
+	store		= CandleStore.from_pricehistory( pricehistory )
+	n		= len(store)
+	ha_close	= store.ohlc4
+
+	# ha_open depends on the previous ha_open, so it is the only part that needs a loop
+	ha_open = np.zeros( n, dtype=np.float64 )
+	if ( n > 0 ):
+		ha_open[0] = store.open[0]
+
+	if ( decimals == None ):
+		prev_o = store.open[0] if ( n > 0 ) else 0
+		for i, prev_c in enumerate( ha_close[:-1].tolist(), start=1 ):
+			prev_o = ha_open[i] = ( prev_o + prev_c ) / 2
+
+		ha_high	= np.maximum( store.high, np.maximum(ha_open, ha_close) )
+		ha_low	= np.minimum( store.low, np.minimum(ha_open, ha_close) )
+
+	else:
+		# Python's round() is used (instead of np.round) to produce exactly the same values as before
+		mask	= ( ha_close > 1 ).tolist()
+		close_r	= [ round(c, decimals) if m else c for c, m in zip(ha_close.tolist(), mask) ]
+		open_r	= [ 0 ] * n
+		if ( n > 0 ):
+			o		= float( ha_open[0] )
+			open_r[0]	= round(o, decimals) if mask[0] else o
+
+		for i in range( 1, n ):
+			o		= ( open_r[i-1] + close_r[i-1] ) / 2
+			ha_open[i]	= o
+			open_r[i]	= round(o, decimals) if mask[i] else o
+
+		# round() is monotonic, so max(round(a), round(b)) == round(max(a, b))
+		ha_high	= np.maximum( store.high, np.maximum(ha_open, ha_close) ).tolist()
+		ha_low	= np.minimum( store.low, np.minimum(ha_open, ha_close) ).tolist()
+		ha_high	= [ round(h, decimals) if m else h for h, m in zip(ha_high, mask) ]
+		ha_low	= [ round(l, decimals) if m else l for l, m in zip(ha_low, mask) ]
+		ha_open	= open_r
+		ha_close = close_r
+
+	return CandleStore.from_arrays( store.symbol, open=ha_open, high=ha_high, low=ha_low, close=ha_close,
+						volume=store.volume, datetime=store.datetime )
+
+# Return the next Heikin Ashi candle, given the new candle and the previous Heikin Ashi candle
+def heikin_ashi_candle(candle=None, prev=None, decimals=None):
+
+	ha_close = ( float(candle['open']) + float(candle['high']) + float(candle['low']) + float(candle['close']) ) / 4
+	if ( prev == None ):
+		ha_open = float( candle['open'] )
+	else:
+		ha_open = ( prev['open'] + prev['close'] ) / 2
+
+	ha_high	= max( float(candle['high']), ha_open, ha_close )
+	ha_low	= min( float(candle['low']), ha_open, ha_close )
+
+	if ( decimals != None and ha_close > 1 ):
+		ha_open		= round( ha_open, decimals )
+		ha_high		= round( ha_high, decimals )
+		ha_low		= round( ha_low, decimals )
+		ha_close	= round( ha_close, decimals )
+
+	return {	'open':		ha_open,
+			'high':		ha_high,
+			'low':		ha_low,
+			'close':	ha_close,
+			'volume':	int( candle['volume'] ),
+			'datetime':	int( candle['datetime'] ) }
+
+# Incremental Heikin Ashi, keeps the previous Heikin Ashi candle
+class HeikinAshi:
+	def __init__(self, decimals=None, prev=None):
+		self.decimals	= decimals
+		self.prev	= prev
+
+	def update(self, candle=None):
+		self.prev = heikin_ashi_candle( candle, self.prev, self.decimals )
+		return self.prev
+
+
+# Aggregate 1-minute candles into N-minute candles
+#
+# If align is True the candles are grouped by the N-minute clock boundary they fall in
+#  (i.e. 09:30-09:34, 09:35-09:39 for 5-minute candles), so a missing 1-minute candle
+#  does not shift every later candle, and the datetime of each new candle is the start
+#  of its interval. If complete is True then the last candle is dropped unless its
+#  interval is complete.
+#
+# If align is False then every N candles are grouped by position, starting with the
+#  first candle, and the datetime of each new candle is the datetime of its last 1-minute
+#  candle. Incomplete groups are always dropped. This is what translate_1m() has always
+#  done, and the backtest code depends on it to map 1-minute candles to N-minute candles.
+def aggregate(pricehistory=None, minutes=5, align=True, complete=True):
+
+	store	= CandleStore.from_pricehistory( pricehistory )
+	minutes	= int( minutes )
+	if ( len(store) == 0 or minutes < 1 ):
+		return CandleStore( symbol=store.symbol, capacity=0 )
+
+	if ( align == True ):
+		interval	= minutes * 60 * 1000
+		bins		= store.datetime // interval
+		starts		= np.flatnonzero( np.diff(bins) ) + 1
+		starts		= np.concatenate( [[0], starts] )
+		ends		= np.append( starts[1:], len(store) )
+
+		if ( complete == True ):
+			last_minute = ( store.datetime[-1] // 60000 ) % minutes
+			if ( last_minute != minutes - 1 ):
+				starts	= starts[:-1]
+				ends	= ends[:-1]
+
+		datetime = bins[starts] * interval
+
+	else:
+		num	= len(store) // minutes
+		starts	= np.arange( num ) * minutes
+		ends	= starts + minutes
+		if ( num > 0 ):
+			datetime = store.datetime[ends - 1]
+
+	if ( len(starts) == 0 ):
+		return CandleStore( symbol=store.symbol, capacity=0 )
+
+	# ufunc.reduceat() reduces each [starts[i]:starts[i+1]] slice, the last slice runs to the
+	#  end of the array so any trailing incomplete group needs to be excluded first
+	last = ends[-1]
+	return CandleStore.from_arrays( store.symbol,
+					open=store.open[starts],
+					high=np.maximum.reduceat( store.high[:last], starts ),
+					low=np.minimum.reduceat( store.low[:last], starts ),
+					close=store.close[ends - 1],
+					volume=np.add.reduceat( store.volume[:last], starts ),
+					datetime=datetime )
+
+# Incremental N-minute candles aligned to the clock
+#
+# update() takes each new 1-minute candle and returns a list of the N-minute candles that
+#  were completed by it. This is usually empty or one candle, but if a 1-minute candle is
+#  missing (i.e. no trades during the last minute of an interval) then the previous
+#  interval is completed by the first candle of the next interval, and if that candle is
+#  also the last candle of its interval then both are returned.
+class CandleAggregator:
+	def __init__(self, minutes=5):
+		self.minutes	= int( minutes )
+		self.interval	= self.minutes * 60 * 1000
+		self.cur	= None
+		self.cur_bin	= None
+
+	# Start from the 1-minute candles at the end of pricehistory that belong to an
+	#  incomplete interval, i.e. after aggregate(pricehistory, complete=True)
+	def seed(self, pricehistory=None):
+		self.cur	= None
+		self.cur_bin	= None
+
+		store = CandleStore.from_pricehistory( pricehistory )
+		if ( len(store) == 0 ):
+			return
+
+		last_bin	= store.datetime[-1] // self.interval
+		first		= np.searchsorted( store.datetime, last_bin * self.interval, side='left' )
+		for i in range( first, len(store) ):
+			self.update( store.candle(i) )
+
+	def update(self, candle=None):
+		completed	= []
+		dt		= int( candle['datetime'] )
+		cur_bin		= dt // self.interval
+
+		if ( self.cur != None and cur_bin != self.cur_bin ):
+			completed.append( self.cur )
+			self.cur = None
+
+		if ( self.cur == None ):
+			self.cur_bin	= cur_bin
+			self.cur	= {	'open':		float( candle['open'] ),
+						'high':		float( candle['high'] ),
+						'low':		float( candle['low'] ),
+						'close':	float( candle['close'] ),
+						'volume':	int( candle['volume'] ),
+						'datetime':	cur_bin * self.interval }
+		else:
+			self.cur['high']	= max( self.cur['high'], float(candle['high']) )
+			self.cur['low']		= min( self.cur['low'], float(candle['low']) )
+			self.cur['close']	= float( candle['close'] )
+			self.cur['volume']	+= int( candle['volume'] )
+
+		# Last minute of the interval
+		if ( (dt // 60000) % self.minutes == self.minutes - 1 ):
+			completed.append( self.cur )
+			self.cur = None
+
+		return completed
@@ -1,36 +1,53 @@
 #!/usr/bin/python3 -u
 
 import os, sys, re, time
+import threading
 from datetime import datetime, timedelta
 from pytz import timezone
 
 from func_timeout import func_timeout, FunctionTimedOut
 
+import tda_blacklist_helper
+import tda_calendar_helper
+import tda_candle_helper
+import tda_history_helper
+import tda_rest_helper
+
 
 # Login to tda using a passcode
+# tda.login() reads, refreshes and rewrites the token file, and the order functions call
+#  this from the OrderExecutor threads at the same time as the main loop, so logins are
+#  serialized with login_lock.
+login_lock = threading.Lock()
+
 def tdalogin(passcode=None, token_fname=None):
 
 	if ( passcode == None ):
 		print('Error: tdalogin(): passcode is empty', file=sys.stderr)
 		return False
 
-	if ( token_fname != None ):
-		tda.authentication.PICKLE_NAME = token_fname
+	with login_lock:
+		if ( token_fname != None ):
+			tda.authentication.PICKLE_NAME = token_fname
 
-	try:
-		enc = func_timeout(5, tda.login, args=(passcode,))
+		try:
+			enc = func_timeout(5, tda.login, args=(passcode,))
 
-	except FunctionTimedOut:
-		print('Caught Exception: tdalogin(): timed out after 10 seconds')
-		return False
+		except FunctionTimedOut:
+			print('Caught Exception: tdalogin(): timed out after 10 seconds')
+			return False
 
-	except Exception as e:
-		print('Caught Exception: tdalogin(): ' + str(e))
-		return False
+		except Exception as e:
+			print('Caught Exception: tdalogin(): ' + str(e))
+			return False
 
-	if ( enc == '' ):
-		print('Error: tdalogin(): tda.login return is empty', file=sys.stderr)
-		return False
+		if ( enc == '' ):
+			print('Error: tdalogin(): tda.login return is empty', file=sys.stderr)
+			return False
+
+		# API requests are made by the shared REST client (see tda_rest_helper.py), which
+		#  uses the access token that robin_stocks obtained
+		tda_rest_helper.get_client().set_token( tda_rest_helper.robin_stocks_token(tda) )
 
 	return True
 
@@ -47,47 +64,11 @@ def isendofday(mins=5, date=None):
 	if ( mins < 0 ):
 		return False
 
-	eastern = timezone('US/Eastern') # Observes EST and EDT
-
-	if ( date == None ):
-		est_time = datetime.now(eastern)
-	elif ( type(date) is datetime ):
-		est_time = date.replace(tzinfo=eastern)
-	else:
+	if ( date != None and type(date) is not datetime ):
 		print('Error: isendofday(): date must be a datetime object')
 		return False
 
-	# Early close (1PM) days
-	early_close = [	'2021-07-02',
-			'2021-11-26',
-			'2021-12-23',
-
-			# 2022
-			#'2022-07-01',
-			'2022-11-25',
-			'2022-12-23',
-
-			# 2023
-			'2023-07-03',
-			'2023-11-24',
-			'2023-12-22',
-
-			# 2024
-			'2024-07-03',
-			'2024-11-29',
-			'2024-12-24' ]
-
-	mins = 60 - int(mins)
-
-	# Check early close holidays (1:00PM Eastern)
-	if ( est_time.strftime('%Y-%m-%d') ) in early_close:
-		if ( int(est_time.strftime('%-H')) == 12 and int(est_time.strftime('%-M')) >= mins ):
-			return True
-
-	elif ( int(est_time.strftime('%-H')) == 15 and int(est_time.strftime('%-M')) >= mins ):
-		return True
-
-	return False
+	return tda_calendar_helper.get_calendar().is_end_of_day( tda_calendar_helper.now(date), mins )
 
 
 # Returns True if it is currently near the beginning of a new trading day
@@ -108,145 +89,15 @@ def isnewday():
 #  to avoid volatility.
 # Extended hours for TDA are 2.5 hours before and after standard market hours
 #  Note: safe_open does not apply to extended hours
+#
+# Holidays and early close days are in tda_calendar_helper.py
 def ismarketopen_US(date=None, safe_open=False, check_day_only=False, extended_hours=False ):
-	eastern = timezone('US/Eastern') # Observes EST and EDT
-
-	if ( date == None ):
-		est_time = datetime.now(eastern)
-	elif ( type(date) is datetime ):
-		est_time = date.replace(tzinfo=eastern)
-	else:
+	if ( date != None and type(date) is not datetime ):
 		print('Error: ismarketopen_US(): date must be a datetime object')
 		return False
 
-	# US market holidays - source: https://www.marketbeat.com/stock-market-holidays/
-	# TDA API doesn't provide this, so I'm hardcoding these dates for now.
-	# Holidays:
-	#   New Year's Day
-	#   Martin Luther King Jr. Day
-	#   President's Day
-	#   Good Friday
-	#   Memorial Day
-	#   Early Close (1:00PM Eastern)
-	#   Independence Day
-	#   Labor Day
-	#   Thanksgiving
-	#   Early Close (1:00PM Eastern)
-	#   Early Close (1:00PM Eastern)
-	#   Christmas Eve
-	holidays = [	'2021-01-01',
-			'2021-01-18',
-			'2021-02-15',
-			'2021-04-02',
-			'2021-05-31',
-			'2021-07-05',
-			'2021-09-06',
-			'2021-11-25',
-			'2021-12-24',
-
-			# 2022
-			'2022-01-17',
-			'2022-02-21',
-			'2022-04-15',
-			'2022-05-30',
-			'2022-07-04',
-			'2022-09-05',
-			'2022-11-24',
-			'2022-12-26',
-
-			# 2023
-			'2023-01-02',
-			'2023-01-16',
-			'2023-02-20',
-			'2023-04-07',
-			'2023-05-29',
-			'2023-07-04',
-			'2023-09-04',
-			'2023-11-23',
-			'2023-12-25',
-
-			# 2024
-			'2024-01-01',
-			'2024-01-15',
-			'2024-02-19',
-			'2024-03-29',
-			'2024-05-27',
-			'2024-07-04',
-			'2024-09-02',
-			'2024-11-28',
-			'2024-12-25' ]
-
-	early_close = [	'2021-07-02',
-			'2021-11-26',
-			'2021-12-23',
-
-			# 2022
-			#'2022-07-01',
-			'2022-11-25',
-			'2022-12-23',
-
-			# 2023
-			'2023-07-03',
-			'2023-11-24',
-			'2023-12-22',
-
-			# 2024
-			'2024-07-03',
-			'2024-11-29',
-			'2024-12-24' ]
-
-	# Return false if it's a holiday
-	if ( est_time.strftime('%Y-%m-%d') ) in holidays:
-		return False
-	if ( int(est_time.strftime('%w')) == 0 or int(est_time.strftime('%w')) == 6 ): # 0=Sunday, 6=Saturday
-		return False
-	if ( check_day_only == True ):
-		return True
-
-	if ( int(est_time.strftime('%w')) != 0 and int(est_time.strftime('%w')) != 6 ): # 0=Sunday, 6=Saturday
-
-		# Extended market hours (07:00-18:30 Eastern)
-		if ( extended_hours == True ):
-			if ( int(est_time.strftime('%-H')) >= 7 ):
-				if ( int(est_time.strftime('%-H')) < 18 ):
-					return True
-
-				elif ( int(est_time.strftime('%-H')) == 18 and int(est_time.strftime('%-M')) <= 30 ):
-					return True
-
-		# Standard market hours (09:30-16:00 Eastern)
-		else:
-			if ( int(est_time.strftime('%-H')) >= 9 ):
-				if ( int(est_time.strftime('%-H')) == 9 ):
-
-					# Do not return True until after 10AM EST to avoid some of the volatility of the open
-					if ( isinstance(safe_open, bool) and safe_open == True ):
-						return False
-
-					if ( int(est_time.strftime('%-M')) >= 30 ):
-						return True
-					else:
-						return False
-
-				elif ( int(est_time.strftime('%-H')) == 10 ):
-
-					# Do not return True until after 10:15AM to void some of the volatility of the open
-					if ( isinstance(safe_open, bool) and safe_open == True ):
-						if ( int(est_time.strftime('%-M')) >= 15 ):
-							return True
-						else:
-							return False
-
-				# Check early close holidays (1:00PM Eastern)
-				if ( est_time.strftime('%Y-%m-%d') ) in early_close:
-					if ( int(est_time.strftime('%-H')) <= 12 and int(est_time.strftime('%-M')) <= 59 ):
-						return True
-
-				# Otherwise consider 3:59 Eastern to be closing time
-				elif ( int(est_time.strftime('%-H')) <= 15 and int(est_time.strftime('%-M')) <= 59 ):
-					return True
-
-	return False
+	return tda_calendar_helper.get_calendar().is_open( tda_calendar_helper.now(date), safe_open=(isinstance(safe_open, bool) and safe_open == True),
+								check_day_only=check_day_only, extended_hours=extended_hours )
 
 
 # Write logs for each ticker for live monitoring of the stock performance
@@ -350,65 +201,18 @@ def check_stock_symbol(stock=None):
 		return False
 
 	# Multiple stock check
+	# The tickers are split into batches, see tda_rest_helper.get_quotes_batch()
 	if ( re.search(',', stock) ):
 
-		# Split the request in batches of 100
-		if ( len(stock.split(',')) > 100 ):
-			maxq = 100
-			stocks = ''
-
-			all_stocks = stock.split(',')
-			all_stocks = [all_stocks[i:i + maxq] for i in range(0, len(all_stocks), maxq)]
-
-			for query in all_stocks:
-
-				query = ','.join(query)
-				try:
-					data,err = func_timeout(10, tda.stocks.get_quotes, args=(str(query), True))
-
-				except FunctionTimedOut:
-					print('Caught Exception: check_stock_symbol(' + str(query) + '): tda.stocks.get_quotes(): timed out after 10 seconds', file=sys.stderr)
-					return False
-				except Exception as e:
-					print('Caught Exception: check_stock_symbol(' + str(query) + '): tda.stocks.get_quotes(): ' + str(e), file=sys.stderr)
-					return False
-
-				if ( err != None ):
-					print('Error: check_stock_symbol(' + str(query) + '): tda.stocks.get_quotes(): ' + str(err), file=sys.stderr)
-					return False
-				elif ( data == {} ):
-					print('Error: check_stock_symbol(' + str(query) + '): tda.stocks.get_quotes(): Empty data set', file=sys.stderr)
-					return False
-
-				stocks += ',' + ','.join(list(data.keys()))
-
-			stocks = re.sub('^,', '', stocks)
-			stocks = re.sub(',$', '', stocks)
-
-			return stocks
-
-		else:
-			try:
-				data,err = func_timeout(10, tda.stocks.get_quotes, args=(str(stock), True))
-
-			except FunctionTimedOut:
-				print('Caught Exception: check_stock_symbol(' + str(stock) + '): tda.stocks.get_quotes(): timed out after 10 seconds', file=sys.stderr)
-				return False
-			except Exception as e:
-				print('Caught Exception: check_stock_symbol(' + str(stock) + '): tda.stocks.get_quotes(): ' + str(e), file=sys.stderr)
-				return False
-
-			if ( err != None ):
-				print('Error: get_lastprice(' + str(stock) + '): ' + str(err), file=sys.stderr)
-				return False
-			elif ( data == {} ):
-				print('Error: get_lastprice(' + str(stock) + '): Empty data set', file=sys.stderr)
-				return False
-
-			stocks = ','.join(list(data.keys()))
-
-			return stocks
+		data,err = tda_rest_helper.get_client().get_quotes_batch(stock, timeout=10)
+		if ( err != None ):
+			print('Error: check_stock_symbol(' + str(stock) + '): get_quotes_batch(): ' + str(err), file=sys.stderr)
+			return False
+		elif ( data == {} ):
+			print('Error: check_stock_symbol(' + str(stock) + '): get_quotes_batch(): Empty data set', file=sys.stderr)
+			return False
 
+		return ','.join(list(data.keys()))
 
 	# Single stock check
 	else:
@@ -430,237 +234,52 @@ def check_stock_symbol(stock=None):
 
 
 # Write a stock blacklist that can be used to avoid wash sales
+# See tda_blacklist_helper.py
 def write_blacklist(ticker=None, stock_qty=-1, orig_base_price=-1, last_price=-1, net_change=-1, percent_change=-1, permanent=False, debug=False):
 
 	if ( ticker == None ):
 		print('Error: write_blacklist(' + str(ticker) + '): ticker is empty', file=sys.stderr)
 		return False
 
-	try:
-		mytimezone
-	except:
-		mytimezone = timezone("US/Eastern")
-
-	# We're assuming the blacklist file will be in the same path as tda_gobot_helper
-	parent_path = os.path.dirname( os.path.realpath(__file__) )
-	blacklist = str(parent_path) + '/.stock-blacklist'
-	try:
-		fh = open( blacklist, "at" )
-
-	except OSError as e:
-		print('Error: write_blacklist(): Unable to open file ' + str(blacklist) + ': ' + str(e), file=sys.stderr)
-		return False
-
-	time_now = 9999999999
-	if ( permanent == False ):
-		time_now = round( datetime.now(mytimezone).timestamp() )
-
-	# Log format - stock|stock_qty|orig_base_price|last_price|net_change|percent_change|timestamp
-	if ( float(last_price) < float(orig_base_price) ):
-		percent_change = '-' + str(round(percent_change,2))
-	else:
-		percent_change = '+' + str(round(percent_change,2))
-
-	msg =	str(ticker)		+ '|' + \
-		str(stock_qty)		+ '|' + \
-		str(orig_base_price)	+ '|' + \
-		str(last_price)		+ '|' + \
-		str(net_change)		+ '|' + \
-		str(percent_change)	+ '|' + \
-		str(time_now)
-
-	if ( os.name != 'nt' ):
-		import fcntl
-
-		fcntl.lockf( fh, fcntl.LOCK_EX )
-		print( msg, file=fh, flush=True )
-		fcntl.lockf( fh, fcntl.LOCK_UN )
-
-	else:
-		print( msg, file=fh, flush=True )
-
-	fh.close()
-
-	return True
+	return tda_blacklist_helper.get_blacklist().add( ticker, stock_qty, orig_base_price, last_price, net_change, percent_change, permanent=permanent )
 
 
 # Check stock blacklist to avoid wash sales
 # Returns True if ticker is in the file and time_stamp is < 32 days ago
 # Or if permaban_only=True, then only returns True for permanently blacklisted stocks
+#
+# The blacklist file is only read again if it has changed since the last call, so this
+#  can be called for each ticker without re-reading the file every time.
 def check_blacklist(ticker=None, permaban_only=False, debug=False):
 	if ( ticker == None ):
 		print('Error: check_blacklist(' + str(ticker) + '): ticker is empty', file=sys.stderr)
 		return False
 
-	try:
-		mytimezone
-	except:
-		mytimezone = timezone("US/Eastern")
+	blacklist = tda_blacklist_helper.get_blacklist()
+	if ( blacklist.reload() == False ):
+		return False
 
-	# We're assuming the blacklist file will be in the same path as tda_gobot_helper
-	parent_path = os.path.dirname( os.path.realpath(__file__) )
-	blacklist = str(parent_path) + '/.stock-blacklist'
-	if ( os.path.exists(blacklist) == False ):
+	if ( blacklist.exists == False ):
 		if ( debug == True ):
-			print('WARNING: check_blacklist(): File ' + str(blacklist) + ' does not exist', file=sys.stderr)
+			print('WARNING: check_blacklist(): File ' + str(blacklist.fname) + ' does not exist', file=sys.stderr)
 
 		return True
 
-	try:
-		fh = open( blacklist, "rt" )
-
-	except OSError as e:
-		print('Error: check_blacklist(): Unable to open file ' + str(blacklist) + ': ' + str(e), file=sys.stderr)
-		return False
-
-	found = False
-	time_now = datetime.now(mytimezone)
-	for line in fh:
-		if ( re.match(r'[\s\t]*#', line) ):
-			continue
-
-		line = line.replace(" ", "")
-		line = line.rstrip()
-
-		try:
-			stock, stock_qty, orig_base_price, last_price, net_change, percent_change, time_stamp = line.split('|', 7)
-		except:
-			continue
-
-		if ( str(stock) == str(ticker) ):
-
-			# Return True of the stock was permanently banned
-			if ( time_stamp == '9999999999' ):
-				return True
-
-			if ( permaban_only == True ):
-				return False
-
-			time_stamp = datetime.fromtimestamp(float(time_stamp), tz=mytimezone)
-			if ( time_stamp + timedelta(days=32) > time_now ):
-
-				# time_stamp is less than 30 days in the past
-				found = True
-				break
-
-			# Note that we keep processing the file as it could contain duplicate
-			#  entries for each ticker, since we're only appending to this file
-			#  and not re-writing it.
-
-	fh.close()
+	return blacklist.check( ticker, permaban_only=permaban_only )
 
-	return found
 
-
-# Check stock blacklist to avoid wash sales
-# Returns True if ticker is in the file and time_stamp is < 32 days ago
+# Clean the stock blacklist
+# Removes entries that are more than 32 days old and duplicate entries for each ticker
 def clean_blacklist(debug=False):
 
-	try:
-		mytimezone
-	except:
-		mytimezone = timezone("US/Eastern")
-
-	# We're assuming the blacklist file will be in the same path as tda_gobot_helper
-	parent_path = os.path.dirname( os.path.realpath(__file__) )
-	blacklist = str(parent_path) + '/.stock-blacklist'
-	if ( os.path.exists(blacklist) == False ):
+	blacklist = tda_blacklist_helper.get_blacklist()
+	if ( os.path.exists(blacklist.fname) == False ):
 		if ( debug == True ):
-			print('WARNING: check_blacklist(): File ' + str(blacklist) + ' does not exist', file=sys.stderr)
+			print('WARNING: clean_blacklist(): File ' + str(blacklist.fname) + ' does not exist', file=sys.stderr)
 
 		return True
 
-	try:
-		fh = open( blacklist, "rt" )
-
-	except OSError as e:
-		print('Error: check_blacklist(): Unable to open file ' + str(blacklist) + ': ' + e, file=sys.stderr)
-		return False
-
-
-	cur_blacklist = []
-	time_now = datetime.now(mytimezone)
-	for line in fh:
-		line = line.rstrip()
-		line = re.sub('[\r\n]', "", line)
-
-		if ( re.match('^[\s\t]*#', line) ):
-			# For now we're keeping all comments intact
-			# Stale comments must be cleaned manually
-			cur_blacklist.append(line)
-			continue
-
-		else:
-			# Comments at the end of each line cannot be supported, strip them
-			line = re.sub('[\s\t]*#.*', "", line)
-			line = line.replace(" ", "")
-			cur_blacklist.append(line)
-
-	fh.close()
-
-	# Process the blacklist, remove any stale entries
-	red		= '\033[0;31m'
-	green		= '\033[0;32m'
-	reset_color	= '\033[0m'
-	text_color	= ''
-
-	if ( debug == True ):
-		print( '{0:10} {1:15} {2:15}'.format('Ticker', 'Entry Date', 'Expiration Date') )
-
-	for idx,line in enumerate(cur_blacklist):
-		if ( re.match('^[\s\t]*#', line) or line == "" ): # Skip comments or blank lines
-			continue
-
-		try:
-			stock, stock_qty, orig_base_price, last_price, net_change, percent_change, time_stamp = line.split('|', 7)
-
-		except:
-			continue
-
-		text_color = green
-		time_stamp = datetime.fromtimestamp( int(time_stamp), tz=mytimezone )
-		if ( time_stamp + timedelta(days=32) > time_now ):
-			# time_stamp is still less than 32 days in the past
-			text_color = red
-
-		else:
-			# time_stamp is more than 32 days in the past, so we can purge it
-			cur_blacklist[idx] = 'DELETED'
-
-		if ( debug == True ):
-			expiration = time_stamp + timedelta(days=32)
-			print(text_color, end='')
-
-			if ( int(expiration.strftime('%-Y')) > 2200 ):
-				# This is a permanently blacklisted ticker
-				print( '{0:10} {1:15} {2:15}'.format(stock, '----------', 'permanent'), end='' )
-			else:
-				print( '{0:10} {1:15} {2:15}'.format(stock, time_stamp.strftime('%Y-%m-%d'), expiration.strftime('%Y-%m-%d')), end='' )
-
-			print(reset_color)
-
-
-	# Print out the blacklist file with the remaining valid entries
-	try:
-		fh = open( blacklist, "wt" )
-
-	except OSError as e:
-		print('Error: write_blacklist(): Unable to open file ' + str(blacklist) + ': ' + str(e), file=sys.stderr)
-		return False
-
-	if ( os.name != 'nt' ):
-		import fcntl
-		fcntl.lockf( fh, fcntl.LOCK_EX )
-
-	for line in cur_blacklist:
-		if ( line == 'DELETED' ):
-			continue
-
-		print( line, file=fh, flush=True )
-
-	fh.close()
-
-	return True
+	return blacklist.compact( debug=debug )
 
 
 # Get the lastPrice for a stock ticker
@@ -676,9 +295,9 @@ def get_lastprice(ticker=None, WarnDelayed=True, mark=False, debug=False):
 		return False
 
 	try:
-		data,err = func_timeout(4, tda.stocks.get_quotes, args=(str(ticker), True))
+		data,err = tda_rest_helper.get_client().get_quotes(str(ticker), timeout=4)
 
-	except FunctionTimedOut:
+	except tda_rest_helper.Timeout:
 		print('Caught Exception: get_lastprice(' + str(ticker) + '): tda.stocks.get_quote(): timed out after 4 seconds')
 		return False
 
@@ -734,7 +353,7 @@ def get_lastprice(ticker=None, WarnDelayed=True, mark=False, debug=False):
 
 # Return the quote information for one or more stock tickers
 # This can be a little tricky as TDA's API sometimes truncates large queries, so we need to break
-#  up the list of tickers into multiple queries.
+#  up the list of tickers into multiple queries (see tda_rest_helper.get_quotes_batch()).
 def get_quotes(stock=None):
 	if ( stock == None ):
 		print('Error: get_quotes(' + str(stock) + '): ticker is empty', file=sys.stderr)
@@ -743,64 +362,22 @@ def get_quotes(stock=None):
 	# Get quotes for multiple stocks
 	if ( re.search(',', stock) ):
 
-		# Split the request in batches of 100
-		if ( len(stock.split(',')) > 100 ):
-			maxq = 100
-			stocks = {}
-
-			all_stocks = stock.split(',')
-			all_stocks = [all_stocks[i:i + maxq] for i in range(0, len(all_stocks), maxq)]
-
-			for query in all_stocks:
-
-				query = ','.join(query)
-				try:
-					data,err = func_timeout(5, tda.stocks.get_quotes, args=(str(query), True))
-
-				except FunctionTimedOut:
-					print('Caught Exception: get_quotes(' + str(query) + '): tda.stocks.get_quotes(): timed out after 10 seconds', file=sys.stderr)
-					return False
-				except Exception as e:
-					print('Caught Exception: get_quotes(' + str(query) + '): tda.stocks.get_quotes(): ' + str(e), file=sys.stderr)
-					return False
-
-				if ( err != None ):
-					print('Error: get_quotes(' + str(query) + '): tda.stocks.get_quotes(): ' + str(err), file=sys.stderr)
-					return False
-				elif ( data == {} ):
-					print('Error: get_quotes(' + str(query) + '): tda.stocks.get_quotes(): Empty data set', file=sys.stderr)
-					return False
-
-				stocks.update(data)
-
-			return stocks
-
-		else:
-			try:
-				data,err = func_timeout(5, tda.stocks.get_quotes, args=(str(stock), True))
-
-			except FunctionTimedOut:
-				print('Caught Exception: get_quotes(' + str(stock) + '): tda.stocks.get_quotes(): timed out after 10 seconds', file=sys.stderr)
-				return False
-			except Exception as e:
-				print('Caught Exception: get_quotes(' + str(stock) + '): tda.stocks.get_quotes(): ' + str(e), file=sys.stderr)
-				return False
-
-			if ( err != None ):
-				print('Error: get_quotes(' + str(stock) + '): tda.stocks.get_quotes(): ' + str(err), file=sys.stderr)
-				return False
-			elif ( data == {} ):
-				print('Error: get_quotes(' + str(stock) + '): tda.stocks.get_quotes(): Empty data set', file=sys.stderr)
-				return False
+		data,err = tda_rest_helper.get_client().get_quotes_batch(stock, timeout=5)
+		if ( err != None ):
+			print('Error: get_quotes(' + str(stock) + '): get_quotes_batch(): ' + str(err), file=sys.stderr)
+			return False
+		elif ( data == {} ):
+			print('Error: get_quotes(' + str(stock) + '): get_quotes_batch(): Empty data set', file=sys.stderr)
+			return False
 
-			return data
+		return data
 
 	# Get a quote for a single stock ticker
 	else:
 		try:
-			data,err = func_timeout(5, tda.stocks.get_quotes, args=(str(stock), True))
+			data,err = tda_rest_helper.get_client().get_quotes(str(stock), timeout=5)
 
-		except FunctionTimedOut:
+		except tda_rest_helper.Timeout:
 			print('Caught Exception: get_quotes(' + str(stock) + '): tda.stocks.get_quote(): timed out after 10 seconds', file=sys.stderr)
 			return False
 		except Exception as e:
@@ -819,6 +396,36 @@ def get_quotes(stock=None):
 	return False
 
 
+# Return a dict of tda_rest_helper.Quote records for one or more stock tickers
+# stock may be a comma-delimited string or a list. Tickers that the API did not
+#  return a quote for (i.e. invalid tickers) are not included.
+# If some of the batched requests failed, the quotes from the other requests are still
+#  returned and the symbols of the failed requests are logged. Returns False only if
+#  no quotes were returned at all.
+def get_quote_records(stock=None, debug=False):
+	if ( stock == None or stock == '' or stock == [] ):
+		print('Error: get_quote_records(' + str(stock) + '): ticker is empty', file=sys.stderr)
+		return False
+
+	data,err = tda_rest_helper.get_client().get_quote_records(stock, timeout=5)
+	if ( err != None ):
+		if ( data == {} ):
+			print('Error: get_quote_records(): ' + str(err), file=sys.stderr)
+			return False
+
+		print('Warning: get_quote_records(): some quotes were not returned: ' + str(err), file=sys.stderr)
+
+	elif ( data == {} ):
+		print('Error: get_quote_records(' + str(stock) + '): Empty data set', file=sys.stderr)
+		return False
+
+	if ( debug == True ):
+		for quote in data.values():
+			print(quote)
+
+	return data
+
+
 # Fix the timestamp for get_pricehistory()
 # TDA API is very picky and may reject requests with timestamps that are
 #  outside normal or extended hours
@@ -838,7 +445,7 @@ def fix_timestamp(date=None, check_day_only=False, debug=False):
 
 	# Make sure start and end dates don't land on a weekend
 	# 0=Sunday, 6=Saturday
-	day = int( date.strftime('%w') )
+	day = ( date.weekday() + 1 ) % 7
 	if ( day == 0 ):
 		date = date - timedelta( days=2 )
 	elif ( day == 6 ):
@@ -857,7 +464,7 @@ def fix_timestamp(date=None, check_day_only=False, debug=False):
 	# Make sure start_end dates aren't outside regular hours
 	# We could use extended hours here, but we assume regular hours
 	#  since "needExtendedHoursData=True" is the default
-	hour = int( date.strftime('%-H') )
+	hour = date.hour
 	if ( hour >= 16 ):
 		date = date - timedelta( hours=hour-15 )
 	elif ( hour >= 0 and hour <= 10 ):
@@ -888,33 +495,46 @@ def get_pricehistory(ticker=None, p_type=None, f_type=None, freq=None, period=No
 			print('Error: get_pricehistory(' + str(ticker) + '): start_date or end_date is out of market open and extended hours (weekend)')
 			return False, []
 
+	# Use the local history cache so that only candles newer than the cached data are
+	#  downloaded (see tda_history_helper.py)
+	fetch = lambda p_type, f_type, freq, period, start_date, end_date: _get_pricehistory(ticker, p_type, f_type, freq, period, start_date, end_date, needExtendedHoursData)
+	data = tda_history_helper.get_pricehistory(fetch, ticker, p_type, f_type, freq, period, start_date, end_date, extended_hours=needExtendedHoursData)
+	if ( isinstance(data, bool) and data == False ):
+		return False, []
+
+	epochs = [ float(key['datetime']) for key in data['candles'] ]
+
+	return data, epochs
+
+
+# Call the API for get_pricehistory()
+# Returns the pricehistory dict, or False on error
+def _get_pricehistory(ticker=None, p_type=None, f_type=None, freq=None, period=None, start_date=None, end_date=None, needExtendedHoursData=False):
+
 	# Example: {'open': 236.25, 'high': 236.25, 'low': 236.25, 'close': 236.25, 'volume': 500, 'datetime': 1616796960000}
 	data = err = ''
 	try:
-		data,err = func_timeout(10, tda.get_price_history, args=(ticker, p_type, f_type, freq, period, start_date, end_date, needExtendedHoursData, True))
+		data,err = tda_rest_helper.get_client().get_price_history(ticker, p_type, f_type, freq, period, start_date, end_date, needExtendedHoursData, timeout=10)
 
-	except FunctionTimedOut:
+	except tda_rest_helper.Timeout:
 		print('Caught Exception: get_pricehistory(' + str(ticker) + '): tda.get_price_history() timed out after 10 seconds')
-		return False, []
+		return False
 
 	except Exception as e:
 		print('Caught Exception: get_pricehistory(' + str(ticker) + '): ' + str(e))
-		return False, []
+		return False
 
 	if ( err != None ):
 		print('Error: get_price_history(' + str(ticker) + ', ' + str(p_type) + ', ' +
 			str(f_type) + ', ' + str(freq) + ', ' + str(period) + ', ' +
 			str(start_date) + ', ' + str(end_date) +'): ' + str(err), file=sys.stderr)
 
-		return False, []
+		return False
 
-	# Populate epochs[] and check for duplicate timestamps
-	epochs = []
+	# Check for duplicate timestamps
 	seen = {}
 	dup = {}
 	for idx,key in enumerate(data['candles']):
-		epochs.append(float(key['datetime']))
-
 		if key['datetime'] not in seen:
 			seen[key['datetime']] = 1
 		else:
@@ -925,14 +545,18 @@ def get_pricehistory(ticker=None, p_type=None, f_type=None, freq=None, period=No
 
 	if ( len( dup.items() ) > 0 ):
 		print("\nWARNING: get_pricehistory(" + str(ticker) + "): DUPLICATE TIMESTAMPS DETECTED\n", file=sys.stderr)
-		return False, []
+		return False
 
-	return data, epochs
+	return data
 
 
 # Translate 1-minute candles to 2+ minute candles
 # Default translates to 5-minute candles
-def translate_1m(pricehistory=None, candle_type=5):
+#
+# By default the new candles are aligned to the clock (i.e. 09:30-09:34, 09:35-09:39), see
+#  tda_candle_helper.aggregate(). Set align=False to group every candle_type candles by
+#  position instead, which the backtest code uses to map 1-minute candles to 5-minute candles.
+def translate_1m(pricehistory=None, candle_type=5, align=True):
 
 	ticker = ''
 	try:
@@ -944,38 +568,9 @@ def translate_1m(pricehistory=None, candle_type=5):
 		print('Error: translate_1m(' + str(ticker) + '): pricehistory is empty', file=sys.stderr)
 		return False
 
-	new_pricehistory = { 'candles': [], 'ticker': ticker }
-	for idx,key in enumerate(pricehistory['candles']):
-		if ( idx == 0 ):
-			continue
-
-		cndl_num = idx + 1
-		if ( cndl_num % candle_type == 0 ):
-			open_p  = float( pricehistory['candles'][idx - (candle_type-1)]['open'] )
-			close   = float( pricehistory['candles'][idx]['close'] )
-			high    = float( pricehistory['candles'][idx]['high'] )
-			low     = float( pricehistory['candles'][idx]['low'] )
-			volume  = int( pricehistory['candles'][idx]['close'] )
+	store = tda_candle_helper.aggregate( pricehistory, minutes=candle_type, align=align )
 
-			for i in range((candle_type-1), 0, -1):
-				volume += int( pricehistory['candles'][idx-i]['volume'] )
-
-				if ( high < float(pricehistory['candles'][idx-i]['high']) ):
-					high = float( pricehistory['candles'][idx-i]['high'] )
-
-				if ( low > float(pricehistory['candles'][idx-i]['low']) ):
-					low = float( pricehistory['candles'][idx-i]['low'] )
-
-			newcandle = {	'open':		open_p,
-					'high':		high,
-					'low':		low,
-					'close':	close,
-					'volume':	volume,
-					'datetime':	pricehistory['candles'][idx]['datetime'] }
-
-			new_pricehistory['candles'].append(newcandle)
-
-	return new_pricehistory
+	return { 'candles': store.candles_list(), 'ticker': ticker }
 
 
 # Translate candle data to Heikin Ashi
@@ -996,38 +591,9 @@ def translate_heikin_ashi(pricehistory=None):
 	#  haClose = (open+high+low+close)/4
 	#  haLow = Min(low, haOpen, haClose)
 	#  haHigh = Max(high, haOpen, haClose)
-	hacandles = []
-	for idx,key in enumerate(pricehistory['candles']):
-		key['open']	= float( key['open'] )
-		key['high']	= float( key['high'] )
-		key['low']	= float( key['low'] )
-		key['close']	= float( key['close'] )
-		key['volume']	= int( key['volume'] )
-		key['datetime']	= int( key['datetime'] )
-
-		if ( idx == 0 ):
-			ha_open = key['open']
-		else:
-			ha_open = ( hacandles[idx-1]['open'] + hacandles[idx-1]['close'] ) / 2
-
-		ha_close	= ( key['open'] + key['high'] + key['low'] + key['close'] ) / 4
-		ha_high		= max( key['high'], ha_open, ha_close )
-		ha_low		= min( key['low'], ha_open, ha_close )
-
-		if ( ha_close > 1 ):
-			ha_open		= round( ha_open, 2 )
-			ha_high		= round( ha_high, 2 )
-			ha_low		= round( ha_low, 2 )
-			ha_close	= round( ha_close, 2 )
+	hacandles = tda_candle_helper.heikin_ashi( pricehistory, decimals=2 )
 
-		hacandles.append ( {	'open':		ha_open,
-					'high':		ha_high,
-					'low':		ha_low,
-					'close':	ha_close,
-					'volume':	key['volume'],
-					'datetime':	key['datetime'] } )
-
-	pricehistory.update({ 'hacandles': hacandles })
+	pricehistory.update({ 'hacandles': hacandles.candles_list() })
 
 	return pricehistory
 
@@ -1198,7 +764,7 @@ def get_order(order_id=None, account_number=None, passcode=None, debug=False):
 	data	= None
 	err	= None
 	try:
-		data, err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+		data, err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 		if ( debug == True ):
 			print( data )
 
@@ -1244,7 +810,7 @@ def cancel_order(order_id=None, account_number=None, passcode=None, debug=False)
 	data	= None
 	err	= None
 	try:
-		data, err = func_timeout(5, tda.cancel_order, args=(account_number, order_id, True))
+		data, err = tda_rest_helper.get_client().cancel_order(account_number, order_id, timeout=5)
 		if ( debug == True ):
 			print( data )
 
@@ -1309,14 +875,14 @@ def buy_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_num
 	# Try to buy the stock num_attempts tries or return False
 	for attempt in range(num_attempts):
 		try:
-			data, err = func_timeout(5, tda.place_order, args=(account_number, order, True))
+			data, err = tda_rest_helper.get_client().place_order(account_number, order, timeout=5)
 			if ( debug == True ):
 				print('DEBUG: buy_stock_marketprice(): tda.place_order(' + str(ticker) + '): attempt ' + str(attempt+1))
 				print(order)
 				print(data)
 				print(err)
 
-		except FunctionTimedOut:
+		except tda_rest_helper.Timeout:
 			print('Caught Exception: buy_stock_marketprice(' + str(ticker) + '): tda.place_order(): timed out after 5 seconds')
 			err = 'Timed Out'
 
@@ -1339,7 +905,7 @@ def buy_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_num
 
 	# Get the order number to feed to tda.get_order
 	try:
-		order_id = func_timeout(5, tda.get_order_number, args=(data,))
+		order_id = tda_rest_helper.get_order_number(data)
 		if ( debug == True ):
 			print(order_id)
 
@@ -1354,7 +920,7 @@ def buy_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_num
 	# Get order information to determine if it was filled
 	try:
 		tdalogin(passcode)
-		data,err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+		data,err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 		if ( debug == True ):
 			print(data)
 
@@ -1371,7 +937,7 @@ def buy_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_num
 	if ( fillwait == True and data['filledQuantity'] != quantity ):
 		while time.sleep(5):
 			try:
-				data,err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+				data,err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 				if ( debug == True ):
 					print(data)
 
@@ -1439,14 +1005,14 @@ def sell_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_nu
 	# Try to sell the stock num_attempts tries or return False
 	for attempt in range(num_attempts):
 		try:
-			data, err = func_timeout(5, tda.place_order, args=(account_number, order, True))
+			data, err = tda_rest_helper.get_client().place_order(account_number, order, timeout=5)
 			if ( debug == True ):
 				print('DEBUG: sell_stock_marketprice(): tda.place_order(' + str(ticker) + '): attempt ' + str(attempt+1))
 				print(order)
 				print(data)
 				print(err)
 
-		except FunctionTimedOut:
+		except tda_rest_helper.Timeout:
 			print('Caught Exception: sell_stock_marketprice(' + str(ticker) + '): tda.place_order(): timed out after 5 seconds')
 			err = 'Timed Out'
 
@@ -1469,7 +1035,7 @@ def sell_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_nu
 
 	# Get the order number to feed to tda.get_order
 	try:
-		order_id = func_timeout(5, tda.get_order_number, args=(data,))
+		order_id = tda_rest_helper.get_order_number(data)
 		if ( debug == True ):
 			print(order_id)
 
@@ -1484,7 +1050,7 @@ def sell_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_nu
 	# Get order information to determine if it was filled
 	try:
 		tdalogin(passcode)
-		data, err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+		data, err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 		if ( debug == True ):
 			print(data)
 
@@ -1501,7 +1067,7 @@ def sell_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_nu
 	if ( fillwait == True and data['filledQuantity'] != quantity ):
 		while time.sleep(5):
 			try:
-				data,err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+				data,err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 				if ( debug == True ):
 					print(data)
 
@@ -1566,14 +1132,14 @@ def short_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_n
 	# Try to buy the stock num_attempts tries or return False
 	for attempt in range(num_attempts):
 		try:
-			data, err = func_timeout(5, tda.place_order, args=(account_number, order, True))
+			data, err = tda_rest_helper.get_client().place_order(account_number, order, timeout=5)
 			if ( debug == True ):
 				print('DEBUG: sell_stock_marketprice(): tda.place_order(' + str(ticker) + '): attempt ' + str(attempt+1))
 				print(order)
 				print(data)
 				print(err)
 
-		except FunctionTimedOut:
+		except tda_rest_helper.Timeout:
 			print('Caught Exception: short_stock_marketprice(' + str(ticker) + '): tda.place_order(): timed out after 5 seconds')
 			err = 'Timed Out'
 
@@ -1596,7 +1162,7 @@ def short_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_n
 
 	# Get the order number to feed to tda.get_order
 	try:
-		order_id = func_timeout(5, tda.get_order_number, args=(data,))
+		order_id = tda_rest_helper.get_order_number(data)
 		if ( debug == True ):
 			print(order_id)
 
@@ -1611,7 +1177,7 @@ def short_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_n
 	# Get order information to determine if it was filled
 	try:
 		tdalogin(passcode)
-		data, err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+		data, err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 		if ( debug == True ):
 			print(data)
 
@@ -1633,7 +1199,7 @@ def short_stock_marketprice(ticker=None, quantity=None, fillwait=True, account_n
 	if ( fillwait == True and float(data['filledQuantity']) != float(quantity) ):
 		while time.sleep(5):
 			try:
-				data,err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+				data,err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 				if ( debug == True ):
 					print(data)
 
@@ -1698,14 +1264,14 @@ def buytocover_stock_marketprice(ticker=None, quantity=None, fillwait=True, acco
 	# Try to sell the stock num_attempts tries or return False
 	for attempt in range(num_attempts):
 		try:
-			data, err = func_timeout(5, tda.place_order, args=(account_number, order, True))
+			data, err = tda_rest_helper.get_client().place_order(account_number, order, timeout=5)
 			if ( debug == True ):
 				print('DEBUG: buytocover_stock_marketprice(): tda.place_order(' + str(ticker) + '): attempt ' + str(attempt+1))
 				print(order)
 				print(data)
 				print(err)
 
-		except FunctionTimedOut:
+		except tda_rest_helper.Timeout:
 			print('Caught Exception: buytocover_stock_marketprice(' + str(ticker) + '): tda.place_order(): timed out after 5 seconds')
 			err = 'Timed Out'
 
@@ -1728,7 +1294,7 @@ def buytocover_stock_marketprice(ticker=None, quantity=None, fillwait=True, acco
 
 	# Get the order number to feed to tda.get_order
 	try:
-		order_id = func_timeout(5, tda.get_order_number, args=(data,))
+		order_id = tda_rest_helper.get_order_number(data)
 		if ( debug == True ):
 			print(order_id)
 
@@ -1743,7 +1309,7 @@ def buytocover_stock_marketprice(ticker=None, quantity=None, fillwait=True, acco
 	# Get order information to determine if it was filled
 	try:
 		tdalogin(passcode)
-		data, err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+		data, err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 		if ( debug == True ):
 			print(data)
 
@@ -1760,7 +1326,7 @@ def buytocover_stock_marketprice(ticker=None, quantity=None, fillwait=True, acco
 	if ( fillwait == True and data['filledQuantity'] != quantity ):
 		while time.sleep(5):
 			try:
-				data,err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+				data,err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 				if ( debug == True ):
 					print(data)
 
@@ -1857,14 +1423,14 @@ def buy_sell_option(contract=None, quantity=None, limit_price=None, instruction=
 	# Try to buy/sell the option num_attempts tries or return False
 	for attempt in range(num_attempts):
 		try:
-			data, err = func_timeout(5, tda.place_order, args=(account_number, order, True))
+			data, err = tda_rest_helper.get_client().place_order(account_number, order, timeout=5)
 			if ( debug == True ):
 				print('DEBUG: buy_sell_option(): tda.place_order(' + str(contract) + '): attempt ' + str(attempt+1))
 				print(order)
 				print(data)
 				print(err)
 
-		except FunctionTimedOut:
+		except tda_rest_helper.Timeout:
 			print('Caught Exception: buy_sell_option(' + str(contract) + '): tda.place_order(): timed out after 5 seconds')
 			err = 'Timed Out'
 
@@ -1887,7 +1453,7 @@ def buy_sell_option(contract=None, quantity=None, limit_price=None, instruction=
 
 	# Get the order number to feed to tda.get_order
 	try:
-		order_id = func_timeout(5, tda.get_order_number, args=(data,))
+		order_id = tda_rest_helper.get_order_number(data)
 		if ( debug == True ):
 			print(order_id)
 
@@ -1902,7 +1468,7 @@ def buy_sell_option(contract=None, quantity=None, limit_price=None, instruction=
 	# Get order information to determine if it was filled
 	try:
 		tdalogin(passcode)
-		data, err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+		data, err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 		if ( debug == True ):
 			print(data)
 
@@ -1919,7 +1485,7 @@ def buy_sell_option(contract=None, quantity=None, limit_price=None, instruction=
 	if ( fillwait == True and data['filledQuantity'] != quantity ):
 		while time.sleep(5):
 			try:
-				data,err = func_timeout(5, tda.get_order, args=(account_number, order_id, True))
+				data,err = tda_rest_helper.get_client().get_order(account_number, order_id, timeout=5)
 				if ( debug == True ):
 					print(data)
 
@@ -1996,9 +1562,9 @@ def get_option_chains(ticker=None, contract_type='ALL', strike_count='10', inclu
 				'option_type':		option_type,
 				'jsonify':		jsonify }
 
-		data, err = func_timeout(5, tda.stocks.get_option_chains, args=(ticker,), kwargs=all_args )
+		data, err = tda_rest_helper.get_client().get_option_chains(ticker, timeout=5, **all_args)
 
-	except FunctionTimedOut:
+	except tda_rest_helper.Timeout:
 		print('Caught Exception: get_option_chains(' + str(ticker) + '): tda.stocks.get_option_chains(): timed out after 10 seconds', file=sys.stderr)
 		return False
 	except Exception as e:
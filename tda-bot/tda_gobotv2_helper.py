@@ -3,6 +3,7 @@
 import os, sys, signal
 import re
 import time, datetime, pytz, random
+import functools
 from collections import OrderedDict
 import pickle
 import numpy as np
@@ -11,6 +12,57 @@ from func_timeout import func_timeout, FunctionTimedOut
 
 import tda_gobot_helper
 import tda_algo_helper
+import tda_candle_helper
+import tda_rest_helper
+
+
+# Streaming archive for candle/level1/level2/ets data (tda_archive_helper.Archiver)
+# If None, all data is written at exit by export_pricehistory()
+archiver = None
+
+# Reverse index of stream_id -> ticker
+# Ticker names may differ from the names used by the streams API (i.e. BRK.A -> BRK/A),
+#  so the stream handlers use this to map the stream key back to the ticker.
+# stream_index_len is len(stocks) when the index was built.
+stream_index		= {}
+stream_index_len	= -1
+
+# Rebuild stream_index from stocks{}
+# Called at startup, and again by get_ticker() if stocks{} has changed since then.
+def build_stream_index():
+
+	global stream_index, stream_index_len
+
+	new_index = {}
+	for ticker in stocks.keys():
+		new_index[ticker] = ticker
+		try:
+			new_index[stocks[ticker]['stream_id']] = ticker
+		except:
+			pass
+
+	stream_index		= new_index
+	stream_index_len	= len(stocks)
+	return True
+
+# Map a stream key back to the ticker name
+# Returns None if the key does not belong to a ticker in stocks{}. Tickers that have been
+#  invalidated are still returned, the caller should check stocks[ticker]['isvalid'].
+#
+# The index is only rebuilt if the lookup found a ticker that has since been removed
+#  from stocks{}, or if tickers were added or removed. Keys that are not in stocks{}
+#  (i.e. unsubscribed tickers) do not trigger a rebuild for every stream message.
+def get_ticker(stream_key=None):
+
+	ticker = stream_index.get( str(stream_key), None )
+	if ( ticker != None and ticker in stocks ):
+		return ticker
+
+	if ( ticker != None or len(stocks) != stream_index_len ):
+		build_stream_index()
+		ticker = stream_index.get( str(stream_key), None )
+
+	return ticker
 
 
 # Runs from stream_client.handle_message() - calls gobot() with each
@@ -45,15 +97,10 @@ def gobot_run(stream=None, algos=None, debug=False):
 	for idx in stream['content']:
 
 		# Map stream_name (ticker name for streams API) back to the ticker name
-		ticker = str( idx['key'] )
-		if ( ticker not in stocks ):
-			for t_name in stocks.keys():
-				if ( ticker == stocks[t_name]['stream_id'] ):
-					ticker = t_name
-					break
-
-			if ( ticker not in stocks ):
-				print('Warning: gobot_run(): invalid ticker name found in stream: ' + str(idx['key']))
+		ticker = get_ticker( idx['key'] )
+		if ( ticker == None ):
+			print('Warning: gobot_run(): invalid ticker name found in stream: ' + str(idx['key']))
+			continue
 
 		if ( stocks[ticker]['isvalid'] == False ):
 			continue
@@ -90,51 +137,25 @@ def gobot_run(stream=None, algos=None, debug=False):
 				'datetime':	int( stream['timestamp'] ) }
 
 		stocks[ticker]['pricehistory']['candles'].append( candle_data )
+		if ( archiver != None ):
+			archiver.append( ticker, 'candles', candle_data )
 
 		# Add Heikin Ashi candle
-		#  ha_open	= [ha_open(Previous Bar) + ha_close(Previous Bar)]/2
-		#  ha_close	= (open+high+low+close)/4
-		#  ha_low	= Min(low, ha_open, ha_close)
-		#  ha_high	= Max(high, ha_open, ha_close)
-		ha_open		= ( stocks[ticker]['pricehistory']['hacandles'][-1]['open'] + stocks[ticker]['pricehistory']['hacandles'][-1]['close'] ) / 2
-		ha_close        = ( float(idx['OPEN_PRICE']) + float(idx['HIGH_PRICE']) + float(idx['LOW_PRICE']) + float(idx['CLOSE_PRICE']) ) / 4
-		ha_low          = min( float(idx['LOW_PRICE']), ha_open, ha_close )
-		ha_high         = max( float(idx['HIGH_PRICE']), ha_open, ha_close )
-		candle_data = { 'open':		ha_open,
-				'high':		ha_high,
-				'low':		ha_low,
-				'close':	ha_close,
-				'volume':	int( idx['VOLUME'] ),
-				'datetime':	int( stream['timestamp'] ) }
-
-		stocks[ticker]['pricehistory']['hacandles'].append( candle_data )
+		# The previous Heikin Ashi candle is always read from hacandles[], since it may
+		#  have been modified elsewhere
+		ha_candle = tda_candle_helper.heikin_ashi_candle( candle_data, stocks[ticker]['pricehistory']['hacandles'][-1] )
+		stocks[ticker]['pricehistory']['hacandles'].append( ha_candle )
 
 		# Add 5min candle
-		if ( len(stocks[ticker]['pricehistory']['candles']) % 5 == 0 ):
-			open_p	= stocks[ticker]['pricehistory']['candles'][-5]['open']
-			close	= stocks[ticker]['pricehistory']['candles'][-1]['close']
-			high	= 0
-			low	= 9999
-			volume	= 0
-
-			for i in range(5, 0, -1):
-				volume += stocks[ticker]['pricehistory']['candles'][-i]['volume']
-
-				if ( high < stocks[ticker]['pricehistory']['candles'][-i]['high'] ):
-					high = stocks[ticker]['pricehistory']['candles'][-i]['high']
-
-				if ( low > stocks[ticker]['pricehistory']['candles'][-i]['low'] ):
-					low = stocks[ticker]['pricehistory']['candles'][-i]['low']
-
-			newcandle = {	'open':		open_p,
-					'high':		high,
-					'low':		low,
-					'close':	close,
-					'volume':	volume,
-					'datetime':	stocks[ticker]['pricehistory']['candles'][-i]['datetime'] }
-
+		# The 1-minute candles are grouped by the 5-minute clock interval they belong to, based on
+		#  CHART_TIME (the start of the 1-minute candle) rather than the stream timestamp.
+		chart_time = int( idx.get('CHART_TIME', stream['timestamp']) )
+		for newcandle in stocks[ticker]['aggregator_5m'].update( dict(candle_data, datetime=chart_time) ):
 			stocks[ticker]['pricehistory_5m']['candles'].append(newcandle)
 
+		# Keep the candle and stream history within the configured limits
+		trim_history(ticker)
+
 
 	# Call gobot() for each set of specific algorithms
 	for algo_list in algos:
@@ -148,15 +169,10 @@ def gobot_run(stream=None, algos=None, debug=False):
 	for idx in stream['content']:
 
 		# Map stream_name (ticker name for streams API) back to the ticker name
-		ticker = str( idx['key'] )
-		if ( ticker not in stocks ):
-			for t_name in stocks.keys():
-				if ( ticker == stocks[t_name]['stream_id'] ):
-					ticker = t_name
-					break
-
-			if ( ticker not in stocks ):
-				print('Warning: gobot_run(): invalid ticker name found in stream: ' + str(idx['key']))
+		ticker = get_ticker( idx['key'] )
+		if ( ticker == None ):
+			print('Warning: gobot_run(): invalid ticker name found in stream: ' + str(idx['key']))
+			continue
 
 		if ( stocks[ticker]['isvalid'] == False ):
 			continue
@@ -190,15 +206,10 @@ def gobot_level1(stream=None, algos=None, debug=False):
 	for idx in stream['content']:
 
 		# Map stream_name (ticker name for streams API) back to the ticker name
-		ticker = str( idx['key'] )
-		if ( ticker not in stocks ):
-			for t_name in stocks.keys():
-				if ( ticker == stocks[t_name]['stream_id'] ):
-					ticker = t_name
-					break
-
-			if ( ticker not in stocks ):
-				print('Warning: gobot_level1(): invalid ticker name found in stream: ' + str(idx['key']))
+		ticker = get_ticker( idx['key'] )
+		if ( ticker == None ):
+			print('Warning: gobot_level1(): invalid ticker name found in stream: ' + str(idx['key']))
+			continue
 
 		idx['datetime']				= dt
 		stocks[ticker]['ask_price']		= float( idx['ASK_PRICE'] )	if ('ASK_PRICE' in idx) else stocks[ticker]['ask_price']
@@ -229,6 +240,8 @@ def gobot_level1(stream=None, algos=None, debug=False):
 				'key':		ticker }
 
 		stocks[ticker]['level1'][dt] = l1_history
+		if ( archiver != None ):
+			archiver.append( ticker, 'level1', l1_history )
 
 	# Call gobot() for each set of specific algorithms
 	for algo_list in algos:
@@ -288,27 +301,20 @@ def gobot_level2(stream=None, debug=False):
 	#   'timestamp': 1644354444643 }
 
 	# The order book changes all the time and we don't want to keep stale
-	#  info - so reset the asks/bids for each ticker contained in this stream
-	#  before processing it.
-	for idx in stream['content']:
-		ticker = idx['key']
-		stocks[ticker]['level2']['asks'] = {}
-		stocks[ticker]['level2']['bids'] = {}
+	#  info - so each ticker's book is replaced by the first entry for that ticker in
+	#  this stream. The book is stored as sorted numpy arrays (see tda_level2_helper.py),
+	#  so the best bid/ask is always the first price on each side.
+	seen = {}
 
 	# Process the stream
 	dt_def = int( stream['timestamp'] )
 	for idx in stream['content']:
 
 		# Map stream_name (ticker name for streams API) back to the ticker name
-		ticker = str( idx['key'] )
-		if ( ticker not in stocks ):
-			for t_name in stocks.keys():
-				if ( ticker == stocks[t_name]['stream_id'] ):
-					ticker = t_name
-					break
-
-			if ( ticker not in stocks ):
-				print('Warning: gobot_level2(): invalid ticker name found in stream: ' + str(idx['key']))
+		ticker = get_ticker( idx['key'] )
+		if ( ticker == None ):
+			print('Warning: gobot_level2(): invalid ticker name found in stream: ' + str(idx['key']))
+			continue
 
 		try:
 			dt = int( idx['BOOK_TIME'] )
@@ -316,43 +322,23 @@ def gobot_level2(stream=None, debug=False):
 			print('Warning: gobot_level2(): BOOK_TIME not defined, using streams timestamp: ' + str(idx))
 			dt = dt_def
 
-		# ASKS
-		for ask in idx['ASKS']:
-			ask_price = float( ask['ASK_PRICE'] )
-			stocks[ticker]['level2']['asks'][ask_price] = {}
-
-			stocks[ticker]['level2']['asks'][ask_price]['num_asks']		= int( ask['NUM_ASKS'] )
-			stocks[ticker]['level2']['asks'][ask_price]['total_volume']	= int( ask['TOTAL_VOLUME'] )
+		book = stocks[ticker]['level2']['book']
+		book.update( dt, asks=idx['ASKS'], bids=idx['BIDS'], merge=(ticker in seen) )
+		seen[ticker] = True
 
 		# The lowest ask price data should be the same as what we get from the level1 stream
-		try:
-			cur_ask_price = min( stocks[ticker]['level2']['asks'].keys() )
-			stocks[ticker]['level2']['cur_ask']['ask_price']	= cur_ask_price
-			stocks[ticker]['level2']['cur_ask']['num_asks']		= stocks[ticker]['level2']['asks'][cur_ask_price]['num_asks']
-			stocks[ticker]['level2']['cur_ask']['total_volume']	= stocks[ticker]['level2']['asks'][cur_ask_price]['total_volume']
-
-		except:
-			# This means that there were no asks in the L2 data received
-			pass
-
-		# BIDS
-		for bid in idx['BIDS']:
-			bid_price							= float( bid['BID_PRICE'] )
-
-			stocks[ticker]['level2']['bids'][bid_price]			= {}
-			stocks[ticker]['level2']['bids'][bid_price]['num_bids']		= int( bid['NUM_BIDS'] )
-			stocks[ticker]['level2']['bids'][bid_price]['total_volume']	= int( bid['TOTAL_VOLUME'] )
+		best_ask = book.best_ask()
+		if ( best_ask != None ):
+			stocks[ticker]['level2']['cur_ask']['ask_price']	= best_ask[0]
+			stocks[ticker]['level2']['cur_ask']['num_asks']		= best_ask[1]
+			stocks[ticker]['level2']['cur_ask']['total_volume']	= best_ask[2]
 
 		# The highest bid price data should be the same as what we get from the level1 stream
-		try:
-			cur_bid_price = max( stocks[ticker]['level2']['bids'].keys() )
-			stocks[ticker]['level2']['cur_bid']['bid_price']	= cur_bid_price
-			stocks[ticker]['level2']['cur_bid']['num_bids']		= stocks[ticker]['level2']['bids'][cur_bid_price]['num_bids']
-			stocks[ticker]['level2']['cur_bid']['total_volume']	= stocks[ticker]['level2']['bids'][cur_bid_price]['total_volume']
-
-		except:
-			# This means that there were no bids in the L2 data received
-			pass
+		best_bid = book.best_bid()
+		if ( best_bid != None ):
+			stocks[ticker]['level2']['cur_bid']['bid_price']	= best_bid[0]
+			stocks[ticker]['level2']['cur_bid']['num_bids']		= best_bid[1]
+			stocks[ticker]['level2']['cur_bid']['total_volume']	= best_bid[2]
 
 		# Populate stocks[ticker][ask_price/ask_size/bid_price/bid_size]
 		# There are several ways to obtain the latest bid/ask price and size, so we use these additional variables
@@ -374,9 +360,9 @@ def gobot_level2(stream=None, debug=False):
 			stocks[ticker]['bid_ask_pct'] = 0
 
 		# Archive level2 data to use later with backtesting
-		stocks[ticker]['level2']['history'][dt]		= {}
-		stocks[ticker]['level2']['history'][dt]['asks']	= stocks[ticker]['level2']['asks']
-		stocks[ticker]['level2']['history'][dt]['bids']	= stocks[ticker]['level2']['bids']
+		stocks[ticker]['level2']['history'].append( book )
+		if ( archiver != None ):
+			archiver.append( ticker, 'level2', { 'datetime': dt, 'records': book.records() } )
 
 	return True
 
@@ -398,18 +384,15 @@ def gobot_ets(stream=None, algos=None, debug=False):
 			print(idx)
 
 		# Map stream_name (ticker name for streams API) back to the ticker name
-		ticker = str( idx['key'] )
-		if ( ticker not in stocks ):
-			for t_name in stocks.keys():
-				if ( ticker == stocks[t_name]['stream_id'] ):
-					ticker = t_name
-					break
-
-			if ( ticker not in stocks ):
-				print('Warning: gobot_level2(): invalid ticker name found in stream: ' + str(idx['key']))
+		ticker = get_ticker( idx['key'] )
+		if ( ticker == None ):
+			print('Warning: gobot_ets(): invalid ticker name found in stream: ' + str(idx['key']))
+			continue
 
 		# Log the data here for archiving later (see export_pricehistory())
 		stocks[ticker]['ets']['history'].append(idx)
+		if ( archiver != None ):
+			archiver.append( ticker, 'ets', idx )
 
 		# Parse out the transaction and determine if the tx was made closer
 		#  to the bid or ask, or neutral.
@@ -738,6 +721,16 @@ def export_pricehistory():
 
 	import lzma
 
+	# With the streaming archiver, everything has already been written to disk during
+	#  the session, so just flush any buffered records
+	if ( archiver != None ):
+		print("Flushing stream archive to ./" + str(args.tx_log_dir) + "/\n")
+		archiver.close()
+		return True
+
+	# Finish writing any history evicted by trim_history()
+	flush_spill()
+
 	# Append today's date to files for archiving
 	dt_today = datetime.datetime.now(mytimezone).strftime('%Y-%m-%d')
 
@@ -818,7 +811,7 @@ def export_pricehistory():
 				print('Error: export_pricehistory(): safe_logfile( ' + str(fname) + ') returned False, unable to export data')
 
 			with lzma.open(fname, 'wb') as handle:
-				pickle.dump(stocks[ticker]['level2']['history'], handle)
+				pickle.dump(stocks[ticker]['level2']['history'].to_dict(), handle)
 				handle.flush()
 
 		except Exception as e:
@@ -842,6 +835,255 @@ def export_pricehistory():
 	return True
 
 
+# Asynchronous order execution (tda_order_helper.OrderExecutor)
+# If None, equity orders are placed synchronously from gobot()
+order_executor = None
+
+# Return the fill price from the order data returned by the *_stock_marketprice() functions
+def get_fill_price(data=None):
+	try:
+		return float( data['orderActivityCollection'][0]['executionLegs'][0]['price'] )
+	except:
+		return None
+
+# Set the base price once an entry order is filled, unless the position has already
+#  been closed or the base price has already been adjusted
+def set_fill_price(ticker=None, tx_id=None, data=None):
+	price = get_fill_price(data)
+	if ( price == None or stocks[ticker]['tx_id'] != tx_id ):
+		return
+
+	if ( stocks[ticker]['base_price'] == stocks[ticker]['orig_base_price'] ):
+		stocks[ticker]['base_price'] = price
+	stocks[ticker]['orig_base_price'] = price
+
+# Clear the position after an entry order failed
+def reset_position(ticker=None, cur_algo=None):
+	stocks[ticker]['stock_usd']		= cur_algo['stock_usd']
+	stocks[ticker]['stock_qty']		= 0
+	stocks[ticker]['base_price']		= 0
+	stocks[ticker]['orig_base_price']	= 0
+	stocks[ticker]['entry_time']		= None
+
+# Callbacks for OrderExecutor, these run on the event loop once the order completes
+def buy_order_done(order=None, cur_algo=None, tx_id=None):
+	ticker = order['ticker']
+	if ( order['state'] == 'failed' ):
+		print('Error: Unable to buy stock "' + str(ticker) + '"', file=sys.stderr)
+		if ( stocks[ticker]['tx_id'] == tx_id ):
+			reset_position(ticker, cur_algo)
+			stocks[ticker]['isvalid'] = False
+			reset_signals(ticker, signal_mode='long')
+
+		return
+
+	set_fill_price(ticker, tx_id, order['result'])
+
+def short_order_done(order=None, cur_algo=None, tx_id=None):
+	ticker = order['ticker']
+	if ( order['state'] == 'failed' ):
+		if ( stocks[ticker]['tx_id'] != tx_id ):
+			print('Error: Unable to short "' + str(ticker) + '"', file=sys.stderr)
+			return
+
+		reset_position(ticker, cur_algo)
+		stocks[ticker]['shortable'] = False
+		if ( args.shortonly == True ):
+			print('Error: Unable to short "' + str(ticker) + '"', file=sys.stderr)
+			reset_signals(ticker)
+			stocks[ticker]['isvalid'] = False
+
+		else:
+			print('Error: Unable to short "' + str(ticker) + '" - disabling shorting', file=sys.stderr)
+			reset_signals(ticker, signal_mode='long')
+
+		return
+
+	set_fill_price(ticker, tx_id, order['result'])
+
+def exit_order_done(order=None):
+	if ( order['state'] == 'failed' ):
+		print('Error: ' + str(order['name']) + '(' + str(order['ticker']) + '): order failed: ' + str(order['error']), file=sys.stderr)
+
+
+# Print the per-ticker hit/miss counters for the indicator cache
+#  (see tda_incremental_helper.IndicatorSet.cached())
+def print_indicator_cache_stats():
+
+	hits	= 0
+	misses	= 0
+	for ticker in stocks.keys():
+		t_hits		= 0
+		t_misses	= 0
+		for ind in [ 'indicators', 'indicators_5m' ]:
+			try:
+				t_hits		+= stocks[ticker][ind].cache_hits
+				t_misses	+= stocks[ticker][ind].cache_misses
+			except:
+				pass
+
+		if ( t_hits + t_misses == 0 ):
+			continue
+
+		hits	+= t_hits
+		misses	+= t_misses
+		if ( args.debug == True ):
+			print( '(' + str(ticker) + '): Indicator cache hits/misses: ' + str(t_hits) + ' / ' + str(t_misses) )
+
+	if ( hits + misses > 0 ):
+		print( 'Indicator cache hits/misses: ' + str(hits) + ' / ' + str(misses) + ' (' + str(round(hits / (hits + misses) * 100, 2)) + '% hit rate)' )
+
+	return True
+
+
+# Bounded history retention
+#
+# Candles, level1, level2 and ets history are appended to continuously, which with
+#  --multiday means memory use and per-candle indicator latency grow throughout the run.
+#  trim_history() caps each of them: once a series grows past its limit plus some slack,
+#  the oldest entries are removed in one chunk and written to the archive with
+#  spill_history(). Trimming in chunks keeps the cost amortized O(1) per entry while
+#  leaving the usual list/dict interfaces in place for the rest of the code.
+#
+# history_max_candles is set by tda-gobot-v2.py from the longest lookback used by the
+#  configured algos, stream_history_max from --stream_history_max. Values <= 0 disable
+#  trimming.
+history_max_candles	= 0
+stream_history_max	= 0
+spill_seq		= {}
+
+# Evicted history is compressed and written by a single background thread, so the
+#  stream handlers are not blocked while it is written. See spill_history().
+spill_executor		= None
+
+# Write evicted history to ./<tx_log_dir>/<date>/<ticker>_<name>_spill-<date>.<seq>.pickle.xz
+# The file is written in the background, data must not be modified after this is called.
+def spill_history(ticker=None, name=None, data=None):
+
+	global spill_executor
+
+	if ( data == None or len(data) == 0 ):
+		return True
+
+	# Everything has already been written to the streaming archive
+	if ( archiver != None ):
+		return True
+
+	dt_today = datetime.datetime.now(mytimezone).strftime('%Y-%m-%d')
+	base_dir = './' + str(args.tx_log_dir) + '/' + str(dt_today) + '/'
+
+	seq_key = ( ticker, name, dt_today )
+	if ( seq_key not in spill_seq ):
+		spill_seq[seq_key] = 0
+	spill_seq[seq_key] += 1
+
+	fname = base_dir + str(ticker) + '_' + str(name) + '_spill-' + str(dt_today) + '.' + str(spill_seq[seq_key]).zfill(4) + '.pickle.xz'
+
+	if ( spill_executor == None ):
+		import concurrent.futures
+		spill_executor = concurrent.futures.ThreadPoolExecutor( max_workers=1, thread_name_prefix='tda-spill' )
+
+	spill_executor.submit( write_spill, base_dir, fname, name, data )
+
+	return True
+
+# Runs on spill_executor
+def write_spill(base_dir=None, fname=None, name=None, data=None):
+
+	import lzma
+
+	try:
+		os.makedirs(base_dir, mode=0o755, exist_ok=True)
+
+	except OSError as e:
+		print('Error: spill_history(): Unable to make TX_LOG_DIR: ' + str(e), file=sys.stderr)
+		return False
+
+	try:
+		with lzma.open(fname, 'wb', preset=1) as handle:
+			pickle.dump(data, handle)
+			handle.flush()
+
+	except Exception as e:
+		print('Warning: spill_history(): Unable to write ' + str(name) + ' data to file ' + str(fname) + ': ' + str(e), file=sys.stderr)
+		return False
+
+	return True
+
+# Wait for any evicted history that has not been written yet
+def flush_spill():
+
+	global spill_executor
+
+	if ( spill_executor != None ):
+		spill_executor.shutdown( wait=True )
+		spill_executor = None
+
+	return True
+
+# Return the number of entries to evict from a series of length cur_len, or 0 if
+#  it has not yet grown past max_len plus slack
+def evict_count(cur_len=0, max_len=0):
+	if ( max_len <= 0 ):
+		return 0
+
+	slack = max( max_len // 4, 1 )
+	if ( cur_len < max_len + slack ):
+		return 0
+
+	return cur_len - max_len
+
+# Trim the candle and stream history for ticker
+def trim_history(ticker=None):
+
+	# 1-minute and Heikin Ashi candles
+	for name in [ 'candles', 'hacandles' ]:
+		try:
+			series = stocks[ticker]['pricehistory'][name]
+		except:
+			continue
+
+		count = evict_count( len(series), history_max_candles )
+		if ( count > 0 ):
+			spill_history( ticker, name, series[:count] )
+			del series[:count]
+
+	try:
+		series	= stocks[ticker]['pricehistory_5m']['candles']
+		count	= evict_count( len(series), history_max_candles // 5 )
+		if ( count > 0 ):
+			spill_history( ticker, 'candles_5m', series[:count] )
+			del series[:count]
+
+	except:
+		pass
+
+	# Level1 history is a dict keyed by timestamp, in insertion order
+	series	= stocks[ticker]['level1']
+	count	= evict_count( len(series), stream_history_max )
+	if ( count > 0 ):
+		evicted = {}
+		for key in list( series.keys() )[:count]:
+			evicted[key] = series.pop(key)
+
+		spill_history( ticker, 'level1', evicted )
+
+	# Level2 history (see tda_level2_helper.BookHistory)
+	series	= stocks[ticker]['level2']['history']
+	count	= evict_count( len(series), stream_history_max )
+	if ( count > 0 ):
+		spill_history( ticker, 'level2', series.evict(count) )
+
+	# Equity time and sales history
+	series	= stocks[ticker]['ets']['history']
+	count	= evict_count( len(series), stream_history_max )
+	if ( count > 0 ):
+		spill_history( ticker, 'ets', series[:count] )
+		del series[:count]
+
+	return True
+
+
 # Main helper function for tda-gobot-v2 that implements the primary stochrsi
 #  algorithm along with any secondary algorithms specified.
 def gobot( cur_algo=None, caller_id=None, debug=False ):
@@ -1425,8 +1667,12 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		etf_roc = []
 		for ticker in cur_algo['etf_tickers'].split(','):
 			stocks[ticker]['cur_roc'] = 0
+			# The stacked MA below needs the full ROC series, but IndicatorSet.get_roc() only
+			#  returns the most recent values. Use the batch calculation instead, memoized for
+			#  the current candle so that it is only calculated once for all algos.
 			try:
-				etf_roc = tda_algo_helper.get_roc( pricehistory=stocks[ticker]['pricehistory'], period=cur_algo['etf_roc_period'], type='hlc3' )
+				etf_roc = stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('batch_roc', cur_algo['etf_roc_period'], 'hlc3'),
+						lambda: tda_algo_helper.get_roc(pricehistory=stocks[ticker]['pricehistory'], period=cur_algo['etf_roc_period'], type='hlc3') )
 
 			except Exception as e:
 				print('Error: gobot(): get_roc(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -1442,7 +1688,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			etf_atr		= []
 			etf_natr	= []
 			try:
-				etf_atr, etf_natr = tda_algo_helper.get_atr( pricehistory=stocks[ticker]['pricehistory_5m'], period=cur_algo['atr_period'] )
+				etf_atr, etf_natr = stocks[ticker]['indicators_5m'].get_atr( pricehistory=stocks[ticker]['pricehistory_5m'], period=cur_algo['atr_period'] )
 
 			except Exception as e:
 				print('Error: gobot(): get_atr(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -1455,13 +1701,10 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			temp_ph         = { 'candles': [] }
 			roc_stacked_ma  = []
 			try:
-				for i in range(len(etf_roc)):
-					if ( np.isnan(etf_roc[i] * 10000) == True ):
-						etf_roc[i] = 1
-					else:
-						etf_roc[i] = etf_roc[i] * 10000
-
-					temp_ph['candles'].append({ 'open': etf_roc[i], 'high': etf_roc[i], 'low': etf_roc[i], 'close': etf_roc[i] })
+				roc_scaled = np.array( etf_roc, dtype=float ) * 10000
+				roc_scaled[np.isnan(roc_scaled)] = 1
+				for roc in roc_scaled:
+					temp_ph['candles'].append({ 'open': roc, 'high': roc, 'low': roc, 'close': roc })
 
 				roc_stacked_ma = get_stackedma( pricehistory=temp_ph, stacked_ma_periods=cur_algo['stacked_ma_periods_primary'], stacked_ma_type='ema' )
 				del(temp_ph)
@@ -1828,18 +2071,19 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			stochrsi	= []
 			try:
 				if ( cur_algo['primary_stochrsi'] == True or cur_algo['bbands_kchannel'] == True ):
-					stochrsi, rsi_k, rsi_d = tda_algo_helper.get_stochrsi( stocks[ticker]['pricehistory'], rsi_period=cur_algo['rsi_period'], stochrsi_period=cur_algo['stochrsi_period'], type=rsi_type,
-												slow_period=cur_algo['rsi_slow'], rsi_k_period=cur_algo['rsi_k_period'], rsi_d_period=cur_algo['rsi_d_period'], debug=False )
+					rsi_k, rsi_d = stocks[ticker]['indicators'].get_stochrsi( stocks[ticker]['pricehistory'], rsi_period=cur_algo['rsi_period'], stochrsi_period=cur_algo['stochrsi_period'], type=rsi_type,
+												slow_period=cur_algo['rsi_slow'], rsi_k_period=cur_algo['rsi_k_period'], rsi_d_period=cur_algo['rsi_d_period'] )
 
 				elif ( cur_algo['primary_stochmfi'] == True ):
-					rsi_k, rsi_d = tda_algo_helper.get_stochmfi( stocks[ticker]['pricehistory'], mfi_period=cur_algo['stochmfi_period'], mfi_k_period=cur_algo['mfi_k_period'],
-											slow_period=cur_algo['mfi_slow'], mfi_d_period=cur_algo['mfi_d_period'], debug=False )
-					stochrsi = rsi_k
+					rsi_k, rsi_d = stocks[ticker]['indicators'].get_stochmfi( stocks[ticker]['pricehistory'], mfi_period=cur_algo['stochmfi_period'], mfi_k_period=cur_algo['mfi_k_period'],
+											slow_period=cur_algo['mfi_slow'], mfi_d_period=cur_algo['mfi_d_period'] )
+
+				stochrsi = rsi_k
 
 			except Exception as e:
 				print('Error: gobot(): get_stochrsi(' + str(ticker) + '): ' + str(e), file=sys.stderr)
 
-			if ( isinstance(stochrsi, bool) and stochrsi == False ):
+			if ( isinstance(stochrsi, bool) or len(stochrsi) < 2 ):
 				print('Error: gobot(): get_stochrsi(' + str(ticker) + ') returned false - no data', file=sys.stderr)
 				continue
 
@@ -1855,14 +2099,15 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			rsi_k_5m	= []
 			rsi_d_5m	= []
 			try:
-				stochrsi_5m, rsi_k_5m, rsi_d_5m = tda_algo_helper.get_stochrsi( stocks[ticker]['pricehistory_5m'], rsi_period=cur_algo['rsi_period'],
+				rsi_k_5m, rsi_d_5m = stocks[ticker]['indicators_5m'].get_stochrsi( stocks[ticker]['pricehistory_5m'], rsi_period=cur_algo['rsi_period'],
 												 stochrsi_period=cur_algo['stochrsi_5m_period'], type=rsi_type, slow_period=cur_algo['rsi_slow'],
-												 rsi_k_period=cur_algo['rsi_k_5m_period'], rsi_d_period=cur_algo['rsi_d_period'], debug=False )
+												 rsi_k_period=cur_algo['rsi_k_5m_period'], rsi_d_period=cur_algo['rsi_d_period'] )
+				stochrsi_5m = rsi_k_5m
 
 			except Exception as e:
 				print('Error: gobot(): get_stochrsi(' + str(ticker) + '): ' + str(e), file=sys.stderr)
 
-			if ( isinstance(stochrsi_5m, bool) and stochrsi_5m == False ):
+			if ( isinstance(stochrsi_5m, bool) or len(stochrsi_5m) < 2 ):
 				print('Error: gobot(): get_stochrsi(' + str(ticker) + ') returned false - no data', file=sys.stderr)
 				continue
 
@@ -1876,13 +2121,13 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			mfi_k = []
 			mfi_d = []
 			try:
-				mfi_k, mfi_d = tda_algo_helper.get_stochmfi( stocks[ticker]['pricehistory'], mfi_period=cur_algo['stochmfi_period'], mfi_k_period=cur_algo['mfi_k_period'],
-									      slow_period=cur_algo['mfi_slow'], mfi_d_period=cur_algo['mfi_d_period'], debug=False )
+				mfi_k, mfi_d = stocks[ticker]['indicators'].get_stochmfi( stocks[ticker]['pricehistory'], mfi_period=cur_algo['stochmfi_period'], mfi_k_period=cur_algo['mfi_k_period'],
+									      slow_period=cur_algo['mfi_slow'], mfi_d_period=cur_algo['mfi_d_period'] )
 
 			except Exception as e:
 				print('Error: gobot(): get_stochmfi(' + str(ticker) + '): ' + str(e), file=sys.stderr)
 
-			if ( isinstance(mfi_k, bool) and mfi_k == False ):
+			if ( isinstance(mfi_k, bool) or len(mfi_k) < 2 ):
 				print('Error: gobot(): get_stochmfi(' + str(ticker) + ') returned false - no data', file=sys.stderr)
 				continue
 
@@ -1896,13 +2141,13 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			mfi_k_5m = []
 			mfi_d_5m = []
 			try:
-				mfi_k_5m, mfi_d_5m = tda_algo_helper.get_stochmfi( stocks[ticker]['pricehistory_5m'], mfi_period=cur_algo['stochmfi_5m_period'], mfi_k_period=cur_algo['mfi_k_5m_period'],
-										    slow_period=cur_algo['mfi_slow'], mfi_d_period=cur_algo['mfi_d_period'], debug=False )
+				mfi_k_5m, mfi_d_5m = stocks[ticker]['indicators_5m'].get_stochmfi( stocks[ticker]['pricehistory_5m'], mfi_period=cur_algo['stochmfi_5m_period'], mfi_k_period=cur_algo['mfi_k_5m_period'],
+										    slow_period=cur_algo['mfi_slow'], mfi_d_period=cur_algo['mfi_d_period'] )
 
 			except Exception as e:
 				print('Error: gobot(): get_stochmfi(' + str(ticker) + '): ' + str(e), file=sys.stderr)
 
-			if ( isinstance(mfi_k_5m, bool) and mfi_k_5m == False ):
+			if ( isinstance(mfi_k_5m, bool) or len(mfi_k_5m) < 2 ):
 				print('Error: gobot(): get_stochmfi(' + str(ticker) + ') returned false - no data', file=sys.stderr)
 				continue
 
@@ -1916,8 +2161,10 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			s_ma_primary	= []
 			s_ma_ha_primary	= []
 			try:
-				s_ma_primary	= get_stackedma(stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods_primary'], cur_algo['stacked_ma_type_primary'] )
-				s_ma_ha_primary	= get_stackedma(stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods_primary'], cur_algo['stacked_ma_type_primary'], use_ha_candles=True )
+				s_ma_primary	= stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('stacked_ma', str(cur_algo['stacked_ma_periods_primary']), cur_algo['stacked_ma_type_primary'], False),
+							lambda: get_stackedma(stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods_primary'], cur_algo['stacked_ma_type_primary']) )
+				s_ma_ha_primary	= stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('stacked_ma', str(cur_algo['stacked_ma_periods_primary']), cur_algo['stacked_ma_type_primary'], True),
+							lambda: get_stackedma(stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods_primary'], cur_algo['stacked_ma_type_primary'], use_ha_candles=True) )
 
 			except Exception as e:
 				print('Error: gobot(): get_stackedma(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -1933,7 +2180,8 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			mama = []
 			fama = []
 			try:
-				mama, fama = tda_algo_helper.get_alt_ma(pricehistory=stocks[ticker]['pricehistory'], ma_type='mama', type='hlc3', mama_fastlimit=0.5, mama_slowlimit=0.05)
+				mama, fama = stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('mama', 'hlc3', 0.5, 0.05),
+							lambda: tda_algo_helper.get_alt_ma(pricehistory=stocks[ticker]['pricehistory'], ma_type='mama', type='hlc3', mama_fastlimit=0.5, mama_slowlimit=0.05) )
 
 			except Exception as e:
 				print('Error: gobot(): mama_fama(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -1949,7 +2197,8 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			m_sine = []
 			m_lead = []
 			try:
-				m_sine, m_lead = tda_algo_helper.get_mesa_sine(pricehistory=stocks[ticker]['pricehistory'], type=cur_algo['mesa_sine_type'], period=cur_algo['mesa_sine_period'])
+				m_sine, m_lead = stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('mesa_sine', cur_algo['mesa_sine_type'], cur_algo['mesa_sine_period']),
+							lambda: tda_algo_helper.get_mesa_sine(pricehistory=stocks[ticker]['pricehistory'], type=cur_algo['mesa_sine_type'], period=cur_algo['mesa_sine_period']) )
 
 			except Exception as e:
 				print('Error: gobot(): get_mesa_sine(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -1967,12 +2216,16 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			s_ma_secondary		= []
 			s_ma_ha_secondary	= []
 			try:
-				s_ma	= get_stackedma( stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods'], cur_algo['stacked_ma_type'] )
-				s_ma_ha	= get_stackedma( stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods'], cur_algo['stacked_ma_type'], use_ha_candles=True )
+				s_ma	= stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('stacked_ma', str(cur_algo['stacked_ma_periods']), cur_algo['stacked_ma_type'], False),
+						lambda: get_stackedma( stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods'], cur_algo['stacked_ma_type'] ) )
+				s_ma_ha	= stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('stacked_ma', str(cur_algo['stacked_ma_periods']), cur_algo['stacked_ma_type'], True),
+						lambda: get_stackedma( stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods'], cur_algo['stacked_ma_type'], use_ha_candles=True ) )
 
 				if ( cur_algo['stacked_ma_secondary'] == True ):
-					s_ma_secondary		= get_stackedma( stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods_secondary'], cur_algo['stacked_ma_type_secondary'] )
-					s_ma_ha_secondary	= get_stackedma( stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods_secondary'], cur_algo['stacked_ma_type_secondary'], use_ha_candles=True )
+					s_ma_secondary		= stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('stacked_ma', str(cur_algo['stacked_ma_periods_secondary']), cur_algo['stacked_ma_type_secondary'], False),
+									lambda: get_stackedma( stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods_secondary'], cur_algo['stacked_ma_type_secondary'] ) )
+					s_ma_ha_secondary	= stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('stacked_ma', str(cur_algo['stacked_ma_periods_secondary']), cur_algo['stacked_ma_type_secondary'], True),
+									lambda: get_stackedma( stocks[ticker]['pricehistory'], cur_algo['stacked_ma_periods_secondary'], cur_algo['stacked_ma_type_secondary'], use_ha_candles=True ) )
 
 			except Exception as e:
 				print('Error: gobot(): get_stackedma(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -1993,7 +2246,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		if ( cur_algo['rsi'] == True ):
 			rsi = []
 			try:
-				rsi = tda_algo_helper.get_rsi(stocks[ticker]['pricehistory'], cur_algo['rsi_period'], rsi_type, debug=False)
+				rsi = stocks[ticker]['indicators'].get_rsi(stocks[ticker]['pricehistory'], cur_algo['rsi_period'], rsi_type)
 
 			except Exception as e:
 				print('Error: gobot(): get_rsi(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -2009,7 +2262,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		atr	= []
 		natr	= []
 		try:
-			atr, natr = tda_algo_helper.get_atr( pricehistory=stocks[ticker]['pricehistory_5m'], period=cur_algo['atr_period'] )
+			atr, natr = stocks[ticker]['indicators_5m'].get_atr( pricehistory=stocks[ticker]['pricehistory_5m'], period=cur_algo['atr_period'] )
 
 		except Exception as e:
 			print('Error: gobot(' + str(ticker) + '): get_atr(): ' + str(e), file=sys.stderr)
@@ -2021,7 +2274,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		# Rate-of-Change and Relative Strength
 		stock_roc	= []
 		try:
-			stock_roc = tda_algo_helper.get_roc( pricehistory=stocks[ticker]['pricehistory'], period=cur_algo['etf_roc_period'], type='hlc3' )
+			stock_roc = stocks[ticker]['indicators'].get_roc( pricehistory=stocks[ticker]['pricehistory'], period=cur_algo['etf_roc_period'], type='hlc3' )
 
 		except Exception as e:
 			print('Error: gobot(): get_roc(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -2038,7 +2291,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 
 			mfi = []
 			try:
-				mfi = tda_algo_helper.get_mfi(stocks[ticker]['pricehistory'], period=cur_algo['mfi_period'])
+				mfi = stocks[ticker]['indicators'].get_mfi(stocks[ticker]['pricehistory'], period=cur_algo['mfi_period'])
 
 			except Exception as e:
 				print('Error: gobot(' + str(ticker) + '): get_mfi(): ' + str(e), file=sys.stderr)
@@ -2055,8 +2308,10 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			plus_di		= []
 			minus_di	= []
 			try:
-				adx, plus_di, minus_di		= tda_algo_helper.get_adx(stocks[ticker]['pricehistory'], period=cur_algo['di_period'])
-				adx, plus_di_adx, minus_di_adx	= tda_algo_helper.get_adx(stocks[ticker]['pricehistory'], period=cur_algo['adx_period'])
+				adx, plus_di, minus_di		= stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('adx', cur_algo['di_period']),
+										lambda: tda_algo_helper.get_adx(stocks[ticker]['pricehistory'], period=cur_algo['di_period']) )
+				adx, plus_di_adx, minus_di_adx	= stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('adx', cur_algo['adx_period']),
+										lambda: tda_algo_helper.get_adx(stocks[ticker]['pricehistory'], period=cur_algo['adx_period']) )
 
 			except Exception as e:
 				print('Error: gobot(' + str(ticker) + '): get_adx(): ' + str(e), file=sys.stderr)
@@ -2079,7 +2334,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 
 			aroonosc = []
 			try:
-				aroonosc = tda_algo_helper.get_aroon_osc(stocks[ticker]['pricehistory'], period=stocks[ticker]['aroonosc_period'])
+				aroonosc = stocks[ticker]['indicators'].get_aroon_osc(stocks[ticker]['pricehistory'], period=stocks[ticker]['aroonosc_period'])
 
 			except Exception as e:
 				print('Error: gobot(): get_aroon_osc(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -2100,7 +2355,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			macd_signal	= []
 			macd_histogram	= []
 			try:
-				macd, macd_avg, macd_histogram = tda_algo_helper.get_macd(stocks[ticker]['pricehistory'], short_period=cur_algo['macd_short_period'], long_period=cur_algo['macd_long_period'], signal_period=cur_algo['macd_signal_period'])
+				macd, macd_avg, macd_histogram = stocks[ticker]['indicators'].get_macd(stocks[ticker]['pricehistory'], short_period=cur_algo['macd_short_period'], long_period=cur_algo['macd_long_period'], signal_period=cur_algo['macd_signal_period'])
 
 			except Exception as e:
 				print('Error: gobot(): get_macd(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -2115,7 +2370,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		if ( cur_algo['chop_index'] == True or cur_algo['chop_simple'] == True ):
 			chop = []
 			try:
-				chop = tda_algo_helper.get_chop_index(stocks[ticker]['pricehistory'], period=cur_algo['chop_period'])
+				chop = stocks[ticker]['indicators'].get_chop_index(stocks[ticker]['pricehistory'], period=cur_algo['chop_period'])
 
 			except Exception as e:
 				print('Error: gobot(): get_chop_index' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -2128,7 +2383,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		if ( cur_algo['supertrend'] == True ):
 			supertrend = []
 			try:
-				supertrend = tda_algo_helper.get_supertrend(pricehistory=stocks[ticker]['pricehistory'], atr_period=cur_algo['supertrend_atr_period'])
+				supertrend = stocks[ticker]['indicators'].get_supertrend(pricehistory=stocks[ticker]['pricehistory'], atr_period=cur_algo['supertrend_atr_period'])
 
 			except Exception as e:
 				print('Error: gobot(): get_supertrend' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -2145,9 +2400,13 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			bbands_upper    = []
 			try:
 				if ( cur_algo['use_bbands_kchannel_5m'] == True ):
-					bbands_lower, bbands_mid, bbands_upper = tda_algo_helper.get_bbands(pricehistory=stocks[ticker]['pricehistory_5m'], period=cur_algo['bbands_period'], type='hlc3', matype=cur_algo['bbands_matype'])
+					bbands_ph	= stocks[ticker]['pricehistory_5m']
+					bbands_ind	= stocks[ticker]['indicators_5m']
 				else:
-					bbands_lower, bbands_mid, bbands_upper = tda_algo_helper.get_bbands(pricehistory=stocks[ticker]['pricehistory'], period=cur_algo['bbands_period'], type='hlc3', matype=cur_algo['bbands_matype'])
+					bbands_ph	= stocks[ticker]['pricehistory']
+					bbands_ind	= stocks[ticker]['indicators']
+
+				bbands_lower, bbands_mid, bbands_upper = bbands_ind.get_bbands(pricehistory=bbands_ph, period=cur_algo['bbands_period'], type='hlc3', matype=cur_algo['bbands_matype'])
 
 			except Exception as e:
 				print('Error: gobot(' + str(ticker) + '): get_bbands(): ' + str(e))
@@ -2157,26 +2416,15 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			stocks[ticker]['prev_bbands']	= ( bbands_lower[-2], bbands_mid[-2], bbands_upper[-2] )
 
 			# Calculation bbands the rate-of-change
-			bbands_ph	= { 'candles': [], 'symbol': ticker }
-			bbands_roc	= []
-			for i in range( len(bbands_upper) ):
-				bbands_ph['candles'].append( {  'upper':        bbands_upper[i],
-								'middle':       bbands_mid[i],
-								'lower':        bbands_lower[i],
-								'close':        bbands_upper[i],
-								'open':         bbands_lower[i] } )
-
-			bbands_roc = tda_algo_helper.get_roc( bbands_ph, period=cur_algo['bbands_kchan_squeeze_count'], type='close' )
+			bbands_roc = bbands_ind.get_bbands_roc( pricehistory=bbands_ph, period=cur_algo['bbands_period'], type='hlc3', matype=cur_algo['bbands_matype'],
+									roc_period=cur_algo['bbands_kchan_squeeze_count'] )
 
 			# Keltner channel
 			kchannel_lower  = []
 			kchannel_mid    = []
 			kchannel_upper  = []
 			try:
-				if ( cur_algo['use_bbands_kchannel_5m'] == True ):
-					kchannel_lower, kchannel_mid, kchannel_upper = tda_algo_helper.get_kchannels(pricehistory=stocks[ticker]['pricehistory_5m'], period=cur_algo['kchannel_period'], atr_period=cur_algo['kchannel_atr_period'], matype=cur_algo['kchan_matype'])
-				else:
-					kchannel_lower, kchannel_mid, kchannel_upper = tda_algo_helper.get_kchannels(pricehistory=stocks[ticker]['pricehistory'], period=cur_algo['kchannel_period'], atr_period=cur_algo['kchannel_atr_period'], matype=cur_algo['kchan_matype'])
+				kchannel_lower, kchannel_mid, kchannel_upper = bbands_ind.get_kchannels(pricehistory=bbands_ph, period=cur_algo['kchannel_period'], atr_period=cur_algo['kchannel_atr_period'], matype=cur_algo['kchan_matype'])
 
 			except Exception as e:
 				print('Error: gobot(' + str(ticker) + '): get_kchannel(): ' + str(e))
@@ -2189,7 +2437,8 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			bbands_kchan_ma = []
 			if ( cur_algo['bbands_kchan_ma_check'] == True ):
 				try:
-					bbands_kchan_ma = tda_algo_helper.get_alt_ma( pricehistory=stocks[ticker]['pricehistory'], ma_type=cur_algo['bbands_kchan_ma_type'], type=cur_algo['bbands_kchan_ma_ptype'], period=cur_algo['bbands_kchan_ma_period'] )
+					bbands_kchan_ma = stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('alt_ma', cur_algo['bbands_kchan_ma_type'], cur_algo['bbands_kchan_ma_ptype'], cur_algo['bbands_kchan_ma_period']),
+									lambda: tda_algo_helper.get_alt_ma( pricehistory=stocks[ticker]['pricehistory'], ma_type=cur_algo['bbands_kchan_ma_type'], type=cur_algo['bbands_kchan_ma_ptype'], period=cur_algo['bbands_kchan_ma_period'] ) )
 
 				except Exception as e:
 					print('Error: gobot(' + str(ticker) + '): get_alt_ma(ema,21): ' + str(e))
@@ -2199,7 +2448,8 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		if ( cur_algo['roc'] == True or cur_algo['roc_exit'] == True ):
 			roc = []
 			try:
-				roc = tda_algo_helper.get_roc( stocks[ticker]['pricehistory'], period=cur_algo['roc_period'], type=cur_algo['roc_type'], calc_percentage=True )
+				roc = stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('roc_pct', cur_algo['roc_period'], cur_algo['roc_type']),
+							lambda: tda_algo_helper.get_roc( stocks[ticker]['pricehistory'], period=cur_algo['roc_period'], type=cur_algo['roc_type'], calc_percentage=True ) )
 
 			except Exception as e:
 				print('Error: gobot(' + str(ticker) + '): get_roc(): ' + str(e))
@@ -2225,7 +2475,8 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		if ( cur_algo['trend_quick_exit'] == True ):
 			qe_s_ma = []
 			try:
-				qe_s_ma = get_stackedma(stocks[ticker]['pricehistory'], cur_algo['qe_stacked_ma_periods'], cur_algo['qe_stacked_ma_type'])
+				qe_s_ma = stocks[ticker]['indicators'].cached( stocks[ticker]['pricehistory'], ('stacked_ma', str(cur_algo['qe_stacked_ma_periods']), cur_algo['qe_stacked_ma_type'], False),
+							lambda: get_stackedma(stocks[ticker]['pricehistory'], cur_algo['qe_stacked_ma_periods'], cur_algo['qe_stacked_ma_type']) )
 
 			except Exception as e:
 				print('Error: gobot(' + str(ticker) + '): get_stackedma(): ' + str(e))
@@ -2241,7 +2492,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			vwap_up = []
 			vwap_down = []
 			try:
-				vwap, vwap_up, vwap_down = tda_algo_helper.get_vwap( stocks[ticker]['pricehistory'] )
+				vwap, vwap_up, vwap_down = stocks[ticker]['indicators'].get_vwap( stocks[ticker]['pricehistory'] )
 
 			except Exception as e:
 				print('Error: gobot(): get_vwap(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -2264,7 +2515,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 			vpt = []
 			vpt_sma = []
 			try:
-				vpt, vpt_sma = tda_algo_helper.get_vpt(stocks[ticker]['pricehistory'], period=cur_algo['vpt_sma_period'])
+				vpt, vpt_sma = stocks[ticker]['indicators'].get_vpt(stocks[ticker]['pricehistory'], period=cur_algo['vpt_sma_period'])
 
 			except Exception as e:
 				print('Error: gobot(): get_vpt(' + str(ticker) + '): ' + str(e), file=sys.stderr)
@@ -2280,7 +2531,7 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 		if ( cur_algo['va_check'] == True ):
 			mprofile = {}
 			try:
-				mprofile = tda_algo_helper.get_market_profile(pricehistory=stocks[ticker]['pricehistory'], close_type='hl2', mp_mode='vol', tick_size=0.01)
+				mprofile = stocks[ticker]['indicators'].get_market_profile( stocks[ticker]['pricehistory'], close_type='hl2', mp_mode='vol', tick_size=0.01, sessions=1 )
 
 			except Exception as e:
 				print('Exception caught: get_market_profile(' + str(ticker) + '): ' + str(e) + '. VAH/VAL will not be used.')
@@ -3798,7 +4049,15 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 						print( 'Purchasing ' + str(stocks[ticker]['stock_qty']) + ' shares of ' + str(ticker) + ' (' + str(cur_algo['algo_id'])  + ')' )
 						stocks[ticker]['num_purchases'] -= 1
 
-						if ( args.fake == False ):
+						if ( args.fake == False and order_executor != None ):
+							# Place the order in the background, buy_order_done() will update the
+							#  base price once the order is filled
+							data = None
+							order_executor.submit( ticker, tda_gobot_helper.buy_stock_marketprice, (ticker, stocks[ticker]['stock_qty']), {'fillwait': True, 'debug': True},
+										callback=functools.partial(buy_order_done, cur_algo=cur_algo, tx_id=stocks[ticker]['tx_id']),
+										chain=stocks[ticker]['tx_id'] )
+
+						elif ( args.fake == False ):
 							data = tda_gobot_helper.buy_stock_marketprice(ticker, stocks[ticker]['stock_qty'], fillwait=True, debug=True)
 							if ( data == False ):
 								print('Error: Unable to buy stock "' + str(ticker) + '"', file=sys.stderr)
@@ -4392,6 +4651,10 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 						order_data = tda_gobot_helper.buy_sell_option(contract=stocks[ticker]['options_ticker'], quantity=stocks[ticker]['options_qty'], instruction='sell_to_close', fillwait=True, account_number=tda_account_number, debug=debug)
 
 					# EQUITY
+					elif ( order_executor != None ):
+						order_executor.submit( ticker, tda_gobot_helper.sell_stock_marketprice, (ticker, stocks[ticker]['stock_qty']), {'fillwait': True, 'debug': True},
+									callback=exit_order_done, chain=stocks[ticker]['tx_id'] )
+
 					else:
 						data = tda_gobot_helper.sell_stock_marketprice(ticker, stocks[ticker]['stock_qty'], fillwait=True, debug=True)
 
@@ -5486,7 +5749,15 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 						print( 'Shorting ' + str(stocks[ticker]['stock_qty']) + ' shares of ' + str(ticker) + ' (' + str(cur_algo['algo_id'])  + ')' )
 						stocks[ticker]['num_purchases'] -= 1
 
-						if ( args.fake == False ):
+						if ( args.fake == False and order_executor != None ):
+							# Place the order in the background, short_order_done() will update the
+							#  base price once the order is filled
+							data = None
+							order_executor.submit( ticker, tda_gobot_helper.short_stock_marketprice, (ticker, stocks[ticker]['stock_qty']), {'fillwait': True, 'debug': True},
+										callback=functools.partial(short_order_done, cur_algo=cur_algo, tx_id=stocks[ticker]['tx_id']),
+										chain=stocks[ticker]['tx_id'] )
+
+						elif ( args.fake == False ):
 							data = tda_gobot_helper.short_stock_marketprice(ticker, stocks[ticker]['stock_qty'], fillwait=True, debug=True)
 							if ( data == False ):
 								if ( args.shortonly == True ):
@@ -6120,6 +6391,10 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 						order_data = tda_gobot_helper.buy_sell_option(contract=stocks[ticker]['options_ticker'], quantity=stocks[ticker]['options_qty'], instruction='sell_to_close', fillwait=True, account_number=tda_account_number, debug=debug)
 
 					# EQUITY
+					elif ( order_executor != None ):
+						order_executor.submit( ticker, tda_gobot_helper.buytocover_stock_marketprice, (ticker, stocks[ticker]['stock_qty']), {'fillwait': True, 'debug': True},
+									callback=exit_order_done, chain=stocks[ticker]['tx_id'] )
+
 					else:
 						data = tda_gobot_helper.buytocover_stock_marketprice(ticker, stocks[ticker]['stock_qty'], fillwait=True, debug=True)
 
@@ -6196,13 +6471,17 @@ def gobot( cur_algo=None, caller_id=None, debug=False ):
 # Sell any open positions. This is usually called via a signal handler.
 def sell_stocks():
 
+	# Let any orders that are still in progress complete first
+	if ( order_executor != None ):
+		order_executor.wait(timeout=60)
+
 	# Make sure we are logged into TDA
 	if ( tda_gobot_helper.tdalogin(passcode, token_fname) != True ):
 		print('Error: sell_stocks(): tdalogin(): login failure', file=sys.stderr)
 		return False
 
 	# Run through the stocks we are watching and sell/buy-to-cover any open positions
-	data = tda.get_account(tda_account_number, options='positions', jsonify=True)
+	data = tda_rest_helper.get_client().get_account(tda_account_number, fields='positions')
 	for ticker in stocks.keys():
 
 		# Look up the stock in the account and sell
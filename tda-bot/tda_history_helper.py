@@ -0,0 +1,265 @@
+#!/usr/bin/python3 -u
+
+# Persistent local cache for tda_gobot_helper.get_pricehistory()
+#
+# tda-gobot-v2.py, tda-keylevels.py, tda-quote-stock.py, etc. download days of 1-minute
+#  data and years of daily and weekly data every time they start, even though nearly all
+#  of it has not changed since the last run. get_pricehistory() stores the candles it
+#  downloads in an NPZ file per (ticker, frequency, extended hours), and on later requests
+#  only asks the API for the candles newer than the last cached candle. The last cached
+#  candle is always downloaded again since it may have been incomplete.
+#
+# Each cache file records the range of time for which it is known to be complete. If a
+#  request starts before that range (or there is no cache file) the full request is sent to
+#  the API as before, and the result is returned unchanged and merged into the cache.
+#
+# The cache is stored in tda-bot/.history-cache by default. Set tda_history_cache in the
+#  environment (or .env) to use a different directory, or to an empty string to disable it.
+
+import os, sys, re, time
+import threading
+import tempfile
+from datetime import datetime, timedelta
+from pytz import timezone
+
+import numpy as np
+
+from tda_candle_helper import CandleStore
+import tda_calendar_helper
+
+# Candle interval (ms) for each f_type, minute candles are multiplied by freq
+intervals = {	'minute':	60 * 1000,
+		'daily':	86400 * 1000,
+		'weekly':	7 * 86400 * 1000,
+		'monthly':	31 * 86400 * 1000 }
+
+# Minute candles older than this are removed from the cache. TDA only keeps about
+#  48 days of 1-minute data so these could never be requested again anyway.
+max_minute_age = 60 * 86400 * 1000
+
+file_locks	= {}
+file_locks_lock	= threading.Lock()
+
+
+# Return the cache directory, or None if the cache is disabled
+def get_cache_dir():
+	cache_dir = os.environ.get( 'tda_history_cache', None )
+	if ( cache_dir == None ):
+		parent_path	= os.path.dirname( os.path.realpath(__file__) )
+		cache_dir	= str(parent_path) + '/.history-cache'
+
+	if ( cache_dir == '' ):
+		return None
+
+	return cache_dir
+
+def get_interval(f_type=None, freq=None):
+	if ( f_type not in intervals ):
+		return None
+
+	interval = intervals[f_type]
+	if ( f_type == 'minute' ):
+		try:
+			interval *= int(freq)
+		except:
+			return None
+
+	return interval
+
+# Return the start time (ms) of a period-based request, as calculated by the API
+# The 'day' period type counts trading days, so market holidays are skipped
+def get_period_start(p_type=None, period=None, now=None):
+	mytimezone	= timezone("US/Eastern")
+	today		= datetime.fromtimestamp( now / 1000, tz=mytimezone ).date()
+	try:
+		if ( p_type == 'day' ):
+			period	= int(period) if ( period != None ) else 10
+			start	= tda_calendar_helper.get_calendar().trading_day_offset( now, period-1 )
+
+		elif ( p_type == 'month' ):
+			period	= int(period) if ( period != None ) else 1
+			month	= today.year * 12 + (today.month - 1) - period
+			start	= today.replace( year=month // 12, month=month % 12 + 1, day=min(today.day, 28) )
+
+		elif ( p_type == 'year' ):
+			period	= int(period) if ( period != None ) else 1
+			start	= today.replace( year=today.year - period, day=min(today.day, 28) )
+
+		elif ( p_type == 'ytd' ):
+			start	= today.replace( month=1, day=1 )
+
+		else:
+			return None
+
+	except:
+		return None
+
+	start = mytimezone.localize( datetime(start.year, start.month, start.day) )
+
+	return int( start.timestamp() * 1000 )
+
+# TDA rejects start/end dates that land on a weekend
+# Move a weekend start time back to Friday morning, or a weekend end time back to Friday night
+def fix_weekend(date=None, end=False):
+	mytimezone	= timezone("US/Eastern")
+	dt		= datetime.fromtimestamp( date / 1000, tz=mytimezone )
+	if ( dt.weekday() < 5 ):
+		return date
+
+	dt = dt - timedelta( days=dt.weekday() - 4 )
+	if ( end == True ):
+		dt = dt.replace( hour=20, minute=0, second=0, microsecond=0 )
+	else:
+		dt = dt.replace( hour=0, minute=0, second=0, microsecond=0 )
+
+	return int( dt.timestamp() * 1000 )
+
+def get_lock(fname=None):
+	with file_locks_lock:
+		if ( fname not in file_locks ):
+			file_locks[fname] = threading.Lock()
+
+		return file_locks[fname]
+
+def get_fname(cache_dir=None, ticker=None, f_type=None, freq=None, extended_hours=False):
+	ticker = re.sub( '[^a-zA-Z0-9$._-]', '_', str(ticker) )
+	return os.path.join( cache_dir, ticker + '-' + str(freq) + str(f_type) + ('-ext' if extended_hours == True else '') + '.npz' )
+
+# Returns the cache as a dict containing a CandleStore and the range of time for which it is complete
+def load(fname=None, ticker=None):
+	try:
+		with np.load(fname) as data:
+			store = CandleStore.from_arrays( ticker, open=data['open'], high=data['high'], low=data['low'], close=data['close'],
+								volume=data['volume'], datetime=data['datetime'] )
+
+			return { 'start': int(data['start']), 'end': int(data['end']), 'store': store }
+
+	except FileNotFoundError:
+		pass
+
+	except Exception as e:
+		print('Warning: tda_history_helper.load(' + str(fname) + '): ' + str(e), file=sys.stderr)
+
+	return None
+
+# Write the cache atomically, multiple processes may use the same cache directory
+def save(fname=None, cache=None):
+	store = cache['store']
+	try:
+		os.makedirs( os.path.dirname(fname), exist_ok=True )
+
+		fd, tmp_fname = tempfile.mkstemp( dir=os.path.dirname(fname), suffix='.tmp' )
+		with os.fdopen(fd, 'wb') as handle:
+			np.savez( handle, start=cache['start'], end=cache['end'], open=store.open, high=store.high, low=store.low,
+					close=store.close, volume=store.volume, datetime=store.datetime )
+
+		os.replace( tmp_fname, fname )
+
+	except Exception as e:
+		print('Warning: tda_history_helper.save(' + str(fname) + '): ' + str(e), file=sys.stderr)
+		try:
+			os.remove( tmp_fname )
+		except:
+			pass
+
+		return False
+
+	return True
+
+# Return a new CandleStore containing candles [i:j] of store
+def slice_store(store=None, i=0, j=None):
+	return CandleStore.from_arrays( store.symbol, **{ f: getattr(store, f)[i:j] for f in CandleStore.fields } )
+
+# Return a new CandleStore containing the candles from first followed by the candles from second
+def concat(first=None, second=None):
+	return CandleStore.from_arrays( first.symbol, **{ f: np.concatenate([getattr(first, f), getattr(second, f)]) for f in CandleStore.fields } )
+
+
+# Return the pricehistory for ticker, using the cache where possible
+# fetch(p_type, f_type, freq, period, start_date, end_date) should call the API and return
+#  the pricehistory dict, or False on error.
+def get_pricehistory(fetch=None, ticker=None, p_type=None, f_type=None, freq=None, period=None, start_date=None, end_date=None, extended_hours=False):
+
+	cache_dir	= get_cache_dir()
+	interval	= get_interval( f_type, freq )
+	if ( cache_dir == None or interval == None ):
+		return fetch( p_type, f_type, freq, period, start_date, end_date )
+
+	now	= int( time.time() * 1000 )
+	start	= int(start_date) if ( start_date != None ) else get_period_start( p_type, period, now )
+	end	= min( int(end_date), now ) if ( end_date != None ) else now
+	if ( start == None ):
+		return fetch( p_type, f_type, freq, period, start_date, end_date )
+
+	fname = get_fname( cache_dir, ticker, f_type, freq, extended_hours )
+	with get_lock(fname):
+		cache = load( fname, ticker )
+
+		# Cache does not cover the start of the request, send the full request to the API
+		if ( cache == None or cache['start'] > start or len(cache['store']) == 0 ):
+			data = fetch( p_type, f_type, freq, period, start_date, end_date )
+			if ( isinstance(data, bool) and data == False ):
+				return False
+
+			store = CandleStore.from_pricehistory( data )
+			if ( len(store) == 0 ):
+				return data
+
+			# Keep the newer cached candles if there is no gap between them and the new candles
+			new_cache = { 'start': start, 'end': end, 'store': store }
+			if ( cache != None and len(cache['store']) > 0 and store.datetime[-1] >= cache['store'].datetime[0] and cache['end'] > end ):
+				keep		= np.searchsorted( cache['store'].datetime, store.datetime[-1], side='right' )
+				new_cache	= { 'start': start, 'end': cache['end'], 'store': concat(store, slice_store(cache['store'], keep)) }
+
+			trim( new_cache, f_type, now )
+			save( fname, new_cache )
+
+			return data
+
+		# Download any candles newer than the cache
+		# The last cached candle is downloaded again in case it was incomplete
+		store = cache['store']
+		if ( end > cache['end'] ):
+			tail_start	= fix_weekend( int(store.datetime[-1]), end=False )
+			tail_end	= fix_weekend( end, end=True )
+
+			data = fetch( p_type, f_type, freq, None, tail_start, tail_end )
+			if ( isinstance(data, bool) and data == False ):
+				return False
+
+			tail = CandleStore.from_pricehistory( data )
+			if ( len(tail) > 0 ):
+				keep	= np.searchsorted( store.datetime, tail.datetime[0], side='left' )
+				store	= concat( slice_store(store, 0, keep), tail )
+
+			cache['store']	= store
+			cache['end']	= end
+
+			trim( cache, f_type, now )
+			save( fname, cache )
+
+		# Return the candles that overlap the requested range
+		dt	= store.datetime
+		i	= np.searchsorted( dt, start - interval, side='right' )
+		j	= np.searchsorted( dt, end, side='right' )
+
+		pricehistory		= slice_store( store, i, j ).to_pricehistory()
+		pricehistory['empty']	= bool( j - i == 0 )
+
+		return pricehistory
+
+# Remove minute candles that are too old to ever be requested again
+def trim(cache=None, f_type=None, now=None):
+	if ( f_type != 'minute' ):
+		return
+
+	cutoff = now - max_minute_age
+	if ( cache['start'] >= cutoff ):
+		return
+
+	store	= cache['store']
+	i	= np.searchsorted( store.datetime, cutoff, side='left' )
+	if ( i > 0 ):
+		store.trim( i )
+
+	cache['start'] = cutoff
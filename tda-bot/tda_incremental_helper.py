@@ -0,0 +1,1137 @@
+#!/usr/bin/python3 -u
+
+# Incremental (streaming) indicators
+#
+# The functions in tda_algo_helper recompute each indicator over the entire pricehistory
+#  every time they are called. tda-gobot-v2 calls them for every ticker and every algo
+#  each time a new 1-minute candle arrives, even though only the final one or two values
+#  are used. The classes here keep the running state for each indicator (EMA accumulators,
+#  Wilder smoothing, rolling windows, etc.) so that each new candle is an O(1) update.
+#
+# Each indicator mirrors the calculation used by the batch version in tda_algo_helper,
+#  including the tulipy/talib seeding conventions, so the values should match the batch
+#  results. Use stock-analyze/tda-indicator-parity.py to verify this against real data.
+#
+# IndicatorSet ties this together for a single pricehistory series. The get_*() methods
+#  take the same arguments as the tda_algo_helper functions, catch up on any candles that
+#  were added to pricehistory since the last call and return lists containing the most
+#  recent values, so existing code that reads result[-1] and result[-2] works unchanged.
+
+import sys
+import copy
+import functools
+import math
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from pytz import timezone
+
+from tda_candle_helper import CandleStore
+
+# Candles added from the level1 stream use this datetime until the real candle arrives
+temp_candle_datetime = 9999999999999
+
+try:
+	mytimezone
+except:
+	mytimezone = timezone('US/Eastern')
+
+
+# Return the price value for a single candle dict
+def candle_price(candle=None, type='close'):
+	if ( type == 'close' or type == 'high' or type == 'low' or type == 'open' or type == 'volume' ):
+		return float( candle[type] )
+
+	elif ( type == 'hl2' ):
+		return ( float(candle['high']) + float(candle['low']) ) / 2
+
+	elif ( type == 'hlc3' ):
+		return ( float(candle['high']) + float(candle['low']) + float(candle['close']) ) / 3
+
+	elif ( type == 'ohlc4' ):
+		return ( float(candle['open']) + float(candle['high']) + float(candle['low']) + float(candle['close']) ) / 4
+
+	raise ValueError( 'Undefined price type "' + str(type) + '"' )
+
+
+# Primitives
+#
+# Each primitive has an update() method that takes the next input value and returns
+#  the new output, or None if there is not yet enough data. The current output is also
+#  available via the 'value' attribute.
+
+# Exponential moving average, seeded with the first input value (same as ti.ema)
+class Ema:
+	def __init__(self, period=50, alpha=None):
+		self.period	= period
+		self.alpha	= alpha if ( alpha != None ) else 2 / (period + 1)
+		self.value	= None
+
+	def update(self, x=0):
+		if ( self.value == None ):
+			self.value = x
+		else:
+			self.value = ( x - self.value ) * self.alpha + self.value
+
+		return self.value
+
+
+# Simple moving average using a running sum (same as ti.sma)
+class Sma:
+	def __init__(self, period=20):
+		self.period	= period
+		self.window	= deque()
+		self.sum	= 0.0
+		self.value	= None
+
+	def update(self, x=0):
+		self.window.append(x)
+		self.sum += x
+		if ( len(self.window) > self.period ):
+			self.sum -= self.window.popleft()
+
+		if ( len(self.window) == self.period ):
+			self.value = self.sum / self.period
+
+		return self.value
+
+
+# Rolling maximum/minimum over the last N values using a monotonic deque
+# On ties the most recent index is retained (same as tulipy's aroon)
+class RollingExtreme:
+	def __init__(self, period=14, mode='max'):
+		self.period	= period
+		self.mode	= mode
+		self.q		= deque()	# (index, value)
+		self.idx	= -1
+
+	def update(self, x=0):
+		self.idx += 1
+		if ( self.mode == 'max' ):
+			while ( len(self.q) > 0 and self.q[-1][1] <= x ):
+				self.q.pop()
+		else:
+			while ( len(self.q) > 0 and self.q[-1][1] >= x ):
+				self.q.pop()
+
+		self.q.append( (self.idx, x) )
+		while ( self.q[0][0] <= self.idx - self.period ):
+			self.q.popleft()
+
+		return self.q[0][1]
+
+	# Number of values since the current extreme
+	def age(self):
+		return self.idx - self.q[0][0]
+
+
+# Wilder-smoothed RSI
+# style='ti' matches ti.rsi(), style='talib' matches talib.RSI() (returns 0 instead of NaN
+#  when there is no movement in the window)
+class Rsi:
+	def __init__(self, period=14, style='ti'):
+		self.period	= period
+		self.style	= style
+		self.prev	= None
+		self.count	= 0
+		self.up		= 0.0
+		self.down	= 0.0
+		self.value	= None
+
+	def update(self, x=0):
+		if ( self.prev == None ):
+			self.prev = x
+			return None
+
+		upward		= x - self.prev if ( x > self.prev ) else 0.0
+		downward	= self.prev - x if ( x < self.prev ) else 0.0
+		self.prev	= x
+		self.count	+= 1
+
+		if ( self.count < self.period ):
+			self.up		+= upward
+			self.down	+= downward
+			return None
+
+		elif ( self.count == self.period ):
+			self.up		= ( self.up + upward ) / self.period
+			self.down	= ( self.down + downward ) / self.period
+
+		else:
+			if ( self.style == 'talib' ):
+				self.up		= ( self.up * (self.period - 1) + upward ) / self.period
+				self.down	= ( self.down * (self.period - 1) + downward ) / self.period
+			else:
+				self.up		= ( upward - self.up ) / self.period + self.up
+				self.down	= ( downward - self.down ) / self.period + self.down
+
+		total = self.up + self.down
+		if ( self.style == 'talib' ):
+			self.value = 100 * ( self.up / total ) if ( total != 0 ) else 0.0
+		else:
+			self.value = 100 * ( self.up / total ) if ( total != 0 ) else float('nan')
+
+		return self.value
+
+
+# Stochastic oscillator K/D (same as ti.stoch)
+class Stoch:
+	def __init__(self, k_period=14, k_slow=3, d_period=3):
+		self.k_period	= k_period
+		self.k_slow	= k_slow
+		self.d_period	= d_period
+
+		self.max	= RollingExtreme(k_period, 'max')
+		self.min	= RollingExtreme(k_period, 'min')
+		self.k_sma	= Sma(k_slow)
+		self.d_sma	= Sma(d_period)
+		self.count	= 0
+		self.k		= None
+		self.d		= None
+
+	def update(self, high=0, low=0, close=0):
+		max_p = self.max.update(high)
+		min_p = self.min.update(low)
+		self.count += 1
+		if ( self.count < self.k_period ):
+			return None, None
+
+		kdiff = max_p - min_p
+		kfast = 0.0 if ( kdiff == 0 ) else 100 * ( (close - min_p) / kdiff )
+
+		k = self.k_sma.update(kfast)
+		if ( k == None ):
+			return None, None
+
+		d = self.d_sma.update(k)
+		if ( d == None ):
+			return None, None
+
+		self.k = k
+		self.d = d
+
+		return self.k, self.d
+
+
+# Average True Range (same as ti.atr / ti.natr)
+class Atr:
+	def __init__(self, period=14):
+		self.period	= period
+		self.prev_close	= None
+		self.count	= 0
+		self.sum	= 0.0
+		self.value	= None
+		self.natr	= None
+
+	def update(self, high=0, low=0, close=0):
+		if ( self.prev_close == None ):
+			tr = high - low
+		else:
+			tr = max( high - low, abs(high - self.prev_close), abs(low - self.prev_close) )
+
+		self.prev_close	= close
+		self.count	+= 1
+
+		if ( self.count < self.period ):
+			self.sum += tr
+			return None
+
+		elif ( self.count == self.period ):
+			self.value = ( self.sum + tr ) / self.period
+
+		else:
+			self.value = ( tr - self.value ) * ( 1 / self.period ) + self.value
+
+		self.natr = 100 * ( self.value / close )
+
+		return self.value
+
+
+# Money Flow Index (same as ti.mfi)
+class Mfi:
+	def __init__(self, period=14):
+		self.period	= period
+		self.prev_typ	= None
+		self.flows	= deque()	# (up, down)
+		self.up		= 0.0
+		self.down	= 0.0
+		self.value	= None
+
+	def update(self, high=0, low=0, close=0, volume=0):
+		typ = ( high + low + close ) / 3
+		if ( self.prev_typ == None ):
+			self.prev_typ = typ
+			return None
+
+		bar = typ * volume
+		up = down = 0.0
+		if ( typ > self.prev_typ ):
+			up = bar
+		elif ( typ < self.prev_typ ):
+			down = bar
+
+		self.prev_typ = typ
+
+		self.flows.append( (up, down) )
+		self.up		+= up
+		self.down	+= down
+		if ( len(self.flows) > self.period ):
+			old_up, old_down = self.flows.popleft()
+			self.up		-= old_up
+			self.down	-= old_down
+
+		if ( len(self.flows) == self.period ):
+			self.value = 100 * ( self.up / (self.up + self.down) ) if ( self.up + self.down != 0 ) else float('nan')
+
+		return self.value
+
+
+# MACD (same as ti.macd, including tulipy's fixed 0.15/0.075 coefficients for 12/26)
+class Macd:
+	def __init__(self, short_period=12, long_period=26, signal_period=9):
+		short_alpha	= 2 / (short_period + 1)
+		long_alpha	= 2 / (long_period + 1)
+		if ( short_period == 12 and long_period == 26 ):
+			short_alpha	= 0.15
+			long_alpha	= 0.075
+
+		self.long_period	= long_period
+		self.short_ema		= Ema(short_period, alpha=short_alpha)
+		self.long_ema		= Ema(long_period, alpha=long_alpha)
+		self.signal_alpha	= 2 / (signal_period + 1)
+		self.count		= 0
+
+		self.macd		= None
+		self.signal		= None
+		self.histogram		= None
+
+	def update(self, x=0):
+		short_ema	= self.short_ema.update(x)
+		long_ema	= self.long_ema.update(x)
+		self.count	+= 1
+		if ( self.count < self.long_period ):
+			return None, None, None
+
+		macd = short_ema - long_ema
+		if ( self.signal == None ):
+			self.signal = macd
+		else:
+			self.signal = ( macd - self.signal ) * self.signal_alpha + self.signal
+
+		self.macd	= macd
+		self.histogram	= macd - self.signal
+
+		return self.macd, self.signal, self.histogram
+
+
+# Aroon Oscillator (same as ti.aroonosc)
+class AroonOsc:
+	def __init__(self, period=25):
+		self.period	= period
+		self.max	= RollingExtreme(period + 1, 'max')
+		self.min	= RollingExtreme(period + 1, 'min')
+		self.count	= 0
+		self.value	= None
+
+	def update(self, high=0, low=0):
+		self.max.update(high)
+		self.min.update(low)
+		self.count += 1
+		if ( self.count <= self.period ):
+			return None
+
+		scale		= 100 / self.period
+		aroon_up	= scale * ( self.period - self.max.age() )
+		aroon_down	= scale * ( self.period - self.min.age() )
+		self.value	= aroon_up - aroon_down
+
+		return self.value
+
+
+# Rate of change (same as ti.roc + tda_algo_helper.get_roc() post-processing)
+class Roc:
+	def __init__(self, period=50, calc_percentage=False):
+		self.period		= period
+		self.calc_percentage	= calc_percentage
+		self.window		= deque()
+		self.value		= 0
+
+	def update(self, x=0):
+		self.window.append(x)
+		if ( len(self.window) <= self.period ):
+			self.value = 0
+			return self.value
+
+		old = self.window.popleft()
+		with np.errstate( divide='ignore', invalid='ignore' ):
+			roc = np.float64(x - old) / np.float64(old)
+
+		if ( self.calc_percentage == True ):
+			roc = roc * 100
+
+		self.value = float( np.nan_to_num(roc, posinf=0, neginf=0) )
+
+		return self.value
+
+
+# Bollinger bands using talib's SMA-based calculation (matype=0)
+class BBands:
+	def __init__(self, period=20, stddev=2):
+		self.period	= period
+		self.stddev	= stddev
+		self.window	= deque()
+		self.sum	= 0.0
+		self.sum_sq	= 0.0
+		self.value	= ( 0, 0, 0 )
+
+	def update(self, x=0):
+		self.window.append(x)
+		self.sum	+= x
+		self.sum_sq	+= x * x
+		if ( len(self.window) > self.period ):
+			old = self.window.popleft()
+			self.sum	-= old
+			self.sum_sq	-= old * old
+
+		if ( len(self.window) < self.period ):
+			self.value = ( 0, 0, 0 )
+			return self.value
+
+		mean	= self.sum / self.period
+		var	= self.sum_sq / self.period - mean * mean
+		dev	= math.sqrt(var) * self.stddev if ( var > 0 ) else 0.0
+
+		self.value = ( mean - dev, mean, mean + dev )
+
+		return self.value
+
+
+# Keltner channel using an EMA middle line and ATR bands (same as get_kchannels(matype='ema'))
+class KChannels:
+	def __init__(self, period=20, atr_period=None, atr_multiplier=1.5):
+		if ( atr_period == None ):
+			atr_period = period
+
+		self.ema		= Ema(period)
+		self.atr		= Atr(atr_period)
+		self.atr_multiplier	= atr_multiplier
+		self.value		= ( 0, 0, 0 )
+
+	def update(self, price=0, high=0, low=0, close=0):
+		ma	= self.ema.update(price)
+		atr	= self.atr.update(high, low, close)
+		if ( atr == None ):
+			atr = 0
+
+		self.value = ( ma - (atr * self.atr_multiplier), ma, ma + (atr * self.atr_multiplier) )
+
+		return self.value
+
+
+# Volume price trend and its SMA signal line (same as get_vpt())
+class Vpt:
+	def __init__(self, period=128):
+		self.sma	= Sma(period)
+		self.prev_close	= None
+		self.value	= 0.0
+		self.signal	= None
+
+	def update(self, close=0, volume=0):
+		if ( self.prev_close != None ):
+			prev_close = self.prev_close
+			if ( prev_close == 0 ):
+				prev_close = close
+
+			self.value += volume * ( (close - prev_close) / prev_close )
+
+		self.prev_close	= close
+		self.signal	= self.sma.update(self.value)
+
+		return self.value, self.signal
+
+
+# Supertrend (same as get_supertrend())
+class Supertrend:
+	def __init__(self, multiplier=3, atr_period=128):
+		self.multiplier		= multiplier
+		self.atr		= Atr(atr_period)
+		self.prev_close		= None
+		self.final_upper	= None
+		self.final_lower	= None
+		self.value		= None
+
+	def update(self, high=0, low=0, close=0):
+		atr = self.atr.update(high, low, close)
+		if ( atr == None ):
+			atr = 0
+
+		avg_price	= ( high + low ) / 2
+		upper_band	= avg_price + ( self.multiplier * atr )
+		lower_band	= avg_price - ( self.multiplier * atr )
+
+		if ( self.value == None ):
+			self.final_upper	= 0
+			self.final_lower	= 0
+			self.value		= 0
+			self.prev_close		= close
+			return self.value
+
+		prev_upper	= self.final_upper
+		prev_lower	= self.final_lower
+
+		if ( upper_band < prev_upper or self.prev_close > prev_upper ):
+			self.final_upper = upper_band
+
+		if ( lower_band > prev_lower or self.prev_close < prev_lower ):
+			self.final_lower = lower_band
+
+		if ( self.value == prev_upper and close <= self.final_upper ):
+			self.value = self.final_upper
+		elif ( self.value == prev_upper and close > self.final_upper ):
+			self.value = self.final_lower
+		elif ( self.value == prev_lower and close >= self.final_lower ):
+			self.value = self.final_lower
+		elif ( self.value == prev_lower and close < self.final_lower ):
+			self.value = self.final_upper
+
+		self.prev_close = close
+
+		return self.value
+
+
+# Choppiness index (same as get_chop_index())
+#
+# Note that get_chop_index() compares the sum of the last N ATR values with the high/low
+#  range of the N candles that end N-1 candles earlier, since the ATR array is not padded
+#  to the length of pricehistory. This is retained here so the values match.
+class Chop:
+	def __init__(self, period=20):
+		self.period	= period
+		self.atr	= Atr(period)
+		self.atr_window	= deque()
+		self.atr_sum	= 0.0
+		self.pending	= deque()	# (high, low) waiting to enter the range window
+		self.max	= RollingExtreme(period, 'max')
+		self.min	= RollingExtreme(period, 'min')
+		self.range_len	= 0
+		self.value	= None
+
+	def update(self, high=0, low=0, close=0):
+		atr = self.atr.update(high, low, close)
+
+		self.pending.append( (high, low) )
+		if ( len(self.pending) > self.period - 1 ):
+			h, l = self.pending.popleft()
+			self.max.update(h)
+			self.min.update(l)
+			self.range_len += 1
+
+		if ( atr == None ):
+			return None
+
+		self.atr_window.append(atr)
+		self.atr_sum += atr
+		if ( len(self.atr_window) > self.period ):
+			self.atr_sum -= self.atr_window.popleft()
+
+		if ( len(self.atr_window) < self.period or self.range_len < self.period ):
+			self.value = atr
+			return self.value
+
+		high_low_range = self.max.q[0][1] - self.min.q[0][1]
+		if ( high_low_range == 0 ):
+			self.value = atr
+			return self.value
+
+		atr_ratio = self.atr_sum / high_low_range
+		if ( atr_ratio == 0 ):
+			self.value = atr
+		else:
+			self.value = 100 * np.log(atr_ratio) * ( 1 / np.log(self.period) )
+
+		return self.value
+
+
+# Intraday VWAP with standard deviation bands (same as get_vwap(day='today'))
+#
+# The running values reset at 01:00 local time each day. get_vwap() replaces zero
+#  volume with 1, which is done here as well. Zero prices are replaced with the previous
+#  price rather than the 5th most recent one.
+#
+# The bounds of the current session are kept as epoch timestamps, so the candle time only
+#  needs to be converted to local time when a candle falls outside the current session.
+class Vwap:
+	def __init__(self, num_stddev=2):
+		self.num_stddev	= num_stddev
+		self.day	= None
+		self.day_start	= 0
+		self.day_end	= 0
+		self.reset()
+
+	def reset(self):
+		self.pv_sum		= 0.0
+		self.vol_sum		= 0.0
+		self.vwap_sum		= 0.0
+		self.stddev_cumsum	= 0.0
+		self.count		= 0
+		self.last_price		= 0.0
+		self.value		= ( None, None, None )
+
+	def update(self, dt=0, high=0, low=0, close=0, volume=0):
+		dt = int(dt)
+		if ( dt < self.day_start or dt >= self.day_end ):
+			cur_dt		= datetime.fromtimestamp( dt / 1000, tz=mytimezone )
+			day_start	= cur_dt.replace( hour=1, minute=0, second=0, microsecond=0 )
+			if ( cur_dt < day_start ):
+				return self.value
+
+			if ( day_start != self.day ):
+				self.day = day_start
+				self.reset()
+
+			# The session ends at midnight local time
+			next_day	= mytimezone.localize( datetime(cur_dt.year, cur_dt.month, cur_dt.day) + timedelta(days=1) )
+			self.day_start	= int( day_start.timestamp() * 1000 )
+			self.day_end	= int( next_day.timestamp() * 1000 )
+
+		price = ( high + low + close ) / 3
+		if ( price == 0 ):
+			price = self.last_price
+		if ( volume == 0 ):
+			volume = 1
+
+		self.last_price	= price
+		self.pv_sum	+= price * volume
+		self.vol_sum	+= volume
+		self.count	+= 1
+
+		vwap = self.pv_sum / self.vol_sum
+
+		self.vwap_sum		+= vwap
+		vwap_avg		= self.vwap_sum / self.count
+		self.stddev_cumsum	+= ( vwap - vwap_avg ) ** 2
+		stdev			= np.sqrt( self.stddev_cumsum / self.count )
+
+		self.value = ( vwap, vwap + stdev * self.num_stddev, vwap - stdev * self.num_stddev )
+
+		return self.value
+
+
+# Volume profile (market profile) for the most recent days (same as get_market_profile())
+#
+# update() adds the volume of each candle to its price level for the day, so each candle
+#  is O(1). The value area, poc, etc. are only calculated when profile() is called, and
+#  are kept for the previous days since those no longer change.
+class MarketProfile:
+	def __init__(self, mp_mode='vol', tick_size=0.01, sessions=3):
+		self.mp_mode	= mp_mode
+		self.roundoff	= 1 / float(tick_size)
+		self.sessions	= sessions
+		self.days	= OrderedDict()	# day -> { 'levels': { tick: [volume, count] }, 'first_dt', 'open_range', 'initial_balance', 'profile' }
+		self.cur	= None
+		self.day_start	= 0
+		self.day_end	= 0
+
+	def update(self, dt=0, high=0, low=0, price=0, volume=0):
+		dt = int(dt)
+		if ( dt < self.day_start or dt >= self.day_end ):
+			cur_dt		= datetime.fromtimestamp( dt / 1000, tz=mytimezone )
+			day_start	= datetime( cur_dt.year, cur_dt.month, cur_dt.day )
+			self.day_start	= int( mytimezone.localize(day_start).timestamp() * 1000 )
+			self.day_end	= int( mytimezone.localize(day_start + timedelta(days=1)).timestamp() * 1000 )
+
+			day = cur_dt.strftime('%Y-%m-%d')
+			if ( day not in self.days ):
+				self.days[day] = { 'levels': {}, 'first_dt': int(dt / 1000), 'open_range': None, 'initial_balance': None, 'profile': None }
+				while ( self.sessions != None and len(self.days) > self.sessions ):
+					self.days.popitem( last=False )
+
+			self.cur = self.days[day]
+
+		cur	= self.cur
+		tick	= math.ceil( price * self.roundoff )
+		if ( tick in cur['levels'] ):
+			cur['levels'][tick][0] += volume
+			cur['levels'][tick][1] += 1
+		else:
+			cur['levels'][tick] = [ volume, 1 ]
+
+		# Open range (first 10 minutes) and initial balance (first hour)
+		for key, delta in ( ('open_range', 600), ('initial_balance', 3600) ):
+			if ( int(dt / 1000) <= cur['first_dt'] + delta ):
+				if ( cur[key] == None ):
+					cur[key] = ( low, high )
+				else:
+					cur[key] = ( min(cur[key][0], low), max(cur[key][1], high) )
+
+		cur['profile'] = None
+
+		return self
+
+	# Return an OrderedDict with the market profile for each day, see get_market_profile()
+	def profile(self):
+		import tda_algo_helper
+
+		mprofile = OrderedDict()
+		for day, data in self.days.items():
+			if ( data['profile'] == None ):
+				ticks	= np.array( sorted(data['levels']), dtype=np.int64 )
+				weights	= np.array( [ data['levels'][t][0 if ( self.mp_mode == 'vol' ) else 1] for t in ticks.tolist() ], dtype=np.float64 )
+
+				data['profile'] = tda_algo_helper.build_market_profile( ticks, weights, self.roundoff )
+				data['profile']['open_range']		= data['open_range']
+				data['profile']['initial_balance']	= data['initial_balance']
+
+			mprofile[day] = data['profile']
+
+		return mprofile
+
+
+
+
+# Memoize IndicatorSet.get_*() results for the current candle
+# gobot() is called once per algo, and algos frequently request the same indicator with
+#  the same parameters. The key includes the method name and all of its arguments, and
+#  the cache is cleared whenever pricehistory changes (see IndicatorSet.candle_seq()).
+def memoize(func=None):
+	@functools.wraps(func)
+	def wrapper(self, pricehistory=None, *args, **kwargs):
+		key = ( func.__name__, args, tuple(sorted(kwargs.items())) )
+		return self.cached( pricehistory, key, lambda: func(self, pricehistory, *args, **kwargs) )
+
+	return wrapper
+
+
+# Per-pricehistory indicator state
+#
+# IndicatorSet tracks the datetime of the last candle it processed so that it only needs
+#  to feed the new candles to each indicator when called. If pricehistory no longer
+#  contains that candle (i.e. the history was replaced), all indicators are rebuilt.
+#  Temporary candles added from the level1 stream are not committed to the running state;
+#  the indicators are evaluated on a copy instead.
+#
+# Indicators are registered the first time they are requested and replayed over the
+#  full pricehistory once. After that each call costs O(new candles).
+#
+# If use_batch is True, the get_*() methods just call tda_algo_helper, which is useful
+#  for comparing results or if something looks off with the incremental values.
+#
+# Results are also memoized per candle, so when several algos request the same indicator
+#  on the same candle it is only calculated once, and each caller gets its own copy of the
+#  result. cached() can be used to do the same for any other (batch) calculation on this
+#  pricehistory. Hits and misses are counted in cache_hits and cache_misses.
+class IndicatorSet:
+	def __init__(self, history=2, use_batch=False):
+		self.history	= history
+		self.use_batch	= use_batch
+		self.indicators	= {}	# key -> { 'create', 'update', 'ind', 'out' }
+		self.last_dt	= None
+		self.temp	= None
+
+		self.cache		= {}
+		self.cache_seq		= None
+		self.cache_hits		= 0
+		self.cache_misses	= 0
+
+	# Return the candle at index i for either a CandleStore or a pricehistory dict
+	@staticmethod
+	def _candle(pricehistory=None, i=-1):
+		if ( isinstance(pricehistory, CandleStore) ):
+			return pricehistory.candle(i)
+
+		return pricehistory['candles'][i]
+
+	@staticmethod
+	def _len(pricehistory=None):
+		if ( isinstance(pricehistory, CandleStore) ):
+			return len(pricehistory)
+
+		return len(pricehistory['candles'])
+
+	# Return the index range of the candles that have not been processed yet, and the
+	#  trailing temporary candle if there is one
+	def _new_range(self, pricehistory=None):
+		n	= self._len(pricehistory)
+		temp	= None
+		if ( n > 0 and int(self._candle(pricehistory, n-1)['datetime']) == temp_candle_datetime ):
+			temp	= self._candle(pricehistory, n-1)
+			n	-= 1
+
+		if ( self.last_dt == None ):
+			return 0, n, temp
+
+		# Search backwards for the last processed candle
+		i = n - 1
+		while ( i >= 0 and int(self._candle(pricehistory, i)['datetime']) != self.last_dt ):
+			i -= 1
+
+		if ( i < 0 ):
+			return None, n, temp
+
+		return i + 1, n, temp
+
+	# Feed any new candles from pricehistory to all registered indicators
+	def sync(self, pricehistory=None):
+		start, end, self.temp = self._new_range(pricehistory)
+		if ( start == None ):
+			self.reset()
+			start = 0
+
+		for i in range(start, end):
+			candle = self._candle(pricehistory, i)
+			for entry in self.indicators.values():
+				self._feed(entry, candle)
+
+			self.last_dt = int( candle['datetime'] )
+
+	def reset(self):
+		for entry in self.indicators.values():
+			entry['ind'] = entry['create']()
+			entry['out'].clear()
+
+		self.last_dt = None
+
+	def _feed(self, entry=None, candle=None):
+		ret = entry['update']( entry['ind'], candle )
+		if ( ret != None ):
+			entry['out'].append( ret )
+
+	# Register an indicator if needed and return the most recent outputs
+	def _get(self, pricehistory=None, key=None, create=None, update=None):
+		self.sync(pricehistory)
+
+		if ( key not in self.indicators ):
+			entry = { 'create': create, 'update': update, 'ind': create(), 'out': deque(maxlen=self.history) }
+			self.indicators[key] = entry
+
+			if ( self.last_dt != None ):
+				start, end, temp = self._new_range(pricehistory)
+				for i in range(0, start):
+					self._feed( entry, self._candle(pricehistory, i) )
+
+		entry = self.indicators[key]
+		if ( self.temp == None ):
+			return list( entry['out'] )
+
+		tmp_entry = { 'update': entry['update'], 'ind': copy.deepcopy(entry['ind']), 'out': deque(entry['out'], maxlen=self.history) }
+		self._feed( tmp_entry, self.temp )
+
+		return list( tmp_entry['out'] )
+
+	# Return a value that identifies the current state of pricehistory
+	# The most recent candle is included in full since the level1 stream updates the
+	#  temporary candle in place.
+	def candle_seq(self, pricehistory=None):
+		n = self._len(pricehistory)
+		if ( n == 0 ):
+			return ( 0, )
+
+		c = self._candle(pricehistory, n-1)
+		return ( n, c['datetime'], c['open'], c['high'], c['low'], c['close'], c['volume'] )
+
+	# Return the memoized value for key if pricehistory has not changed since it was
+	#  calculated, otherwise call func() and memoize the result
+	# Callers get a copy of the memoized lists/arrays, so modifying the result in place
+	#  does not change the value returned to the next algo.
+	def cached(self, pricehistory=None, key=None, func=None):
+		seq = self.candle_seq(pricehistory)
+		if ( seq != self.cache_seq ):
+			self.cache.clear()
+			self.cache_seq = seq
+
+		try:
+			ret = self.cache[key]
+			self.cache_hits += 1
+			return self._copy(ret)
+
+		except KeyError:
+			pass
+
+		except TypeError:
+			# Unhashable key, just run the calculation
+			return func()
+
+		self.cache_misses += 1
+		ret = func()
+		self.cache[key] = ret
+
+		return self._copy(ret)
+
+	# Return a copy of a cached result
+	# Results are lists, numpy arrays, dicts or tuples of these, the values themselves
+	#  are not modified by the callers so a shallow copy of each container is enough.
+	@staticmethod
+	def _copy(ret=None):
+		if ( isinstance(ret, list) ):
+			return list(ret)
+		elif ( isinstance(ret, np.ndarray) ):
+			return ret.copy()
+		elif ( isinstance(ret, dict) ):
+			return dict(ret)
+		elif ( isinstance(ret, tuple) ):
+			return tuple( IndicatorSet._copy(r) for r in ret )
+
+		return ret
+
+	def cache_stats(self):
+		total = self.cache_hits + self.cache_misses
+		return { 'hits':		self.cache_hits,
+			 'misses':		self.cache_misses,
+			 'hit_rate':		round(self.cache_hits / total * 100, 2) if ( total > 0 ) else 0 }
+
+	# Split a list of tuples into a tuple of lists
+	@staticmethod
+	def _split(values=None, num=2):
+		if ( len(values) == 0 ):
+			return tuple( [] for i in range(num) )
+
+		return tuple( list(v) for v in zip(*values) )
+
+
+	# Indicators
+	# Arguments match the respective tda_algo_helper functions
+
+	@memoize
+	def get_ema(self, pricehistory=None, period=50, type='close'):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_ema(pricehistory, period=period, type=type)
+
+		return self._get( pricehistory, ('ema', period, type),
+					lambda: Ema(period),
+					lambda ind, c: ind.update( candle_price(c, type) ) )
+
+	@memoize
+	def get_sma(self, pricehistory=None, period=200, type='close'):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_sma(pricehistory, period=period, type=type)
+
+		return self._get( pricehistory, ('sma', period, type),
+					lambda: Sma(period),
+					lambda ind, c: ind.update( candle_price(c, type) ) )
+
+	# Returns rsi[]
+	@memoize
+	def get_rsi(self, pricehistory=None, rsi_period=14, type='close'):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_rsi(pricehistory, rsi_period=rsi_period, type=type)
+
+		return self._get( pricehistory, ('rsi', rsi_period, type),
+					lambda: Rsi(rsi_period, style='ti'),
+					lambda ind, c: ind.update( candle_price(c, type) ) )
+
+	# Returns k[], d[]
+	# Note that unlike tda_algo_helper.get_stochrsi(), ti.stochrsi() is not calculated
+	#  since gobot only uses the K and D values.
+	@memoize
+	def get_stochrsi(self, pricehistory=None, rsi_period=14, stochrsi_period=128, type='close', rsi_d_period=3, rsi_k_period=128, slow_period=3):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			stochrsi, k, d = tda_algo_helper.get_stochrsi(pricehistory, rsi_period=rsi_period, stochrsi_period=stochrsi_period, type=type,
+									rsi_d_period=rsi_d_period, rsi_k_period=rsi_k_period, slow_period=slow_period)
+			if ( isinstance(stochrsi, bool) and stochrsi == False ):
+				return [], []
+
+			return k, d
+
+		# get_stochrsi() replaces the leading NaN values from talib.RSI() with 0
+		def create():
+			return { 'rsi': Rsi(stochrsi_period, style='talib'), 'stoch': Stoch(rsi_k_period, slow_period, rsi_d_period) }
+
+		def update(ind, c):
+			rsi = ind['rsi'].update( candle_price(c, type) )
+			if ( rsi == None ):
+				rsi = 0.0
+
+			k, d = ind['stoch'].update(rsi, rsi, rsi)
+			return None if ( k == None ) else ( k, d )
+
+		return self._split( self._get(pricehistory, ('stochrsi', stochrsi_period, type, rsi_d_period, rsi_k_period, slow_period), create, update) )
+
+	# Returns mfi[]
+	@memoize
+	def get_mfi(self, pricehistory=None, period=14):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_mfi(pricehistory, period=period)
+
+		return self._get( pricehistory, ('mfi', period),
+					lambda: Mfi(period),
+					lambda ind, c: ind.update( float(c['high']), float(c['low']), float(c['close']), float(c['volume']) ) )
+
+	# Returns k[], d[]
+	@memoize
+	def get_stochmfi(self, pricehistory=None, mfi_period=14, mfi_k_period=128, mfi_d_period=3, slow_period=3):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_stochmfi(pricehistory, mfi_period=mfi_period, mfi_k_period=mfi_k_period, mfi_d_period=mfi_d_period, slow_period=slow_period)
+
+		def create():
+			return { 'mfi': Mfi(mfi_period), 'stoch': Stoch(mfi_k_period, slow_period, mfi_d_period) }
+
+		def update(ind, c):
+			mfi = ind['mfi'].update( float(c['high']), float(c['low']), float(c['close']), float(c['volume']) )
+			if ( mfi == None ):
+				return None
+
+			k, d = ind['stoch'].update(mfi, mfi, mfi)
+			return None if ( k == None ) else ( k, d )
+
+		return self._split( self._get(pricehistory, ('stochmfi', mfi_period, mfi_k_period, mfi_d_period, slow_period), create, update) )
+
+	# Returns atr[], natr[]
+	@memoize
+	def get_atr(self, pricehistory=None, period=14):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_atr(pricehistory, period=period)
+
+		def update(ind, c):
+			atr = ind.update( float(c['high']), float(c['low']), float(c['close']) )
+			return None if ( atr == None ) else ( atr, ind.natr )
+
+		return self._split( self._get(pricehistory, ('atr', period), lambda: Atr(period), update) )
+
+	# Returns roc[]
+	@memoize
+	def get_roc(self, pricehistory=None, type='hlc3', period=50, calc_percentage=False):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_roc(pricehistory, type=type, period=period, calc_percentage=calc_percentage)
+
+		return self._get( pricehistory, ('roc', type, period, calc_percentage),
+					lambda: Roc(period, calc_percentage),
+					lambda ind, c: ind.update( candle_price(c, type) ) )
+
+	# Returns aroonosc[]
+	@memoize
+	def get_aroon_osc(self, pricehistory=None, period=25):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_aroon_osc(pricehistory, period=period)
+
+		return self._get( pricehistory, ('aroonosc', period),
+					lambda: AroonOsc(period),
+					lambda ind, c: ind.update( float(c['high']), float(c['low']) ) )
+
+	# Returns macd[], macd_signal[], macd_histogram[]
+	@memoize
+	def get_macd(self, pricehistory=None, short_period=12, long_period=26, signal_period=9):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_macd(pricehistory, short_period=short_period, long_period=long_period, signal_period=signal_period)
+
+		def update(ind, c):
+			macd, signal, hist = ind.update( float(c['close']) )
+			return None if ( macd == None ) else ( macd, signal, hist )
+
+		return self._split( self._get(pricehistory, ('macd', short_period, long_period, signal_period), lambda: Macd(short_period, long_period, signal_period), update), 3 )
+
+	# Returns chop[]
+	@memoize
+	def get_chop_index(self, pricehistory=None, period=20):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_chop_index(pricehistory, period=period)
+
+		return self._get( pricehistory, ('chop', period),
+					lambda: Chop(period),
+					lambda ind, c: ind.update( float(c['high']), float(c['low']), float(c['close']) ) )
+
+	# Returns supertrend[]
+	@memoize
+	def get_supertrend(self, pricehistory=None, multiplier=3, atr_period=128):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_supertrend(pricehistory, multiplier=multiplier, atr_period=atr_period)
+
+		return self._get( pricehistory, ('supertrend', multiplier, atr_period),
+					lambda: Supertrend(multiplier, atr_period),
+					lambda ind, c: ind.update( float(c['high']), float(c['low']), float(c['close']) ) )
+
+	# Returns bbands_lower[], bbands_middle[], bbands_upper[]
+	# Only matype=0 (SMA) is calculated incrementally, other types use get_bbands()
+	@memoize
+	def get_bbands(self, pricehistory=None, type='hlc3', period=20, stddev=2, matype=0):
+		if ( self.use_batch == True or matype != 0 ):
+			import tda_algo_helper
+			return tda_algo_helper.get_bbands(pricehistory, type=type, period=period, stddev=stddev, matype=matype)
+
+		return self._split( self._get(pricehistory, ('bbands', type, period, stddev),
+						lambda: BBands(period, stddev),
+						lambda ind, c: ind.update( candle_price(c, type) )), 3 )
+
+	# Returns the rate-of-change of the upper bollinger band, which gobot uses to
+	#  detect a squeeze
+	@memoize
+	def get_bbands_roc(self, pricehistory=None, type='hlc3', period=20, stddev=2, matype=0, roc_period=4):
+		if ( self.use_batch == True or matype != 0 ):
+			import tda_algo_helper
+			lower, middle, upper = tda_algo_helper.get_bbands(pricehistory, type=type, period=period, stddev=stddev, matype=matype)
+			return tda_algo_helper.get_roc( list(upper), period=roc_period, type='close' )
+
+		def create():
+			return { 'bbands': BBands(period, stddev), 'roc': Roc(roc_period) }
+
+		def update(ind, c):
+			lower, middle, upper = ind['bbands'].update( candle_price(c, type) )
+			return ind['roc'].update(upper)
+
+		return self._get( pricehistory, ('bbands_roc', type, period, stddev, roc_period), create, update )
+
+	# Returns kchannel_lower[], kchannel_mid[], kchannel_upper[]
+	# Only matype='ema' is calculated incrementally, other types use get_kchannels()
+	@memoize
+	def get_kchannels(self, pricehistory=None, type='hlc3', period=20, matype='ema', atr_period=None, atr_multiplier=1.5):
+		if ( self.use_batch == True or matype != 'ema' ):
+			import tda_algo_helper
+			return tda_algo_helper.get_kchannels(pricehistory, type=type, period=period, matype=matype, atr_period=atr_period, atr_multiplier=atr_multiplier)
+
+		return self._split( self._get(pricehistory, ('kchannels', type, period, atr_period, atr_multiplier),
+						lambda: KChannels(period, atr_period, atr_multiplier),
+						lambda ind, c: ind.update( candle_price(c, type), float(c['high']), float(c['low']), float(c['close']) )), 3 )
+
+	# Returns vwap[], vwap_up[], vwap_down[] for the current day
+	@memoize
+	def get_vwap(self, pricehistory=None, num_stddev=2):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_vwap(pricehistory, num_stddev=num_stddev)
+
+		def update(ind, c):
+			vwap, vwap_up, vwap_down = ind.update( int(c['datetime']), float(c['high']), float(c['low']), float(c['close']), float(c['volume']) )
+			return None if ( vwap == None ) else ( vwap, vwap_up, vwap_down )
+
+		return self._split( self._get(pricehistory, ('vwap', num_stddev), lambda: Vwap(num_stddev), update), 3 )
+
+	# Returns the market profile for the most recent N days, see tda_algo_helper.get_market_profile()
+	@memoize
+	def get_market_profile(self, pricehistory=None, close_type='hl2', mp_mode='vol', tick_size=0.01, sessions=3):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_market_profile(pricehistory, close_type=close_type, mp_mode=mp_mode, tick_size=tick_size, sessions=sessions)
+
+		out = self._get( pricehistory, ('market_profile', close_type, mp_mode, tick_size, sessions),
+					lambda: MarketProfile(mp_mode, tick_size, sessions),
+					lambda ind, c: ind.update( int(c['datetime']), float(c['high']), float(c['low']), candle_price(c, close_type), float(c['volume']) ) )
+
+		if ( len(out) == 0 ):
+			return OrderedDict()
+
+		return out[-1].profile()
+
+	# Returns vpt[], vpt_sma[]
+	@memoize
+	def get_vpt(self, pricehistory=None, period=128):
+		if ( self.use_batch == True ):
+			import tda_algo_helper
+			return tda_algo_helper.get_vpt(pricehistory, period=period)
+
+		def update(ind, c):
+			vpt, vpt_sma = ind.update( float(c['close']), float(c['volume']) )
+			return None if ( vpt_sma == None ) else ( vpt, vpt_sma )
+
+		return self._split( self._get(pricehistory, ('vpt', period), lambda: Vpt(period), update) )
@@ -0,0 +1,284 @@
+#!/usr/bin/python3 -u
+
+# Compact Level2 order book
+#
+# gobot_level2() used to rebuild a dict of {price: {'num_asks', 'total_volume'}} for each
+#  side of the book on every message, find the best bid/ask with max()/min() over the keys,
+#  and keep a reference to both dicts in ['level2']['history'][dt]. A full day of Level2
+#  data for a busy ticker therefore lived in memory as millions of small Python dicts.
+#
+# OrderBook stores the current book for one ticker as numpy arrays sorted by price (bids
+#  descending, asks ascending), so the best bid/ask is simply the first entry on each side.
+#  BookHistory stores every snapshot as rows in flat, growable arrays of
+#  (datetime, side, level, price, num, volume), where side is 0 for bids and 1 for asks
+#  (as in tda_archive_helper.level2_records()) and level is the depth (0 is the best
+#  price). Depth based features like the bid/ask imbalance and the cumulative size within
+#  N ticks of the best price are computed with vectorized numpy operations, either for the
+#  current book or for every snapshot in the history.
+#
+# to_dict() on either class returns the legacy dict format, which is still used for the
+#  pickle files written by export_pricehistory() and read by tda-ts-reader.py.
+
+import numpy as np
+
+BID	= 0
+ASK	= 1
+
+
+class OrderBook:
+	def __init__(self):
+		self.datetime	= 0
+		self.price	= [ np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float64) ]	# [bids, asks]
+		self.num	= [ np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64) ]
+		self.volume	= [ np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64) ]
+
+	# Replace the book with the bids/asks from a LISTED_BOOK or NASDAQ_BOOK stream entry
+	# If merge is True the new price levels are merged into the current book instead,
+	#  i.e. when a message contains more than one entry for the same ticker.
+	def update(self, dt=None, asks=[], bids=[], merge=False):
+		self.datetime = int(dt)
+		for side, entries, price_key, num_key in [ (BID, bids, 'BID_PRICE', 'NUM_BIDS'), (ASK, asks, 'ASK_PRICE', 'NUM_ASKS') ]:
+			price	= np.array( [ float(e[price_key]) for e in entries ], dtype=np.float64 )
+			num	= np.array( [ int(e[num_key]) for e in entries ], dtype=np.int64 )
+			volume	= np.array( [ int(e['TOTAL_VOLUME']) for e in entries ], dtype=np.int64 )
+
+			if ( merge == True ):
+				price	= np.concatenate( [self.price[side], price] )
+				num	= np.concatenate( [self.num[side], num] )
+				volume	= np.concatenate( [self.volume[side], volume] )
+
+			# Sort by price (bids descending, asks ascending) and keep the last entry for each price
+			order = np.unique( price[::-1], return_index=True )[1]
+			order = len(price) - 1 - order
+			if ( side == BID ):
+				order = order[::-1]
+
+			self.price[side]	= price[order]
+			self.num[side]		= num[order]
+			self.volume[side]	= volume[order]
+
+		return self
+
+	def __len__(self):
+		return len(self.price[BID]) + len(self.price[ASK])
+
+	# Return (price, num, volume) for the best bid or ask, or None if that side of the book is empty
+	def best(self, side=BID):
+		if ( len(self.price[side]) == 0 ):
+			return None
+
+		return float(self.price[side][0]), int(self.num[side][0]), int(self.volume[side][0])
+
+	def best_bid(self):
+		return self.best( BID )
+
+	def best_ask(self):
+		return self.best( ASK )
+
+	# Bid/ask volume imbalance over the top N price levels of each side of the book
+	# Returns a value between -1 (all asks) and 1 (all bids)
+	def imbalance(self, levels=5):
+		bid_vol = self.volume[BID][:levels].sum()
+		ask_vol = self.volume[ASK][:levels].sum()
+		if ( bid_vol + ask_vol == 0 ):
+			return 0.0
+
+		return float( (bid_vol - ask_vol) / (bid_vol + ask_vol) )
+
+	# Cumulative (bid_volume, ask_volume) within N ticks of the best bid and best ask
+	def depth(self, ticks=10, tick_size=0.01):
+		dist	= ticks * tick_size + tick_size / 100
+		depth	= []
+		for side in [ BID, ASK ]:
+			if ( len(self.price[side]) == 0 ):
+				depth.append( 0 )
+				continue
+
+			within = np.abs( self.price[side] - self.price[side][0] ) <= dist
+			depth.append( int(self.volume[side][within].sum()) )
+
+		return depth[BID], depth[ASK]
+
+	# Return the book as a list of (datetime, side, price, num, volume) records, as used by tda_archive_helper
+	def records(self):
+		records = []
+		for side in [ BID, ASK ]:
+			records += [ (self.datetime, side, p, n, v) for p, n, v in zip(self.price[side].tolist(), self.num[side].tolist(), self.volume[side].tolist()) ]
+
+		return records
+
+	# Return the book in the legacy format: { 'asks': {price: {'num_asks', 'total_volume'}}, 'bids': {...} }
+	def to_dict(self):
+		return { 'asks': { p: { 'num_asks': n, 'total_volume': v } for p, n, v in zip(self.price[ASK].tolist(), self.num[ASK].tolist(), self.volume[ASK].tolist()) },
+			 'bids': { p: { 'num_bids': n, 'total_volume': v } for p, n, v in zip(self.price[BID].tolist(), self.num[BID].tolist(), self.volume[BID].tolist()) } }
+
+
+class BookHistory:
+
+	fields = [ ('datetime', np.int64), ('side', np.int8), ('level', np.int32), ('price', np.float64), ('num', np.int64), ('volume', np.int64) ]
+
+	def __init__(self, capacity=4096):
+		self._len	= 0				# Number of rows
+		self._cap	= max( int(capacity), 16 )
+		self._data	= { f: np.zeros(self._cap, dtype=t) for f, t in self.fields }
+
+		# Offset of the first row of each snapshot, and the snapshot datetimes
+		self._snaps	= 0
+		self._snap_cap	= max( int(capacity) // 16, 16 )
+		self._start	= np.zeros( self._snap_cap, dtype=np.int64 )
+		self._snap_dt	= np.zeros( self._snap_cap, dtype=np.int64 )
+
+	def _grow(self, min_cap=0, min_snap_cap=0):
+		if ( min_cap > self._cap ):
+			new_cap = self._cap * 2
+			while ( new_cap < min_cap ):
+				new_cap *= 2
+
+			for f, t in self.fields:
+				arr = np.zeros( new_cap, dtype=t )
+				arr[:self._len] = self._data[f][:self._len]
+				self._data[f] = arr
+
+			self._cap = new_cap
+
+		if ( min_snap_cap > self._snap_cap ):
+			new_cap = self._snap_cap * 2
+			while ( new_cap < min_snap_cap ):
+				new_cap *= 2
+
+			for name in [ '_start', '_snap_dt' ]:
+				arr = np.zeros( new_cap, dtype=np.int64 )
+				arr[:self._snaps] = getattr(self, name)[:self._snaps]
+				setattr( self, name, arr )
+
+			self._snap_cap = new_cap
+
+	# Append a snapshot of book
+	def append(self, book=None):
+		n = len(book)
+		self._grow( self._len + n, self._snaps + 1 )
+
+		self._start[self._snaps]	= self._len
+		self._snap_dt[self._snaps]	= book.datetime
+		self._snaps			+= 1
+
+		i = self._len
+		for side in [ BID, ASK ]:
+			j = i + len(book.price[side])
+			self._data['datetime'][i:j]	= book.datetime
+			self._data['side'][i:j]		= side
+			self._data['level'][i:j]	= np.arange( j - i )
+			self._data['price'][i:j]	= book.price[side]
+			self._data['num'][i:j]		= book.num[side]
+			self._data['volume'][i:j]	= book.volume[side]
+			i = j
+
+		self._len = i
+
+	# Number of snapshots
+	def __len__(self):
+		return self._snaps
+
+	# Column views over all rows
+	def __getitem__(self, key):
+		if ( key == 'snapshot' ):
+			return self.snapshot_ids()
+
+		return self._data[key][:self._len]
+
+	@property
+	def datetimes(self):
+		return self._snap_dt[:self._snaps]
+
+	# Snapshot number of each row
+	def snapshot_ids(self):
+		counts = np.diff( np.append(self._start[:self._snaps], self._len) )
+		return np.repeat( np.arange(self._snaps), counts )
+
+	# Remove the oldest count snapshots, and return them in the legacy dict format
+	def evict(self, count=0):
+		count = min( int(count), self._snaps )
+		if ( count <= 0 ):
+			return {}
+
+		evicted	= self.to_dict( 0, count )
+		rows	= self._start[count] if ( count < self._snaps ) else self._len
+
+		for f, t in self.fields:
+			self._data[f][:self._len-rows] = self._data[f][rows:self._len]
+		self._len -= rows
+
+		self._start[:self._snaps-count]		= self._start[count:self._snaps] - rows
+		self._snap_dt[:self._snaps-count]	= self._snap_dt[count:self._snaps]
+		self._snaps				-= count
+
+		return evicted
+
+	# Return snapshots [first:last] in the legacy format: { dt: {'asks': {...}, 'bids': {...}} }
+	def to_dict(self, first=0, last=None):
+		if ( last == None ):
+			last = self._snaps
+
+		history = {}
+		if ( last <= first ):
+			return history
+
+		lo	= self._start[first]
+		hi	= self._start[last] if ( last < self._snaps ) else self._len
+		snap_id	= self.snapshot_ids()[lo:hi]
+		for s in range( first, last ):
+			history[int(self._snap_dt[s])] = { 'asks': {}, 'bids': {} }
+
+		cols = [ self._data[f][lo:hi].tolist() for f in ('side', 'price', 'num', 'volume') ]
+		for s, side, price, num, vol in zip( snap_id.tolist(), *cols ):
+			snap = history[int(self._snap_dt[s])]
+			if ( side == BID ):
+				snap['bids'][price] = { 'num_bids': num, 'total_volume': vol }
+			else:
+				snap['asks'][price] = { 'num_asks': num, 'total_volume': vol }
+
+		return history
+
+	# Best bid or ask price for each snapshot (NaN if that side of the book was empty)
+	def best(self, side=BID):
+		best	= np.full( self._snaps, np.nan )
+		rows	= ( self['level'] == 0 ) & ( self['side'] == side )
+		best[ self.snapshot_ids()[rows] ] = self['price'][rows]
+
+		return best
+
+	def best_bid(self):
+		return self.best( BID )
+
+	def best_ask(self):
+		return self.best( ASK )
+
+	# Bid/ask volume imbalance over the top N price levels for each snapshot
+	def imbalance(self, levels=5):
+		snap_id	= self.snapshot_ids()
+		rows	= self['level'] < levels
+		side	= self['side'][rows]
+		vol	= self['volume'][rows].astype(np.float64)
+
+		bid_vol	= np.bincount( snap_id[rows], weights=np.where(side == BID, vol, 0), minlength=self._snaps )
+		ask_vol	= np.bincount( snap_id[rows], weights=np.where(side == ASK, vol, 0), minlength=self._snaps )
+		total	= bid_vol + ask_vol
+
+		with np.errstate( divide='ignore', invalid='ignore' ):
+			return np.where( total > 0, (bid_vol - ask_vol) / total, 0 )
+
+	# Cumulative bid and ask volume within N ticks of the best bid/ask for each snapshot
+	# Returns two arrays, (bid_volume, ask_volume)
+	def depth(self, ticks=10, tick_size=0.01):
+		snap_id	= self.snapshot_ids()
+		side	= self['side']
+		price	= self['price']
+		dist	= ticks * tick_size + tick_size / 100
+
+		depth = []
+		for s in [ BID, ASK ]:
+			best	= self.best( s )[snap_id]
+			rows	= ( side == s ) & ( np.abs(price - best) <= dist )
+			depth.append( np.bincount(snap_id[rows], weights=self['volume'][rows], minlength=self._snaps).astype(np.int64) )
+
+		return depth[BID], depth[ASK]
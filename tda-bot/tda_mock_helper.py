@@ -0,0 +1,348 @@
+#!/usr/bin/python3 -u
+
+# Local mock of the TDA REST API, used to test tda_rest_helper.py and the tda_gobot_helper
+#  functions offline (see stock-analyze/tda-rest-mock.py)
+#
+# MockServer runs a threaded HTTP/1.1 server (with keep-alive) on localhost that implements
+#  the endpoints used by RestClient: quotes, pricehistory, option chains, accounts, orders
+#  and watchlists. Quotes and candles are generated from the ticker name, so they are the
+#  same on every run. Orders are filled immediately and added to the account positions.
+#
+# The server can also be used to test error handling:
+#  - token:	Requests without 'Authorization: Bearer <token>' return 401
+#  - delay:	Seconds to wait before each response, i.e. to test timeouts
+#  - rate/per:	Return 429 once more than 'rate' requests are made within 'per' seconds
+#  - invalid:	Tickers that are not returned by the quotes endpoint
+#
+# stats{} counts the requests and the number of client connections, so that connection
+#  reuse can be checked.
+#
+# MockLogin stands in for robin_stocks.tda in tda_gobot_helper.tdalogin(), and sets
+#  the mock server's token like robin_stocks does after a real login.
+
+import time
+import json
+import zlib
+import threading
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+	protocol_version = 'HTTP/1.1'
+
+	def setup(self):
+		super().setup()
+		with self.server.mock.lock:
+			self.server.mock.stats['connections'] += 1
+
+	def log_message(self, format, *args):
+		if ( self.server.mock.debug == True ):
+			super().log_message( format, *args )
+
+	def do_GET(self):
+		self.handle_request( 'GET' )
+
+	def do_POST(self):
+		self.handle_request( 'POST' )
+
+	def do_PUT(self):
+		self.handle_request( 'PUT' )
+
+	def do_DELETE(self):
+		self.handle_request( 'DELETE' )
+
+	def handle_request(self, method='GET'):
+		mock	= self.server.mock
+		url	= urlparse( self.path )
+		params	= { k: v[-1] for k, v in parse_qs(url.query).items() }
+
+		body = None
+		length = int( self.headers.get('Content-Length', 0) )
+		if ( length > 0 ):
+			try:
+				body = json.loads( self.rfile.read(length) )
+			except ValueError:
+				return self.reply( 400, { 'error': 'Invalid JSON' } )
+
+		if ( mock.delay > 0 ):
+			time.sleep( mock.delay )
+
+		if ( mock.token != None and self.headers.get('Authorization', '') != 'Bearer ' + str(mock.token) ):
+			return self.reply( 401, { 'error': 'The access token being passed has expired or is invalid.' } )
+
+		if ( mock.rate_limited() == True ):
+			return self.reply( 429, { 'error': 'Individual App\'s transactions per seconds restriction reached.' }, headers={ 'Retry-After': '1' } )
+
+		try:
+			status, data, headers = mock.dispatch( method, url.path, params, body )
+
+		except Exception as e:
+			status, data, headers = 500, { 'error': str(e) }, {}
+
+		self.reply( status, data, headers )
+
+	def reply(self, status=200, data=None, headers={}):
+		content = b''
+		if ( data != None ):
+			content = json.dumps( data ).encode( 'utf-8' )
+
+		self.send_response( status )
+		self.send_header( 'Content-Type', 'application/json' )
+		self.send_header( 'Content-Length', str(len(content)) )
+		for k, v in headers.items():
+			self.send_header( k, v )
+
+		self.end_headers()
+		try:
+			self.wfile.write( content )
+
+		# The client gave up, i.e. it timed out while waiting for a delayed response
+		except ( BrokenPipeError, ConnectionResetError ):
+			self.close_connection = True
+
+
+class MockServer:
+	def __init__(self, host='127.0.0.1', port=0, token='mock-token', delay=0, rate=None, per=60, invalid=None, debug=False):
+		self.token	= token
+		self.delay	= delay
+		self.rate	= rate
+		self.per	= per
+		self.invalid	= set( invalid ) if ( invalid != None ) else set()
+		self.debug	= debug
+
+		self.lock	= threading.Lock()
+		self.stats	= { 'requests': 0, 'connections': 0, 'rate_limited': 0 }
+		self.history	= deque()		# Request times, for rate limiting
+
+		self.orders	= {}
+		self.order_id	= 1000
+		self.positions	= {}			# ticker -> quantity (negative for short)
+		self.watchlists	= {}
+		self.quotes	= {}			# ticker -> quote overrides
+
+		self.httpd		= ThreadingHTTPServer( (host, port), MockHandler )
+		self.httpd.mock		= self
+		self.httpd.daemon_threads = True
+		self.thread		= None
+
+	@property
+	def url(self):
+		host, port = self.httpd.server_address[:2]
+		return 'http://' + str(host) + ':' + str(port) + '/v1'
+
+	def start(self):
+		self.thread = threading.Thread( target=self.httpd.serve_forever, daemon=True )
+		self.thread.start()
+
+		return self.url
+
+	def stop(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+
+	def rate_limited(self):
+		with self.lock:
+			self.stats['requests'] += 1
+			if ( self.rate == None ):
+				return False
+
+			now = time.monotonic()
+			while ( len(self.history) > 0 and self.history[0] <= now - self.per ):
+				self.history.popleft()
+
+			if ( len(self.history) >= self.rate ):
+				self.stats['rate_limited'] += 1
+				return True
+
+			self.history.append( now )
+
+		return False
+
+	# Deterministic price for a ticker
+	@staticmethod
+	def base_price(ticker=None):
+		return round( 10 + zlib.crc32(str(ticker).encode()) % 49000 / 100, 2 )
+
+	def quote(self, ticker=None):
+		price	= self.base_price( ticker )
+		quote	= {	'assetType':		'EQUITY',
+				'symbol':		ticker,
+				'description':		str(ticker) + ' Mock Inc',
+				'bidPrice':		round(price - 0.01, 2),
+				'askPrice':		round(price + 0.01, 2),
+				'lastPrice':		price,
+				'openPrice':		round(price * 0.99, 2),
+				'highPrice':		round(price * 1.02, 2),
+				'lowPrice':		round(price * 0.98, 2),
+				'closePrice':		round(price * 0.995, 2),
+				'netChange':		round(price - price * 0.995, 2),
+				'totalVolume':		zlib.crc32(str(ticker).encode()) % 10000000,
+				'mark':			price,
+				'exchangeName':		'NASD',
+				'52WkHigh':		round(price * 1.5, 2),
+				'52WkLow':		round(price * 0.5, 2),
+				'regularMarketLastPrice': price,
+				'delayed':		False }
+
+		quote.update( self.quotes.get(ticker, {}) )
+		return quote
+
+	# 1-minute (or daily/weekly) candles between start and end (epoch ms)
+	def candles(self, ticker=None, params={}):
+		freq_type	= params.get( 'frequencyType', 'minute' )
+		interval	= { 'minute': 60000, 'daily': 86400000, 'weekly': 604800000, 'monthly': 2592000000 }.get( freq_type, 60000 )
+		interval	*= int( params.get('frequency', 1) )
+
+		end = int( params.get('endDate', int(time.time() * 1000)) )
+		if ( 'startDate' in params ):
+			start = int( params['startDate'] )
+		else:
+			period	= int( params.get('period', 1) )
+			days	= { 'day': 1, 'month': 30, 'year': 365, 'ytd': 365 }.get( params.get('periodType', 'day'), 1 )
+			start	= end - period * days * 86400000
+
+		start	= start - start % interval
+		price	= self.base_price( ticker )
+		candles	= []
+		for t in range( start, end + 1, interval ):
+			step	= ( zlib.crc32((str(ticker) + str(t)).encode()) % 201 - 100 ) / 10000
+			close	= round( price * (1 + step), 2 )
+			candles.append( {	'open':		price,
+						'high':		max(price, close),
+						'low':		min(price, close),
+						'close':	close,
+						'volume':	zlib.crc32(str(t).encode()) % 50000,
+						'datetime':	t } )
+			price = close
+
+		return { 'candles': candles, 'symbol': ticker, 'empty': ( len(candles) == 0 ) }
+
+	def dispatch(self, method='GET', path='', params={}, body=None):
+		parts = [ p for p in path.split('/') if p != '' ]
+		if ( len(parts) == 0 or parts[0] != 'v1' ):
+			return 404, { 'error': 'Not Found' }, {}
+
+		parts = parts[1:]
+		with self.lock:
+
+			# /marketdata/quotes
+			if ( parts == ['marketdata', 'quotes'] and method == 'GET' ):
+				tickers = [ t for t in str(params.get('symbol', '')).split(',') if t != '' ]
+				return 200, { t: self.quote(t) for t in tickers if t not in self.invalid }, {}
+
+			# /marketdata/<ticker>/pricehistory
+			elif ( len(parts) == 3 and parts[0] == 'marketdata' and parts[2] == 'pricehistory' and method == 'GET' ):
+				if ( parts[1] in self.invalid ):
+					return 400, { 'error': 'Invalid symbol' }, {}
+
+				return 200, self.candles( parts[1], params ), {}
+
+			# /marketdata/chains
+			elif ( parts == ['marketdata', 'chains'] and method == 'GET' ):
+				ticker = params.get( 'symbol', '' )
+				return 200, {	'symbol': ticker, 'status': 'SUCCESS', 'underlyingPrice': self.base_price(ticker),
+						'callExpDateMap': {}, 'putExpDateMap': {} }, {}
+
+			elif ( len(parts) >= 2 and parts[0] == 'accounts' ):
+				return self.accounts( method, parts[1], parts[2:], params, body )
+
+		return 404, { 'error': 'Not Found' }, {}
+
+	def accounts(self, method='GET', account_id=None, parts=[], params={}, body=None):
+
+		# /accounts/<id>
+		if ( len(parts) == 0 and method == 'GET' ):
+			positions = []
+			for ticker, qty in self.positions.items():
+				positions.append( {	'instrument':		{ 'symbol': ticker, 'assetType': 'EQUITY' },
+							'longQuantity':		max(qty, 0),
+							'shortQuantity':	max(-qty, 0),
+							'averagePrice':		self.base_price(ticker) } )
+
+			account = { 'securitiesAccount': { 'accountId': account_id, 'type': 'MARGIN' } }
+			if ( 'positions' in str(params.get('fields', '')) ):
+				account['securitiesAccount']['positions'] = positions
+
+			return 200, account, {}
+
+		# /accounts/<id>/orders
+		elif ( parts == ['orders'] and method == 'POST' ):
+			self.order_id	+= 1
+			order_id	= self.order_id
+			order		= dict( body )
+
+			qty = 0
+			for leg in order.get( 'orderLegCollection', [] ):
+				ticker	= leg['instrument']['symbol']
+				sign	= 1 if ( leg['instruction'] in ('BUY', 'BUY_TO_COVER', 'BUY_TO_OPEN') ) else -1
+				qty	= float( leg['quantity'] )
+
+				self.positions[ticker] = self.positions.get( ticker, 0 ) + sign * qty
+				if ( self.positions[ticker] == 0 ):
+					del self.positions[ticker]
+
+			order.update( { 'orderId': order_id, 'accountId': account_id, 'status': 'FILLED', 'filledQuantity': qty, 'remainingQuantity': 0 } )
+			self.orders[order_id] = order
+
+			return 201, None, { 'Location': 'https://api.tdameritrade.com/v1/accounts/' + str(account_id) + '/orders/' + str(order_id) }
+
+		# /accounts/<id>/orders/<order_id>
+		elif ( len(parts) == 2 and parts[0] == 'orders' ):
+			order = self.orders.get( int(parts[1]) if parts[1].isdigit() else None, None )
+			if ( order == None ):
+				return 404, { 'error': 'Order not found' }, {}
+
+			if ( method == 'GET' ):
+				return 200, order, {}
+			elif ( method == 'DELETE' ):
+				if ( order['status'] == 'FILLED' ):
+					return 400, { 'error': 'Order cannot be canceled' }, {}
+
+				order['status'] = 'CANCELED'
+				return 200, None, {}
+
+		# /accounts/<id>/watchlists
+		elif ( parts == ['watchlists'] and method == 'GET' ):
+			return 200, list( self.watchlists.values() ), {}
+
+		elif ( parts == ['watchlists'] and method == 'POST' ):
+			watchlist_id = str( len(self.watchlists) + 1 )
+			self.watchlists[watchlist_id] = dict( body, watchlistId=watchlist_id, accountId=account_id )
+			return 201, None, { 'Location': 'https://api.tdameritrade.com/v1/accounts/' + str(account_id) + '/watchlists/' + watchlist_id }
+
+		# /accounts/<id>/watchlists/<watchlist_id>
+		elif ( len(parts) == 2 and parts[0] == 'watchlists' ):
+			if ( parts[1] not in self.watchlists ):
+				return 404, { 'error': 'Watchlist not found' }, {}
+
+			if ( method == 'GET' ):
+				return 200, self.watchlists[parts[1]], {}
+			elif ( method == 'PUT' ):
+				self.watchlists[parts[1]] = dict( body, watchlistId=parts[1], accountId=account_id )
+				return 204, None, {}
+			elif ( method == 'DELETE' ):
+				del self.watchlists[parts[1]]
+				return 204, None, {}
+
+		return 404, { 'error': 'Not Found' }, {}
+
+
+# Stand-in for robin_stocks.tda, for tda_gobot_helper.tdalogin()
+# tda_rest_helper.robin_stocks_token() reads the token from globals.SESSION.headers
+class MockLogin:
+	class authentication:
+		PICKLE_NAME = None
+
+	class globals:
+		class SESSION:
+			headers = {}
+
+	def __init__(self, token='mock-token'):
+		self.token = token
+
+	def login(self, passcode=None):
+		self.globals.SESSION.headers['Authorization'] = 'Bearer ' + str(self.token)
+		return 'mock'
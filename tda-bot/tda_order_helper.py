@@ -0,0 +1,141 @@
+#!/usr/bin/python3 -u
+
+# Asynchronous order execution
+#
+# The *_stock_marketprice() functions in tda_gobot_helper make blocking HTTP calls
+#  (with retries, and polling get_order() until the order is filled when fillwait=True).
+#  tda-gobot-v2 calls them from the stream handlers, so every order would stall the
+#  processing of all other tickers until it completes.
+#
+# OrderExecutor runs these calls on a thread pool instead. submit() returns immediately
+#  with a concurrent.futures.Future, and the optional callback is called with the result
+#  once the order completes. If submit() is called from within a running asyncio event
+#  loop (i.e. from stream_client.handle_message()), the callback is scheduled back on
+#  that loop so it can safely update the same state as the stream handlers.
+#
+# Orders for the same ticker are executed in the order they were submitted. If an order
+#  fails (returns False or raises), the next order for that ticker is skipped and returns
+#  False as well if it belongs to the same chain (i.e. the same transaction) and was queued
+#  before the failure was known, since i.e. a sell order makes no sense if the buy order
+#  failed. Orders queued after the failure was reported, or that belong to a different
+#  chain (i.e. a new entry), are always executed.
+
+import sys
+import time
+import asyncio
+import itertools
+import threading
+import concurrent.futures
+
+
+class OrderExecutor:
+	def __init__(self, max_workers=4):
+		self.pool	= concurrent.futures.ThreadPoolExecutor( max_workers=max_workers, thread_name_prefix='tda-order' )
+		self.lock	= threading.Lock()
+		self.ids	= itertools.count(1)
+		self.orders	= {}	# order_id -> order info, see submit()
+		self.last	= {}	# ticker -> most recent order_id
+
+	# Queue func(*args, **kwargs) for execution
+	# callback(order) is called once the order completes, where order is the dict
+	#  stored in self.orders. order['result'] contains the return value of func.
+	# chain identifies related orders for the ticker (i.e. the tx_id of the position),
+	#  see above.
+	def submit(self, ticker=None, func=None, args=(), kwargs={}, callback=None, name=None, chain=None):
+
+		try:
+			loop = asyncio.get_running_loop()
+		except RuntimeError:
+			loop = None
+
+		with self.lock:
+			order_id	= next(self.ids)
+			prev_id		= self.last.get(ticker, None)
+			order		= {	'order_id':	order_id,
+						'ticker':	ticker,
+						'name':		name if ( name != None ) else getattr(func, '__name__', str(func)),
+						'chain':	chain,
+						'state':	'queued',
+						'submitted':	time.time(),
+						'completed':	None,
+						'result':	None,
+						'error':	None,
+						'future':	None }
+
+			self.orders[order_id]	= order
+			self.last[ticker]	= order_id
+
+			# Wait for the previous order for this ticker if it has not completed yet, and skip
+			#  this order if it fails and belongs to the same chain
+			prev_future	= None
+			skip_failed	= False
+			if ( prev_id != None and prev_id in self.orders ):
+				prev = self.orders[prev_id]
+
+				# Completed orders are only kept until the next order for the ticker is queued
+				if ( prev['state'] in ('filled', 'failed') ):
+					del self.orders[prev_id]
+				else:
+					prev_future	= prev['future']
+					skip_failed	= ( prev['chain'] == chain )
+
+			order['future'] = self.pool.submit( self._run, order, prev_future, skip_failed, func, args, kwargs )
+
+		order['future'].add_done_callback( lambda f: self._done(order, callback, loop) )
+
+		return order['future']
+
+	def _run(self, order=None, prev_future=None, skip_failed=False, func=None, args=(), kwargs={}):
+
+		# Wait for the previous order for this ticker, and skip this order if it failed
+		if ( prev_future != None ):
+			prev_result = prev_future.result()
+			if ( skip_failed == True and isinstance(prev_result, bool) and prev_result == False ):
+				order['error'] = 'previous order for ' + str(order['ticker']) + ' failed'
+				return False
+
+		order['state'] = 'running'
+		try:
+			return func( *args, **kwargs )
+
+		except Exception as e:
+			order['error'] = str(e)
+			print('Caught Exception: OrderExecutor(): ' + str(order['name']) + '(' + str(order['ticker']) + '): ' + str(e), file=sys.stderr)
+			return False
+
+	def _done(self, order=None, callback=None, loop=None):
+		order['result']		= order['future'].result()
+		order['completed']	= time.time()
+		order['state']		= 'failed' if ( isinstance(order['result'], bool) and order['result'] == False ) else 'filled'
+
+		if ( callback == None ):
+			return
+
+		if ( loop != None and loop.is_closed() == False ):
+			loop.call_soon_threadsafe( callback, order )
+		else:
+			callback( order )
+
+	# Return True if there are any incomplete orders for ticker (or for any ticker if ticker is None)
+	def pending(self, ticker=None):
+		with self.lock:
+			for order in self.orders.values():
+				if ( ticker != None and order['ticker'] != ticker ):
+					continue
+				if ( order['state'] in ('queued', 'running') ):
+					return True
+
+		return False
+
+	# Wait for all incomplete orders
+	def wait(self, timeout=None):
+		with self.lock:
+			futures = [ order['future'] for order in self.orders.values() if order['state'] in ('queued', 'running') ]
+
+		if ( len(futures) > 0 ):
+			concurrent.futures.wait( futures, timeout=timeout )
+
+		return True
+
+	def shutdown(self, wait=True):
+		self.pool.shutdown( wait=wait )
@@ -0,0 +1,380 @@
+#!/usr/bin/python3 -u
+
+# Unified REST client for the TDA API
+#
+# tda_gobot_helper used to call the robin_stocks.tda functions for each request, wrapped in
+#  func_timeout() so that a hung request could not block the bot. func_timeout() starts a
+#  new thread for every call, robin_stocks makes its requests without any timeout, and the
+#  scripts that also use the tda-api client open a second set of connections to the API.
+#
+# RestClient makes the requests itself:
+#  - One requests.Session with a pooled HTTPAdapter, so connections to the API are kept
+#    alive and reused by all threads (i.e. the warmup and order executor thread pools).
+#  - Each endpoint has its own (connect, read) timeout, which is enforced by the socket
+#    instead of a separate thread. Callers may override the read timeout.
+#  - Requests take a token from a shared TokenBucket before they are sent. TDA allows 120
+#    requests per minute for market data and account requests, and limits orders separately,
+#    so each class of endpoint has its own bucket.
+#  - GET requests that fail with 429 (Too Many Requests) are retried after a short wait.
+#
+# The API functions return (data, err) like the robin_stocks functions did with jsonify=True,
+#  where err is None on success. As with robin_stocks, place_order() and cancel_order() return
+#  the response object, use get_order_number() to get the order ID from place_order().
+#
+# get_quotes_batch() splits a long list of tickers into requests of up to max_quote_symbols
+#  and sends them concurrently, and get_quote_records() returns the results as Quote records.
+#
+# robin_stocks is still used to log in, since it manages the encrypted token file, and
+#  tda_gobot_helper.tdalogin() passes the access token to the shared client. Set tda_api_url
+#  in the environment to use a different API endpoint, i.e. the mock server in tda_mock_helper.py.
+
+import os, sys, time
+import threading
+import collections
+import concurrent.futures
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tda_warmup_helper import TokenBucket
+
+base_url = 'https://api.tdameritrade.com/v1'
+
+# Rate limiter and (connect, read) timeouts in seconds for each endpoint
+endpoints = {
+	'quotes':		( 'data',	(3.05, 5) ),
+	'pricehistory':		( 'data',	(3.05, 10) ),
+	'chains':		( 'data',	(3.05, 10) ),
+	'account':		( 'data',	(3.05, 5) ),
+	'get_order':		( 'data',	(3.05, 5) ),
+	'watchlists':		( 'data',	(3.05, 10) ),
+	'place_order':		( 'orders',	(3.05, 5) ),
+	'cancel_order':		( 'orders',	(3.05, 5) ),
+}
+
+# Rate limits for each rate limiter, as (requests, seconds) or (requests, seconds, burst)
+rate_limits = {
+	'data':		( 120, 60 ),
+	'orders':	( 120, 60 ),
+}
+
+# Maximum number of symbols in one quotes request, and the number of requests that
+#  get_quotes_batch() sends at the same time
+max_quote_symbols	= 100
+quote_workers		= 4
+
+# Exceptions raised by the API functions
+Timeout			= requests.exceptions.Timeout
+RequestException	= requests.exceptions.RequestException
+
+
+class RestClient:
+	def __init__(self, url=None, token=None, pool_size=16, limits=None, retries=2, debug=False):
+		if ( url == None ):
+			url = os.environ.get( 'tda_api_url', base_url )
+
+		self.url	= str(url).rstrip('/')
+		self.retries	= retries
+		self.debug	= debug
+
+		self.session	= requests.Session()
+		adapter		= HTTPAdapter( pool_connections=2, pool_maxsize=pool_size, max_retries=0 )
+		self.session.mount( 'https://', adapter )
+		self.session.mount( 'http://', adapter )
+		self.session.headers.update( { 'Accept': 'application/json' } )
+
+		if ( limits == None ):
+			limits = rate_limits
+
+		self.buckets = {}
+		for name, limit in limits.items():
+			self.buckets[name] = TokenBucket( *limit )
+
+		self.token_lock = threading.Lock()
+		self.set_token( token )
+
+	# Set the access token used for all requests
+	# token may be the access token or the full Authorization header ('Bearer ...')
+	def set_token(self, token=None):
+		if ( token == None or token == '' ):
+			return False
+
+		token = str(token)
+		if ( token.startswith('Bearer ') == False ):
+			token = 'Bearer ' + token
+
+		with self.token_lock:
+			self.session.headers['Authorization'] = token
+
+		return True
+
+	def authorized(self):
+		return ( 'Authorization' in self.session.headers )
+
+	# Send a request to endpoint and return the response
+	# If timeout is set then it is used as the read timeout instead of the endpoint's default.
+	def request(self, endpoint=None, method='GET', path='', params=None, body=None, timeout=None):
+		bucket, timeouts = endpoints[endpoint]
+		if ( timeout != None ):
+			timeouts = ( timeouts[0], float(timeout) )
+
+		# Drop empty parameters, and send booleans the way the API expects them
+		if ( params != None ):
+			params = { k: (str(v).lower() if isinstance(v, bool) else v) for k, v in params.items() if v != None }
+
+		for attempt in range( self.retries + 1 ):
+			self.buckets[bucket].acquire()
+
+			res = self.session.request( method, self.url + path, params=params, json=body, timeout=timeouts )
+			if ( self.debug == True ):
+				print('DEBUG: RestClient.request(): ' + str(method) + ' ' + str(res.url) + ': ' + str(res.status_code))
+
+			if ( res.status_code == 429 and method == 'GET' and attempt < self.retries ):
+				try:
+					wait = float( res.headers['Retry-After'] )
+				except:
+					wait = 2 ** attempt
+
+				time.sleep( min(wait, 10) )
+				continue
+
+			break
+
+		return res
+
+	# Return (data, err) with the decoded JSON data from res
+	@staticmethod
+	def parse(res=None):
+		if ( res.ok == False ):
+			return None, str(res.status_code) + ' ' + str(res.reason) + ': ' + str(res.text)[:200]
+
+		if ( len(res.content) == 0 ):
+			return {}, None
+
+		try:
+			return res.json(), None
+
+		except ValueError as e:
+			return None, 'Unable to decode response: ' + str(e)
+
+	# Return (res, err) for requests that do not return any data, i.e. orders
+	@staticmethod
+	def check(res=None):
+		if ( res.ok == False ):
+			return res, str(res.status_code) + ' ' + str(res.reason) + ': ' + str(res.text)[:200]
+
+		return res, None
+
+	# Market data
+	# tickers may be a comma-delimited string or a list
+	def get_quotes(self, tickers=None, timeout=None):
+		if ( isinstance(tickers, (list, tuple)) ):
+			tickers = ','.join( tickers )
+
+		return self.parse( self.request('quotes', 'GET', '/marketdata/quotes', params={ 'symbol': tickers }, timeout=timeout) )
+
+	# Get quotes for any number of tickers
+	# The tickers are split into requests of up to max_symbols, which are sent concurrently.
+	#  Returns (data, err) like get_quotes(). If some of the requests failed then data contains
+	#  the quotes from the requests that succeeded and err lists the errors along with the
+	#  symbols of each failed request.
+	def get_quotes_batch(self, tickers=None, max_symbols=None, workers=None, timeout=None):
+		if ( isinstance(tickers, str) ):
+			tickers = tickers.split(',')
+		if ( max_symbols == None ):
+			max_symbols = max_quote_symbols
+		if ( workers == None ):
+			workers = quote_workers
+
+		# Remove empty and duplicate tickers
+		tickers	= list( dict.fromkeys([ str(t).strip() for t in tickers if str(t).strip() != '' ]) )
+		chunks	= [ tickers[i:i + max_symbols] for i in range(0, len(tickers), max_symbols) ]
+
+		def get_chunk(chunk=None):
+			try:
+				data, err = self.get_quotes( chunk, timeout=timeout )
+
+			except Timeout:
+				data, err = None, 'timed out'
+			except RequestException as e:
+				data, err = None, str(e)
+
+			if ( err != None ):
+				err = ','.join(chunk) + ': ' + str(err)
+
+			return data, err
+
+		if ( len(chunks) <= 1 ):
+			results = [ get_chunk(c) for c in chunks ]
+		else:
+			with concurrent.futures.ThreadPoolExecutor( max_workers=max(1, min(workers, len(chunks))) ) as executor:
+				results = list( executor.map(get_chunk, chunks) )
+
+		quotes	= {}
+		errors	= []
+		for data, err in results:
+			if ( err != None ):
+				errors.append( err )
+			elif ( isinstance(data, dict) ):
+				quotes.update( data )
+
+		if ( len(errors) > 0 ):
+			return quotes, '; '.join( errors )
+
+		return quotes, None
+
+	# Same as get_quotes_batch(), but returns a dict of Quote records
+	def get_quote_records(self, tickers=None, max_symbols=None, workers=None, timeout=None):
+		data, err = self.get_quotes_batch( tickers, max_symbols=max_symbols, workers=workers, timeout=timeout )
+
+		return { ticker: make_quote(ticker, quote) for ticker, quote in data.items() }, err
+
+	def get_price_history(self, ticker=None, period_type=None, frequency_type=None, frequency=None, period=None, start_date=None, end_date=None,
+				needExtendedHoursData=True, timeout=None):
+
+		# Either period or start_date and end_date must be set, as with robin_stocks
+		if ( (start_date == None or end_date == None or period != None) and (start_date != None or end_date != None or period == None) ):
+			raise ValueError( 'get_price_history(): set either period or start_date and end_date' )
+
+		params = {	'periodType':			period_type,
+				'frequencyType':		frequency_type,
+				'frequency':			frequency,
+				'period':			period,
+				'startDate':			start_date,
+				'endDate':			end_date,
+				'needExtendedHoursData':	needExtendedHoursData }
+
+		return self.parse( self.request('pricehistory', 'GET', '/marketdata/' + str(ticker) + '/pricehistory', params=params, timeout=timeout) )
+
+	def get_option_chains(self, ticker=None, contract_type='ALL', strike_count='10', include_quotes='FALSE', strategy='SINGLE', interval=None,
+				strike_price=None, range_value='ALL', from_date=None, to_date=None, volatility=None, underlying_price=None,
+				interest_rate=None, days_to_expiration=None, exp_month='ALL', option_type='ALL', jsonify=True, timeout=None):
+
+		params = {	'symbol':		ticker,
+				'contractType':		contract_type,
+				'strikeCount':		strike_count,
+				'includeQuotes':	include_quotes,
+				'strategy':		strategy,
+				'interval':		interval,
+				'strike':		strike_price,
+				'range':		range_value,
+				'fromDate':		from_date,
+				'toDate':		to_date,
+				'volatility':		volatility,
+				'underlyingPrice':	underlying_price,
+				'interestRate':		interest_rate,
+				'daysToExpiration':	days_to_expiration,
+				'expMonth':		exp_month,
+				'optionType':		option_type }
+
+		res = self.request( 'chains', 'GET', '/marketdata/chains', params=params, timeout=timeout )
+		if ( jsonify == False ):
+			return self.check( res )
+
+		return self.parse( res )
+
+	# Accounts and orders
+	def get_account(self, account_id=None, fields=None, timeout=None):
+		return self.parse( self.request('account', 'GET', '/accounts/' + str(account_id), params={ 'fields': fields }, timeout=timeout) )
+
+	def get_order(self, account_id=None, order_id=None, timeout=None):
+		return self.parse( self.request('get_order', 'GET', '/accounts/' + str(account_id) + '/orders/' + str(order_id), timeout=timeout) )
+
+	def place_order(self, account_id=None, order=None, timeout=None):
+		return self.check( self.request('place_order', 'POST', '/accounts/' + str(account_id) + '/orders', body=order, timeout=timeout) )
+
+	def cancel_order(self, account_id=None, order_id=None, timeout=None):
+		return self.check( self.request('cancel_order', 'DELETE', '/accounts/' + str(account_id) + '/orders/' + str(order_id), timeout=timeout) )
+
+	# Watchlists
+	def get_watchlists(self, account_id=None, timeout=None):
+		return self.parse( self.request('watchlists', 'GET', '/accounts/' + str(account_id) + '/watchlists', timeout=timeout) )
+
+	def get_watchlist(self, account_id=None, watchlist_id=None, timeout=None):
+		return self.parse( self.request('watchlists', 'GET', '/accounts/' + str(account_id) + '/watchlists/' + str(watchlist_id), timeout=timeout) )
+
+	def replace_watchlist(self, account_id=None, watchlist_id=None, watchlist=None, timeout=None):
+		return self.check( self.request('watchlists', 'PUT', '/accounts/' + str(account_id) + '/watchlists/' + str(watchlist_id), body=watchlist, timeout=timeout) )
+
+	def delete_watchlist(self, account_id=None, watchlist_id=None, timeout=None):
+		return self.check( self.request('watchlists', 'DELETE', '/accounts/' + str(account_id) + '/watchlists/' + str(watchlist_id), timeout=timeout) )
+
+
+# Quote record returned by get_quote_records()
+# Prices are float (0 if the API did not return them), volume is int and delayed is bool.
+#  data is the quote as returned by the API.
+Quote = collections.namedtuple( 'Quote', [	'symbol', 'description', 'asset_type', 'exchange',
+						'last_price', 'mark', 'bid', 'ask', 'open', 'high', 'low', 'close',
+						'net_change', 'volume', 'high_52wk', 'low_52wk', 'delayed', 'data' ] )
+
+def make_quote(ticker=None, data=None):
+
+	def get(key=None, default=0, cast=float):
+		try:
+			return cast( data[key] )
+		except:
+			return default
+
+	# Futures use the *InDouble fields
+	suffix = ''
+	if ( str(data.get('assetType', '')).lower() == 'future' ):
+		suffix = 'InDouble'
+
+	return Quote(	symbol		= str( data.get('symbol', ticker) ),
+			description	= str( data.get('description', '') ),
+			asset_type	= str( data.get('assetType', '') ),
+			exchange	= str( data.get('exchangeName', '') ),
+			last_price	= get( 'lastPrice' + suffix ),
+			mark		= get( 'mark' ),
+			bid		= get( 'bidPrice' + suffix ),
+			ask		= get( 'askPrice' + suffix ),
+			open		= get( 'openPrice' + suffix ),
+			high		= get( 'highPrice' + suffix ),
+			low		= get( 'lowPrice' + suffix ),
+			close		= get( 'closePrice' + suffix ),
+			net_change	= get( 'netChange' + suffix ),
+			volume		= get( 'totalVolume', cast=int ),
+			high_52wk	= get( '52WkHigh' + suffix ),
+			low_52wk	= get( '52WkLow' + suffix ),
+			delayed		= ( str(data.get('delayed', True)).lower() == 'true' ),
+			data		= data )
+
+
+# Return the order ID from the response to place_order()
+# The API returns the new order's URL in the Location header
+def get_order_number(res=None):
+	try:
+		return str( res.headers['Location'] ).rstrip('/').split('/')[-1]
+	except:
+		return ''
+
+
+# Return the Authorization header that robin_stocks.tda set on its requests session at login
+def robin_stocks_token(tda=None):
+	for mod in ( 'globals', 'helper' ):
+		try:
+			return getattr(tda, mod).SESSION.headers['Authorization']
+		except:
+			pass
+
+	return None
+
+# Return the access token from a tda-api client
+def tda_api_token(tda_client=None):
+	try:
+		return tda_client.session.token['access_token']
+	except:
+		return None
+
+
+# Shared client, created on first use
+client		= None
+client_lock	= threading.Lock()
+
+def get_client():
+	global client
+	with client_lock:
+		if ( client == None ):
+			client = RestClient()
+
+	return client
@@ -0,0 +1,164 @@
+#!/usr/bin/python3 -u
+
+# Concurrent warmup of ticker data at startup
+#
+# Before it can start trading, tda-gobot-v2 needs several API calls per ticker (the
+#  1-minute, weekly and daily pricehistory, and the 3-week/20-week price stats). Making
+#  these calls one after another, with sleeps in between to stay under the API rate limit,
+#  means startup can take many minutes with a large list of tickers.
+#
+# Warmup runs these calls on a bounded thread pool instead. Each call first takes a token
+#  from a shared TokenBucket, so the request rate never exceeds the API limit (TDA allows
+#  120 non-transactional requests per minute) no matter how many workers are used. Failed
+#  calls are retried with exponential backoff, and as with the old startup loop the login
+#  function (i.e. tda_gobot_helper.tdalogin()) is called before each retry. Logins are
+#  serialized, so a burst of failures from several workers only results in one login.
+
+import sys
+import time
+import threading
+import concurrent.futures
+
+
+# Token bucket rate limiter
+# Allows up to 'rate' calls per 'per' seconds, with bursts of up to 'burst' calls
+class TokenBucket:
+	def __init__(self, rate=120, per=60, burst=None):
+		self.fill_rate	= float(rate) / float(per)	# Tokens added per second
+		self.capacity	= float(burst) if ( burst != None ) else max( 1.0, self.fill_rate * 5 )
+		self.tokens	= self.capacity
+		self.last	= time.monotonic()
+		self.lock	= threading.Lock()
+
+	# Block until num tokens are available and consume them
+	def acquire(self, num=1):
+		while True:
+			with self.lock:
+				now		= time.monotonic()
+				self.tokens	= min( self.capacity, self.tokens + (now - self.last) * self.fill_rate )
+				self.last	= now
+
+				if ( self.tokens >= num ):
+					self.tokens -= num
+					return True
+
+				wait = (num - self.tokens) / self.fill_rate
+
+			time.sleep(wait)
+
+
+class Warmup:
+	def __init__(self, max_workers=8, rate=120, per=60, burst=None, attempts=4, backoff=5, max_backoff=60, login=None, debug=False):
+		self.max_workers	= max_workers
+		self.bucket		= TokenBucket( rate=rate, per=per, burst=burst )
+		self.attempts		= attempts
+		self.backoff		= backoff
+		self.max_backoff	= max_backoff
+		self.login		= login
+		self.debug		= debug
+
+		self.jobs		= []
+		self.login_lock		= threading.Lock()
+		self.last_login		= 0
+
+	# Queue a call for ticker
+	# func(attempt) is called to make the request, attempt starts at 1. check(result)
+	#  should return True if the result is usable, otherwise the call is retried. If all
+	#  attempts fail then the last result is returned anyway, so the caller can decide
+	#  what to do with it.
+	def add(self, ticker=None, name=None, func=None, check=None, attempts=None):
+		if ( check == None ):
+			check = lambda result: not ( isinstance(result, bool) and result == False )
+
+		self.jobs.append( {	'ticker':	ticker,
+					'name':		name,
+					'func':		func,
+					'check':	check,
+					'attempts':	attempts if ( attempts != None ) else self.attempts } )
+
+	# Call the login function, unless another worker has done so since this job's last attempt failed
+	def _login(self, failed_at=0):
+		if ( self.login == None ):
+			return True
+
+		with self.login_lock:
+			if ( self.last_login > failed_at ):
+				return True
+
+			try:
+				ret = self.login()
+			except Exception as e:
+				print('Caught Exception: Warmup._login(): ' + str(e), file=sys.stderr)
+				ret = False
+
+			self.last_login = time.monotonic()
+
+		if ( ret != True ):
+			print('Error: Warmup._login(): Login failure', file=sys.stderr)
+
+		return ret
+
+	def _run(self, job=None):
+		result = False
+		for attempt in range(1, job['attempts'] + 1):
+			self.bucket.acquire()
+
+			try:
+				result = job['func'](attempt)
+			except Exception as e:
+				print('Caught Exception: Warmup(): ' + str(job['name']) + '(' + str(job['ticker']) + '): ' + str(e), file=sys.stderr)
+				result = False
+
+			try:
+				if ( job['check'](result) == True ):
+					return True, result, attempt
+			except:
+				pass
+
+			if ( attempt == job['attempts'] ):
+				break
+
+			if ( self.debug == True ):
+				print('(' + str(job['ticker']) + '): Warmup: ' + str(job['name']) + ' failed, retrying (attempt ' + str(attempt+1) + ')')
+
+			failed_at = time.monotonic()
+			time.sleep( min(self.backoff * 2 ** (attempt-1), self.max_backoff) )
+			self._login( failed_at )
+
+		return False, result, job['attempts']
+
+	# Run all queued jobs and return the results
+	# Returns a dict of results[ticker][name], and prints progress as each ticker completes
+	def run(self):
+		results		= {}
+		remaining	= {}
+		failed		= {}
+		for job in self.jobs:
+			results.setdefault( job['ticker'], {} )
+			remaining[job['ticker']]	= remaining.get(job['ticker'], 0) + 1
+			failed[job['ticker']]		= []
+
+		num_tickers	= len(remaining)
+		num_done	= 0
+		start		= time.monotonic()
+
+		with concurrent.futures.ThreadPoolExecutor( max_workers=self.max_workers, thread_name_prefix='tda-warmup' ) as pool:
+			futures = { pool.submit(self._run, job): job for job in self.jobs }
+			for future in concurrent.futures.as_completed( futures ):
+				job = futures[future]
+				ok, result, attempts = future.result()
+
+				results[job['ticker']][job['name']] = result
+				if ( ok == False ):
+					failed[job['ticker']].append( job['name'] )
+					print('(' + str(job['ticker']) + '): Warning: Warmup: ' + str(job['name']) + ' failed after ' + str(attempts) + ' attempts')
+
+				remaining[job['ticker']] -= 1
+				if ( remaining[job['ticker']] == 0 ):
+					num_done += 1
+					status = 'OK' if ( len(failed[job['ticker']]) == 0 ) else 'failed: ' + ','.join(failed[job['ticker']])
+					print('(' + str(job['ticker']) + '): Warmup complete (' + str(status) + ') [' + str(num_done) + '/' + str(num_tickers) + ' tickers, ' + str(round(time.monotonic() - start, 1)) + 's]')
+
+		self.jobs = []
+
+		return results